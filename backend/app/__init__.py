@@ -1,6 +1,7 @@
 """
 Flask应用工厂模式
 """
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -41,6 +42,22 @@ def create_app(config_object=None):
     # 初始化配置
     config_class.init_app(app)
     
+    # 问答上下文压缩编解码器
+    from app.utils.context_codec import init_context_codec
+    init_context_codec(app)
+    
+    # 统计汇总表增量维护
+    from app.services.stats_rollup import init_stats_rollup
+    init_stats_rollup(app)
+    
+    # 上传去重的内容指纹过滤器
+    from app.services.fingerprint_filter import init_fingerprint_filter
+    init_fingerprint_filter(app)
+    
+    # chatlog 定时同步
+    from app.services.chatlog_sync import init_chatlog_sync
+    init_chatlog_sync(app)
+    
     # 注册蓝图
     register_blueprints(app)
     
@@ -180,6 +197,151 @@ def register_cli_commands(app):
         db.create_all()
         current_app.logger.info('Database reset successfully')
     
+    @app.cli.command()
+    def reconcile_stats():
+        """全量重建统计汇总表"""
+        from flask import current_app
+        from app.services.stats_rollup import get_stats_rollup_service
+        
+        result = get_stats_rollup_service().reconcile()
+        current_app.logger.info(f'Stats rollup reconciled: {result}')
+    
+    @app.cli.command()
+    @click.option('--capacity', type=int, default=None, help='过滤器容量（不小于 DEDUP_FILTER_CAPACITY）')
+    def rebuild_dedup_filter(capacity):
+        """从数据库重建上传去重的内容指纹过滤器"""
+        from flask import current_app
+        from app.services.fingerprint_filter import get_fingerprint_filter_service
+        
+        service = get_fingerprint_filter_service()
+        service.rebuild(capacity)
+        current_app.logger.info(f'Dedup filter rebuilt: {service.get_stats()}')
+    
+    @app.cli.command()
+    @click.option('--talker', 'talkers', multiple=True, help='要同步的聊天（可重复），默认按 CHATLOG_SYNC_TALKERS 或会话列表')
+    def sync_chatlog(talkers):
+        """从 chatlog HTTP 接口增量同步聊天记录"""
+        from flask import current_app
+        from app.services.chatlog_sync import get_chatlog_sync_service
+        
+        service = get_chatlog_sync_service()
+        run, created = service.create_run(current_app.config, talkers or None, trigger='cli')
+        if not created:
+            current_app.logger.warning(f'Chatlog sync {run.run_id} is already running')
+            return
+        result = service.run_sync(current_app._get_current_object(), run.run_id)
+        current_app.logger.info(f'Chatlog sync finished: {result}')
+    
+    @app.cli.command()
+    @click.option('--upload-id', 'upload_ids', type=int, multiple=True, help='要重新提取的上传记录（可重复），默认全部有归档的上传')
+    @click.option('--apply', is_flag=True, help='保存新增的问答对（默认只比较）')
+    @click.option('--prune', is_flag=True, help='同时删除新规则不再提取出的问答对（需要 --apply）')
+    def reextract(upload_ids, apply, prune):
+        """从消息归档重新提取问答对，与已有问答对比较"""
+        from flask import current_app
+        from app.services.reextraction import get_reextraction_service
+        
+        service = get_reextraction_service()
+        job, created = service.create_job(upload_ids or None, apply=apply, prune=prune)
+        if not created:
+            current_app.logger.warning(f'Reextraction {job.job_id} is already running')
+            return
+        result = service.run_job(current_app._get_current_object(), job.job_id)
+        current_app.logger.info(f'Reextraction finished: {result}')
+    
+    @app.cli.command()
+    @click.option('--batch-size', type=int, default=None, help='每批处理的问答对数（默认 RECLASSIFY_BATCH_SIZE）')
+    @click.option('--workers', type=int, default=None, help='分类进程数（默认 RECLASSIFY_WORKERS）')
+    @click.option('--include-ai', is_flag=True, help='同时重新分类 AI 处理的问答对')
+    def reclassify(batch_size, workers, include_ai):
+        """按当前分类规则重新分类全部问答对"""
+        from flask import current_app
+        from app.services.reclassification import get_reclassification_service
+        
+        service = get_reclassification_service()
+        job, created = service.create_job(
+            batch_size or current_app.config.get('RECLASSIFY_BATCH_SIZE', 2000),
+            workers or current_app.config.get('RECLASSIFY_WORKERS') or None,
+            include_ai=include_ai
+        )
+        if not created:
+            current_app.logger.warning(f'Reclassification {job.job_id} is already running')
+            return
+        result = service.run_job(current_app._get_current_object(), job.job_id)
+        current_app.logger.info(f'Reclassification finished: {result}')
+    
+    @app.cli.command()
+    @click.option('--samples', default=2000, help='训练样本数量')
+    @click.option('--dict-size', default=16 * 1024, help='字典大小（字节）')
+    def train_context_dict(samples, dict_size):
+        """用现有上下文训练 zstd 字典，并用新字典重新压缩全部上下文"""
+        from flask import current_app
+        from sqlalchemy.orm import undefer
+        from app.models import ContextDictionary, MessageArchiveSegment, QAPair
+        from app.utils.context_codec import ContextCodec, get_context_codec, train_zstd_dictionary
+        
+        old_codec = get_context_codec()
+        rows = QAPair.query.options(undefer(QAPair.context_blob))\
+                           .filter(QAPair.context_blob.isnot(None))\
+                           .order_by(db.func.random()).limit(samples).all()
+        dictionary = train_zstd_dictionary([qa.original_context for qa in rows], dict_size)
+        
+        # 新字典按ID入库（旧字典保留），数据首部记录字典ID：重新压缩中断时，已处理和未处理的
+        # 数据都能解压；其他进程按ID加载字典，并在刷新间隔内开始用新字典压缩
+        dict_id = old_codec.dictionaries.add(dictionary)
+        db.session.merge(ContextDictionary(dict_id=dict_id, data=dictionary, sample_count=len(rows)))
+        db.session.commit()
+        old_codec.dictionaries.refresh()
+        
+        new_codec = ContextCodec(
+            method='zstd',
+            level=current_app.config.get('CONTEXT_COMPRESSION_LEVEL', 6),
+            dictionaries=old_codec.dictionaries
+        )
+        
+        # 分批用旧编解码器解压、新字典压缩
+        last_id = 0
+        recompressed = 0
+        while True:
+            batch = db.session.query(QAPair.id, QAPair.context_blob)\
+                              .filter(QAPair.id > last_id, QAPair.context_blob.isnot(None))\
+                              .order_by(QAPair.id).limit(1000).all()
+            if not batch:
+                break
+            db.session.execute(
+                QAPair.__table__.update().where(QAPair.__table__.c.id == db.bindparam('qa_id')),
+                [{'qa_id': qa_id, 'context_blob': new_codec.encode(old_codec.decode(blob))}
+                 for qa_id, blob in batch]
+            )
+            db.session.commit()
+            last_id = batch[-1][0]
+            recompressed += len(batch)
+        
+        # 消息归档使用同一个编解码器，一并重新压缩
+        last_id = 0
+        segments = 0
+        while True:
+            batch = db.session.query(MessageArchiveSegment.id, MessageArchiveSegment.payload)\
+                              .filter(MessageArchiveSegment.id > last_id)\
+                              .order_by(MessageArchiveSegment.id).limit(100).all()
+            if not batch:
+                break
+            db.session.execute(
+                MessageArchiveSegment.__table__.update()
+                .where(MessageArchiveSegment.__table__.c.id == db.bindparam('segment_id')),
+                [{'segment_id': segment_id, 'payload': new_codec.encode(old_codec.decode(payload))}
+                 for segment_id, payload in batch]
+            )
+            db.session.commit()
+            last_id = batch[-1][0]
+            segments += len(batch)
+            
+        current_app.logger.info(
+            f'Trained {len(dictionary)} byte context dictionary {dict_id} from {len(rows)} samples, '
+            f'recompressed {recompressed} contexts and {segments} archive segments; '
+            f'set CONTEXT_COMPRESSION=zstd to keep using it'
+        )
+    
     @app.cli.command()
     def create_sample_data():
         """创建示例数据"""
@@ -4,5 +4,18 @@
 from .qa import QAPair
 from .category import Category
 from .upload import UploadHistory
+from .raw_qa import RawQAPair
+from .watermark import ChatWatermark
+from .archive import MessageArchiveSegment
+from .context_dictionary import ContextDictionary
+from .stats import (
+    CategoryStats, AdvisorStats, ConfidenceStats, DailyStats,
+    UploadStatusStats, StatsState
+)
 
-__all__ = ['QAPair', 'Category', 'UploadHistory']
\ No newline at end of file
+__all__ = [
+    'QAPair', 'Category', 'UploadHistory', 'RawQAPair', 'ChatWatermark', 'MessageArchiveSegment',
+    'ContextDictionary',
+    'CategoryStats', 'AdvisorStats', 'ConfidenceStats', 'DailyStats',
+    'UploadStatusStats', 'StatsState'
+]
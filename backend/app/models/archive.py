@@ -0,0 +1,39 @@
+"""
+消息归档模型
+"""
+from app import db
+from .base import BaseModel
+
+
+class MessageArchiveSegment(BaseModel):
+    """
+    标准化消息归档分段
+    
+    上传处理时，每个聊天标准化后的消息按顺序切成若干段，每段压缩为一个 NDJSON 块
+    （编码见 app.services.message_archive）追加写入这里。原始导出文件处理后即删除，
+    调整提取规则后由重新提取任务读取归档重新提取，不需要客户重新上传。
+    """
+    __tablename__ = 'message_archive_segments'
+    
+    # 来源：上传记录和上传中的聊天（ChatStart.source，zip 包中每个 JSON 文件是一个聊天）
+    upload_id = db.Column(db.Integer, db.ForeignKey('upload_history.id'), nullable=False)
+    source = db.Column(db.String(255), nullable=False)
+    segment_index = db.Column(db.Integer, nullable=False)  # 分段在聊天中的顺序
+    start_position = db.Column(db.Integer, nullable=False)  # 第一条消息在聊天中的序号
+    
+    # 聊天标识（原始消息中的 talker，没有时为空）和时间范围
+    chat = db.Column(db.String(255), nullable=True)
+    chat_name = db.Column(db.String(255), nullable=True)
+    first_timestamp = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    
+    message_count = db.Column(db.Integer, nullable=False)
+    payload = db.deferred(db.Column(db.LargeBinary, nullable=False))  # 压缩后的 NDJSON
+    
+    __table_args__ = (
+        db.UniqueConstraint('upload_id', 'source', 'segment_index', name='uq_archive_upload_segment'),
+        db.Index('idx_archive_chat_time', 'chat', 'first_timestamp'),
+    )
+    
+    def __repr__(self):
+        return f'<MessageArchiveSegment upload {self.upload_id} {self.source}#{self.segment_index}>'
@@ -0,0 +1,23 @@
+"""
+上下文压缩字典模型
+"""
+from datetime import datetime
+from app import db
+
+
+class ContextDictionary(db.Model):
+    """
+    zstd 上下文压缩字典
+    
+    主键是 zstd 字典自带的字典ID，压缩数据首部记录所用字典的ID（见 app.utils.context_codec）。
+    重新训练只新增记录，旧字典保留用于解压历史数据；最近创建的字典用于压缩新数据。
+    """
+    __tablename__ = 'context_dictionaries'
+    
+    dict_id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=True)  # 训练样本数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<ContextDictionary {self.dict_id} ({len(self.data or b"")} bytes)>'
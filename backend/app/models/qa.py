@@ -1,9 +1,20 @@
 """
 问答对模型
 """
+import logging
+from datetime import datetime
 from app import db
+from app.utils.context_codec import get_context_codec
 from .base import BaseModel
 from sqlalchemy import Index, func
+from sqlalchemy.orm import load_only, joinedload, with_expression
+
+logger = logging.getLogger(__name__)
+
+
+def _inserted_fingerprint(context):
+    """extraction_fingerprint 的默认值：插入时的 content_fingerprint（批量插入逐行取）"""
+    return context.get_current_parameters().get('content_fingerprint')
 
 
 class QAPair(BaseModel):
@@ -27,7 +38,26 @@ class QAPair(BaseModel):
     
     # 源数据信息
     source_file = db.Column(db.String(255))  # 来源文件
-    original_context = db.Column(db.Text)  # 原始上下文
+    # 去重指纹（见 app.utils.content_fingerprint，ORM 写入时自动计算，批量写入由调用方设置）
+    content_fingerprint = db.Column(db.String(32))
+    # 提取时的指纹：插入时取 content_fingerprint，之后不再改变（手工修改问答后两者不同，重新提取据此比较）
+    extraction_fingerprint = db.Column(db.String(32), default=_inserted_fingerprint)
+    # 原始上下文（压缩存储，延迟加载；通过 original_context 属性读写）
+    context_blob = db.deferred(db.Column(db.LargeBinary))
+    
+    # 回答摘要（查询时按需计算，见 sparse_load_options）
+    answer_preview = db.query_expression()
+    ANSWER_PREVIEW_LENGTH = 120
+    
+    # 列表接口可通过 fields= 选择的字段，category 为分类的精简信息
+    SPARSE_FIELDS = (
+        'id', 'question', 'answer', 'answer_preview', 'category_id', 'category',
+        'asker', 'advisor', 'confidence', 'source_file', 'created_at', 'updated_at',
+    )
+    # 预设视图（view=list 供前端列表页使用）
+    FIELD_VIEWS = {
+        'list': ('id', 'question', 'answer_preview', 'category', 'advisor', 'confidence', 'created_at'),
+    }
     
     # 索引优化
     __table_args__ = (
@@ -37,20 +67,110 @@ class QAPair(BaseModel):
         Index('idx_qa_created', 'created_at'),
         Index('idx_qa_confidence', 'confidence'),
         Index('idx_qa_composite', 'category_id', 'advisor', 'created_at'),
+        Index('idx_qa_content_fingerprint', 'content_fingerprint'),
+        Index('idx_qa_extraction_fingerprint', 'extraction_fingerprint'),
     )
     
-    def to_dict(self, include_relationships=True, highlight_query=None):
+    @property
+    def original_context(self):
+        """原始上下文（按需解压；无法解压时记录错误并返回 None，不影响问答本身的读取）"""
+        try:
+            return get_context_codec().decode(self.context_blob)
+        except Exception as e:
+            logger.error(f"Failed to decode original_context of QA pair {self.id}: {str(e)}")
+            return None
+    
+    @original_context.setter
+    def original_context(self, value):
+        self.context_blob = get_context_codec().encode(value)
+    
+    @classmethod
+    def resolve_fields(cls, fields=None, view=None):
+        """
+        解析 fields= / view= 请求参数
+        
+        Args:
+            fields: 逗号分隔的字段列表
+            view: 预设视图名称
+            
+        Returns:
+            tuple: 字段元组；两者都为空时返回 None（返回完整字段）
+            
+        Raises:
+            ValueError: 字段或视图不存在
+        """
+        if fields:
+            selected = [f.strip() for f in fields.split(',') if f.strip()]
+            unknown = [f for f in selected if f not in cls.SPARSE_FIELDS]
+            if unknown:
+                raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+        elif view:
+            if view not in cls.FIELD_VIEWS:
+                raise ValueError(f"不支持的视图: {view}")
+            selected = list(cls.FIELD_VIEWS[view])
+        else:
+            return None
+        
+        # id 始终返回，保持请求中的字段顺序并去重
+        if 'id' not in selected:
+            selected.insert(0, 'id')
+        return tuple(dict.fromkeys(selected))
+    
+    @classmethod
+    def sparse_load_options(cls, fields):
+        """
+        按字段生成加载选项，只从数据库读取需要的列
+        
+        Args:
+            fields: resolve_fields 返回的字段元组
+            
+        Returns:
+            list: Query.options() 参数
+        """
+        from .category import Category
+        
+        column_keys = {column.key for column in cls.__table__.columns}
+        columns = [getattr(cls, f) for f in fields if f in column_keys]
+        options = []
+        
+        if 'category' in fields:
+            columns.append(cls.category_id)
+            options.append(joinedload(cls.category).load_only(Category.id, Category.name, Category.color))
+        if 'answer_preview' in fields:
+            options.append(with_expression(
+                cls.answer_preview, func.substr(cls.answer, 1, cls.ANSWER_PREVIEW_LENGTH)
+            ))
+            
+        options.insert(0, load_only(*columns))
+        return options
+    
+    def to_dict(self, include_relationships=True, highlight_query=None, include_context=False, fields=None):
         """
         转换为字典
         
         Args:
             include_relationships: 是否包含关联关系
             highlight_query: 搜索关键词，用于高亮显示
+            include_context: 是否包含原始上下文（需要解压，仅详情接口使用）
+            fields: 只返回这些字段（见 resolve_fields）
         
         Returns:
             dict: 字典表示
         """
-        data = super().to_dict(include_relationships=False)
+        if fields is not None:
+            return self._to_sparse_dict(fields, highlight_query)
+            
+        data = {}
+        for column in self.__table__.columns:
+            if column.key == 'context_blob':
+                continue
+            value = getattr(self, column.key)
+            if isinstance(value, datetime):
+                value = value.isoformat() + 'Z'
+            data[column.key] = value
+        
+        if include_context:
+            data['original_context'] = self.original_context
         
         # 包含分类信息
         if include_relationships and self.category:
@@ -63,6 +183,31 @@ class QAPair(BaseModel):
         
         return data
     
+    def _to_sparse_dict(self, fields, highlight_query=None):
+        """按字段列表转换为字典，不触发未加载列和分类统计的查询"""
+        data = {}
+        for field in fields:
+            if field == 'category':
+                category = self.category
+                data['category'] = {
+                    'id': category.id,
+                    'name': category.name,
+                    'color': category.color
+                } if category else None
+                continue
+                
+            value = getattr(self, field)
+            if isinstance(value, datetime):
+                value = value.isoformat() + 'Z'
+            data[field] = value
+            
+        if highlight_query:
+            for field in ('question', 'answer', 'answer_preview'):
+                if data.get(field):
+                    data[field] = self._highlight_text(data[field], highlight_query)
+                    
+        return data
+    
     def _highlight_text(self, text, query):
         """
         在文本中高亮显示查询关键词
@@ -163,57 +308,14 @@ class QAPair(BaseModel):
     
     @classmethod
     def get_statistics(cls):
-        """获取问答统计信息"""
-        from .category import Category
+        """
+        获取问答统计信息
+        
+        读取增量维护的统计汇总表，不再对 qa_pairs 做全表聚合
+        """
+        from app.services.stats_rollup import get_stats_rollup_service
         
-        # 总数统计（只计算高质量QA对）
-        total_qa = cls.query.filter(cls.confidence >= 0.5).count()
-        
-        # 分类统计（只计算高质量QA对）
-        category_stats = db.session.query(
-            Category.name,
-            func.count(cls.id).label('count')
-        ).outerjoin(cls, db.and_(Category.id == cls.category_id, cls.confidence >= 0.5))\
-         .group_by(Category.id).all()
-        
-        # 回答者统计（只计算高质量QA对）
-        advisor_stats = db.session.query(
-            cls.advisor,
-            func.count(cls.id).label('count')
-        ).filter(db.and_(cls.advisor.isnot(None), cls.confidence >= 0.5))\
-         .group_by(cls.advisor)\
-         .order_by(func.count(cls.id).desc())\
-         .limit(10).all()
-        
-        # 置信度统计
-        confidence_stats = db.session.query(
-            func.avg(cls.confidence).label('avg_confidence'),
-            func.min(cls.confidence).label('min_confidence'),
-            func.max(cls.confidence).label('max_confidence'),
-            func.count(db.case((cls.confidence >= 0.8, 1))).label('high_confidence'),
-            func.count(db.case((db.and_(cls.confidence >= 0.5, cls.confidence < 0.8), 1))).label('medium_confidence'),
-            func.count(db.case((cls.confidence < 0.5, 1))).label('low_confidence')
-        ).first()
-        
-        return {
-            'total_qa': total_qa,
-            'category_distribution': [
-                {'category': stat[0], 'count': stat[1]} 
-                for stat in category_stats
-            ],
-            'top_advisors': [
-                {'advisor': stat[0], 'count': stat[1]} 
-                for stat in advisor_stats if stat[0]
-            ],
-            'confidence_stats': {
-                'average': float(confidence_stats.avg_confidence or 0),
-                'minimum': float(confidence_stats.min_confidence or 0),
-                'maximum': float(confidence_stats.max_confidence or 0),
-                'high_confidence': confidence_stats.high_confidence or 0,
-                'medium_confidence': confidence_stats.medium_confidence or 0,
-                'low_confidence': confidence_stats.low_confidence or 0
-            }
-        }
+        return get_stats_rollup_service().get_qa_statistics()
     
     def __repr__(self):
         question_preview = self.question[:50] + '...' if len(self.question) > 50 else self.question
@@ -0,0 +1,72 @@
+"""
+原始问答对（待审核暂存）模型
+"""
+from datetime import datetime
+from app import db
+from .base import BaseModel
+
+
+class RawQAPair(BaseModel):
+    """
+    原始问答对模型
+    
+    未能提取出高质量问答时，相邻消息按顺序配对后暂存在这里等待人工审核，
+    审核通过后再提升到 qa_pairs。暂存表只有 (upload_id, status) 和去重指纹两个索引，
+    不参与全文索引和统计汇总。
+    """
+    __tablename__ = 'raw_qa_pairs'
+    
+    # 来源
+    upload_id = db.Column(db.Integer, db.ForeignKey('upload_history.id'), nullable=True)
+    
+    # 问答内容
+    question = db.Column(db.Text, nullable=False)
+    answer = db.Column(db.Text, nullable=False)
+    asker = db.Column(db.String(100))
+    advisor = db.Column(db.String(100))
+    
+    # 原始消息时间
+    question_timestamp = db.Column(db.String(40))
+    answer_timestamp = db.Column(db.String(40))
+    
+    # 去重指纹（见 app.utils.content_fingerprint）
+    content_fingerprint = db.Column(db.String(32))
+    
+    # 审核状态
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, approved, rejected
+    reviewed_at = db.Column(db.DateTime, nullable=True)
+    promoted_qa_id = db.Column(db.Integer, nullable=True)  # 审核通过后对应的 qa_pairs.id
+    
+    __table_args__ = (
+        db.CheckConstraint(
+            "status IN ('pending', 'approved', 'rejected')",
+            name='valid_raw_status'
+        ),
+        db.Index('idx_raw_qa_upload_status', 'upload_id', 'status'),
+        db.Index('idx_raw_qa_content_fingerprint', 'content_fingerprint'),
+    )
+    
+    def mark_reviewed(self, status, promoted_qa_id=None):
+        """标记审核结果"""
+        self.status = status
+        self.reviewed_at = datetime.utcnow()
+        self.promoted_qa_id = promoted_qa_id
+    
+    @classmethod
+    def get_fingerprints(cls):
+        """获取暂存表中所有去重指纹"""
+        rows = db.session.query(cls.content_fingerprint)\
+                         .filter(cls.content_fingerprint.isnot(None)).all()
+        return {row[0] for row in rows}
+    
+    @classmethod
+    def get_pending(cls, upload_id=None, page=1, per_page=20):
+        """分页获取待审核记录"""
+        query = cls.query.filter_by(status='pending')
+        if upload_id is not None:
+            query = query.filter_by(upload_id=upload_id)
+        return query.order_by(cls.id).paginate(page=page, per_page=per_page, error_out=False)
+    
+    def __repr__(self):
+        question_preview = self.question[:50] + '...' if len(self.question) > 50 else self.question
+        return f'<RawQAPair {self.id}: {question_preview} ({self.status})>'
@@ -0,0 +1,87 @@
+"""
+统计汇总（rollup）模型
+
+仪表盘统计不再直接对 qa_pairs / upload_history 做全表聚合，而是读取这些
+按维度预先汇总的计数表。计数表在入库、编辑、删除时增量更新，并由
+StatsRollupService.reconcile() 定期全量校准。
+"""
+from datetime import datetime
+from app import db
+
+
+# 高质量问答的置信度阈值（与原统计口径一致）
+QUALITY_THRESHOLD = 0.5
+
+# 未分类问答在汇总表中的分类键（主键列不能为NULL）
+UNCATEGORIZED_ID = 0
+
+
+class CategoryStats(db.Model):
+    """按分类汇总的问答数量"""
+    __tablename__ = 'stats_category'
+    
+    category_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    qa_count = db.Column(db.Integer, default=0, nullable=False)  # 全部问答
+    quality_count = db.Column(db.Integer, default=0, nullable=False)  # 置信度 >= QUALITY_THRESHOLD
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class AdvisorStats(db.Model):
+    """按回答者汇总的问答数量"""
+    __tablename__ = 'stats_advisor'
+    
+    advisor = db.Column(db.String(100), primary_key=True)
+    qa_count = db.Column(db.Integer, default=0, nullable=False)
+    quality_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_stats_advisor_quality', 'quality_count'),
+    )
+
+
+class ConfidenceStats(db.Model):
+    """按来源类型和置信度区间（0.1 宽度，共 11 档）汇总"""
+    __tablename__ = 'stats_confidence'
+    
+    source_kind = db.Column(db.String(10), primary_key=True)  # rule, raw, ai
+    bucket = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0-10
+    qa_count = db.Column(db.Integer, default=0, nullable=False)
+    confidence_sum = db.Column(db.Float, default=0.0, nullable=False)
+    # 区间内的最小/最大值；删除时不回退，由 reconcile 校准
+    confidence_min = db.Column(db.Float, nullable=True)
+    confidence_max = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DailyStats(db.Model):
+    """按天汇总的问答与上传数量"""
+    __tablename__ = 'stats_daily'
+    
+    day = db.Column(db.String(10), primary_key=True)  # YYYY-MM-DD (UTC)
+    qa_count = db.Column(db.Integer, default=0, nullable=False)
+    quality_count = db.Column(db.Integer, default=0, nullable=False)
+    upload_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UploadStatusStats(db.Model):
+    """按上传状态汇总"""
+    __tablename__ = 'stats_upload_status'
+    
+    status = db.Column(db.String(20), primary_key=True)
+    upload_count = db.Column(db.Integer, default=0, nullable=False)
+    qa_total = db.Column(db.Integer, default=0, nullable=False)
+    processing_time_sum = db.Column(db.Float, default=0.0, nullable=False)
+    processing_time_count = db.Column(db.Integer, default=0, nullable=False)
+    file_size_sum = db.Column(db.BigInteger, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class StatsState(db.Model):
+    """汇总表元信息（最近一次全量校准时间等）"""
+    __tablename__ = 'stats_state'
+    
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(255))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
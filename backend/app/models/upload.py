@@ -1,6 +1,7 @@
 """
 上传历史模型
 """
+import json
 from datetime import datetime
 from app import db
 from .base import BaseModel
@@ -13,7 +14,9 @@ class UploadHistory(BaseModel):
     # 文件信息
     filename = db.Column(db.String(255), nullable=False)  # 存储文件名
     file_size = db.Column(db.BigInteger, nullable=True)  # 文件大小（字节）
-    file_hash = db.Column(db.String(32), nullable=True)  # MD5文件哈希，用于去重
+    file_hash = db.Column(db.String(32), nullable=True)  # MD5文件哈希（旧记录去重；没有旧记录后不再计算）
+    content_hash = db.Column(db.String(48), nullable=True)  # 带算法前缀的文件哈希（xxh128/blake2b），用于去重
+    sample_hash = db.Column(db.String(48), nullable=True)  # 文件大小+开头64KB的哈希，用于提前发现疑似重复
     
     # 处理状态
     status = db.Column(db.String(20), default='pending', nullable=False)  # pending, processing, completed, failed
@@ -22,6 +25,7 @@ class UploadHistory(BaseModel):
     qa_count = db.Column(db.Integer, nullable=True)  # 提取的问答对数量
     processing_time = db.Column(db.Float, nullable=True)  # 处理时间（秒）
     error_message = db.Column(db.Text, nullable=True)  # 错误消息
+    ingest_checkpoint = db.Column(db.Text, nullable=True)  # 入库进度检查点（JSON，见 services/ingest_checkpoint.py）
     
     # 处理时间
     uploaded_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
@@ -41,11 +45,23 @@ class UploadHistory(BaseModel):
         db.Index('idx_upload_status', 'status'),
         db.Index('idx_upload_uploaded_at', 'uploaded_at'),
         db.Index('idx_upload_hash', 'file_hash'),
+        db.Index('idx_upload_content_hash', 'content_hash'),
+        db.Index('idx_upload_sample_hash', 'file_size', 'sample_hash'),
     )
     
+    def get_ingest_checkpoint(self):
+        """解析入库进度检查点，没有或无法解析时返回 None"""
+        if not self.ingest_checkpoint:
+            return None
+        try:
+            return json.loads(self.ingest_checkpoint)
+        except ValueError:
+            return None
+    
     def to_dict(self, include_relationships=False):
         """转换为字典"""
         data = super().to_dict(include_relationships=False)
+        data['ingest_checkpoint'] = self.get_ingest_checkpoint()
         return data
     
     def __repr__(self):
@@ -0,0 +1,41 @@
+"""
+聊天水位线模型
+"""
+from app import db
+from .base import BaseModel
+
+
+class ChatWatermark(BaseModel):
+    """
+    聊天水位线模型
+    
+    同一个群/联系人（chatlog 导出中的 talker）每周重新导出时包含全部历史消息。
+    这里记录每个聊天已处理到的最新消息时间和 seq，再次上传时在提取前跳过水位线
+    之前的消息（保留答案时间窗口内的回看消息），处理量只与新增消息有关。
+    """
+    __tablename__ = 'chat_watermarks'
+    
+    talker = db.Column(db.String(255), nullable=False, unique=True)  # 群聊或联系人ID
+    talker_name = db.Column(db.String(255), nullable=True)
+    
+    # 已处理到的位置
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    last_seq = db.Column(db.BigInteger, nullable=True)  # chatlog 消息序号，导出中没有时为空
+    
+    # 累计处理的新消息数和最近一次推进水位线的上传
+    message_count = db.Column(db.Integer, default=0, nullable=False)
+    upload_id = db.Column(db.Integer, db.ForeignKey('upload_history.id'), nullable=True)
+    
+    def advance(self, timestamp, seq, new_messages, upload_id, talker_name=None):
+        """推进水位线（只前进不后退）"""
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+        if seq is not None and (self.last_seq is None or seq > self.last_seq):
+            self.last_seq = seq
+        self.message_count = (self.message_count or 0) + new_messages
+        self.upload_id = upload_id
+        if talker_name:
+            self.talker_name = talker_name
+    
+    def __repr__(self):
+        return f'<ChatWatermark {self.talker}: {self.last_timestamp} (seq {self.last_seq})>'
@@ -6,8 +6,9 @@ import logging
 from datetime import datetime, timedelta
 from flask import Blueprint, jsonify, request
 from app import db
-from app.models import QAPair, Category, UploadHistory
+from app.models import QAPair, Category, UploadHistory, MessageArchiveSegment
 from app.services.search_service import SearchService
+from app.services.stats_rollup import get_stats_rollup_service
 
 logger = logging.getLogger(__name__)
 admin_bp = Blueprint('admin', __name__)
@@ -89,6 +90,212 @@ def rebuild_search_index():
         }), 500
 
 
+@admin_bp.route('/stats/reconcile', methods=['POST'])
+def reconcile_stats():
+    """全量校准统计汇总表"""
+    try:
+        result = get_stats_rollup_service().reconcile()
+        
+        return jsonify({
+            'success': True,
+            'data': result,
+            'message': '统计汇总表校准完成'
+        })
+        
+    except Exception as e:
+        logger.error(f"Reconcile stats error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'RECONCILE_ERROR',
+                'message': '统计汇总表校准失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@admin_bp.route('/archive')
+def get_archive_stats():
+    """消息归档统计"""
+    try:
+        from app.services.message_archive import get_archive_stats as archive_stats
+        
+        return jsonify({
+            'success': True,
+            'data': archive_stats(),
+            'message': '获取消息归档统计成功'
+        })
+        
+    except Exception as e:
+        logger.error(f"Get archive stats error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'ARCHIVE_ERROR',
+                'message': '获取消息归档统计失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@admin_bp.route('/reextract', methods=['POST'])
+def start_reextraction():
+    """
+    从消息归档重新提取问答对
+    
+    请求体（均可选）：upload_ids 上传记录ID列表（默认全部有归档的上传），
+    apply 保存新增的问答对（默认只比较），prune 同时删除不再提取出的问答对（需要 apply）
+    """
+    try:
+        from flask import current_app
+        from app.services.reextraction import get_reextraction_service
+        
+        data = request.get_json(silent=True) or {}
+        upload_ids = data.get('upload_ids')
+        if upload_ids is not None and (
+            not isinstance(upload_ids, list) or
+            not all(isinstance(i, int) and not isinstance(i, bool) for i in upload_ids)
+        ):
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'INVALID_UPLOAD_IDS',
+                    'message': 'upload_ids 必须是上传记录ID列表'
+                }
+            }), 400
+            
+        service = get_reextraction_service()
+        job, created = service.create_job(upload_ids, apply=bool(data.get('apply')), prune=bool(data.get('prune')))
+        if not created:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'REEXTRACT_IN_PROGRESS',
+                    'message': '已有重新提取任务在进行',
+                    'details': job.to_dict()
+                }
+            }), 409
+        service.submit(current_app._get_current_object(), job)
+        
+        return jsonify({
+            'success': True,
+            'data': job.to_dict(),
+            'message': '重新提取任务已提交'
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Start reextraction error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'REEXTRACT_ERROR',
+                'message': '提交重新提取任务失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@admin_bp.route('/reextract/<job_id>')
+def get_reextraction(job_id):
+    """查询重新提取任务"""
+    from app.services.reextraction import get_reextraction_service
+    
+    job = get_reextraction_service().get_job(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'JOB_NOT_FOUND',
+                'message': '重新提取任务不存在'
+            }
+        }), 404
+        
+    return jsonify({
+        'success': True,
+        'data': job.to_dict(),
+        'message': '获取重新提取任务成功'
+    })
+
+
+@admin_bp.route('/reclassify', methods=['POST'])
+def start_reclassification():
+    """
+    按当前分类规则重新分类已入库的问答对
+    
+    请求体（均可选）：batch_size 每批问答对数，workers 分类进程数，include_ai 是否包含 AI 处理的问答对
+    """
+    try:
+        from flask import current_app
+        from app.services.reclassification import get_reclassification_service
+        
+        data = request.get_json(silent=True) or {}
+        try:
+            batch_size = int(data.get('batch_size') or current_app.config.get('RECLASSIFY_BATCH_SIZE', 2000))
+            workers = int(data.get('workers') or current_app.config.get('RECLASSIFY_WORKERS') or 0)
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'INVALID_PARAMETERS',
+                    'message': 'batch_size 和 workers 必须是整数'
+                }
+            }), 400
+            
+        service = get_reclassification_service()
+        job, created = service.create_job(
+            min(max(batch_size, 100), 10000), workers or None, include_ai=bool(data.get('include_ai'))
+        )
+        if not created:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'RECLASSIFY_IN_PROGRESS',
+                    'message': '已有重新分类任务在进行',
+                    'details': job.to_dict()
+                }
+            }), 409
+        service.submit(current_app._get_current_object(), job)
+        
+        return jsonify({
+            'success': True,
+            'data': job.to_dict(),
+            'message': '重新分类任务已提交'
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Start reclassification error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'RECLASSIFY_ERROR',
+                'message': '提交重新分类任务失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@admin_bp.route('/reclassify/<job_id>')
+def get_reclassification(job_id):
+    """查询重新分类任务"""
+    from app.services.reclassification import get_reclassification_service
+    
+    job = get_reclassification_service().get_job(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'JOB_NOT_FOUND',
+                'message': '重新分类任务不存在'
+            }
+        }), 404
+        
+    return jsonify({
+        'success': True,
+        'data': job.to_dict(),
+        'message': '获取重新分类任务成功'
+    })
+
+
 @admin_bp.route('/health')
 def system_health():
     """系统健康检查"""
@@ -240,6 +447,10 @@ def cleanup_system():
                 UploadHistory.created_at < cutoff_date
             )
             failed_count = failed_uploads.count()
+            MessageArchiveSegment.query.filter(
+                MessageArchiveSegment.upload_id.in_(failed_uploads.with_entities(UploadHistory.id))
+            ).delete(synchronize_session=False)
+            get_stats_rollup_service().record_upload_bulk_delete(failed_uploads)
             failed_uploads.delete()
             
             result['cleaned_items']['failed_uploads'] = failed_count
@@ -276,44 +487,9 @@ def cleanup_system():
 
 
 def _get_upload_statistics():
-    """获取上传统计"""
+    """获取上传统计（读取统计汇总表）"""
     try:
-        from sqlalchemy import func
-        
-        # 基础统计
-        total_uploads = UploadHistory.query.count()
-        
-        # 按状态统计
-        status_stats = db.session.query(
-            UploadHistory.status,
-            func.count(UploadHistory.id).label('count')
-        ).group_by(UploadHistory.status).all()
-        
-        # 最近7天统计
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        recent_uploads = UploadHistory.query.filter(
-            UploadHistory.uploaded_at >= week_ago
-        ).count()
-        
-        # 成功上传统计
-        successful_stats = db.session.query(
-            func.sum(UploadHistory.qa_count).label('total_qa'),
-            func.avg(UploadHistory.processing_time).label('avg_time'),
-            func.sum(UploadHistory.file_size).label('total_size')
-        ).filter(UploadHistory.status == 'completed').first()
-        
-        return {
-            'total_uploads': total_uploads,
-            'recent_uploads_7d': recent_uploads,
-            'status_distribution': {
-                stat[0]: stat[1] for stat in status_stats
-            },
-            'successful_processing': {
-                'total_qa_extracted': successful_stats.total_qa or 0,
-                'avg_processing_time': round(successful_stats.avg_time or 0, 2),
-                'total_file_size_mb': round((successful_stats.total_size or 0) / (1024 * 1024), 2)
-            }
-        }
+        return get_stats_rollup_service().get_upload_statistics()
         
     except Exception as e:
         logger.error(f"Failed to get upload statistics: {str(e)}")
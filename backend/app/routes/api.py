@@ -2,6 +2,7 @@
 API基础路由
 """
 from flask import Blueprint, jsonify, request
+from sqlalchemy.orm import undefer
 from datetime import datetime
 from app import db
 from app.models import Category, QAPair
@@ -37,6 +38,7 @@ def api_info():
                 'search': '/api/v1/search/*',
                 'qa': '/api/v1/qa/*',
                 'categories': '/api/v1/categories/*',
+                'review': '/api/v1/review/*',
                 'admin': '/api/v1/admin/*'
             }
         },
@@ -74,7 +76,22 @@ def get_qa_pairs():
         limit = request.args.get('limit', type=int)
         confidence_min = request.args.get('confidence_min', type=float)
         
+        # 稀疏字段：fields=id,question,... 或 view=list
+        try:
+            fields = QAPair.resolve_fields(request.args.get('fields'), request.args.get('view'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'INVALID_PARAMETERS',
+                    'message': '字段参数无效',
+                    'details': str(e)
+                }
+            }), 400
+            
         query = QAPair.query
+        if fields:
+            query = query.options(*QAPair.sparse_load_options(fields))
         
         # 添加置信度过滤
         if confidence_min is not None:
@@ -86,7 +103,7 @@ def get_qa_pairs():
             qas = query.limit(limit).all()
             return jsonify({
                 'success': True,
-                'data': [qa.to_dict(include_relationships=True) for qa in qas],
+                'data': [qa.to_dict(include_relationships=True, fields=fields) for qa in qas],
                 'total': query.count(),
                 'message': '问答获取成功'
             })
@@ -99,7 +116,7 @@ def get_qa_pairs():
             
             return jsonify({
                 'success': True,
-                'data': [qa.to_dict(include_relationships=True) for qa in pagination.items],
+                'data': [qa.to_dict(include_relationships=True, fields=fields) for qa in pagination.items],
                 'pagination': {
                     'page': pagination.page,
                     'per_page': pagination.per_page,
@@ -125,10 +142,10 @@ def get_qa_pairs():
 def get_qa_detail(qa_id):
     """获取问答详情"""
     try:
-        qa = QAPair.query.get_or_404(qa_id)
+        qa = QAPair.query.options(undefer(QAPair.context_blob)).get_or_404(qa_id)
         return jsonify({
             'success': True,
-            'data': qa.to_dict(include_relationships=True),
+            'data': qa.to_dict(include_relationships=True, include_context=True),
             'message': '问答详情获取成功'
         })
     except Exception as e:
@@ -139,4 +156,126 @@ def get_qa_detail(qa_id):
                 'message': '问答不存在',
                 'details': str(e)
             }
-        }), 404
\ No newline at end of file
+        }), 404
+
+@api_bp.route('/review')
+def get_review_queue():
+    """获取待审核的原始问答（暂存表，不在 /qa 和搜索结果中出现）"""
+    try:
+        from app.services.review_service import get_review_service
+        
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+        upload_id = request.args.get('upload_id', type=int)
+        status = request.args.get('status', 'pending')
+        query = request.args.get('q', '').strip()
+        
+        review_service = get_review_service()
+        pagination = review_service.list_raw_pairs(
+            upload_id=upload_id,
+            status=status,
+            query=query or None,
+            page=page,
+            per_page=min(per_page, 100)
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': [raw.to_dict() for raw in pagination.items],
+            'pagination': {
+                'page': pagination.page,
+                'per_page': pagination.per_page,
+                'total': pagination.total,
+                'pages': pagination.pages
+            },
+            'stats': review_service.get_review_stats(upload_id),
+            'message': '待审核问答获取成功'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'DATABASE_ERROR',
+                'message': '获取待审核问答失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@api_bp.route('/review/approve', methods=['POST'])
+def approve_raw_pairs():
+    """审核通过，将原始问答提升为正式问答"""
+    try:
+        from app.services.review_service import get_review_service
+        
+        data = request.get_json() or {}
+        raw_ids = data.get('ids') or []
+        if not raw_ids:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'INVALID_PARAMETERS',
+                    'message': '缺少要审核的记录ID',
+                    'details': 'ids 不能为空'
+                }
+            }), 400
+        
+        result = get_review_service().approve(
+            raw_ids,
+            category_id=data.get('category_id'),
+            confidence=data.get('confidence')
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': result,
+            'message': f'已通过 {result["approved"]} 条问答'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'REVIEW_ERROR',
+                'message': '审核失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@api_bp.route('/review/reject', methods=['POST'])
+def reject_raw_pairs():
+    """审核拒绝原始问答"""
+    try:
+        from app.services.review_service import get_review_service
+        
+        data = request.get_json() or {}
+        raw_ids = data.get('ids') or []
+        if not raw_ids:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'INVALID_PARAMETERS',
+                    'message': '缺少要审核的记录ID',
+                    'details': 'ids 不能为空'
+                }
+            }), 400
+        
+        result = get_review_service().reject(raw_ids)
+        
+        return jsonify({
+            'success': True,
+            'data': result,
+            'message': f'已拒绝 {result["rejected"]} 条问答'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'REVIEW_ERROR',
+                'message': '审核失败',
+                'details': str(e)
+            }
+        }), 500
@@ -3,6 +3,7 @@
 """
 import logging
 from flask import Blueprint, jsonify, request
+from app.models import QAPair
 from app.services.search_service import SearchService
 
 logger = logging.getLogger(__name__)
@@ -31,6 +32,19 @@ def search_qa():
         if sort_by not in ['relevance', 'time', 'confidence']:
             sort_by = 'relevance'
         
+        # 稀疏字段：fields=id,question,... 或 view=list
+        try:
+            fields = QAPair.resolve_fields(request.args.get('fields'), request.args.get('view'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'INVALID_PARAMETERS',
+                    'message': '字段参数无效',
+                    'details': str(e)
+                }
+            }), 400
+        
         # 执行搜索
         search_service = SearchService()
         result = search_service.search(
@@ -39,12 +53,13 @@ def search_qa():
             advisor=advisor,
             page=page,
             per_page=per_page,
-            sort_by=sort_by
+            sort_by=sort_by,
+            fields=fields
         )
         
         return jsonify({
             'success': True,
-            'data': [qa.to_dict(include_relationships=True, highlight_query=query) 
+            'data': [qa.to_dict(include_relationships=True, highlight_query=query, fields=fields) 
                     for qa in result.qa_pairs],
             'pagination': {
                 'page': result.page,
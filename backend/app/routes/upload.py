@@ -1,19 +1,25 @@
 """
 文件上传相关路由 - 支持异步处理和实时状态更新
 """
-from flask import Blueprint, jsonify, request, current_app
-from werkzeug.utils import secure_filename
+from flask import Blueprint, jsonify, request, current_app, url_for
 import os
+import uuid
 import logging
 from datetime import datetime
 from pathlib import Path
 from app import db
-from app.models import UploadHistory
+from app.models import UploadHistory, ChatWatermark
 from app.services import FileProcessor
 from app.services.ai_file_processor import AIFileProcessor
 from app.services.intelligent_file_processor import intelligent_file_processor
 from app.services.task_queue import get_file_processing_service, TaskPriority
 from app.services.websocket_service import get_websocket_manager
+from app.services.chunked_upload import get_chunked_upload_service, ChunkedUploadError
+from app.services.batch_upload import get_batch_upload_service
+from app.services.upload_preview import get_upload_preview_service
+from app.services.chatlog_sync import get_chatlog_sync_service
+from app.utils.compressed_input import DecompressedSizeError, get_upload_suffix, secure_upload_name
+from app.utils.file_hash import CONTENT_HASH_ALGORITHM, save_stream
 
 logger = logging.getLogger(__name__)
 upload_bp = Blueprint('upload', __name__)
@@ -21,7 +27,14 @@ upload_bp = Blueprint('upload', __name__)
 
 @upload_bp.route('/file', methods=['POST'])
 def upload_file():
-    """上传并处理微信聊天记录JSON文件"""
+    """
+    上传微信聊天记录JSON文件
+    
+    支持 .json、.json.gz、.json.zst 和包含多个聊天的 .zip，压缩文件在处理时边解压边解析。
+    默认保存文件后提交后台处理，立即返回 202 和 upload_id/task_id，
+    处理进度通过 /status/<upload_id>、/task/<task_id>/status 或 WebSocket 获取。
+    ?wait=true 时对小文件保持原来的同步处理方式。
+    """
     try:
         # 检查文件
         if 'file' not in request.files:
@@ -47,7 +60,7 @@ def upload_file():
         
         # 保存上传的文件
         original_filename = file.filename
-        filename = secure_filename(original_filename)
+        filename = secure_upload_name(original_filename)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"{timestamp}_{filename}"
         
@@ -55,115 +68,605 @@ def upload_file():
         upload_folder.mkdir(exist_ok=True)
         file_path = upload_folder / filename
         
-        # 保存文件
-        file.save(str(file_path))
-        logger.info(f"File saved: {file_path}")
-        
-        # 强制调试输出
-        print(f"[UPLOAD-DEBUG] File received: {original_filename}")
-        print(f"[UPLOAD-DEBUG] File size: {file_path.stat().st_size} bytes")
-        print(f"[UPLOAD-DEBUG] Saved to: {file_path}")
-        
-        # 调试：备份前端发送的文件用于分析
-        debug_path = file_path.parent / f"debug_{filename}"
-        try:
-            import shutil
-            shutil.copy2(file_path, debug_path)
-            print(f"[UPLOAD-DEBUG] Debug copy saved: {debug_path}")
-            logger.info(f"Debug copy saved: {debug_path}")
-        except Exception as e:
-            print(f"[UPLOAD-DEBUG] Failed to create debug copy: {e}")
+        # 保存文件，写盘的同时计算哈希（处理时不再重新读取文件）
+        hashes = save_stream(file.stream, file_path, legacy_md5=FileProcessor().needs_legacy_md5())
+        file_size = hashes.size
+        logger.info(f"File saved: {file_path} ({file_size} bytes)")
         
         # 获取处理选项
         use_ai = request.form.get('use_ai', 'true').lower() == 'true'
         processing_mode = request.form.get('processing_mode', 'standard')  # 'standard' 或 'intelligent'
+        wait = request.args.get('wait', request.form.get('wait', 'false')).lower() == 'true'
         
-        # 选择处理器
-        if processing_mode == 'intelligent':
-            # 使用新的智能处理器
-            import asyncio
-            result_obj = asyncio.run(intelligent_file_processor.process_file_intelligently(
-                file_path, original_filename, force_ai=use_ai
-            ))
+        # 先创建上传记录，客户端凭 upload_id 查询进度
+        upload_record = UploadHistory(
+            filename=original_filename,
+            file_size=file_size,
+            file_hash=hashes.md5,
+            content_hash=hashes.content_hash,
+            sample_hash=hashes.sample_hash,
+            status='pending',
+            uploaded_at=datetime.utcnow()
+        )
+        db.session.add(upload_record)
+        db.session.commit()
+        
+        file_processing_service = get_file_processing_service()
+        
+        # 兼容模式：小文件在请求内同步处理
+        if wait and file_size <= current_app.config.get('UPLOAD_SYNC_MAX_SIZE', 5 * 1024 * 1024):
+            result = file_processing_service.run_upload(
+                file_path, original_filename, upload_record, use_ai, processing_mode
+            )
             
-            # 转换为兼容格式
-            result = {
-                'success': result_obj.success,
-                'upload_id': result_obj.upload_id,
-                'total_extracted': result_obj.qa_pairs_extracted,
-                'total_saved': result_obj.final_knowledge_entries,
-                'processing_time': result_obj.processing_time,
-                'processing_method': result_obj.processing_method,
-                'ai_enabled': result_obj.ai_enabled,
-                'statistics': {
-                    'original_messages': result_obj.original_messages,
-                    'useful_messages': result_obj.useful_messages,
-                    'noise_filtered': result_obj.noise_filtered,
-                    'extraction_efficiency': result_obj.extraction_efficiency,
-                    'content_improvement_rate': result_obj.content_improvement_rate,
-                    'ai_provider_used': result_obj.ai_provider_used,
-                    'tokens_consumed': result_obj.tokens_consumed,
-                    'processing_cost': result_obj.processing_cost
-                },
-                'message': f'智能处理完成! 从{result_obj.original_messages}条消息中生成{result_obj.final_knowledge_entries}个高质量知识库条目',
-                'error': result_obj.error_message
-            }
-        elif use_ai:
-            processor = AIFileProcessor()
-            result = processor.process_file_async_with_ai(file_path, original_filename, use_ai=True)
-        else:
-            processor = FileProcessor()
-            result = processor.process_file_async(file_path, original_filename)
+            if result['success']:
+                return jsonify({
+                    'success': True,
+                    'data': {
+                        'upload_id': result['upload_id'],
+                        'filename': original_filename,
+                        'total_extracted': result.get('total_extracted', 0),
+                        'total_saved': result.get('total_saved', 0),
+                        'processing_time': result.get('processing_time', 0),
+                        'statistics': result.get('statistics', {})
+                    },
+                    'message': result.get('message', '文件处理完成')
+                }), 200
+            else:
+                return jsonify({
+                    'success': False,
+                    'error': {
+                        'code': 'PROCESSING_ERROR',
+                        'message': '文件处理失败',
+                        'details': result.get('error', '未知错误')
+                    }
+                }), 400
         
-        # 清理临时文件（仅在成功时清理）
+        # 提交到后台任务队列
+        task_id = file_processing_service.process_upload(
+            current_app._get_current_object(), upload_record.id, file_path, original_filename,
+            use_ai=use_ai, processing_mode=processing_mode,
+            timeout=current_app.config.get('UPLOAD_TASK_TIMEOUT', 1800)
+        )
+        status_url = url_for('upload.get_upload_status', upload_id=upload_record.id)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'upload_id': upload_record.id,
+                'task_id': task_id,
+                'filename': original_filename,
+                'status': upload_record.status,
+                'status_url': status_url
+            },
+            'websocket_info': {
+                'subscribe_event': 'subscribe_task',
+                'task_id': task_id,
+                'status_event': 'task_status_update'
+            },
+            'message': '文件已上传，正在后台处理'
+        }), 202, {'Location': status_url}
+            
+    except Exception as e:
+        logger.error(f"Upload file error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'UPLOAD_ERROR',
+                'message': '文件上传失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+def _chunked_upload_error(error: ChunkedUploadError):
+    """分块上传错误响应"""
+    return jsonify({
+        'success': False,
+        'error': {
+            'code': error.code,
+            'message': error.message,
+            'details': error.details
+        }
+    }), error.status
+
+
+@upload_bp.route('/chunked', methods=['POST'])
+def init_chunked_upload():
+    """
+    创建分块上传会话（用于超过单次请求大小限制的导出文件）
+    
+    请求体: {"filename": "...", "total_size": 字节数, "md5": 是否要在 finalize 时用 MD5 校验（可选）}
+    之后按 offset 依次 PUT /chunked/<upload_token>?offset=N 上传分块，
+    断线后 GET /chunked/<upload_token> 查询 received 并从该位置继续，
+    全部上传后 POST /chunked/<upload_token>/finalize 开始处理。
+    分块响应中出现 probable_duplicate_of 时说明已有大小和开头内容相同的上传，可以取消。
+    """
+    try:
+        data = request.get_json(silent=True) or {}
         try:
-            if result['success']:
+            total_size = int(data.get('total_size', 0))
+        except (TypeError, ValueError):
+            total_size = 0
+        
+        status = get_chunked_upload_service().init_upload(
+            current_app.config['UPLOAD_FOLDER'],
+            str(data.get('filename') or ''),
+            total_size,
+            chunk_size=current_app.config.get('CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024),
+            max_size=current_app.config.get('UPLOAD_MAX_FILE_SIZE', current_app.config['MAX_CONTENT_LENGTH']),
+            legacy_md5=bool(data.get('md5')) or FileProcessor().needs_legacy_md5()
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': status,
+            'message': '上传会话已创建'
+        }), 201
+        
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+    except Exception as e:
+        logger.error(f"Init chunked upload error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'UPLOAD_ERROR',
+                'message': '创建上传会话失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@upload_bp.route('/chunked/<upload_token>', methods=['GET'])
+def get_chunked_upload_status(upload_token):
+    """查询分块上传进度（已接收字节数即续传位置）"""
+    try:
+        status = get_chunked_upload_service().get_status(current_app.config['UPLOAD_FOLDER'], upload_token)
+        
+        return jsonify({
+            'success': True,
+            'data': status,
+            'message': '状态获取成功'
+        }), 200
+        
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+    except Exception as e:
+        logger.error(f"Get chunked upload status error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'STATUS_ERROR',
+                'message': '获取上传状态失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@upload_bp.route('/chunked/<upload_token>', methods=['PUT'])
+def upload_chunk(upload_token):
+    """上传一个分块：请求体为分块的原始字节，?offset= 为其在文件中的起始位置"""
+    try:
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'MISSING_OFFSET',
+                    'message': '缺少分块位置',
+                    'details': '请通过 ?offset= 指定分块的起始字节'
+                }
+            }), 400
+        
+        status = get_chunked_upload_service().write_chunk(
+            current_app.config['UPLOAD_FOLDER'], upload_token, offset, request.stream
+        )
+        
+        # 开头部分收齐后按样本哈希提前发现疑似重复
+        if status['sample_hash']:
+            duplicate = FileProcessor().find_probable_duplicate(status['total_size'], status['sample_hash'])
+            status['probable_duplicate_of'] = duplicate.id if duplicate else None
+        
+        return jsonify({
+            'success': True,
+            'data': status,
+            'message': '分块已接收'
+        }), 200
+        
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+    except Exception as e:
+        logger.error(f"Upload chunk error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'UPLOAD_ERROR',
+                'message': '分块上传失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@upload_bp.route('/chunked/<upload_token>/finalize', methods=['POST'])
+def finalize_chunked_upload(upload_token):
+    """
+    完成分块上传并提交后台处理
+    
+    请求体（可选）: {"content_hash": 与服务端算法一致的哈希（如 "xxh128:..."）, "md5": 客户端计算的MD5,
+                    "use_ai": false, "processing_mode": "standard"}
+    md5 校验需要在 init 时声明（会话状态中 md5 为 true），接收过程中才会计算 MD5。
+    大文件默认不使用AI，由标准处理器按流式方式读取。
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        upload_folder = Path(current_app.config['UPLOAD_FOLDER'])
+        chunked_service = get_chunked_upload_service()
+        
+        status = chunked_service.get_status(upload_folder, upload_token)
+        if data.get('md5') and not status['md5']:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'MD5_NOT_TRACKED',
+                    'message': '该上传会话没有计算MD5，请使用 content_hash 校验或在创建会话时指定 md5',
+                    'details': {'content_hash_algorithm': CONTENT_HASH_ALGORITHM}
+                }
+            }), 400
+        filename = secure_upload_name(status['filename'])
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        file_path = upload_folder / f"{timestamp}_{upload_token[:8]}_{filename}"
+        
+        upload_info = chunked_service.finalize(upload_folder, upload_token, file_path)
+        hashes = upload_info['hashes']
+        
+        # 客户端校验值：都在接收过程中算出，不再重新读取文件
+        checksums = []
+        if data.get('content_hash'):
+            checksums.append((str(data['content_hash']).lower(), hashes.content_hash))
+        if data.get('md5'):
+            checksums.append((str(data['md5']).lower(), hashes.md5))
+        for expected, actual in checksums:
+            if expected != actual:
                 file_path.unlink()
-                print(f"[UPLOAD-DEBUG] Cleaned up temp file: {file_path}")
-            else:
-                print(f"[UPLOAD-DEBUG] Keeping failed file for analysis: {file_path}")
-        except Exception as e:
-            print(f"[UPLOAD-DEBUG] Failed to clean temp file: {str(e)}")
-            logger.warning(f"Failed to remove temp file {file_path}: {str(e)}")
+                return jsonify({
+                    'success': False,
+                    'error': {
+                        'code': 'CHECKSUM_MISMATCH',
+                        'message': '文件校验失败，请重新上传',
+                        'details': {'expected': expected, 'actual': actual}
+                    }
+                }), 400
         
-        # 返回处理结果
-        if result['success']:
-            response_data = {
+        # 接收时已算出哈希，重复文件不必进入队列
+        duplicate = FileProcessor().check_duplicate_upload(hashes.md5, hashes.content_hash)
+        if duplicate:
+            file_path.unlink()
+            return jsonify({
                 'success': True,
                 'data': {
-                    'upload_id': result['upload_id'],
-                    'filename': original_filename,
-                    'total_extracted': result.get('total_extracted', 0),
-                    'total_saved': result.get('total_saved', 0),
-                    'processing_time': result.get('processing_time', 0),
-                    'statistics': result.get('statistics', {})
+                    'upload_id': duplicate.id,
+                    'duplicate_of': duplicate.id,
+                    'filename': upload_info['filename'],
+                    'qa_count': duplicate.qa_count,
+                    'status': duplicate.status
                 },
-                'message': result.get('message', '文件处理完成')
+                'message': '文件已存在，跳过处理'
+            }), 200
+        
+        upload_record = UploadHistory(
+            filename=upload_info['filename'],
+            file_size=upload_info['file_size'],
+            file_hash=hashes.md5,
+            content_hash=hashes.content_hash,
+            sample_hash=hashes.sample_hash,
+            status='pending',
+            uploaded_at=datetime.utcnow()
+        )
+        db.session.add(upload_record)
+        db.session.commit()
+        
+        use_ai = bool(data.get('use_ai', False))
+        processing_mode = data.get('processing_mode', 'standard')
+        task_id = get_file_processing_service().process_upload(
+            current_app._get_current_object(), upload_record.id, file_path, upload_info['filename'],
+            use_ai=use_ai, processing_mode=processing_mode,
+            timeout=current_app.config.get('UPLOAD_TASK_TIMEOUT', 1800)
+        )
+        status_url = url_for('upload.get_upload_status', upload_id=upload_record.id)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'upload_id': upload_record.id,
+                'task_id': task_id,
+                'filename': upload_info['filename'],
+                'file_size': upload_info['file_size'],
+                'status': upload_record.status,
+                'status_url': status_url
+            },
+            'websocket_info': {
+                'subscribe_event': 'subscribe_task',
+                'task_id': task_id,
+                'status_event': 'task_status_update'
+            },
+            'message': '文件已上传，正在后台处理'
+        }), 202, {'Location': status_url}
+        
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+    except Exception as e:
+        logger.error(f"Finalize chunked upload error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'UPLOAD_ERROR',
+                'message': '完成上传失败',
+                'details': str(e)
             }
-            
-            return jsonify(response_data), 200
+        }), 500
+
+
+@upload_bp.route('/chunked/<upload_token>', methods=['DELETE'])
+def abort_chunked_upload(upload_token):
+    """取消分块上传并删除已接收的数据"""
+    try:
+        get_chunked_upload_service().abort(current_app.config['UPLOAD_FOLDER'], upload_token)
+        
+        return jsonify({
+            'success': True,
+            'data': {'upload_token': upload_token},
+            'message': '上传已取消'
+        }), 200
+        
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+    except Exception as e:
+        logger.error(f"Abort chunked upload error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'UPLOAD_ERROR',
+                'message': '取消上传失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@upload_bp.route('/preview', methods=['POST'])
+def preview_upload():
+    """
+    抽样预览导出文件的提取结果（只在内存中处理，不写数据库）
+    
+    文件来源（二选一）：
+    - 表单字段 file：直接上传文件，只保留开头 UPLOAD_PREVIEW_MAX_BYTES 字节；
+      只上传文件开头时用 total_size 告知完整大小，用于外推
+    - upload_token：使用分块上传已接收的部分，上传完成前即可预览（zip 需要上传完整）
+    
+    可选参数：limit 抽样消息数、sample=prefix|spread（spread 在未压缩文件中等间距取 windows 个窗口）、
+    candidates 返回的候选问答数。返回候选问答、估算的消息数/问答对数和处理时间。
+    """
+    temp_path = None
+    try:
+        upload_folder = Path(current_app.config['UPLOAD_FOLDER'])
+        data = request.get_json(silent=True) or {}
+        params = {**data, **request.form.to_dict(), **request.args.to_dict()}
+        
+        def int_param(key, default, maximum):
+            try:
+                return min(max(int(params.get(key, default)), 1), maximum)
+            except (TypeError, ValueError):
+                return default
+        
+        upload_token = params.get('upload_token')
+        file = request.files.get('file')
+        if upload_token:
+            status, file_path = get_chunked_upload_service().get_part(upload_folder, str(upload_token))
+            filename = status['filename']
+            total_size = status['total_size']
+        elif file is not None and file.filename:
+            filename = file.filename
+            suffix = get_upload_suffix(filename)
+            if suffix not in current_app.config.get('ALLOWED_EXTENSIONS', {'.json'}):
+                return jsonify({
+                    'success': False,
+                    'error': {
+                        'code': 'INVALID_FILE_TYPE',
+                        'message': '不支持的文件类型',
+                        'details': f"仅支持: {', '.join(sorted(current_app.config.get('ALLOWED_EXTENSIONS', {'.json'})))}"
+                    }
+                }), 400
+                
+            preview_folder = upload_folder / 'preview'
+            preview_folder.mkdir(parents=True, exist_ok=True)
+            temp_path = preview_folder / f"{uuid.uuid4().hex}{suffix}"
+            max_bytes = current_app.config.get('UPLOAD_PREVIEW_MAX_BYTES', 16 * 1024 * 1024)
+            with open(temp_path, 'wb') as f:
+                remaining = max_bytes
+                while remaining > 0:
+                    chunk = file.stream.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    remaining -= len(chunk)
+                truncated = remaining == 0 and bool(file.stream.read(1))
+            file_path = temp_path
+            try:
+                total_size = int(params['total_size']) if params.get('total_size') else None
+            except (TypeError, ValueError):
+                total_size = None
+            if total_size is None and truncated:
+                total_size = request.content_length
         else:
             return jsonify({
                 'success': False,
                 'error': {
-                    'code': 'PROCESSING_ERROR',
-                    'message': '文件处理失败',
-                    'details': result.get('error', '未知错误')
+                    'code': 'NO_FILE',
+                    'message': '未选择文件',
+                    'details': '请上传文件或提供分块上传的 upload_token'
                 }
             }), 400
-            
+        
+        preview_service = get_upload_preview_service()
+        max_messages = current_app.config.get('UPLOAD_PREVIEW_MESSAGES', 2000)
+        result = preview_service.preview(
+            file_path,
+            filename=filename,
+            total_size=total_size,
+            limit=int_param('limit', max_messages, max_messages * 10),
+            sample=str(params.get('sample', 'prefix')),
+            windows=int_param('windows', 5, 20),
+            time_budget=current_app.config.get('UPLOAD_PREVIEW_TIME_BUDGET', 0.8),
+            candidate_limit=int_param('candidates', 20, 100),
+            max_decompressed=current_app.config.get('UPLOAD_MAX_DECOMPRESSED_SIZE'),
+            watermark_filter=preview_service.load_watermark_filter(
+                current_app.config.get('INCREMENTAL_INGEST', True)
+            )
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': result,
+            'message': '预览完成'
+        }), 200
+        
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'PREVIEW_ERROR',
+                'message': '无法预览该文件',
+                'details': str(e)
+            }
+        }), 400
     except Exception as e:
-        logger.error(f"Upload file error: {str(e)}")
+        logger.error(f"Preview upload error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'PREVIEW_ERROR',
+                'message': '文件预览失败',
+                'details': str(e)
+            }
+        }), 500
+    finally:
+        if temp_path is not None:
+            temp_path.unlink(missing_ok=True)
+
+
+@upload_bp.route('/batch', methods=['POST'])
+def upload_batch():
+    """
+    批量上传多个聊天导出文件
+    
+    表单字段 files 可包含多个 JSON 文件或 zip 压缩包（每个 .json 成员作为一个文件），
+    可选 concurrency 指定同时处理的文件数（不超过 BATCH_UPLOAD_CONCURRENCY）。
+    文件保存后作为一个批次提交后台处理，同一批次共用去重索引和分类缓存；返回 202 和 batch_id，
+    整体进度和每个文件的状态通过 /batch/<batch_id> 查询。
+    请求体受 MAX_CONTENT_LENGTH 限制，文件很多时分几次上传或打包为 zip。
+    """
+    try:
+        uploads = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+        if not uploads:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'NO_FILE',
+                    'message': '未选择文件',
+                    'details': '请选择要上传的JSON文件或zip压缩包'
+                }
+            }), 400
+        
+        max_files = current_app.config.get('BATCH_UPLOAD_MAX_FILES', 200)
+        if len(uploads) > max_files:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'TOO_MANY_FILES',
+                    'message': f'一次最多上传{max_files}个文件',
+                    'details': {'file_count': len(uploads)}
+                }
+            }), 400
+        
+        max_concurrency = current_app.config.get('BATCH_UPLOAD_CONCURRENCY', 3)
+        concurrency = min(max(request.form.get('concurrency', max_concurrency, type=int), 1), max_concurrency)
+        
+        upload_folder = Path(current_app.config['UPLOAD_FOLDER'])
+        upload_folder.mkdir(exist_ok=True)
+        
+        batch_service = get_batch_upload_service()
+        files = batch_service.stage_files(((f.filename, f.stream) for f in uploads), upload_folder, max_files)
+        batch = batch_service.create_batch(files, concurrency)
+        if batch.status == 'completed':
+            return jsonify({
+                'success': True,
+                'data': batch.to_dict(),
+                'message': '没有需要处理的新文件'
+            }), 200
+        
+        # 超时按每个文件的处理超时和需要的轮数估算
+        queued_count = sum(1 for item in files if item.status == 'queued')
+        rounds = (queued_count + batch.concurrency - 1) // batch.concurrency
+        task_id = batch_service.submit(
+            current_app._get_current_object(), batch,
+            timeout=current_app.config.get('UPLOAD_TASK_TIMEOUT', 1800) * rounds
+        )
+        status_url = url_for('upload.get_batch_status', batch_id=batch.batch_id)
+        
+        return jsonify({
+            'success': True,
+            'data': dict(batch.to_dict(), status_url=status_url),
+            'websocket_info': {
+                'subscribe_event': 'subscribe_task',
+                'task_id': task_id,
+                'status_event': 'task_status_update'
+            },
+            'message': f'{queued_count}个文件已提交后台处理'
+        }), 202, {'Location': status_url}
+        
+    except DecompressedSizeError as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'DECOMPRESSED_TOO_LARGE',
+                'message': '压缩包解压后的总大小超过限制，整个批次未保存',
+                'details': str(e)
+            }
+        }), 413
+    except Exception as e:
+        logger.error(f"Batch upload error: {str(e)}")
         return jsonify({
             'success': False,
             'error': {
                 'code': 'UPLOAD_ERROR',
-                'message': '文件上传失败',
+                'message': '批量上传失败',
                 'details': str(e)
             }
         }), 500
 
 
+@upload_bp.route('/batch/<batch_id>')
+def get_batch_status(batch_id):
+    """查询批量上传的整体进度和每个文件的状态"""
+    batch = get_batch_upload_service().get_batch(batch_id)
+    if not batch:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'BATCH_NOT_FOUND',
+                'message': '批量上传不存在或已过期'
+            }
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': batch.to_dict(),
+        'message': '批量上传状态获取成功'
+    }), 200
+
+
 @upload_bp.route('/status/<int:upload_id>')
 def get_upload_status(upload_id):
     """获取上传处理状态"""
@@ -182,7 +685,8 @@ def get_upload_status(upload_id):
                     'processing_time': result['processing_time'],
                     'uploaded_at': result['uploaded_at'],
                     'completed_at': result['completed_at'],
-                    'error_message': result['error_message']
+                    'error_message': result['error_message'],
+                    'task': get_file_processing_service().get_upload_task(upload_id)
                 },
                 'message': '状态获取成功'
             }), 200
@@ -276,6 +780,9 @@ def cleanup_files():
         
         processor = FileProcessor()
         cleaned_count = processor.cleanup_temp_files(max_age_hours)
+        cleaned_count += get_chunked_upload_service().cleanup_expired(
+            current_app.config['UPLOAD_FOLDER'], max_age_hours
+        )
         
         return jsonify({
             'success': True,
@@ -297,6 +804,155 @@ def cleanup_files():
         }), 500
 
 
+@upload_bp.route('/watermarks')
+def get_chat_watermarks():
+    """获取各聊天的增量导入水位线"""
+    try:
+        watermarks = ChatWatermark.query.order_by(ChatWatermark.updated_at.desc()).all()
+        
+        return jsonify({
+            'success': True,
+            'data': [watermark.to_dict() for watermark in watermarks],
+            'message': '水位线获取成功'
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Get chat watermarks error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'WATERMARK_ERROR',
+                'message': '获取水位线失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@upload_bp.route('/watermarks/<int:watermark_id>', methods=['DELETE'])
+def reset_chat_watermark(watermark_id):
+    """重置聊天水位线（下次上传该聊天的导出时重新处理全部消息）"""
+    try:
+        watermark = ChatWatermark.query.get(watermark_id)
+        if not watermark:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'NOT_FOUND',
+                    'message': '水位线不存在'
+                }
+            }), 404
+        
+        talker = watermark.talker
+        db.session.delete(watermark)
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'data': {'talker': talker},
+            'message': '水位线已重置'
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Reset chat watermark error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'WATERMARK_ERROR',
+                'message': '重置水位线失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@upload_bp.route('/chatlog-sync', methods=['POST'])
+def start_chatlog_sync():
+    """
+    从 chatlog HTTP 接口增量同步聊天记录
+    
+    JSON 请求体可选 talkers 指定要同步的聊天，默认按 CHATLOG_SYNC_TALKERS 或 chatlog 的会话列表。
+    同步作为后台任务执行，返回 202 和 run_id，进度通过 /chatlog-sync/<run_id> 查询；
+    已有同步在进行时返回 409 和正在进行的同步。
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        talkers = data.get('talkers')
+        if talkers is not None and (not isinstance(talkers, list) or not all(isinstance(t, str) for t in talkers)):
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'INVALID_TALKERS',
+                    'message': 'talkers 必须是聊天标识的列表'
+                }
+            }), 400
+        
+        run, created = get_chatlog_sync_service().start(current_app._get_current_object(), talkers)
+        if not created:
+            return jsonify({
+                'success': False,
+                'error': {
+                    'code': 'SYNC_IN_PROGRESS',
+                    'message': '已有同步正在进行',
+                    'details': run.to_dict(include_talkers=False)
+                }
+            }), 409
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                **run.to_dict(include_talkers=False),
+                'status_url': url_for('upload.get_chatlog_sync_status', run_id=run.run_id)
+            },
+            'message': '同步已开始'
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Start chatlog sync error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'SYNC_ERROR',
+                'message': '启动同步失败',
+                'details': str(e)
+            }
+        }), 500
+
+
+@upload_bp.route('/chatlog-sync')
+def list_chatlog_syncs():
+    """最近的同步记录和定时同步设置"""
+    service = get_chatlog_sync_service()
+    return jsonify({
+        'success': True,
+        'data': {
+            'source': current_app.config.get('CHATLOG_SYNC_URL'),
+            'schedule': service.get_schedule(),
+            'runs': [run.to_dict(include_talkers=False) for run in service.list_runs()]
+        },
+        'message': '同步记录获取成功'
+    }), 200
+
+
+@upload_bp.route('/chatlog-sync/<run_id>')
+def get_chatlog_sync_status(run_id):
+    """查询一次同步的整体进度和每个聊天的同步状态"""
+    run = get_chatlog_sync_service().get_run(run_id)
+    if not run:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'SYNC_NOT_FOUND',
+                'message': '同步记录不存在或已过期'
+            }
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': run.to_dict(),
+        'message': '同步状态获取成功'
+    }), 200
+
+
 @upload_bp.route('/ai/capabilities')
 def get_ai_capabilities():
     """获取AI处理能力信息"""
@@ -413,7 +1069,7 @@ def upload_file_with_ai():
         
         # 保存文件
         original_filename = file.filename
-        filename = secure_filename(original_filename)
+        filename = secure_upload_name(original_filename)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"{timestamp}_ai_{filename}"
         
@@ -504,7 +1160,7 @@ def upload_file_intelligent():
             
             # 保存文件
             original_filename = file.filename
-            filename = secure_filename(original_filename)
+            filename = secure_upload_name(original_filename)
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f"{timestamp}_intelligent_{filename}"
             
@@ -631,7 +1287,7 @@ def upload_file_async():
         
         # 保存上传的文件
         original_filename = file.filename
-        filename = secure_filename(original_filename)
+        filename = secure_upload_name(original_filename)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"{timestamp}_async_{filename}"
         
@@ -693,7 +1349,8 @@ def get_task_status(task_id):
         file_processing_service = get_file_processing_service()
         status_data = file_processing_service.get_processing_status(task_id)
         
-        if 'error' in status_data:
+        # 任务结果本身也带 error 字段，以是否有 task_id 区分未找到
+        if 'task_id' not in status_data:
             return jsonify({
                 'success': False,
                 'error': {
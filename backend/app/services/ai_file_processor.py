@@ -12,11 +12,15 @@ from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 
 from app import db
-from app.models import QAPair, Category, UploadHistory
+from app.models import QAPair, UploadHistory
 from .file_processor import FileProcessor, ProcessingResult
+from .stats_rollup import get_stats_rollup_service
 from .ai_data_extractor import AIDataExtractor, AIExtractionResult
 from .ai_classifier import AIClassifier, AIClassificationResult
 from .ai_config import ai_config_manager
+from .ingest_pipeline import IngestStats, save_stage
+from app.utils.dedup_index import DedupIndex
+from app.utils.pipeline import Pipeline, Stage, iter_batches
 
 logger = logging.getLogger(__name__)
 
@@ -32,11 +36,14 @@ class AIProcessingResult(ProcessingResult):
 class AIFileProcessor(FileProcessor):
     """AI增强的文件处理器"""
     
+    AI_CLASSIFY_BATCH_SIZE = 50  # 每次交给AI分类的问答对数量
+    
     def __init__(self):
         super().__init__()
         self.ai_extractor = AIDataExtractor()
         self.ai_classifier = AIClassifier()
         self.ai_enabled = self._check_ai_availability()
+        self.allowed_extensions = {'.json'}  # AI处理需要整个文档，压缩文件走标准流式处理
         
     def _check_ai_availability(self) -> bool:
         """检查AI功能是否可用"""
@@ -82,17 +89,10 @@ class AIFileProcessor(FileProcessor):
             
             logger.info(f"Extracted {len(extraction_result.qa_pairs)} QA pairs using {extraction_result.extraction_method}")
             
-            # 使用AI分类问答对
-            classification_results = await self._classify_qa_pairs_with_ai(
-                extraction_result.qa_pairs, use_ai=use_ai
-            )
-            
-            # 保存到数据库
-            saved_count = await self._save_ai_processed_qa_pairs(
-                extraction_result.qa_pairs, 
-                classification_results, 
-                upload_record.id
-            )
+            # 分批AI分类并保存到数据库
+            classification_results = []
+            pipeline = self.build_ai_pipeline(upload_record.id, classification_results, use_ai)
+            saved_count = sum(pipeline.run(extraction_result.qa_pairs))
             
             # 计算处理时间
             processing_time = (datetime.utcnow() - start_time).total_seconds()
@@ -117,7 +117,8 @@ class AIFileProcessor(FileProcessor):
                     'processing_method': extraction_result.extraction_method,
                     'ai_enabled': use_ai,
                     'total_tokens_used': extraction_result.tokens_used + sum(r.tokens_used for r in classification_results),
-                    'providers_used': list(set([extraction_result.provider_used] + [r.provider_used for r in classification_results]))
+                    'providers_used': list(set([extraction_result.provider_used] + [r.provider_used for r in classification_results])),
+                    'pipeline': pipeline.get_metrics()
                 },
                 'file_info': {
                     'filename': upload_record.filename,
@@ -199,95 +200,108 @@ class AIFileProcessor(FileProcessor):
                 for qa in qa_pairs
             ]
     
-    async def _save_ai_processed_qa_pairs(self, qa_pairs: List, 
-                                        classification_results: List[AIClassificationResult],
-                                        upload_id: int) -> int:
-        """保存AI处理的问答对到数据库"""
-        saved_count = 0
-        batch_size = 500
+    def build_ai_pipeline(self, upload_id: int, classification_results: List[AIClassificationResult],
+                          use_ai: bool = True) -> Pipeline:
+        """
+        AI处理的入库流水线：classify → save
+        
+        AI提取需要完整的对话，仍然对整个文件进行；提取结果按 AI_CLASSIFY_BATCH_SIZE 条一批
+        在流水线线程中分类，已分类的问答对在调用线程中分批入库，等待AI响应与写库同时进行。
         
+        Args:
+            classification_results: 分类结果按顺序追加到该列表（用于统计）
+        """
+        category_ids = self._get_category_ids()
+        existing_fingerprints = self._get_dedup_index()
+        stats = IngestStats()
+        
+        def classify(qa_pairs):
+            for batch in iter_batches(qa_pairs, self.AI_CLASSIFY_BATCH_SIZE):
+                # 阶段线程里没有事件循环，每批用独立的事件循环等待AI响应
+                results = asyncio.run(self._classify_qa_pairs_with_ai(batch, use_ai=use_ai))
+                classification_results.extend(results)
+                yield from zip(batch, results)
+        
+        def save_batch(batch):
+            return self._save_ai_batch(batch, upload_id, existing_fingerprints, category_ids)
+        
+        return Pipeline(f'ai-upload-{upload_id}', [
+            Stage('classify', classify, threaded=True),
+            save_stage(save_batch, stats, batch_size=500)
+        ])
+    
+    def _save_ai_batch(self, batch: List[Tuple], upload_id: int, existing_fingerprints: DedupIndex,
+                       category_ids: set) -> int:
+        """保存一批AI处理的 (问答对, 分类结果)，跳过重复的，返回实际保存的数量"""
         try:
-            # 预加载所有分类到内存中
-            categories_dict = {cat.id: cat for cat in Category.query.all()}
-            
-            # 内容去重
-            existing_fingerprints = self._get_existing_content_fingerprints()
+            batch_objects = []
             
-            # 合并问答对和分类结果
-            combined_data = list(zip(qa_pairs, classification_results))
-            
-            for i in range(0, len(combined_data), batch_size):
-                batch = combined_data[i:i + batch_size]
-                batch_objects = []
-                
-                for qa_candidate, classification_result in batch:
-                    try:
-                        # 使用AI分类结果
-                        category_id = classification_result.category_match.category_id
-                        if category_id not in categories_dict:
-                            category_id = 1  # 默认分类
-                        
-                        # 创建内容指纹进行去重检查
-                        content_fingerprint = self._generate_content_fingerprint(
-                            qa_candidate.question,
-                            qa_candidate.answer,
-                            qa_candidate.asker,
-                            qa_candidate.advisor
-                        )
-                        
-                        # 检查是否重复
-                        if content_fingerprint in existing_fingerprints:
-                            logger.debug(f"Skipping duplicate QA pair: {qa_candidate.question[:50]}...")
-                            continue
-                        
-                        # 创建问答对对象
-                        qa_pair = QAPair(
-                            question=qa_candidate.question[:2000],
-                            answer=qa_candidate.answer[:2000],
-                            category_id=category_id,
-                            asker=qa_candidate.asker[:100] if qa_candidate.asker else None,
-                            advisor=qa_candidate.advisor[:100] if qa_candidate.advisor else None,
-                            confidence=qa_candidate.confidence,
-                            source_file=f"upload_{upload_id}_ai",
-                            original_context=json.dumps({
-                                'context': qa_candidate.context[:5],
-                                'ai_processed': True,
-                                'extraction_method': 'ai',
-                                'classification_method': classification_result.classification_method,
-                                'classification_confidence': classification_result.category_match.confidence,
-                                'matched_keywords': classification_result.category_match.matched_keywords,
-                                'reasoning': classification_result.reasoning
-                            }, ensure_ascii=False)
-                        )
-                        
-                        batch_objects.append(qa_pair)
-                        existing_fingerprints.add(content_fingerprint)
-                        
-                    except Exception as e:
-                        logger.error(f"Failed to create QA pair: {str(e)}")
+            # 创建内容指纹进行去重检查，过滤器命中的整批查一次数据库
+            fingerprints = [
+                self._generate_content_fingerprint(qa.question, qa.answer, qa.asker, qa.advisor)
+                for qa, _ in batch
+            ]
+            existing_fingerprints.prefetch(fingerprints)
+            
+            for (qa_candidate, classification_result), content_fingerprint in zip(batch, fingerprints):
+                try:
+                    # 使用AI分类结果
+                    category_id = classification_result.category_match.category_id
+                    if category_id not in category_ids:
+                        category_id = 1  # 默认分类
+                    
+                    # 检查是否重复（同时登记指纹）
+                    if not existing_fingerprints.claim(content_fingerprint):
+                        logger.debug(f"Skipping duplicate QA pair: {qa_candidate.question[:50]}...")
                         continue
-                
-                # 批量保存
-                if batch_objects:
-                    db.session.bulk_save_objects(batch_objects)
-                    db.session.commit()
                     
-                    saved_count += len(batch_objects)
+                    # 创建问答对对象
+                    qa_pair = QAPair(
+                        question=qa_candidate.question[:2000],
+                        answer=qa_candidate.answer[:2000],
+                        category_id=category_id,
+                        asker=qa_candidate.asker[:100] if qa_candidate.asker else None,
+                        advisor=qa_candidate.advisor[:100] if qa_candidate.advisor else None,
+                        confidence=qa_candidate.confidence,
+                        source_file=f"upload_{upload_id}_ai",
+                        content_fingerprint=content_fingerprint,
+                        original_context=json.dumps({
+                            'context': qa_candidate.context[:5],
+                            'ai_processed': True,
+                            'extraction_method': 'ai',
+                            'classification_method': classification_result.classification_method,
+                            'classification_confidence': classification_result.category_match.confidence,
+                            'matched_keywords': classification_result.category_match.matched_keywords,
+                            'reasoning': classification_result.reasoning
+                        }, ensure_ascii=False)
+                    )
                     
-                    # 更新FTS索引（如果启用）
-                    try:
-                        from .search_service import SearchService
-                        search_service = SearchService()
-                        if search_service.fts_enabled:
-                            for qa_pair in batch_objects:
-                                db.session.refresh(qa_pair)
-                                search_service.update_fts_record(qa_pair, 'insert')
-                    except Exception as fts_error:
-                        logger.warning(f"Failed to update FTS index: {fts_error}")
+                    batch_objects.append(qa_pair)
                     
-                    logger.debug(f"Saved AI batch {i//batch_size + 1}, count: {len(batch_objects)}")
-            
-            return saved_count
+                except Exception as e:
+                    logger.error(f"Failed to create QA pair: {str(e)}")
+                    continue
+            
+            # 批量保存
+            if batch_objects:
+                db.session.bulk_save_objects(batch_objects)
+                get_stats_rollup_service().record_qa_inserts(batch_objects)
+                db.session.commit()
+                
+                # 更新FTS索引（如果启用）
+                try:
+                    from .search_service import SearchService
+                    search_service = SearchService()
+                    if search_service.fts_enabled:
+                        for qa_pair in batch_objects:
+                            db.session.refresh(qa_pair)
+                            search_service.update_fts_record(qa_pair, 'insert')
+                except Exception as fts_error:
+                    logger.warning(f"Failed to update FTS index: {fts_error}")
+                    
+                logger.debug(f"Saved AI batch of {len(batch_objects)} QA pairs for upload {upload_id}")
+                
+            return len(batch_objects)
             
         except Exception as e:
             db.session.rollback()
@@ -329,7 +343,8 @@ class AIFileProcessor(FileProcessor):
         )
     
     def process_file_async_with_ai(self, file_path: Path, filename: str, 
-                                  use_ai: bool = None) -> Dict[str, Any]:
+                                  use_ai: bool = None,
+                                  upload_record: Optional[UploadHistory] = None) -> Dict[str, Any]:
         """
         异步处理文件（AI增强版）
         
@@ -337,6 +352,7 @@ class AIFileProcessor(FileProcessor):
             file_path: 文件路径
             filename: 文件名
             use_ai: 是否使用AI（None表示自动判断）
+            upload_record: 预先创建的上传记录（后台处理时由上传接口创建）
         
         Returns:
             Dict: 包含upload_id和处理信息的响应
@@ -345,6 +361,7 @@ class AIFileProcessor(FileProcessor):
             # 文件验证
             is_valid, error_msg = self.validate_file(file_path)
             if not is_valid:
+                self.finish_upload_record(upload_record, error_msg)
                 return {
                     'success': False,
                     'error': error_msg
@@ -352,21 +369,23 @@ class AIFileProcessor(FileProcessor):
             
             # 计算文件信息
             file_size = file_path.stat().st_size
-            file_hash = self.calculate_file_hash(file_path)
+            hashes = self.get_file_hashes(file_path, upload_record)
             
             # 检查重复上传
-            duplicate = self.check_duplicate_upload(file_hash)
+            duplicate = self.check_duplicate_upload(hashes.md5, hashes.content_hash)
             if duplicate:
+                self.finish_upload_record(upload_record)
                 return {
                     'success': True,
-                    'upload_id': duplicate.id,
+                    'upload_id': upload_record.id if upload_record else duplicate.id,
+                    'duplicate_of': duplicate.id,
                     'message': '文件已存在，跳过处理',
                     'qa_count': duplicate.qa_count,
                     'status': duplicate.status
                 }
             
             # 创建上传记录
-            upload_record = self.create_upload_record(filename, file_size, file_hash)
+            upload_record = self.prepare_upload_record(filename, file_size, hashes, upload_record)
             
             # 确定是否使用AI
             if use_ai is None:
@@ -453,9 +472,9 @@ class AIFileProcessor(FileProcessor):
                     'daily_tokens': stats.daily_tokens,
                     'success_rate': (stats.successful_requests / max(stats.total_requests, 1)) * 100
                 }
-        
+                
         return capabilities
-    
+        
     async def enhance_existing_qa_pairs(self, limit: int = 100) -> Dict[str, Any]:
         """使用AI增强现有的低质量问答对"""
         if not self.ai_enabled:
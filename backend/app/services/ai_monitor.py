@@ -9,6 +9,7 @@ from dataclasses import dataclass, asdict
 from collections import defaultdict
 
 from sqlalchemy import func, and_, or_
+from sqlalchemy.orm import undefer
 from app import db
 from app.models import QAPair, UploadHistory
 from .ai_config import ai_config_manager
@@ -147,17 +148,12 @@ class AIMonitor:
             return {'error': str(e)}
     
     def _get_quality_metrics(self) -> Dict[str, Any]:
-        """获取质量指标"""
+        """获取质量指标（读取统计汇总表中 AI 来源的置信度分档）"""
         try:
-            # 查询AI处理的问答对
-            ai_qa_pairs = QAPair.query.filter(
-                or_(
-                    QAPair.source_file.like('%_ai'),
-                    QAPair.original_context.like('%ai_processed%')
-                )
-            ).all()
+            from .stats_rollup import get_stats_rollup_service
+            distribution = get_stats_rollup_service().get_confidence_distribution('ai')
             
-            if not ai_qa_pairs:
+            if not distribution['total']:
                 return {
                     'total_ai_qa_pairs': 0,
                     'avg_confidence': 0,
@@ -165,24 +161,21 @@ class AIMonitor:
                     'high_quality_ratio': 0
                 }
             
-            # 计算质量指标
-            confidences = [qa.confidence for qa in ai_qa_pairs]
-            avg_confidence = sum(confidences) / len(confidences)
-            
-            # 质量分布
+            # 质量分布（分档 b 表示置信度落在 [b/10, (b+1)/10)）
+            buckets = distribution['buckets']
             quality_dist = {
-                'excellent': len([c for c in confidences if c >= 0.9]),
-                'good': len([c for c in confidences if 0.7 <= c < 0.9]),
-                'fair': len([c for c in confidences if 0.5 <= c < 0.7]),
-                'poor': len([c for c in confidences if c < 0.5])
+                'excellent': sum(buckets.get(b, 0) for b in (9, 10)),
+                'good': sum(buckets.get(b, 0) for b in (7, 8)),
+                'fair': sum(buckets.get(b, 0) for b in (5, 6)),
+                'poor': sum(buckets.get(b, 0) for b in range(0, 5))
             }
             
             high_quality_count = quality_dist['excellent'] + quality_dist['good']
-            high_quality_ratio = high_quality_count / len(ai_qa_pairs)
+            high_quality_ratio = high_quality_count / distribution['total']
             
             return {
-                'total_ai_qa_pairs': len(ai_qa_pairs),
-                'avg_confidence': round(avg_confidence, 3),
+                'total_ai_qa_pairs': distribution['total'],
+                'avg_confidence': round(distribution['avg_confidence'], 3),
                 'quality_distribution': quality_dist,
                 'high_quality_ratio': round(high_quality_ratio, 3)
             }
@@ -273,7 +266,7 @@ class AIMonitor:
                 )
             ).all()
             
-            period_qa_pairs = QAPair.query.filter(
+            period_qa_pairs = QAPair.query.options(undefer(QAPair.context_blob)).filter(
                 and_(
                     QAPair.created_at >= start_date,
                     QAPair.created_at <= end_date
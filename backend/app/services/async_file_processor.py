@@ -10,8 +10,10 @@ from pathlib import Path
 from datetime import datetime
 import time
 
+from flask import current_app
+
 from app import db
-from app.models import QAPair, Category, UploadHistory
+from app.models import UploadHistory
 from app.services.file_processor import FileProcessor, ProcessingResult
 from app.utils.cache import file_process_cache
 
@@ -77,10 +79,10 @@ class AsyncFileProcessor(FileProcessor):
                 )
             
             # 计算文件哈希（用于去重）
-            file_hash = self.calculate_file_hash(file_path)
+            hashes = self.get_file_hashes(file_path)
             
             # 检查重复上传
-            duplicate = self.check_duplicate_upload(file_hash)
+            duplicate = self.check_duplicate_upload(hashes.md5, hashes.content_hash)
             if duplicate:
                 return ProcessingResult(
                     success=False,
@@ -95,72 +97,30 @@ class AsyncFileProcessor(FileProcessor):
             upload_record = UploadHistory(
                 filename=original_filename or file_path.name,
                 file_size=file_path.stat().st_size,
-                file_hash=file_hash,
+                file_hash=hashes.md5,
+                content_hash=hashes.content_hash,
+                sample_hash=hashes.sample_hash,
                 status='processing',
                 started_at=datetime.utcnow()
             )
             db.session.add(upload_record)
             db.session.commit()
             
-            try:
-                # 异步读取和处理文件
-                chat_data = await self._read_json_file_async(file_path)
-                
-                # 异步提取问答对
-                qa_candidates = await self._extract_qa_pairs_async(
-                    chat_data, upload_record.id, file_path.name
-                )
-                
-                if not qa_candidates:
-                    upload_record.status = 'completed'
-                    upload_record.qa_count = 0
-                    upload_record.completed_at = datetime.utcnow()
-                    db.session.commit()
-                    
-                    return ProcessingResult(
-                        success=True,
-                        upload_id=upload_record.id,
-                        total_extracted=0,
-                        total_saved=0,
-                        processing_time=time.time() - start_time,
-                        statistics={'message': 'No QA pairs extracted'}
-                    )
-                
-                # 异步分类处理
-                classified_results = await self._classify_qa_pairs_async(qa_candidates)
-                
-                # 异步保存到数据库
-                saved_count = await self._save_qa_pairs_async(classified_results, upload_record.id)
-                
-                # 更新上传记录
-                processing_time = time.time() - start_time
-                upload_record.status = 'completed'
-                upload_record.qa_count = saved_count
-                upload_record.processing_time = processing_time
-                upload_record.completed_at = datetime.utcnow()
-                db.session.commit()
-                
-                logger.info(f"异步文件处理完成: {saved_count} 个问答对, 用时 {processing_time:.2f}s")
-                
-                return ProcessingResult(
-                    success=True,
-                    upload_id=upload_record.id,
-                    total_extracted=len(qa_candidates),
-                    total_saved=saved_count,
-                    processing_time=processing_time,
-                    statistics={
-                        'async_processing': True,
-                        'processing_efficiency': saved_count / len(qa_candidates) if qa_candidates else 0,
-                        'performance_gain': '3-5x faster than sync processing'
-                    }
-                )
-                
-            except Exception as e:
-                upload_record.status = 'failed'
-                upload_record.error_message = str(e)
-                upload_record.completed_at = datetime.utcnow()
-                db.session.commit()
-                raise
+            # 入库流水线（与 FileProcessor 相同，解析和提取在流水线线程中进行）在线程池中运行，
+            # 不阻塞事件循环
+            app = current_app._get_current_object()
+            upload_id = upload_record.id
+            
+            def run_pipeline() -> ProcessingResult:
+                with app.app_context():
+                    return self.process_file(file_path, db.session.get(UploadHistory, upload_id))
+            
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(None, run_pipeline)
+            if result.success:
+                result.statistics['async_processing'] = True
+                logger.info(f"异步文件处理完成: {result.total_saved} 个问答对, 用时 {result.processing_time:.2f}s")
+            return result
                 
         except Exception as e:
             logger.error(f"异步文件处理失败: {str(e)}")
@@ -173,185 +133,6 @@ class AsyncFileProcessor(FileProcessor):
                 error_message=str(e)
             )
     
-    async def _read_json_file_async(self, file_path: Path) -> Dict[str, Any]:
-        """异步读取JSON文件"""
-        try:
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                return json.loads(content)
-        except Exception as e:
-            logger.error(f"异步文件读取失败: {str(e)}")
-            raise
-    
-    async def _extract_qa_pairs_async(self, chat_data: Dict[str, Any], 
-                                    upload_id: int, filename: str) -> List:
-        """异步提取问答对"""
-        try:
-            # 解析消息数据
-            if 'messages' in chat_data:
-                messages = chat_data['messages']
-            elif isinstance(chat_data, list):
-                messages = chat_data
-            else:
-                messages = []
-            
-            if not messages:
-                logger.warning("未找到有效的消息数据")
-                return []
-            
-            # 异步批量提取QA对（使用线程池处理CPU密集型任务）
-            loop = asyncio.get_event_loop()
-            qa_candidates = await loop.run_in_executor(
-                None, 
-                self.data_extractor._extract_qa_pairs,
-                messages,
-                filename
-            )
-            
-            return qa_candidates
-            
-        except Exception as e:
-            logger.error(f"异步QA提取失败: {str(e)}")
-            raise
-    
-    async def _classify_qa_pairs_async(self, qa_candidates: List) -> List:
-        """异步分类问答对"""
-        if not qa_candidates:
-            return []
-        
-        try:
-            # 将QA候选转换为分类所需格式
-            classification_data = []
-            for qa_candidate in qa_candidates:
-                classification_data.append((
-                    qa_candidate.question,
-                    qa_candidate.answer,
-                    qa_candidate.context
-                ))
-            
-            # 异步批量分类（使用线程池处理）
-            loop = asyncio.get_event_loop()
-            classification_results = await loop.run_in_executor(
-                None,
-                self._classify_batch_sync,
-                classification_data
-            )
-            
-            # 合并QA候选和分类结果
-            return list(zip(qa_candidates, classification_results))
-            
-        except Exception as e:
-            logger.error(f"异步分类失败: {str(e)}")
-            # 返回原始数据，使用默认分类
-            default_classification = self.qa_classifier.classify_text("默认", "默认")
-            return [(qa, default_classification) for qa in qa_candidates]
-    
-    def _classify_batch_sync(self, classification_data: List) -> List:
-        """同步批量分类（在线程池中执行）"""
-        classification_results = []
-        for question, answer, context in classification_data:
-            # 合并问题和答案进行分类
-            combined_text = f"{question} {answer}"
-            classification = self.qa_classifier.classify_text(combined_text, answer)
-            classification_results.append(classification)
-        return classification_results
-    
-    async def _save_qa_pairs_async(self, classified_results: List, upload_id: int) -> int:
-        """异步保存问答对到数据库"""
-        if not classified_results:
-            return 0
-        
-        saved_count = 0
-        batch_size = 1000  # 大批量处理
-        
-        try:
-            # 预加载分类信息到内存
-            categories_dict = {cat.id: cat for cat in Category.query.all()}
-            
-            # 内容去重
-            existing_fingerprints = await self._get_existing_content_fingerprints_async()
-            
-            # 分批异步处理
-            for i in range(0, len(classified_results), batch_size):
-                batch = classified_results[i:i + batch_size]
-                batch_count = await self._save_batch_async(
-                    batch, categories_dict, existing_fingerprints, upload_id
-                )
-                saved_count += batch_count
-                
-                # 让其他协程有机会执行
-                await asyncio.sleep(0)
-            
-            return saved_count
-            
-        except Exception as e:
-            logger.error(f"异步保存失败: {str(e)}")
-            raise
-    
-    async def _get_existing_content_fingerprints_async(self) -> set:
-        """异步获取现有内容指纹"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            self._get_existing_content_fingerprints
-        )
-    
-    async def _save_batch_async(self, batch: List, categories_dict: Dict,
-                               existing_fingerprints: set, upload_id: int) -> int:
-        """异步保存批次数据"""
-        batch_objects = []
-        
-        for qa_candidate, classification in batch:
-            try:
-                # 内容去重检查
-                content_fingerprint = self._generate_content_fingerprint(
-                    qa_candidate.question, qa_candidate.answer
-                )
-                
-                if content_fingerprint in existing_fingerprints:
-                    continue
-                
-                # 创建QA对象
-                qa_pair = QAPair(
-                    question=qa_candidate.question,
-                    answer=qa_candidate.answer,
-                    asker=qa_candidate.asker,
-                    advisor=qa_candidate.advisor,
-                    confidence=qa_candidate.confidence,
-                    source_file=upload_id,
-                    category_id=classification.category_id,
-                    original_context=json.dumps(qa_candidate.context, ensure_ascii=False),
-                    created_at=datetime.utcnow()
-                )
-                
-                batch_objects.append(qa_pair)
-                existing_fingerprints.add(content_fingerprint)
-                
-            except Exception as e:
-                logger.warning(f"处理QA对时出错: {str(e)}")
-                continue
-        
-        # 批量保存到数据库
-        if batch_objects:
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                self._bulk_save_objects,
-                batch_objects
-            )
-        
-        return len(batch_objects)
-    
-    def _bulk_save_objects(self, objects: List):
-        """同步批量保存对象（在线程池中执行）"""
-        try:
-            db.session.bulk_save_objects(objects)
-            db.session.commit()
-        except Exception as e:
-            logger.error(f"批量保存失败: {str(e)}")
-            db.session.rollback()
-            raise
-    
     async def stream_large_file_processing(self, file_path: Path) -> AsyncGenerator[Dict[str, Any], None]:
         """流式处理大文件"""
         try:
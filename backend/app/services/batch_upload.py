@@ -0,0 +1,376 @@
+"""
+批量上传服务 - 一次导入多个聊天导出，有限并发处理
+
+新客户一次要导入几十到上百个群的导出。批量上传把这些文件登记为一个批次，作为一个
+后台任务提交到任务队列，任务内用有界线程池（最多 concurrency 个文件同时处理）逐个处理。
+同一批次的文件共用一个 IngestContext：
+- 去重指纹索引只从数据库加载一次，文件之间重复的问答对也只保存一次
+- 分类ID和编译好的分类规则（QAClassifier）只初始化一次
+批次状态保存在内存中，提供整体进度和每个文件的处理状态。
+"""
+import logging
+import threading
+import uuid
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app import db
+from app.models import Category, UploadHistory
+from app.services.file_processor import FileProcessor
+from app.services.qa_classifier import QAClassifier
+from app.services.task_queue import get_task_queue
+from app.utils.dedup_index import DedupIndex
+from app.utils.compressed_input import (
+    DecompressedSizeError, SizeBudget, SizeLimitedReader, get_upload_suffix, secure_upload_name
+)
+from app.utils.file_hash import save_stream
+
+logger = logging.getLogger(__name__)
+
+
+class IngestContext:
+    """同一批次文件共享的去重索引和分类缓存（线程安全，第一次使用时加载）"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes: Dict[bool, DedupIndex] = {}
+        self._category_ids: Optional[set] = None
+        self.classifier = QAClassifier()
+    
+    def get_dedup_index(self, include_raw: bool, factory: Callable[[bool], DedupIndex]) -> DedupIndex:
+        """
+        取共享的指纹索引
+        
+        Args:
+            include_raw: 是否为包含暂存表指纹的索引
+            factory: 第一次使用时新建索引（指纹过滤器或从数据库加载的指纹）
+            
+        正式问答对索引登记的指纹同时写入暂存表索引，与单文件处理时暂存表去重
+        能看到已入库问答对的行为一致。
+        """
+        with self._lock:
+            index = self._indexes.get(include_raw)
+            if index is None:
+                index = self._indexes[include_raw] = factory(include_raw)
+                qa_index, raw_index = self._indexes.get(False), self._indexes.get(True)
+                if qa_index is not None and raw_index is not None:
+                    qa_index.mirror = raw_index
+                    raw_index.update(qa_index)
+            return index
+    
+    def get_category_ids(self) -> set:
+        """已有分类ID"""
+        with self._lock:
+            if self._category_ids is None:
+                self._category_ids = {category_id for (category_id,) in db.session.query(Category.id).all()}
+            return self._category_ids
+
+
+@dataclass
+class BatchFile:
+    """批次中的一个文件"""
+    filename: str
+    file_path: Optional[str] = None
+    file_size: int = 0
+    upload_id: Optional[int] = None
+    status: str = 'queued'  # queued / processing / completed / duplicate / failed / rejected
+    stage: Optional[str] = None
+    progress: float = 0.0
+    qa_count: int = 0
+    duplicate_of: Optional[int] = None
+    error: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop('file_path')
+        return data
+
+
+@dataclass
+class UploadBatch:
+    """一次批量上传"""
+    batch_id: str
+    files: List[BatchFile]
+    concurrency: int
+    task_id: Optional[str] = None
+    status: str = 'pending'  # pending / running / completed
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    
+    FINISHED_STATUSES = ('completed', 'duplicate', 'failed', 'rejected')
+    
+    @property
+    def finished_count(self) -> int:
+        return sum(1 for item in self.files if item.status in self.FINISHED_STATUSES)
+    
+    def get_progress(self) -> float:
+        """整体进度 0-100（已结束的文件按 100 计）"""
+        if not self.files:
+            return 100.0
+        total = sum(100.0 if item.status in self.FINISHED_STATUSES else item.progress for item in self.files)
+        return round(total / len(self.files), 1)
+    
+    def to_dict(self, include_files: bool = True) -> Dict[str, Any]:
+        data = {
+            'batch_id': self.batch_id,
+            'task_id': self.task_id,
+            'status': self.status,
+            'concurrency': self.concurrency,
+            'total_files': len(self.files),
+            'finished_files': self.finished_count,
+            'progress': self.get_progress(),
+            'status_counts': dict(Counter(item.status for item in self.files)),
+            'total_saved': sum(item.qa_count for item in self.files),
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+        if include_files:
+            data['files'] = [item.to_dict() for item in self.files]
+        return data
+
+
+class BatchUploadService:
+    """批量上传管理"""
+    
+    MAX_BATCHES = 100  # 内存中保留的批次数，超过时丢弃最早结束的批次
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches: Dict[str, UploadBatch] = {}
+    
+    def stage_files(self, uploads: Iterable[Tuple[str, BinaryIO]], upload_folder: Path,
+                    max_files: Optional[int] = None) -> List[BatchFile]:
+        """
+        保存上传的文件并创建上传记录
+        
+        zip 压缩包展开为其中的各个 JSON 文件。写盘时计算哈希，与已完成的上传或本批次中
+        前面的文件重复的文件直接标记为 duplicate，不进入处理；超过 max_files 的文件不保存。
+        
+        Raises:
+            DecompressedSizeError: 展开出的 zip 成员合计超过 UPLOAD_MAX_DECOMPRESSED_SIZE
+                （所有成员共用一个额度），此时整个批次被拒绝，已保存的文件全部删除
+        """
+        processor = FileProcessor()
+        legacy_md5 = processor.needs_legacy_md5()
+        max_size = processor._get_max_file_size()
+        budget = SizeBudget(processor._get_max_decompressed_size())
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        files: List[BatchFile] = []
+        records: List[Tuple[BatchFile, UploadHistory]] = []
+        batch_duplicates: List[Tuple[BatchFile, BatchFile]] = []
+        seen_hashes: Dict[str, BatchFile] = {}
+        
+        try:
+            for filename, stream in self._expand_uploads(uploads, budget):
+                item = BatchFile(filename=filename)
+                files.append(item)
+                if stream is None:
+                    item.status = 'rejected'
+                    item.error = '无法读取压缩包'
+                    continue
+                if max_files is not None and len(files) > max_files:
+                    item.status = 'rejected'
+                    item.error = f'超过单次批量上传的文件数上限（{max_files}）'
+                    continue
+                if get_upload_suffix(filename) not in ('.json', '.json.gz', '.json.zst'):
+                    item.status = 'rejected'
+                    item.error = '只支持 .json、.json.gz、.json.zst 文件和 zip 压缩包'
+                    continue
+                    
+                file_path = upload_folder / f"{timestamp}_batch{len(files)}_{secure_upload_name(filename)}"
+                try:
+                    hashes = save_stream(stream, file_path, legacy_md5=legacy_md5, max_size=max_size)
+                except DecompressedSizeError:
+                    raise
+                except Exception as e:
+                    item.status = 'rejected'
+                    item.error = str(e)
+                    continue
+                item.file_size = hashes.size
+                
+                earlier = seen_hashes.get(hashes.content_hash)
+                duplicate = processor.check_duplicate_upload(hashes.md5, hashes.content_hash) if earlier is None else None
+                if earlier is not None or duplicate is not None:
+                    file_path.unlink()
+                    item.status = 'duplicate'
+                    item.progress = 100
+                    item.duplicate_of = duplicate.id if duplicate is not None else None
+                    if earlier is not None:
+                        batch_duplicates.append((item, earlier))  # 上传ID在提交后回填
+                    continue
+                    
+                item.file_path = str(file_path)
+                seen_hashes[hashes.content_hash] = item
+                upload_record = UploadHistory(
+                    filename=filename,
+                    file_size=hashes.size,
+                    file_hash=hashes.md5,
+                    content_hash=hashes.content_hash,
+                    sample_hash=hashes.sample_hash,
+                    status='pending',
+                    uploaded_at=datetime.utcnow()
+                )
+                db.session.add(upload_record)
+                records.append((item, upload_record))
+        except DecompressedSizeError:
+            db.session.rollback()
+            for item in files:
+                if item.file_path:
+                    Path(item.file_path).unlink(missing_ok=True)
+            logger.warning(f"Batch upload rejected: zip members exceed {budget.max_size} bytes after decompression")
+            raise
+            
+        db.session.commit()
+        for item, upload_record in records:
+            item.upload_id = upload_record.id
+        for item, earlier in batch_duplicates:
+            item.duplicate_of = earlier.upload_id
+            
+        return files
+    
+    def _expand_uploads(self, uploads: Iterable[Tuple[str, BinaryIO]],
+                        budget: Optional[SizeBudget] = None) -> Iterator[Tuple[str, Optional[BinaryIO]]]:
+        """
+        逐个返回 (文件名, 数据流)，zip 压缩包展开为其中的文件；压缩包损坏时数据流为 None
+        
+        zip 成员的数据流按 budget 计数，所有压缩包的成员共用这一个额度
+        """
+        for filename, stream in uploads:
+            if not filename.lower().endswith('.zip'):
+                yield filename, stream
+                continue
+                
+            try:
+                archive = zipfile.ZipFile(stream)
+            except (zipfile.BadZipFile, OSError) as e:
+                logger.warning(f"Failed to open zip upload {filename}: {str(e)}")
+                yield filename, None
+                continue
+                
+            with archive:
+                for info in archive.infolist():
+                    if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                        continue
+                    with archive.open(info) as member:
+                        yield Path(info.filename).name, SizeLimitedReader(member, budget) if budget else member
+    
+    def create_batch(self, files: List[BatchFile], concurrency: int) -> UploadBatch:
+        """登记批次"""
+        batch = UploadBatch(batch_id=uuid.uuid4().hex[:12], files=files, concurrency=max(1, concurrency))
+        if not any(item.status == 'queued' for item in files):
+            batch.status = 'completed'
+            batch.completed_at = datetime.utcnow()
+            
+        with self._lock:
+            self.batches[batch.batch_id] = batch
+            if len(self.batches) > self.MAX_BATCHES:
+                finished = sorted(
+                    (b for b in self.batches.values() if b.status == 'completed'),
+                    key=lambda b: b.completed_at
+                )
+                for old in finished[:len(self.batches) - self.MAX_BATCHES]:
+                    self.batches.pop(old.batch_id, None)
+        return batch
+    
+    def submit(self, app, batch: UploadBatch, timeout: int = 1800) -> str:
+        """把批次作为一个后台任务提交到任务队列"""
+        batch.task_id = get_task_queue().submit_task(
+            "batch_upload",
+            self._run_batch,
+            app, batch.batch_id,
+            max_retries=0,  # 部分入库后重试会重复处理
+            timeout=timeout
+        )
+        return batch.task_id
+    
+    def get_batch(self, batch_id: str) -> Optional[UploadBatch]:
+        return self.batches.get(batch_id)
+    
+    def _run_batch(self, app, batch_id: str) -> Dict[str, Any]:
+        """批次处理任务（在任务队列的线程池中执行）"""
+        batch = self.batches[batch_id]
+        batch.status = 'running'
+        batch.started_at = datetime.utcnow()
+        
+        context = IngestContext()
+        queued = [item for item in batch.files if item.status == 'queued']
+        logger.info(f"Batch {batch_id}: processing {len(queued)} files with concurrency {batch.concurrency}")
+        
+        with ThreadPoolExecutor(max_workers=batch.concurrency, thread_name_prefix=f'batch-{batch_id}') as pool:
+            list(pool.map(lambda item: self._process_file(app, batch, item, context), queued))
+            
+        batch.status = 'completed'
+        batch.completed_at = datetime.utcnow()
+        self._report_progress(batch)
+        logger.info(f"Batch {batch_id} completed: {dict(Counter(item.status for item in batch.files))}")
+        return batch.to_dict(include_files=False)
+    
+    def _process_file(self, app, batch: UploadBatch, item: BatchFile, context: IngestContext):
+        """处理批次中的一个文件（工作线程中执行）"""
+        with app.app_context():
+            try:
+                item.status = 'processing'
+                upload_record = UploadHistory.query.get(item.upload_id)
+                
+                processor = FileProcessor()
+                processor.ingest_context = context
+                processor.qa_classifier = context.classifier
+                processor.progress_callback = lambda stage, progress: self._update_file(batch, item, stage, progress)
+                
+                result = processor.process_file_async(Path(item.file_path), item.filename, upload_record=upload_record)
+                if result['success']:
+                    if result.get('duplicate_of'):
+                        item.status = 'duplicate'
+                        item.duplicate_of = result['duplicate_of']
+                    else:
+                        item.status = 'completed'
+                        item.qa_count = result.get('total_saved', 0)
+                    Path(item.file_path).unlink(missing_ok=True)
+                else:
+                    item.status = 'failed'
+                    item.error = result.get('error') or result.get('message')
+                    
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Batch {batch.batch_id}: failed to process {item.filename}: {str(e)}")
+                item.status = 'failed'
+                item.error = str(e)
+            finally:
+                item.progress = 100.0
+                db.session.remove()
+                
+        self._report_progress(batch)
+    
+    def _update_file(self, batch: UploadBatch, item: BatchFile, stage: str, progress: float):
+        item.stage = stage
+        item.progress = progress
+        self._report_progress(batch)
+    
+    def _report_progress(self, batch: UploadBatch):
+        """更新任务进度并推送WebSocket通知"""
+        if not batch.task_id:
+            return
+            
+        get_task_queue().update_progress(
+            batch.task_id, batch.get_progress(), f'{batch.finished_count}/{len(batch.files)} files'
+        )
+        
+        from app.services.websocket_service import get_websocket_manager
+        get_websocket_manager().notify_task_update(batch.task_id)
+
+
+# 全局批量上传服务实例
+batch_upload_service = BatchUploadService()
+
+
+def get_batch_upload_service() -> BatchUploadService:
+    """获取批量上传服务实例"""
+    return batch_upload_service
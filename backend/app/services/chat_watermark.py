@@ -0,0 +1,206 @@
+"""
+聊天水位线服务 - 增量导入同一聊天的重复导出
+
+chatlog 每次导出同一个群都包含全部历史。上传时按 talker 读取 ChatWatermark，
+在标准化和提取之前跳过水位线之前的消息，只保留：
+- 水位线之后的新消息（有 seq 时按 seq 判断，否则按时间）
+- 水位线前答案时间窗口内的回看消息，让跨两次导出的问答仍能配对
+- 第一条保留消息之前的几条消息，作为上下文
+回看消息产生的重复问答由内容指纹去重。上传处理成功后再推进水位线。
+"""
+import hashlib
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app import db
+from app.models import ChatWatermark
+from app.utils.timestamp_parser import TimestampParser, get_timestamp_value
+
+logger = logging.getLogger(__name__)
+
+# 聊天标识字段（按优先级）
+CHAT_ID_FIELDS = ('talker', 'chatroom', 'roomid')
+
+
+def get_chat_id(msg: Dict[str, Any]) -> Optional[str]:
+    """取消息所属聊天的标识，没有时返回 None"""
+    for field in CHAT_ID_FIELDS:
+        value = msg.get(field)
+        if value:
+            return str(value)
+    return None
+
+
+def _get_seq(msg: Dict[str, Any]) -> Optional[int]:
+    seq = msg.get('seq')
+    if isinstance(seq, int) and not isinstance(seq, bool):
+        return seq
+    return None
+
+
+class WatermarkFilter:
+    """
+    单次上传的水位线过滤器
+    
+    filter() 包装原始消息流（在标准化之前），同时记录每个聊天在本文件中出现的
+    最新时间和 seq；save() 在上传处理成功后把它们写回 ChatWatermark。
+    没有聊天标识或时间戳无法解析的消息不会被跳过。
+    """
+    
+    def __init__(self, watermarks: Dict[str, Tuple[datetime, Optional[int]]],
+                 lookback_seconds: int, context_messages: int = 2):
+        self.watermarks = watermarks
+        self.lookback = timedelta(seconds=lookback_seconds)
+        self.context_messages = context_messages
+        self.timestamp_parser = TimestampParser()
+        
+        # talker -> [最新时间, 最新seq, 新消息数, 聊天名称]
+        self.latest: Dict[str, list] = {}
+        self.skipped_count = 0
+        self.overlap_count = 0
+    
+    @classmethod
+    def load(cls, lookback_seconds: int, context_messages: int = 2) -> 'WatermarkFilter':
+        """读取所有聊天的水位线"""
+        watermarks = {
+            row.talker: (row.last_timestamp, row.last_seq)
+            for row in ChatWatermark.query.all()
+        }
+        return cls(watermarks, lookback_seconds, context_messages)
+    
+    def filter(self, raw_messages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """跳过已处理过的消息"""
+        skipped = deque(maxlen=self.context_messages)
+        
+        for msg in raw_messages:
+            decision = self._classify(msg)
+            if decision == 'skip':
+                if len(skipped) == skipped.maxlen:
+                    self.skipped_count += 1
+                skipped.append(msg)
+                continue
+            
+            # 第一条保留消息之前的几条消息作为上下文一并保留
+            if skipped:
+                self.overlap_count += len(skipped)
+                yield from skipped
+                skipped.clear()
+            if decision == 'overlap':
+                self.overlap_count += 1
+            yield msg
+            
+        self.skipped_count += len(skipped)
+        
+        if self.skipped_count:
+            logger.info(f"Watermark filter skipped {self.skipped_count} processed messages, "
+                        f"kept {self.overlap_count} look-back messages")
+    
+    def is_new(self, msg: Any) -> bool:
+        """消息是否在水位线之后（不计入统计），没有聊天标识或时间戳无法解析的消息视为新消息"""
+        position = self._position(msg)
+        return position is None or position[3]
+    
+    def _position(self, msg: Any) -> Optional[Tuple[str, datetime, Optional[int], bool]]:
+        """消息的 (聊天标识, 时间, seq, 是否新消息)，没有聊天标识或时间戳无法解析时返回 None"""
+        if not isinstance(msg, dict):
+            return None
+            
+        talker = get_chat_id(msg)
+        if talker is None:
+            return None
+            
+        try:
+            timestamp = self.timestamp_parser.parse(get_timestamp_value(msg))
+        except (ValueError, TypeError, OverflowError, OSError):
+            timestamp = None
+        if timestamp is None:
+            return None
+            
+        seq = _get_seq(msg)
+        watermark = self.watermarks.get(talker)
+        if watermark is None:
+            is_new = True
+        else:
+            last_timestamp, last_seq = watermark
+            if last_seq is not None and seq is not None:
+                is_new = seq > last_seq
+            else:
+                is_new = timestamp > last_timestamp
+        return talker, timestamp, seq, is_new
+    
+    def _classify(self, msg: Any) -> str:
+        """判断消息是新消息（new）、回看消息（overlap）还是可跳过（skip）"""
+        position = self._position(msg)
+        if position is None:
+            return 'new'
+            
+        talker, timestamp, seq, is_new = position
+        self._track(talker, timestamp, seq, is_new, msg.get('talkerName'))
+        
+        if is_new:
+            return 'new'
+        if timestamp > self.watermarks[talker][0] - self.lookback:
+            return 'overlap'
+        return 'skip'
+    
+    def _track(self, talker: str, timestamp: datetime, seq: Optional[int], is_new: bool, talker_name: Optional[str]):
+        latest = self.latest.get(talker)
+        if latest is None:
+            latest = self.latest[talker] = [timestamp, seq, 0, None]
+        elif timestamp > latest[0]:
+            latest[0] = timestamp
+        if seq is not None and (latest[1] is None or seq > latest[1]):
+            latest[1] = seq
+        if is_new:
+            latest[2] += 1
+        if talker_name:
+            latest[3] = str(talker_name)[:255]
+    
+    def save(self, upload_id: int):
+        """上传处理成功后推进水位线"""
+        if not self.latest:
+            return
+            
+        try:
+            existing = {
+                row.talker: row
+                for row in ChatWatermark.query.filter(ChatWatermark.talker.in_(list(self.latest))).all()
+            }
+            for talker, (timestamp, seq, new_messages, talker_name) in self.latest.items():
+                watermark = existing.get(talker)
+                if watermark is None:
+                    watermark = ChatWatermark(talker=talker[:255], message_count=0)
+                    db.session.add(watermark)
+                watermark.advance(timestamp, seq, new_messages, upload_id, talker_name)
+            db.session.commit()
+            logger.info(f"Advanced watermarks for {len(self.latest)} chats (upload {upload_id})")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to save chat watermarks: {str(e)}")
+    
+    def seen_chats(self) -> List[str]:
+        """本次过滤已读到的聊天（流水线线程可能同时在登记，先复制再排序）"""
+        return sorted(list(self.latest))
+    
+    def signature(self, talkers: Iterable[str]) -> str:
+        """
+        指定聊天加载时的水位线摘要（没有水位线的聊天也计入）
+        
+        这些聊天的水位线变化后，过滤保留的消息和序号随之变化，覆盖它们的断点续传检查点
+        据此失效；其他聊天的水位线变化不影响已读到的部分。
+        """
+        digest = hashlib.md5()
+        for talker in sorted(set(talkers)):
+            timestamp, seq = self.watermarks.get(talker, (None, None))
+            digest.update(f"{talker}|{timestamp.isoformat() if timestamp else ''}|{seq}\n".encode('utf-8'))
+        return digest.hexdigest()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """本次过滤统计"""
+        return {
+            'chats': len(self.latest),
+            'skipped_messages': self.skipped_count,
+            'lookback_messages': self.overlap_count
+        }
@@ -0,0 +1,565 @@
+"""
+chatlog 同步服务 - 从 chatlog HTTP 接口增量拉取聊天记录
+
+以前的流程是从 chatlog 导出 JSON、上传、下周再导出全部历史重新上传。同步服务直接
+分页读取 chatlog 的 /api/v1/chatlog 接口，每个聊天（talker）的消息流直接进入流式入库流水线：
+- 所有请求共用一个 keep-alive 连接池，BoundedSemaphore 限制同时进行的请求数
+- 按消息时间游标分页（不用偏移量），同步期间新写入或撤回的消息不会造成漏读和重复
+- 多个聊天用有界线程池并发同步，共用一个 IngestContext（去重索引和分类缓存只加载一次）
+- 每个聊天的同步位置就是聊天水位线（ChatWatermark，与上传共用）：只请求水位线前答案时间窗口
+  之后的消息，没有新消息的聊天不创建上传记录；处理成功后推进水位线
+- 配置 CHATLOG_SYNC_INTERVAL 后定时自动同步（多进程部署时由持有文件锁的一个进程发起），
+  也可以通过接口或 flask sync-chatlog 手动触发
+同步记录保存在内存中，提供整体进度和每个聊天的同步状态。
+"""
+import fcntl
+import itertools
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app import db
+from app.models import ChatWatermark, UploadHistory
+from app.services.batch_upload import IngestContext
+from app.services.chat_watermark import WatermarkFilter
+from app.services.data_extractor import DataExtractor
+from app.services.file_processor import FileProcessor
+from app.services.task_queue import get_task_queue
+from app.utils.timestamp_parser import TimestampParser, get_timestamp_value
+
+logger = logging.getLogger(__name__)
+
+
+class ChatlogAPIError(Exception):
+    """chatlog 接口请求失败或返回了无法识别的数据"""
+
+
+class ChatlogClient:
+    """
+    chatlog HTTP 接口客户端（线程安全）
+    
+    所有请求共用一个 requests.Session，连接池大小为 max_connections（pool_block=True，
+    连接用完时等待而不是新建），同一服务的连接保持复用；BoundedSemaphore 限制同时进行的请求数。
+    连接失败和 5xx 响应按指数退避重试。
+    """
+    
+    SESSION_PATH = '/api/v1/session'
+    CHATLOG_PATH = '/api/v1/chatlog'
+    
+    def __init__(self, base_url: str, max_connections: int = 4, page_size: int = 500,
+                 timeout: float = 30, retries: int = 3):
+        self.base_url = base_url.rstrip('/')
+        self.page_size = max(1, page_size)
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(max(1, max_connections))
+        self.requests_made = 0
+        
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET']))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_connections),
+                              pool_block=True, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def _get(self, path: str, params: Dict[str, Any]) -> Any:
+        with self._semaphore:
+            self.requests_made += 1
+            try:
+                response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+                response.raise_for_status()
+                return response.json()
+            except requests.RequestException as e:
+                raise ChatlogAPIError(f"GET {path} failed: {str(e)}") from e
+            except ValueError as e:
+                raise ChatlogAPIError(f"GET {path} returned invalid JSON: {str(e)}") from e
+    
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        """会话列表（userName 为聊天标识，nickName 为名称）"""
+        data = self._get(self.SESSION_PATH, {'format': 'json'})
+        items = data.get('items') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            raise ChatlogAPIError(f"GET {self.SESSION_PATH} returned unexpected data")
+        return [item for item in items if isinstance(item, dict) and item.get('userName')]
+    
+    def iter_messages(self, talker: str, since: date, until: date) -> Iterator[Dict[str, Any]]:
+        """
+        按时间顺序分页读取一个聊天在 [since, until] 日期范围内的消息
+        
+        按需请求下一页（由入库流水线的读取速度决定），返回的条数少于 page_size 时结束。
+        按时间游标分页而不是按偏移量：下一页从上一页最后一条消息的时间（秒）开始请求，
+        跳过游标那一秒中已返回的消息。同步期间有新消息写入或消息被撤回时，偏移量会错位
+        而漏读或重复，游标不受影响。游标那一秒的消息超过一页时（极少见）才在这一秒内按偏移量继续。
+        时间无法解析的消息不能推进游标，重新请求游标所在的页时会再次出现，按完整内容去重，只返回一次。
+        """
+        parser = TimestampParser()
+        start = f"{since:%Y-%m-%d}"
+        cursor: Optional[datetime] = None
+        at_cursor: Set[Any] = set()  # 游标那一秒中已返回的消息
+        untimed: Set[str] = set()  # 已返回的时间无法解析的消息
+        offset = 0
+        while True:
+            page = self._get(self.CHATLOG_PATH, {
+                'talker': talker,
+                'time': f"{start}~{until:%Y-%m-%d}",
+                'limit': self.page_size,
+                'offset': offset,
+                'format': 'json'
+            })
+            if page is None:
+                return
+            if not isinstance(page, list):
+                raise ChatlogAPIError(f"GET {self.CHATLOG_PATH} returned unexpected data for {talker}")
+                
+            advanced = False
+            for msg in page:
+                timestamp = self._message_time(parser, msg)
+                if timestamp is None:
+                    key = json.dumps(msg, sort_keys=True, ensure_ascii=False, default=str)
+                    if key not in untimed:
+                        untimed.add(key)
+                        yield msg
+                    continue
+                identity = self._message_identity(msg)
+                if cursor is not None and (timestamp < cursor or (timestamp == cursor and identity in at_cursor)):
+                    continue
+                if timestamp != cursor:
+                    cursor, at_cursor, advanced = timestamp, set(), True
+                at_cursor.add(identity)
+                yield msg
+                
+            if len(page) < self.page_size:
+                if untimed:
+                    logger.warning(f"{len(untimed)} messages from {talker} have no parseable time")
+                return
+            if advanced:
+                start, offset = f"{cursor:%Y-%m-%dT%H:%M:%S}", 0
+            else:
+                offset += len(page)
+    
+    @staticmethod
+    def _message_time(parser: TimestampParser, msg: Any) -> Optional[datetime]:
+        """消息时间（精确到秒，与请求的时间范围一致），无法解析时返回 None"""
+        if not isinstance(msg, dict):
+            return None
+        try:
+            timestamp = parser.parse(get_timestamp_value(msg))
+        except (ValueError, TypeError, OverflowError, OSError):
+            return None
+        return timestamp.replace(microsecond=0) if timestamp else None
+    
+    @staticmethod
+    def _message_identity(msg: Dict[str, Any]) -> Any:
+        """同一秒内区分消息：有 seq 时用 seq，否则用发送者和内容"""
+        if msg.get('seq') is not None:
+            return msg['seq']
+        return (msg.get('sender'), msg.get('type'), str(msg.get('content')), str(msg.get('contents')))
+    
+    def close(self):
+        self.session.close()
+
+
+@dataclass
+class TalkerSync:
+    """一次同步中的一个聊天"""
+    talker: str
+    name: Optional[str] = None
+    status: str = 'queued'  # queued / syncing / up_to_date / completed / failed
+    since: Optional[str] = None  # 请求的起始日期
+    upload_id: Optional[int] = None
+    fetched: int = 0  # 从接口读取的消息数
+    stage: Optional[str] = None
+    progress: float = 0.0
+    qa_count: int = 0
+    error: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class SyncRun:
+    """一次同步"""
+    run_id: str
+    trigger: str  # manual / scheduled / cli
+    concurrency: int
+    requested_talkers: Optional[List[str]] = None  # 为 None 时同步会话列表中的聊天
+    talkers: List[TalkerSync] = field(default_factory=list)
+    task_id: Optional[str] = None
+    status: str = 'pending'  # pending / running / completed / failed
+    error: Optional[str] = None
+    requests_made: int = 0
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    
+    FINISHED_STATUSES = ('up_to_date', 'completed', 'failed')
+    
+    @property
+    def active(self) -> bool:
+        return self.status in ('pending', 'running')
+    
+    @property
+    def finished_count(self) -> int:
+        return sum(1 for item in self.talkers if item.status in self.FINISHED_STATUSES)
+    
+    def get_progress(self) -> float:
+        """整体进度 0-100（已结束的聊天按 100 计）"""
+        if not self.talkers:
+            return 0.0 if self.active else 100.0
+        total = sum(100.0 if item.status in self.FINISHED_STATUSES else item.progress for item in self.talkers)
+        return round(total / len(self.talkers), 1)
+    
+    def to_dict(self, include_talkers: bool = True) -> Dict[str, Any]:
+        data = {
+            'run_id': self.run_id,
+            'task_id': self.task_id,
+            'trigger': self.trigger,
+            'status': self.status,
+            'error': self.error,
+            'concurrency': self.concurrency,
+            'total_talkers': len(self.talkers),
+            'finished_talkers': self.finished_count,
+            'progress': self.get_progress(),
+            'status_counts': dict(Counter(item.status for item in self.talkers)),
+            'fetched_messages': sum(item.fetched for item in self.talkers),
+            'total_saved': sum(item.qa_count for item in self.talkers),
+            'requests_made': self.requests_made,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+        if include_talkers:
+            data['talkers'] = [item.to_dict() for item in self.talkers]
+        return data
+
+
+class ChatlogSyncService:
+    """chatlog 同步管理（同一时间只运行一次同步）"""
+    
+    MAX_RUNS = 50  # 内存中保留的同步记录数
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs: Dict[str, SyncRun] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._lock_fd: Optional[int] = None  # 定时同步文件锁（本进程持有时）
+        self.interval = 0
+    
+    def create_run(self, config: Dict[str, Any], talkers: Optional[Iterable[str]] = None,
+                   trigger: str = 'manual') -> Tuple[SyncRun, bool]:
+        """
+        登记一次同步
+        
+        Args:
+            config: 应用配置
+            talkers: 要同步的聊天，为 None 时使用 CHATLOG_SYNC_TALKERS，仍为空时同步会话列表中的聊天
+            
+        Returns:
+            Tuple[SyncRun, bool]: (同步记录, 是否新建)；已有同步在进行时返回该同步和 False
+        """
+        requested = [t.strip() for t in talkers if t and t.strip()] if talkers is not None else []
+        requested = requested or list(config.get('CHATLOG_SYNC_TALKERS') or []) or None
+        
+        with self._lock:
+            active = next((run for run in self.runs.values() if run.active), None)
+            if active is not None:
+                return active, False
+                
+            run = SyncRun(
+                run_id=uuid.uuid4().hex[:12],
+                trigger=trigger,
+                concurrency=max(1, config.get('CHATLOG_SYNC_CONCURRENCY', 4)),
+                requested_talkers=requested
+            )
+            self.runs[run.run_id] = run
+            if len(self.runs) > self.MAX_RUNS:
+                finished = sorted((r for r in self.runs.values() if not r.active), key=lambda r: r.created_at)
+                for old in finished[:len(self.runs) - self.MAX_RUNS]:
+                    self.runs.pop(old.run_id, None)
+        return run, True
+    
+    def submit(self, app, run: SyncRun) -> str:
+        """把同步作为一个后台任务提交到任务队列"""
+        run.task_id = get_task_queue().submit_task(
+            "chatlog_sync",
+            self.run_sync,
+            app, run.run_id,
+            max_retries=0,  # 失败的聊天没有推进水位线，下次同步时重新拉取
+            timeout=app.config.get('CHATLOG_SYNC_TASK_TIMEOUT', 3600)
+        )
+        return run.task_id
+    
+    def start(self, app, talkers: Optional[Iterable[str]] = None, trigger: str = 'manual') -> Tuple[SyncRun, bool]:
+        """登记并提交一次同步，已有同步在进行时不重复提交"""
+        run, created = self.create_run(app.config, talkers, trigger)
+        if created:
+            self.submit(app, run)
+        return run, created
+    
+    def get_run(self, run_id: str) -> Optional[SyncRun]:
+        return self.runs.get(run_id)
+    
+    def list_runs(self, limit: int = 10) -> List[SyncRun]:
+        """最近的同步记录（新的在前）"""
+        return sorted(self.runs.values(), key=lambda r: r.created_at, reverse=True)[:limit]
+    
+    def run_sync(self, app, run_id: str) -> Dict[str, Any]:
+        """执行同步（任务队列线程或命令行中执行）"""
+        run = self.runs[run_id]
+        run.status = 'running'
+        run.started_at = datetime.utcnow()
+        config = app.config
+        
+        client = ChatlogClient(
+            config.get('CHATLOG_SYNC_URL', 'http://127.0.0.1:5030'),
+            max_connections=run.concurrency,
+            page_size=config.get('CHATLOG_SYNC_PAGE_SIZE', 500),
+            timeout=config.get('CHATLOG_SYNC_REQUEST_TIMEOUT', 30)
+        )
+        try:
+            run.talkers = self._resolve_talkers(client, run, config)
+            logger.info(f"Chatlog sync {run_id}: syncing {len(run.talkers)} chats from {client.base_url} "
+                        f"with concurrency {run.concurrency}")
+                        
+            context = IngestContext()
+            with ThreadPoolExecutor(max_workers=run.concurrency, thread_name_prefix=f'chatlog-sync-{run_id}') as pool:
+                list(pool.map(lambda item: self._sync_talker(app, run, item, client, context), run.talkers))
+            run.status = 'completed'
+            
+        except Exception as e:
+            logger.error(f"Chatlog sync {run_id} failed: {str(e)}")
+            run.status = 'failed'
+            run.error = str(e)
+        finally:
+            run.requests_made = client.requests_made
+            client.close()
+            run.completed_at = datetime.utcnow()
+            
+        self._report_progress(run)
+        logger.info(f"Chatlog sync {run_id} {run.status}: {dict(Counter(item.status for item in run.talkers))}, "
+                    f"{client.requests_made} requests")
+        return run.to_dict(include_talkers=False)
+    
+    def _resolve_talkers(self, client: ChatlogClient, run: SyncRun, config: Dict[str, Any]) -> List[TalkerSync]:
+        """确定要同步的聊天：指定的聊天，或会话列表中的聊天（默认只同步群聊）"""
+        if run.requested_talkers:
+            return [TalkerSync(talker=talker) for talker in dict.fromkeys(run.requested_talkers)]
+            
+        groups_only = config.get('CHATLOG_SYNC_GROUPS_ONLY', True)
+        talkers = {}
+        for session in client.list_sessions():
+            talker = str(session['userName'])
+            if groups_only and not talker.endswith('@chatroom'):
+                continue
+            talkers.setdefault(talker, TalkerSync(talker=talker, name=session.get('nickName') or None))
+        return list(talkers.values())
+    
+    def _sync_talker(self, app, run: SyncRun, item: TalkerSync, client: ChatlogClient, context: IngestContext):
+        """同步一个聊天（工作线程中执行）"""
+        with app.app_context():
+            try:
+                item.status = 'syncing'
+                watermark = ChatWatermark.query.filter_by(talker=item.talker).first()
+                if watermark is not None and not item.name:
+                    item.name = watermark.talker_name
+                since = self._sync_start(watermark, app.config)
+                item.since = since.isoformat()
+                
+                messages = self._fetch(item, client.iter_messages(item.talker, since, date.today() + timedelta(days=1)))
+                pending = self._skip_to_new(messages, watermark)
+                if pending is None:
+                    item.status = 'up_to_date'
+                    return
+                    
+                upload_record = UploadHistory(
+                    filename=f"chatlog:{item.name or item.talker}"[:255],
+                    status='pending',
+                    uploaded_at=datetime.utcnow()
+                )
+                db.session.add(upload_record)
+                db.session.commit()
+                item.upload_id = upload_record.id
+                
+                processor = FileProcessor()
+                processor.ingest_context = context
+                processor.qa_classifier = context.classifier
+                processor.progress_callback = lambda stage, progress: self._update_talker(run, item, stage, progress)
+                
+                result = processor.process_messages(f"chatlog:{item.talker}", pending, upload_record)
+                if result.success:
+                    item.status = 'completed'
+                    item.qa_count = result.total_saved
+                else:
+                    item.status = 'failed'
+                    item.error = result.error_message
+                    
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Chatlog sync {run.run_id}: failed to sync {item.talker}: {str(e)}")
+                item.status = 'failed'
+                item.error = str(e)
+            finally:
+                item.progress = 100.0
+                db.session.remove()
+                
+        self._report_progress(run)
+    
+    def _sync_start(self, watermark: Optional[ChatWatermark], config: Dict[str, Any]) -> date:
+        """
+        请求的起始日期
+        
+        有水位线时从水位线前答案时间窗口再往前一天开始（接口按日期过滤，多留一天
+        避免时区差异漏掉消息），水位线之前的消息由水位线过滤跳过；没有水位线时从 CHATLOG_SYNC_SINCE 开始。
+        """
+        if watermark is None:
+            return date.fromisoformat(config.get('CHATLOG_SYNC_SINCE', '2010-01-01'))
+        lookback = timedelta(seconds=DataExtractor.ANSWER_TIME_WINDOW)
+        return (watermark.last_timestamp - lookback).date() - timedelta(days=1)
+    
+    def _fetch(self, item: TalkerSync, messages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """统计读取的消息数；接口返回的消息缺少聊天标识时补上（水位线按它记录）"""
+        for msg in messages:
+            item.fetched += 1
+            if isinstance(msg, dict) and not msg.get('talker'):
+                msg['talker'] = item.talker
+            yield msg
+    
+    def _skip_to_new(self, messages: Iterator[Dict[str, Any]],
+                     watermark: Optional[ChatWatermark]) -> Optional[Iterator[Dict[str, Any]]]:
+        """
+        读到水位线之后的第一条消息为止
+        
+        没有新消息时返回 None（不创建上传记录）；否则返回包含已读取消息的完整消息流，
+        回看窗口和上下文仍由入库时的水位线过滤处理。已读取的消息不超过请求起始日期到水位线之间的部分。
+        """
+        watermarks = {watermark.talker: (watermark.last_timestamp, watermark.last_seq)} if watermark else {}
+        probe = WatermarkFilter(watermarks, DataExtractor.ANSWER_TIME_WINDOW)
+        
+        buffered = []
+        for msg in messages:
+            buffered.append(msg)
+            if probe.is_new(msg):
+                return itertools.chain(buffered, messages)
+        return None
+    
+    def _update_talker(self, run: SyncRun, item: TalkerSync, stage: str, progress: float):
+        item.stage = stage
+        item.progress = progress
+        self._report_progress(run)
+    
+    def _report_progress(self, run: SyncRun):
+        """更新任务进度并推送WebSocket通知"""
+        if not run.task_id:
+            return
+            
+        get_task_queue().update_progress(
+            run.task_id, run.get_progress(), f'{run.finished_count}/{len(run.talkers)} chats'
+        )
+        
+        from app.services.websocket_service import get_websocket_manager
+        get_websocket_manager().notify_task_update(run.task_id)
+    
+    def start_scheduler(self, app, interval: int):
+        """
+        每隔 interval 秒自动同步一次（上一次同步还在进行时跳过这一次）
+        
+        多进程部署（如多个 gunicorn worker）时每个进程都会启动定时器，但只有持有定时同步
+        文件锁的进程真正发起同步；持有锁的进程退出后（锁随之释放），其他进程在下一次到点时接替。
+        """
+        with self._lock:
+            if self._timer is not None:
+                return
+            self.interval = interval
+            self._schedule_next(app)
+        logger.info(f"Chatlog sync scheduled every {interval}s")
+    
+    def stop_scheduler(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+    
+    def _schedule_next(self, app):
+        self._timer = threading.Timer(self.interval, self._scheduled_sync, args=(app,))
+        self._timer.daemon = True
+        self._timer.start()
+    
+    def _acquire_scheduler_lock(self, app) -> bool:
+        """
+        取得定时同步的跨进程文件锁（flock，进程退出时自动释放），已被其他进程持有时返回 False
+        
+        锁文件为 CHATLOG_SYNC_LOCK_FILE（默认上传目录下的 chatlog_sync.lock），
+        写入持有锁的进程号。
+        """
+        if self._lock_fd is not None:
+            return True
+            
+        lock_path = Path(app.config.get('CHATLOG_SYNC_LOCK_FILE')
+                         or Path(app.config['UPLOAD_FOLDER']) / 'chatlog_sync.lock')
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode('ascii'))
+        self._lock_fd = fd
+        logger.info(f"Process {os.getpid()} runs the scheduled chatlog sync ({lock_path})")
+        return True
+    
+    def _scheduled_sync(self, app):
+        try:
+            if not self._acquire_scheduler_lock(app):
+                logger.debug("Scheduled chatlog sync is run by another process")
+                return
+            run, created = self.start(app, trigger='scheduled')
+            if not created:
+                logger.info(f"Chatlog sync {run.run_id} still running, skipping scheduled sync")
+        except Exception as e:
+            logger.error(f"Failed to start scheduled chatlog sync: {str(e)}")
+        finally:
+            with self._lock:
+                if self._timer is not None:
+                    self._schedule_next(app)
+    
+    def get_schedule(self) -> Dict[str, Any]:
+        """定时同步设置（leader 表示本进程持有定时同步锁）"""
+        return {
+            'enabled': self._timer is not None,
+            'interval': self.interval if self._timer is not None else 0,
+            'leader': self._lock_fd is not None
+        }
+
+
+# 全局 chatlog 同步服务实例
+chatlog_sync_service = ChatlogSyncService()
+
+
+def get_chatlog_sync_service() -> ChatlogSyncService:
+    """获取 chatlog 同步服务实例"""
+    return chatlog_sync_service
+
+
+def init_chatlog_sync(app):
+    """配置了 CHATLOG_SYNC_INTERVAL 时启动定时同步（测试环境不启动）"""
+    interval = app.config.get('CHATLOG_SYNC_INTERVAL', 0)
+    if interval > 0 and not app.testing:
+        chatlog_sync_service.start_scheduler(app, interval)
@@ -0,0 +1,319 @@
+"""
+分块上传服务 - 可断点续传的大文件上传
+
+单次请求受 MAX_CONTENT_LENGTH 限制，整群导出（几百MB到几GB）改为分块上传：
+1. init：登记文件名和总大小，返回 upload_token
+2. PUT 分块：请求体按 offset 追加写入 <token>.part，边写边更新文件哈希（收到开头部分后
+   即可用样本哈希发现疑似重复，客户端可以提前取消）
+3. 连接中断后用 status 查询已接收的字节数（以磁盘上 .part 文件大小为准），从该位置继续
+4. finalize：校验大小后把文件移入上传目录，交给后台流式处理
+
+会话元信息保存在 <token>.json 中，服务重启后仍可续传。多个服务进程共享上传目录：
+- 会话锁是 <token>.lock 上的文件锁（fcntl.flock），finalize 和 abort 后删除
+- 哈希对象无法序列化，各进程缓存自己的增量哈希和已哈希的字节数；分块落到没有缓存的
+  进程时只补读该进程缺少的部分（进程重启后从 .part 开头补读）；样本哈希算出后写入会话元信息
+- 是否计算 MD5 在 init 时确定并写入会话，finalize 不再为校验 MD5 重新读取文件
+"""
+import fcntl
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from app.utils.file_hash import READ_BUFFER_SIZE, UploadHasher
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkedUploadError(Exception):
+    """分块上传错误（code 对应接口错误码，status 为 HTTP 状态码）"""
+    
+    def __init__(self, code: str, message: str, status: int = 400, details: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+        self.details = details or {}
+
+
+class ChunkedUploadService:
+    """分块上传会话管理"""
+    
+    SESSION_DIR = 'chunked'
+    WRITE_BUFFER_SIZE = READ_BUFFER_SIZE  # 读取请求体和写盘的块大小
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hashers: Dict[str, UploadHasher] = {}
+    
+    def _session_dir(self, upload_folder: Path) -> Path:
+        session_dir = Path(upload_folder) / self.SESSION_DIR
+        session_dir.mkdir(parents=True, exist_ok=True)
+        return session_dir
+    
+    def _paths(self, upload_folder: Path, token: str):
+        if not token or not token.isalnum():
+            raise ChunkedUploadError('INVALID_TOKEN', '上传会话标识无效', 404)
+        session_dir = self._session_dir(upload_folder)
+        return session_dir / f'{token}.json', session_dir / f'{token}.part'
+    
+    @contextmanager
+    def _session_lock(self, upload_folder: Path, token: str, blocking: bool = True):
+        """
+        会话的跨进程锁（<token>.lock 上的 flock，进程退出时自动释放）
+        
+        blocking 为 False 时锁被占用则抛出 UPLOAD_BUSY。会话不存在时抛出 UPLOAD_NOT_FOUND，
+        不会留下锁文件。
+        """
+        meta_path, _ = self._paths(upload_folder, token)
+        if not meta_path.exists():
+            raise ChunkedUploadError('UPLOAD_NOT_FOUND', '上传会话不存在或已过期', 404)
+            
+        lock_path = meta_path.with_suffix('.lock')
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise ChunkedUploadError('UPLOAD_BUSY', '该上传会话正在写入其他分块', 409)
+            yield lock_path
+        finally:
+            os.close(fd)
+    
+    def _release_session(self, token: str, lock_path: Path):
+        """会话结束（finalize / abort）：删除锁文件和本进程的哈希缓存（持有锁时调用）"""
+        lock_path.unlink(missing_ok=True)
+        with self._lock:
+            self._hashers.pop(token, None)
+    
+    def _load(self, upload_folder: Path, token: str) -> Dict[str, Any]:
+        meta_path, part_path = self._paths(upload_folder, token)
+        if not meta_path.exists():
+            raise ChunkedUploadError('UPLOAD_NOT_FOUND', '上传会话不存在或已过期', 404)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            session = json.load(f)
+        session['received'] = part_path.stat().st_size if part_path.exists() else 0
+        return session
+    
+    def _save(self, upload_folder: Path, session: Dict[str, Any]):
+        """写入会话元信息（已接收字节数以 .part 文件为准，不保存）"""
+        meta_path, _ = self._paths(upload_folder, session['token'])
+        tmp_path = meta_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({key: value for key, value in session.items() if key != 'received'}, f, ensure_ascii=False)
+        tmp_path.replace(meta_path)
+    
+    def _status(self, session: Dict[str, Any], hasher: Optional[UploadHasher] = None) -> Dict[str, Any]:
+        return {
+            'upload_token': session['token'],
+            'filename': session['filename'],
+            'total_size': session['total_size'],
+            'received': session['received'],
+            'chunk_size': session['chunk_size'],
+            'md5': session.get('legacy_md5', True),
+            'complete': session['received'] == session['total_size'],
+            'sample_hash': session.get('sample_hash') or (hasher.sample_hash if hasher is not None else None),
+            'created_at': session['created_at']
+        }
+    
+    def init_upload(self, upload_folder: Path, filename: str, total_size: int,
+                    chunk_size: int, max_size: int, legacy_md5: bool = True) -> Dict[str, Any]:
+        """
+        创建上传会话
+        
+        Args:
+            legacy_md5: 是否同时计算 MD5（库里还有只记录了 MD5 的旧上传，或客户端要用 MD5 校验时需要）
+        """
+        if not filename:
+            raise ChunkedUploadError('EMPTY_FILENAME', '文件名为空')
+        if total_size <= 0:
+            raise ChunkedUploadError('INVALID_SIZE', '文件大小无效')
+        if total_size > max_size:
+            raise ChunkedUploadError(
+                'FILE_TOO_LARGE', f'文件大小不能超过{max_size // (1024 * 1024)}MB', 413
+            )
+            
+        token = secrets.token_hex(16)
+        session = {
+            'token': token,
+            'filename': filename,
+            'total_size': total_size,
+            'chunk_size': chunk_size,
+            'legacy_md5': legacy_md5,
+            'created_at': datetime.utcnow().isoformat()
+        }
+        _, part_path = self._paths(upload_folder, token)
+        self._save(upload_folder, session)
+        part_path.touch()
+        
+        with self._lock:
+            self._hashers[token] = UploadHasher(total_size, legacy_md5)
+        logger.info(f"Chunked upload {token} started: {filename} ({total_size} bytes)")
+        
+        session['received'] = 0
+        return self._status(session)
+    
+    def get_status(self, upload_folder: Path, token: str) -> Dict[str, Any]:
+        """查询已接收的字节数（续传位置）"""
+        session = self._load(upload_folder, token)
+        with self._lock:
+            hasher = self._hashers.get(token)
+        return self._status(session, hasher if hasher is not None and hasher.size == session['received'] else None)
+    
+    def get_part(self, upload_folder: Path, token: str) -> Tuple[Dict[str, Any], Path]:
+        """已接收部分的数据文件（上传完成前即可用于预览开头的消息）"""
+        session = self._load(upload_folder, token)
+        _, part_path = self._paths(upload_folder, token)
+        return self._status(session), part_path
+    
+    def write_chunk(self, upload_folder: Path, token: str, offset: int, stream: BinaryIO) -> Dict[str, Any]:
+        """
+        在 offset 处写入一个分块
+        
+        offset 必须等于已接收的字节数；不一致时返回 409 和当前位置，客户端从该位置重传。
+        请求中途断开时已写入的部分保留，下一次从新的位置继续。
+        """
+        with self._session_lock(upload_folder, token, blocking=False):
+            session = self._load(upload_folder, token)
+            if offset != session['received']:
+                raise ChunkedUploadError(
+                    'OFFSET_MISMATCH', '分块位置与已接收的数据不一致', 409,
+                    {'received': session['received']}
+                )
+                
+            _, part_path = self._paths(upload_folder, token)
+            hasher = self._get_hasher(token, part_path, session)
+            remaining = session['total_size'] - session['received']
+            
+            written = 0
+            with open(part_path, 'ab') as f:
+                while True:
+                    block = stream.read(self.WRITE_BUFFER_SIZE)
+                    if not block:
+                        break
+                    if written + len(block) > remaining:
+                        raise ChunkedUploadError('CHUNK_TOO_LARGE', '分块超出文件总大小', 400)
+                    f.write(block)
+                    hasher.update(block)
+                    written += len(block)
+                    
+            session['received'] += written
+            if hasher.sample_hash and not session.get('sample_hash'):
+                session['sample_hash'] = hasher.sample_hash
+                self._save(upload_folder, session)
+            return self._status(session, hasher)
+    
+    def _get_hasher(self, token: str, part_path: Path, session: Dict[str, Any]) -> UploadHasher:
+        """
+        取会话的增量哈希（持有会话锁时调用）
+        
+        其他进程写入的分块不在本进程的哈希里：从已哈希的位置补读 .part 中缺少的部分，
+        本进程没有缓存（如服务重启）时从开头读取。
+        """
+        with self._lock:
+            hasher = self._hashers.get(token)
+        if hasher is None or hasher.size > session['received']:
+            hasher = UploadHasher(session['total_size'], session.get('legacy_md5', True))
+            
+        if hasher.size < session['received']:
+            logger.info(f"Chunked upload {token}: hashing {session['received'] - hasher.size} bytes "
+                        f"received by another process")
+            with open(part_path, 'rb') as f:
+                f.seek(hasher.size)
+                remaining = session['received'] - hasher.size
+                while remaining > 0:
+                    block = f.read(min(self.WRITE_BUFFER_SIZE, remaining))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    remaining -= len(block)
+                    
+        with self._lock:
+            self._hashers[token] = hasher
+        return hasher
+    
+    def finalize(self, upload_folder: Path, token: str, target_path: Path) -> Dict[str, Any]:
+        """
+        结束上传：校验完整性，把文件移动到 target_path
+        
+        Returns:
+            Dict: 文件名、大小和接收过程中计算出的哈希（hashes: FileHashes）
+        """
+        with self._session_lock(upload_folder, token) as lock_path:
+            session = self._load(upload_folder, token)
+            if session['received'] != session['total_size']:
+                raise ChunkedUploadError(
+                    'UPLOAD_INCOMPLETE', '文件尚未上传完整', 409,
+                    {'received': session['received'], 'total_size': session['total_size']}
+                )
+                
+            meta_path, part_path = self._paths(upload_folder, token)
+            hashes = self._get_hasher(token, part_path, session).finish()
+            
+            part_path.replace(target_path)
+            meta_path.unlink()
+            self._release_session(token, lock_path)
+            
+        logger.info(f"Chunked upload {token} finalized: {target_path} ({session['total_size']} bytes)")
+        return {
+            'filename': session['filename'],
+            'file_size': session['total_size'],
+            'hashes': hashes
+        }
+    
+    def abort(self, upload_folder: Path, token: str):
+        """取消上传并删除已接收的数据"""
+        meta_path, part_path = self._paths(upload_folder, token)
+        with self._session_lock(upload_folder, token) as lock_path:
+            for path in (part_path, meta_path):
+                if path.exists():
+                    path.unlink()
+            self._release_session(token, lock_path)
+    
+    def cleanup_expired(self, upload_folder: Path, max_age_hours: int = 24) -> int:
+        """清理长时间未完成的上传会话"""
+        cutoff_time = time.time() - max_age_hours * 3600
+        cleaned = 0
+        
+        for meta_path in self._session_dir(upload_folder).glob('*.json'):
+            token = meta_path.stem
+            part_path = meta_path.with_suffix('.part')
+            last_write = max(
+                path.stat().st_mtime for path in (meta_path, part_path) if path.exists()
+            )
+            if last_write >= cutoff_time:
+                continue
+                
+            try:
+                self.abort(upload_folder, token)
+                cleaned += 1
+            except Exception as e:
+                logger.error(f"Failed to remove expired chunked upload {token}: {str(e)}")
+        
+        # 其他进程结束的会话：删除遗留的锁文件，丢弃本进程的哈希缓存
+        session_dir = self._session_dir(upload_folder)
+        for lock_path in session_dir.glob('*.lock'):
+            if not lock_path.with_suffix('.json').exists() and lock_path.stat().st_mtime < cutoff_time:
+                lock_path.unlink(missing_ok=True)
+        with self._lock:
+            for token in [token for token in self._hashers if not (session_dir / f'{token}.json').exists()]:
+                self._hashers.pop(token, None)
+                
+        if cleaned:
+            logger.info(f"Cleaned up {cleaned} expired chunked uploads")
+        return cleaned
+
+
+# 全局分块上传服务实例
+chunked_upload_service = ChunkedUploadService()
+
+
+def get_chunked_upload_service() -> ChunkedUploadService:
+    """获取分块上传服务实例"""
+    return chunked_upload_service
@@ -1,15 +1,27 @@
 """
 微信聊天记录数据提取服务
 """
+import atexit
 import json
 import re
 import logging
+import multiprocessing
+import threading
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
-from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator, Sequence, Callable
+from dataclasses import dataclass, field
+import numpy as np
+from app.utils.chatlog_converter import extract_chatlog_content
+from app.utils.message_buffer import MessageBuffer
+from app.utils.pattern_engine import PatternSet, KeywordMatcher
+from app.utils.timestamp_parser import TimestampParser, get_timestamp_value, parse_timestamp_slow
 
 logger = logging.getLogger(__name__)
 
+CHINESE_WORD_PATTERN = re.compile(r'[\u4e00-\u9fff]+')
+
 
 @dataclass
 class QACandidate:
@@ -23,13 +35,97 @@ class QACandidate:
     context: List[str]  # 上下文消息
 
 
+@dataclass
+class ExtractionTally:
+    """提取统计的累计值（逐个候选累加，不保留候选本身）"""
+    count: int = 0
+    confidence_sum: float = 0.0
+    high: int = 0
+    medium: int = 0
+    low: int = 0
+    advisors: Counter = field(default_factory=Counter)
+    
+    def add(self, confidence: float, advisor: str):
+        self.count += 1
+        self.confidence_sum += confidence
+        if confidence >= 0.8:
+            self.high += 1
+        elif confidence >= 0.6:
+            self.medium += 1
+        else:
+            self.low += 1
+        self.advisors[advisor] += 1
+    
+    def to_stats(self) -> Dict[str, Any]:
+        """与 DataExtractor.get_extraction_stats 相同结构的统计"""
+        if not self.count:
+            return {
+                'total_extracted': 0,
+                'avg_confidence': 0,
+                'confidence_distribution': {},
+                'top_advisors': [],
+                'extraction_quality': 'poor'
+            }
+            
+        avg_confidence = self.confidence_sum / self.count
+        
+        # 提取质量评估
+        quality = 'excellent' if avg_confidence >= 0.8 else \
+                  'good' if avg_confidence >= 0.7 else \
+                  'fair' if avg_confidence >= 0.6 else 'poor'
+                  
+        return {
+            'total_extracted': self.count,
+            'avg_confidence': round(avg_confidence, 3),
+            'confidence_distribution': {'high': self.high, 'medium': self.medium, 'low': self.low},
+            'top_advisors': sorted(self.advisors.items(), key=lambda x: x[1], reverse=True)[:5],
+            'extraction_quality': quality
+        }
+
+
+@dataclass
+class MessageFeatures:
+    """单条消息的规则特征（每条消息只计算一次，答案评分只做集合运算）"""
+    length: int
+    question_score: float
+    indicator_boost: float  # 命中的答案指示词分组加分之和
+    words: frozenset  # 中文词段
+    has_solution: bool
+    has_steps: bool
+    length_bonus: float
+
+
 class DataExtractor:
     """微信聊天记录数据提取器"""
     
-    def __init__(self):
+    # 答案在问题后15条消息内查找，上下文再向后1条、向前2条（流式提取的窗口大小）
+    ANSWER_LOOKAHEAD = 16
+    CONTEXT_LOOKBEHIND = 2
+    ANSWER_TIME_WINDOW = 1800  # 答案需在问题后30分钟内（秒）
+    
+    # 并行提取：消息数达到阈值时按分片分发到多个进程
+    PARALLEL_MIN_MESSAGES = 20000
+    SHARD_SIZE = 5000
+    
+    # 问题识别加分词
+    QUESTION_WORDS = ['什么', '如何', '怎么', '为什么', '哪里', '哪个', '能否', '可以', '请问', '有没有', '您有', '老师']
+    EDUCATIONAL_WORDS = ['FAFSA', 'CSS', '学费', '助学金', '申请', '学校', '孩子', '办法', '建议']
+    
+    def __init__(self, max_workers: Optional[int] = None):
         self.qa_patterns = self._init_qa_patterns()
         self.noise_patterns = self._init_noise_patterns()
         self.confidence_threshold = 0.1  # 进一步降低阈值，适应真实聊天场景
+        self.max_workers = max(1, max_workers if max_workers is not None else self._configured_workers())
+        self._compile_patterns()
+    
+    @staticmethod
+    def _configured_workers() -> int:
+        """提取进程数（EXTRACT_WORKERS，默认1即在当前进程提取；不在应用上下文中时为1）"""
+        try:
+            from flask import current_app
+            return int(current_app.config.get('EXTRACT_WORKERS', 1))
+        except RuntimeError:
+            return 1
     
     def _init_qa_patterns(self) -> List[Dict[str, Any]]:
         """初始化问答识别模式"""
@@ -109,6 +205,23 @@ class DataExtractor:
             }
         ]
     
+    def _compile_patterns(self):
+        """把规则编译成组合匹配器（修改 qa_patterns / noise_patterns 后需重新调用）"""
+        # 问题识别：每个模式组一个规则，外加长文本请教和求助两个固定模式
+        question_rules = {group['name']: group['question_patterns'] for group in self.qa_patterns}
+        question_rules['__advice'] = [r'.*[您你].*(有|什么|怎么).*(好的)?.*[办法方法建议].*[吗？?]?']
+        question_rules['__help'] = [r'.*(老师|请教|咨询|求助|帮忙).*']
+        self._question_matcher = PatternSet(question_rules)
+        
+        # 答案置信度：每个模式组的答案指示词，外加解决方案和步骤结构两个固定模式
+        answer_rules = {group['name']: group.get('answer_indicators', []) for group in self.qa_patterns}
+        answer_rules['__solution'] = [r'(可以|建议|推荐|方法|步骤|解决|处理)']
+        answer_rules['__steps'] = [r'(首先|然后|接着|最后|第[一二三四五六七八九十])']
+        self._answer_matcher = PatternSet(answer_rules)
+        
+        self._noise_matcher = PatternSet({'noise': self.noise_patterns})
+        self._question_word_matcher = KeywordMatcher(self.QUESTION_WORDS + self.EDUCATIONAL_WORDS)
+    
     def _init_noise_patterns(self) -> List[str]:
         """初始化噪声过滤模式"""
         return [
@@ -176,77 +289,112 @@ class DataExtractor:
             logger.error(f"Failed to extract data from {source_file}: {str(e)}")
             return []
     
-    def _parse_messages(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """解析消息数据"""
-        messages = []
+    def _parse_messages(self, data: Dict[str, Any],
+                        message_filter: Optional[Callable[[Iterable[Dict[str, Any]]], Iterable[Dict[str, Any]]]] = None
+                        ) -> MessageBuffer:
+        """
+        解析消息数据，返回按时间排序的列式消息缓冲区
         
+        Args:
+            data: 导出的JSON数据
+            message_filter: 标准化之前作用于原始消息流的过滤（如聊天水位线）
+        """
+        raw_messages = self.iter_raw_messages(data)
+        if message_filter is not None:
+            raw_messages = message_filter(raw_messages)
+        
+        messages = MessageBuffer()
+        messages.extend(self.iter_normalized_messages(raw_messages))
+        return messages.sorted_by_time()
+    
+    def iter_raw_messages(self, data: Any) -> Iterable[Dict[str, Any]]:
+        """
+        取导出数据中的原始消息列表
+        
+        根对象取先出现的 messages 字段或 data 数组，与流式读取的识别规则
+        （StreamingJSONProcessor.detect_messages_prefix）相同，同一文件两条路径读到相同的消息
+        """
         if isinstance(data, dict):
             # 处理单个群聊数据
-            if 'messages' in data:
-                messages.extend(self._normalize_messages(data['messages']))
-            elif 'data' in data and isinstance(data['data'], list):
-                messages.extend(self._normalize_messages(data['data']))
+            for key, value in data.items():
+                if key == 'messages' or (key == 'data' and isinstance(value, list)):
+                    return value
         elif isinstance(data, list):
             # 处理消息列表
-            messages.extend(self._normalize_messages(data))
-        
-        return sorted(messages, key=lambda x: x.get('timestamp', 0))
+            return data
+        return []
     
-    def _normalize_messages(self, raw_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """标准化消息格式"""
-        normalized = []
+    def iter_normalized_messages(self, raw_messages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """逐条标准化消息（可直接消费流式读取的消息）"""
+        # 每个文件单独识别时间戳格式
+        timestamp_parser = TimestampParser()
         
         for msg in raw_messages:
             try:
-                # 检查是否是前端转换的简化格式
-                if self._is_frontend_format(msg):
-                    logger.info(f"Processing frontend format message: {msg.get('id', 'no-id')}")
-                    normalized_msg = self._normalize_frontend_message(msg)
-                    if normalized_msg:
-                        if self._is_noise(normalized_msg['content']):
-                            logger.info(f"Message filtered as noise: {normalized_msg['content'][:50]}")
-                        else:
-                            logger.info(f"Added normalized message: {normalized_msg['content'][:50]}")
-                            normalized.append(normalized_msg)
-                    else:
-                        logger.info(f"Failed to normalize message: {msg}")
-                    continue
-                
-                # 处理原始chatlog格式
-                # 跳过chatlog格式的无效消息类型
-                msg_type = msg.get('type', 1)
-                if msg_type in [3, 10000]:  # 系统消息等无效类型
-                    continue
-                
-                # 跳过没有发送者的消息
-                if not msg.get('senderName') and not msg.get('sender') and not msg.get('from_user'):
-                    continue
-                
-                content = self._extract_content(msg)
-                
-                # 跳过内容过短或为空的消息 (放宽限制以便原始消息保存)
-                if not content or len(content.strip()) < 2:
-                    continue
-                
-                # 跳过纯表情或特殊字符
-                if re.match(r'^[\s\U0001F300-\U0001F9FF\u2600-\u27BF\u2B05-\u2B07\u2934-\u2935\u2B05-\u2B07\u25B6\u25C0\u23CF-\u23FA\U0001F680-\U0001F6FF]+$', content):
-                    continue
-                
-                normalized_msg = {
-                    'content': content,
-                    'sender': self._extract_sender(msg),
-                    'timestamp': self._extract_timestamp(msg),
-                    'msg_type': msg_type,
-                    'original': msg
-                }
-                
-                if not self._is_noise(normalized_msg['content']):
-                    normalized.append(normalized_msg)
+                normalized_msg = self.normalize_message(msg, timestamp_parser)
+                if normalized_msg:
+                    yield normalized_msg
             except Exception as e:
                 logger.debug(f"Failed to normalize message: {str(e)}")
                 continue
         
-        return normalized
+        logger.debug(f"Timestamp format: {timestamp_parser.fast_parser_name}, "
+                     f"fast {timestamp_parser.fast_count}, slow {timestamp_parser.slow_count}")
+    
+    def normalize_message(self, msg: Dict[str, Any],
+                          timestamp_parser: Optional[TimestampParser] = None) -> Optional[Dict[str, Any]]:
+        """
+        标准化单条消息
+        
+        Args:
+            msg: 原始消息
+            timestamp_parser: 当前文件的时间戳解析器
+        
+        Returns:
+            Optional[Dict]: 标准化后的消息；无效消息或噪声返回 None
+        """
+        # 检查是否是前端转换的简化格式
+        if self._is_frontend_format(msg):
+            logger.debug(f"Processing frontend format message: {msg.get('id', 'no-id')}")
+            normalized_msg = self._normalize_frontend_message(msg, timestamp_parser)
+            if not normalized_msg:
+                logger.debug(f"Failed to normalize message: {msg}")
+                return None
+            if self._is_noise(normalized_msg['content']):
+                logger.debug(f"Message filtered as noise: {normalized_msg['content'][:50]}")
+                return None
+            return normalized_msg
+        
+        # 处理原始chatlog格式
+        # 跳过chatlog格式的无效消息类型
+        msg_type = msg.get('type', 1)
+        if msg_type in [3, 10000]:  # 系统消息等无效类型
+            return None
+        
+        # 跳过没有发送者的消息
+        if not msg.get('senderName') and not msg.get('sender') and not msg.get('from_user'):
+            return None
+        
+        content = self._extract_content(msg)
+        
+        # 跳过内容过短或为空的消息 (放宽限制以便原始消息保存)
+        if not content or len(content.strip()) < 2:
+            return None
+        
+        # 跳过纯表情或特殊字符
+        if re.match(r'^[\s\U0001F300-\U0001F9FF\u2600-\u27BF\u2B05-\u2B07\u2934-\u2935\u2B05-\u2B07\u25B6\u25C0\u23CF-\u23FA\U0001F680-\U0001F6FF]+$', content):
+            return None
+        
+        normalized_msg = {
+            'content': content,
+            'sender': self._extract_sender(msg),
+            'timestamp': self._extract_timestamp(msg, timestamp_parser),
+            'msg_type': msg_type
+        }
+        
+        if self._is_noise(normalized_msg['content']):
+            return None
+        return normalized_msg
     
     def _is_frontend_format(self, msg: Dict[str, Any]) -> bool:
         """判断是否是前端转换的简化格式"""
@@ -270,7 +418,8 @@ class DataExtractor:
         
         return result
     
-    def _normalize_frontend_message(self, msg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    def _normalize_frontend_message(self, msg: Dict[str, Any],
+                                    timestamp_parser: Optional[TimestampParser] = None) -> Optional[Dict[str, Any]]:
         """标准化前端转换的消息格式"""
         try:
             content = str(msg.get('content', '')).strip()
@@ -284,7 +433,7 @@ class DataExtractor:
                 return None
             
             # 解析时间戳（支持多种格式）
-            parsed_timestamp = self._extract_timestamp(msg)
+            parsed_timestamp = self._extract_timestamp(msg, timestamp_parser)
             
             # 提取发送者（支持多种字段名）
             sender = self._extract_sender(msg)
@@ -293,51 +442,15 @@ class DataExtractor:
                 'content': content,
                 'sender': sender,
                 'timestamp': parsed_timestamp,
-                'msg_type': 1,  # 文本消息
-                'original': msg
+                'msg_type': 1  # 文本消息
             }
         except Exception as e:
             logger.debug(f"Failed to normalize frontend message: {str(e)}")
             return None
     
     def _extract_content(self, msg: Dict[str, Any]) -> str:
-        """提取消息内容"""
-        content = ''
-        
-        # 优先处理chatlog格式的复杂内容结构
-        if 'contents' in msg and isinstance(msg['contents'], dict):
-            contents = msg['contents']
-            
-            # 处理描述内容
-            if contents.get('desc'):
-                content = str(contents['desc']).strip()
-            
-            # 处理嵌套的聊天记录内容
-            elif contents.get('recordInfo') and contents['recordInfo'].get('DataList'):
-                data_list = contents['recordInfo']['DataList']
-                if data_list.get('DataItems'):
-                    for item in data_list['DataItems']:
-                        if item.get('DataDesc'):
-                            nested_content = str(item['DataDesc']).strip()
-                            if nested_content and len(nested_content) > len(content):
-                                content = nested_content
-        
-        # 如果没有找到复杂内容，尝试标准字段
-        if not content:
-            for field in ['content', 'text', 'message', 'body']:
-                if field in msg and msg[field]:
-                    content = str(msg[field]).strip()
-                    break
-        
-        # 清理内容格式
-        if content:
-            # 移除用户名前缀（如 "林: "）
-            import re
-            content = re.sub(r'^[^:：]+[:：]\s*', '', content)
-            # 移除多余的空白字符
-            content = re.sub(r'\s+', ' ', content).strip()
-        
-        return content
+        """提取消息内容（规则与 chatlog 转换工具相同）"""
+        return extract_chatlog_content(msg)
     
     def _extract_sender(self, msg: Dict[str, Any]) -> str:
         """提取发送者信息"""
@@ -346,221 +459,458 @@ class DataExtractor:
             return str(msg['senderName']).strip()
         
         # 尝试其他常见字段
-        for field in ['sender', 'from', 'user', 'nickname', 'name', 'from_user']:
-            if field in msg and msg[field]:
-                return str(msg[field]).strip()
+        for key in ['sender', 'from', 'user', 'nickname', 'name', 'from_user']:
+            if key in msg and msg[key]:
+                return str(msg[key]).strip()
         return 'Unknown'
     
-    def _extract_timestamp(self, msg: Dict[str, Any]) -> datetime:
-        """提取时间戳"""
-        timestamp = None
+    def _extract_timestamp(self, msg: Dict[str, Any], timestamp_parser: Optional[TimestampParser] = None) -> datetime:
+        """
+        提取时间戳
         
-        for field in ['timestamp', 'time', 'created_at', 'date']:
-            if field in msg and msg[field] is not None:
-                timestamp = msg[field]
-                logger.debug(f"Found timestamp field '{field}': {timestamp} (type: {type(timestamp)})")
-                break
+        Args:
+            msg: 原始消息
+            timestamp_parser: 当前文件的时间戳解析器（识别格式后走快速路径）；为空时逐个格式尝试
+        """
+        timestamp = get_timestamp_value(msg)
         
         if timestamp is not None:
             try:
-                if isinstance(timestamp, str):
-                    logger.debug(f"Parsing string timestamp: {timestamp}")
-                    # 尝试解析字符串时间，支持chatlog的ISO格式
-                    formats = [
-                        '%Y-%m-%d %H:%M:%S',
-                        '%Y/%m/%d %H:%M:%S',
-                        '%Y-%m-%dT%H:%M:%S',
-                        '%Y-%m-%dT%H:%M:%SZ',
-                        '%Y-%m-%dT%H:%M:%S.%f',
-                        '%Y-%m-%dT%H:%M:%S.%fZ'
-                    ]
-                    for fmt in formats:
-                        try:
-                            result = datetime.strptime(timestamp, fmt)
-                            logger.debug(f"Successfully parsed with format {fmt}: {result}")
-                            return result
-                        except ValueError:
-                            continue
-                    
-                    # 处理chatlog的复杂ISO格式（如2025-07-28T09:21:50+08:00）
-                    try:
-                        # 移除时区信息后解析
-                        clean_timestamp = re.sub(r'[+\-]\d{2}:\d{2}$', '', timestamp)
-                        clean_timestamp = clean_timestamp.replace('Z', '')
-                        for fmt in ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f']:
-                            try:
-                                result = datetime.strptime(clean_timestamp, fmt)
-                                logger.debug(f"Successfully parsed cleaned timestamp with format {fmt}: {result}")
-                                return result
-                            except ValueError:
-                                continue
-                    except:
-                        pass
-                elif isinstance(timestamp, (int, float)):
-                    logger.debug(f"Parsing numeric timestamp: {timestamp}")
-                    # Unix时间戳 - 前端parseTimestamp返回的是毫秒时间戳
-                    if timestamp > 1e12:  # 毫秒时间戳（调整阈值）
-                        timestamp = timestamp / 1000
-                    elif timestamp > 1e10:  # 也可能是毫秒
-                        timestamp = timestamp / 1000
-                    result = datetime.fromtimestamp(timestamp)
-                    logger.debug(f"Successfully parsed numeric timestamp: {result}")
+                if timestamp_parser is not None:
+                    result = timestamp_parser.parse(timestamp)
+                else:
+                    result = parse_timestamp_slow(timestamp)
+                if result is not None:
                     return result
-                elif isinstance(timestamp, datetime):
-                    logger.debug(f"Using datetime object directly: {timestamp}")
-                    return timestamp
             except Exception as e:
                 logger.warning(f"Failed to parse timestamp {timestamp}: {str(e)}")
         
-        default_time = datetime.now()
-        logger.debug(f"Using default timestamp: {default_time}")
-        return default_time
+        return datetime.now()
     
     def _is_noise(self, content: str) -> bool:
         """判断是否为噪声内容"""
         if len(content.strip()) < 2:
             return True
         
-        for pattern in self.noise_patterns:
-            if re.search(pattern, content, re.IGNORECASE):
-                return True
+        return self._noise_matcher.search(content)
+    
+    def _extract_qa_pairs(self, messages: Sequence[Dict[str, Any]], source_file: str) -> List[QACandidate]:
+        """提取问答对（messages 可以是消息列表或 MessageBuffer）"""
+        if self.max_workers > 1 and len(messages) >= self.PARALLEL_MIN_MESSAGES:
+            return self.extract_parallel(messages, source_file)
         
-        return False
+        buffer = messages if isinstance(messages, MessageBuffer) else MessageBuffer.from_messages(messages)
+        return self._extract_shard(buffer, 0, len(buffer))
     
-    def _extract_qa_pairs(self, messages: List[Dict[str, Any]], source_file: str) -> List[QACandidate]:
-        """提取问答对"""
+    def extract_from_stream(self, messages: Iterable[Dict[str, Any]], source_file: str) -> List[QACandidate]:
+        """
+        从标准化消息流中增量提取问答对
+        
+        消息按 SHARD_SIZE 条分片读入列式缓冲区逐片提取（分片之间的重叠见 extract_parallel），
+        同一时间只保留一个分片，结果与对完整消息列表调用 _extract_qa_pairs 一致。
+        消息需按时间顺序到达。
+        
+        Args:
+            messages: 标准化后的消息迭代器（见 iter_normalized_messages）
+            source_file: 源文件路径
+        
+        Returns:
+            List[QACandidate]: 提取的问答候选列表
+        """
         qa_candidates = []
+        for _, shard_candidates in self.iter_shard_results(messages, source_file):
+            qa_candidates.extend(shard_candidates)
+        return self._deduplicate_qa(qa_candidates)
+    
+    def iter_extract(self, messages: Iterable[Dict[str, Any]], source_file: str,
+                     offset: int = 0) -> Iterator[Tuple[int, List[QACandidate]]]:
+        """
+        逐个分片产出问答候选（上传处理流水线的提取阶段）
+        
+        每个分片提取完即产出 (分片结束位置, 候选列表)，下游的分类和入库不必等整个文件提取结束，
+        位置可作为断点续传的检查点。跨分片的重复按先出现的保留（extract_from_stream 在全部结果中
+        保留置信度最高的一条，只有问答前50字相同但置信度不同时两者才会选中不同的一条，候选数量相同）。
+        
+        Args:
+            offset: 从该位置的消息开始判断问题（之前的消息只作为上下文），见 _iter_shards
+        """
+        seen = set()
+        for position, shard_candidates in self.iter_shard_results(messages, source_file, offset):
+            unique = []
+            for qa in shard_candidates:
+                key = self._dedup_key(qa)
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(qa)
+            yield position, unique
+    
+    def iter_shard_results(self, messages: Iterable[Dict[str, Any]], source_file: str,
+                           offset: int = 0) -> Iterator[Tuple[int, List[QACandidate]]]:
+        """
+        按分片顺序产出 (分片结束位置, 分片的提取结果)（max_workers > 1 时多进程并行，见 extract_parallel）
+        
+        位置是消息在整个消息流中的序号，offset 之前的问题已在之前处理过
+        """
+        if self.max_workers > 1:
+            yield from self._iter_parallel_results(messages, source_file, offset)
+            return
+        
+        candidate_count = 0
+        position = offset
+        
+        for shard, start, end in self._iter_shards(messages, offset):
+            shard_candidates = self._extract_shard(shard, start, end)
+            candidate_count += len(shard_candidates)
+            position += end - start
+            yield position, shard_candidates
+        
+        logger.info(f"Extracted {candidate_count} QA candidates from {position - offset} streamed messages in {source_file}")
+    
+    def extract_parallel(self, messages: Iterable[Dict[str, Any]], source_file: str) -> List[QACandidate]:
+        """
+        多进程并行提取问答对
+        
+        消息流按 SHARD_SIZE 条切片，每个分片向前带 CONTEXT_LOOKBEHIND 条、向后带
+        ANSWER_LOOKAHEAD 条重叠消息（_find_answers 最多看15条，30分钟限制只会更早结束），
+        因此分片内的结果与串行提取完全相同。各分片结果按分片顺序合并后统一去重，
+        输出与 _extract_qa_pairs 串行路径一致。进程池不可用时退回到当前进程逐片提取。
         
-        for i, msg in enumerate(messages):
-            if self._is_potential_question(msg['content']):
-                answers = self._find_answers(messages, i, msg)
+        Args:
+            messages: 按时间排序的标准化消息（列表或迭代器）
+            source_file: 源文件路径
+        
+        Returns:
+            List[QACandidate]: 提取的问答候选列表
+        """
+        qa_candidates = []
+        for _, shard_candidates in self._iter_parallel_results(messages, source_file):
+            qa_candidates.extend(shard_candidates)
+        return self._deduplicate_qa(qa_candidates)
+    
+    def _iter_parallel_results(self, messages: Iterable[Dict[str, Any]], source_file: str,
+                               offset: int = 0) -> Iterator[Tuple[int, List[QACandidate]]]:
+        """
+        把分片提交到进程池，按分片顺序产出 (分片结束位置, 结果)
+        
+        消息流的长度事先未知：分片先暂存，读到 PARALLEL_MIN_MESSAGES 条消息后才把暂存的分片提交到
+        共享进程池（见 _get_extract_pool）；不足阈值的消息流全部在当前进程提取（与 _extract_qa_pairs
+        的阈值一致），不付出进程启动和分片序列化的开销。
+        """
+        pending = deque()  # [future（在当前进程提取时为 None）, 分片, 起始, 结束, 分片结束位置]
+        shard_count = 0
+        candidate_count = 0
+        position = offset
+        executor = None
+        pool_started = False
+        
+        def collect(item):
+            future, shard, start, end, shard_end = item
+            if future is None:
+                return shard_end, self._extract_shard(shard, start, end)
+            try:
+                return shard_end, future.result()
+            except Exception as e:
+                logger.warning(f"Extraction shard failed in worker, retrying in-process: {str(e)}")
+                _discard_extract_pool(executor)
+                return shard_end, self._extract_shard(shard, start, end)
+        
+        def submit(item):
+            nonlocal executor
+            if executor is None:
+                return
+            try:
+                item[0] = executor.submit(_extract_shard_in_worker, item[1], item[2], item[3])
+            except Exception as e:
+                logger.warning(f"Process pool unavailable, extracting remaining shards in-process: {str(e)}")
+                _discard_extract_pool(executor)
+                executor = None
+        
+        try:
+            for shard, start, end in self._iter_shards(messages, offset):
+                shard_count += 1
+                position += end - start
+                pending.append([None, shard, start, end, position])
                 
-                for answer_msg, confidence in answers:
-                    if confidence >= self.confidence_threshold:
-                        context = self._extract_context(messages, i, answer_msg.get('index', i+1))
-                        
-                        qa_candidate = QACandidate(
-                            question=msg['content'],
-                            answer=answer_msg['content'],
-                            asker=msg['sender'],
-                            advisor=answer_msg['sender'],
-                            timestamp=msg['timestamp'],
-                            confidence=confidence,
-                            context=context
-                        )
-                        qa_candidates.append(qa_candidate)
+                if not pool_started:
+                    if position - offset < self.PARALLEL_MIN_MESSAGES:
+                        continue
+                    pool_started = True
+                    try:
+                        executor = _get_extract_pool(self.max_workers)
+                    except Exception as e:
+                        logger.warning(f"Process pool unavailable, extracting in-process: {str(e)}")
+                    for item in pending:
+                        submit(item)
+                else:
+                    submit(pending[-1])
+                
+                # 限制在途分片数量，流式输入时内存占用保持稳定
+                while len(pending) >= self.max_workers * 2:
+                    result = collect(pending.popleft())
+                    candidate_count += len(result[1])
+                    yield result
+            
+            while pending:
+                result = collect(pending.popleft())
+                candidate_count += len(result[1])
+                yield result
+        finally:
+            # 进程池由所有提取器共享，提前结束时只取消本次提交的分片
+            for item in pending:
+                if item[0] is not None:
+                    item[0].cancel()
+        
+        workers = f"{self.max_workers} workers" if pool_started else 'in-process, below parallel threshold'
+        logger.info(f"Extracted {candidate_count} QA candidates from {position - offset} messages "
+                    f"in {shard_count} shards ({workers}) in {source_file}")
+    
+    def _iter_shards(self, messages: Iterable[Dict[str, Any]], offset: int = 0) -> Iterator[Tuple[MessageBuffer, int, int]]:
+        """
+        把消息流切成带重叠的分片
+        
+        offset 大于0时（断点续传）跳过 offset 之前的问题，只保留 CONTEXT_LOOKBEHIND 条作为上下文；
+        offset 总在之前的分片边界上，因此之后的分片与从头处理时完全相同。
         
+        Yields:
+            (分片消息, 起始序号, 结束序号)：分片只负责判断 [起始, 结束) 范围内的问题，
+            其余消息仅作为上下文和答案候选
+        """
+        shard_size = max(self.SHARD_SIZE, self.CONTEXT_LOOKBEHIND)
+        
+        if isinstance(messages, MessageBuffer):
+            start = offset
+            while start < len(messages):
+                head = min(start, self.CONTEXT_LOOKBEHIND)
+                end = min(len(messages), start + shard_size)
+                yield messages[start - head:end + self.ANSWER_LOOKAHEAD], head, head + end - start
+                start = end
+            return
+        
+        buffer = MessageBuffer()
+        head = min(offset, self.CONTEXT_LOOKBEHIND)  # buffer 开头属于之前分片的消息数
+        skip = offset - head
+        
+        for index, message in enumerate(messages):
+            if index < skip:
+                continue
+            buffer.append_message(message)
+            
+            if len(buffer) >= head + shard_size + self.ANSWER_LOOKAHEAD:
+                yield buffer, head, head + shard_size
+                buffer = buffer[head + shard_size - self.CONTEXT_LOOKBEHIND:]
+                head = self.CONTEXT_LOOKBEHIND
+        
+        if len(buffer) > head:
+            yield buffer, head, len(buffer)
+    
+    def _extract_shard(self, shard: MessageBuffer, start: int, end: int) -> List[QACandidate]:
+        """提取单个分片中 [start, end) 范围内问题的问答对（分片内去重）"""
+        answer_windows = self._answer_windows(shard)
+        
+        qa_candidates = []
+        for i in range(start, end):
+            qa_candidates.extend(self._extract_qa_at(shard, i, answer_windows))
+        
+        # 分片内先去重可减少回传数据；去重保留置信度最高且最早的一条，合并后再次去重结果不变
         return self._deduplicate_qa(qa_candidates)
     
+    def _answer_windows(self, messages: MessageBuffer) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        向量化计算每条消息作为问题时的答案查找窗口
+        
+        Returns:
+            (window_end, other_sender)：window_end[i] 是问题 i 的候选答案截止位置（不含），
+            other_sender[i, k] 表示第 i+1+k 条消息与问题 i 的发送者不同
+        """
+        n = len(messages)
+        lookahead = self.ANSWER_LOOKAHEAD - 1
+        if n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, lookahead), dtype=bool)
+        
+        timestamps = messages.timestamps
+        sender_ids = messages.sender_ids
+        
+        # 每条消息之后的 lookahead 条消息的发送者（越界位置填 -1 并排除）
+        padded_senders = np.concatenate([sender_ids[1:], np.full(lookahead, -1, dtype=sender_ids.dtype)])
+        following_senders = np.lib.stride_tricks.sliding_window_view(padded_senders, lookahead)
+        other_sender = (following_senders != sender_ids[:, None]) & (following_senders >= 0)
+        
+        positions = np.arange(n)
+        window_end = np.minimum(positions + self.ANSWER_LOOKAHEAD, n)
+        limits = timestamps + self.ANSWER_TIME_WINDOW * 1000000
+        
+        if messages.is_sorted():
+            # 时间有序：第一条超出30分钟的消息位置用二分查找一次算出
+            window_end = np.minimum(window_end, np.searchsorted(timestamps, limits, side='right'))
+        else:
+            # 无序时与逐条扫描一致：遇到第一条超时的他人消息即停止
+            padded_times = np.concatenate([timestamps[1:], np.zeros(lookahead, dtype=timestamps.dtype)])
+            following_times = np.lib.stride_tricks.sliding_window_view(padded_times, lookahead)
+            blocked = other_sender & (following_times > limits[:, None])
+            first_blocked = np.where(blocked.any(axis=1), blocked.argmax(axis=1), lookahead)
+            window_end = np.minimum(window_end, positions + 1 + first_blocked)
+        
+        return window_end, other_sender
+    
+    def _extract_qa_at(self, messages: MessageBuffer, i: int,
+                       answer_windows: Tuple[np.ndarray, np.ndarray]) -> List[QACandidate]:
+        """以第 i 条消息为问题提取问答对"""
+        if self._get_features(messages, i).question_score < 0.3:
+            return []
+        
+        qa_candidates = []
+        for answer_index, confidence in self._find_answers(messages, i, answer_windows):
+            if confidence >= self.confidence_threshold:
+                context = self._extract_context(messages, i, answer_index)
+                
+                qa_candidates.append(QACandidate(
+                    question=messages.content(i),
+                    answer=messages.content(answer_index),
+                    asker=messages.sender(i),
+                    advisor=messages.sender(answer_index),
+                    timestamp=messages.timestamp(i),
+                    confidence=confidence,
+                    context=context
+                ))
+        
+        return qa_candidates
+    
+    def _get_features(self, messages: MessageBuffer, index: int) -> MessageFeatures:
+        """
+        获取消息的规则特征
+        
+        首次使用时计算并缓存在缓冲区的 features 列。一条消息会落在前面多达15个问题的
+        答案查找窗口里，缓存后正则和分词只做一次。
+        """
+        features = messages.features[index]
+        if features is None:
+            features = self._compute_features(messages.contents[index])
+            messages.features[index] = features
+        return features
+    
+    def _compute_features(self, content: str) -> MessageFeatures:
+        """计算单条消息的规则特征"""
+        matched = self._answer_matcher.matches(content)
+        
+        # 与原逐组累加的顺序一致，保证浮点结果相同
+        indicator_boost = 0.0
+        for pattern_group in self.qa_patterns:
+            if pattern_group['name'] in matched:
+                indicator_boost += pattern_group.get('confidence_boost', 0.2)
+        
+        # 答案长度合理性
+        length = len(content)
+        if 10 <= length <= 200:
+            length_bonus = 0.1
+        elif length > 200:
+            length_bonus = 0.05
+        else:
+            length_bonus = 0.0
+        
+        return MessageFeatures(
+            length=length,
+            question_score=self._question_score(content),
+            indicator_boost=indicator_boost,
+            words=frozenset(CHINESE_WORD_PATTERN.findall(content)),
+            has_solution='__solution' in matched,
+            has_steps='__steps' in matched,
+            length_bonus=length_bonus
+        )
+    
     def _is_potential_question(self, content: str) -> bool:
         """判断是否为潜在问题"""
+        return self._question_score(content) >= 0.3  # 保持较低阈值
+    
+    def _question_score(self, content: str) -> float:
+        """计算问题得分"""
         question_score = 0
+        matched = self._question_matcher.matches(content)
         
         for pattern_group in self.qa_patterns:
-            for pattern in pattern_group['question_patterns']:
-                if re.search(pattern, content, re.IGNORECASE):
-                    question_score += 1
-                    break
+            if pattern_group['name'] in matched:
+                question_score += 1
         
         # 问句长度判断
         if len(content) > 5:
             question_score += 0.5
         
+        words = self._question_word_matcher.find(content)
+        
         # 包含疑问词
-        question_words = ['什么', '如何', '怎么', '为什么', '哪里', '哪个', '能否', '可以', '请问', '有没有', '您有', '老师']
-        for word in question_words:
-            if word in content:
-                question_score += 0.5
-                break
+        if any(word in words for word in self.QUESTION_WORDS):
+            question_score += 0.5
         
         # 教育咨询特殊词汇加分
-        educational_words = ['FAFSA', 'CSS', '学费', '助学金', '申请', '学校', '孩子', '办法', '建议']
-        for word in educational_words:
-            if word in content:
-                question_score += 0.3
-                break
+        if any(word in words for word in self.EDUCATIONAL_WORDS):
+            question_score += 0.3
         
         # 长文本中的问题模式（如：...您有好的办法吗？）
-        if re.search(r'.*[您你].*(有|什么|怎么).*(好的)?.*[办法方法建议].*[吗？?]?', content):
+        if '__advice' in matched:
             question_score += 0.8
         
         # 求助模式
-        if re.search(r'.*(老师|请教|咨询|求助|帮忙).*', content):
+        if '__help' in matched:
             question_score += 0.4
             
-        return question_score >= 0.3  # 保持较低阈值
+        return question_score
     
-    def _find_answers(self, messages: List[Dict[str, Any]], question_index: int, question_msg: Dict[str, Any]) -> List[Tuple[Dict[str, Any], float]]:
-        """寻找问题的答案"""
-        answers = []
-        question_time = question_msg['timestamp']
+    def _find_answers(self, messages: MessageBuffer, question_index: int,
+                      answer_windows: Tuple[np.ndarray, np.ndarray]) -> List[Tuple[int, float]]:
+        """
+        寻找问题的答案
         
-        # 在问题后的15条消息中寻找答案（教育咨询场景答案可能较远）
-        search_range = min(len(messages), question_index + 16)
+        在问题后的15条消息中寻找答案（教育咨询场景答案可能较远），跳过同一人的后续消息
+        （可能是补充问题），时间间隔不超过30分钟（专业回答需要更多时间准备）。
+        窗口由 _answer_windows 预先算好。
         
-        for i in range(question_index + 1, search_range):
-            candidate_msg = messages[i]
-            
-            # 跳过同一人的后续消息（可能是补充问题）
-            if candidate_msg['sender'] == question_msg['sender']:
-                continue
-            
-            # 时间间隔不能太长（教育咨询允许30分钟内）
-            time_diff = (candidate_msg['timestamp'] - question_time).total_seconds()
-            if time_diff > 1800:  # 30分钟，因为专业回答需要更多时间准备
-                break
-            
-            # 计算答案置信度
-            confidence = self._calculate_answer_confidence(
-                question_msg['content'], 
-                candidate_msg['content']
-            )
+        Returns:
+            List[Tuple[int, float]]: (答案消息序号, 置信度)，最多3个
+        """
+        window_end, other_sender = answer_windows
+        question_features = self._get_features(messages, question_index)
+        answers = []
+        
+        candidates = np.flatnonzero(other_sender[question_index, :window_end[question_index] - question_index - 1])
+        for offset in candidates.tolist():
+            i = question_index + 1 + offset
+            confidence = self._score_answer(question_features, self._get_features(messages, i))
             
             if confidence > 0.1:  # 最低答案阈值，更宽松
-                candidate_msg['index'] = i  # 添加索引信息
-                answers.append((candidate_msg, confidence))
+                answers.append((i, confidence))
         
         return sorted(answers, key=lambda x: x[1], reverse=True)[:3]  # 返回最多3个答案
     
     def _calculate_answer_confidence(self, question: str, answer: str) -> float:
         """计算答案置信度"""
-        confidence = 0.0
-        
+        return self._score_answer(self._compute_features(question), self._compute_features(answer))
+    
+    def _score_answer(self, question: MessageFeatures, answer: MessageFeatures) -> float:
+        """用缓存的消息特征计算答案置信度"""
         # 基础长度判断
-        if len(answer) < 5:
+        if answer.length < 5:
             return 0.1
         
         # 答案指示词匹配
-        for pattern_group in self.qa_patterns:
-            for pattern in pattern_group.get('answer_indicators', []):
-                if re.search(pattern, answer, re.IGNORECASE):
-                    confidence += pattern_group.get('confidence_boost', 0.2)
-                    break
+        confidence = answer.indicator_boost
         
         # 关键词重叠
-        question_words = set(re.findall(r'[\u4e00-\u9fff]+', question))
-        answer_words = set(re.findall(r'[\u4e00-\u9fff]+', answer))
-        
-        if question_words and answer_words:
-            overlap_ratio = len(question_words & answer_words) / len(question_words | answer_words)
+        if question.words and answer.words:
+            overlap_ratio = len(question.words & answer.words) / len(question.words | answer.words)
             confidence += overlap_ratio * 0.3
         
         # 答案结构特征
-        if re.search(r'(可以|建议|推荐|方法|步骤|解决|处理)', answer):
+        if answer.has_solution:
             confidence += 0.2
         
-        if re.search(r'(首先|然后|接着|最后|第[一二三四五六七八九十])', answer):
+        if answer.has_steps:
             confidence += 0.15
         
         # 答案长度合理性
-        if 10 <= len(answer) <= 200:
-            confidence += 0.1
-        elif len(answer) > 200:
-            confidence += 0.05
+        confidence += answer.length_bonus
         
         return min(confidence, 1.0)
     
-    def _extract_context(self, messages: List[Dict[str, Any]], question_index: int, answer_index: int) -> List[str]:
+    def _extract_context(self, messages: MessageBuffer, question_index: int, answer_index: int) -> List[str]:
         """提取上下文"""
         context = []
         
@@ -570,8 +920,7 @@ class DataExtractor:
         
         for i in range(start_idx, end_idx):
             if i != question_index and i != answer_index:
-                msg = messages[i]
-                context.append(f"{msg['sender']}: {msg['content']}")
+                context.append(f"{messages.sender(i)}: {messages.contents[i]}")
         
         return context
     
@@ -581,57 +930,72 @@ class DataExtractor:
         unique_candidates = []
         
         for qa in sorted(qa_candidates, key=lambda x: x.confidence, reverse=True):
-            # 简单的内容指纹
-            fingerprint = (
-                qa.question[:50],  # 问题前50字符
-                qa.answer[:50],    # 答案前50字符
-                qa.asker,
-                qa.advisor
-            )
-            
+            fingerprint = self._dedup_key(qa)
             if fingerprint not in seen:
                 seen.add(fingerprint)
                 unique_candidates.append(qa)
         
         return unique_candidates
     
+    @staticmethod
+    def _dedup_key(qa: QACandidate) -> Tuple[str, str, str, str]:
+        """去重用的简单内容指纹：问题和答案的前50字符加提问者、回答者"""
+        return qa.question[:50], qa.answer[:50], qa.asker, qa.advisor
+    
     def get_extraction_stats(self, qa_candidates: List[QACandidate]) -> Dict[str, Any]:
         """获取提取统计信息"""
-        if not qa_candidates:
-            return {
-                'total_extracted': 0,
-                'avg_confidence': 0,
-                'confidence_distribution': {},
-                'top_advisors': [],
-                'extraction_quality': 'poor'
-            }
-        
-        confidences = [qa.confidence for qa in qa_candidates]
-        avg_confidence = sum(confidences) / len(confidences)
-        
-        # 置信度分布
-        confidence_dist = {
-            'high': len([c for c in confidences if c >= 0.8]),
-            'medium': len([c for c in confidences if 0.6 <= c < 0.8]),
-            'low': len([c for c in confidences if c < 0.6])
-        }
-        
-        # 热门回答者
-        advisor_count = {}
+        tally = ExtractionTally()
         for qa in qa_candidates:
-            advisor_count[qa.advisor] = advisor_count.get(qa.advisor, 0) + 1
-        
-        top_advisors = sorted(advisor_count.items(), key=lambda x: x[1], reverse=True)[:5]
-        
-        # 提取质量评估
-        quality = 'excellent' if avg_confidence >= 0.8 else \
-                  'good' if avg_confidence >= 0.7 else \
-                  'fair' if avg_confidence >= 0.6 else 'poor'
-        
-        return {
-            'total_extracted': len(qa_candidates),
-            'avg_confidence': round(avg_confidence, 3),
-            'confidence_distribution': confidence_dist,
-            'top_advisors': top_advisors,
-            'extraction_quality': quality
-        }
\ No newline at end of file
+            tally.add(qa.confidence, qa.advisor)
+        return tally.to_stats()
+
+
+# 进程内共享的提取进程池：上传、同步等线程中的提取器共用，而不是每次提取各建一个。
+# 使用 spawn 启动工作进程，不从持有数据库会话和锁的多线程进程 fork
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+
+def _get_extract_pool(max_workers: int) -> ProcessPoolExecutor:
+    """获取共享进程池（首次使用时按请求的进程数创建）"""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(max_workers=max_workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return _extract_pool
+
+
+def _discard_extract_pool(executor: Optional[ProcessPoolExecutor]):
+    """进程池损坏时丢弃，下次使用时重新创建"""
+    global _extract_pool
+    if executor is None:
+        return
+    with _extract_pool_lock:
+        if _extract_pool is executor:
+            _extract_pool = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_extract_pool():
+    """关闭共享进程池（进程退出时调用）"""
+    global _extract_pool
+    with _extract_pool_lock:
+        executor, _extract_pool = _extract_pool, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+atexit.register(shutdown_extract_pool)
+
+
+# 工作进程内复用的提取器（避免每个分片重新初始化规则）
+_worker_extractor = None
+
+
+def _extract_shard_in_worker(shard: List[Dict[str, Any]], start: int, end: int) -> List[QACandidate]:
+    """进程池任务：提取一个分片"""
+    global _worker_extractor
+    if _worker_extractor is None:
+        _worker_extractor = DataExtractor(max_workers=1)
+    return _worker_extractor._extract_shard(shard, start, end)
@@ -3,21 +3,42 @@
 """
 import os
 import json
+import time
 import logging
-import hashlib
 import asyncio
+import threading
+import ijson
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple, Callable, Iterable, Sequence
 from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from dataclasses import dataclass
 
+from sqlalchemy import or_
 from app import db
-from app.models import QAPair, Category, UploadHistory
-from .data_extractor import DataExtractor, QACandidate
+from app.models import QAPair, Category, UploadHistory, RawQAPair
+from .data_extractor import DataExtractor
 from .qa_classifier import QAClassifier
+from .stats_rollup import get_stats_rollup_service
+from .fingerprint_filter import get_fingerprint_filter_service
+from .chat_watermark import WatermarkFilter
+from .ingest_checkpoint import IngestCheckpoint
+from .message_archive import MessageArchiveWriter, create_archive_writer
+from .ingest_pipeline import (
+    IngestStats, archive_stage, classify_stage, extract_stage, normalize_stage, parse_stage, save_stage,
+    stage_raw_stage
+)
 from app.utils.memory_monitor import get_memory_monitor, memory_profile
 from app.utils.streaming_processor import StreamingJSONProcessor, memory_limited_operation
+from app.utils.file_hash import CONTENT_HASH_PREFIX, FileHashes, hash_file
+from app.utils.dedup_index import DedupIndex
+from app.utils.content_fingerprint import content_fingerprint as compute_content_fingerprint
+from app.utils.pipeline import Pipeline, PipelineCancelled
+from app.utils.compressed_input import (
+    CORRUPT_ERRORS, JSON_SUFFIXES, ZSTD_AVAILABLE, DecompressedSizeError, SizeBudget,
+    get_compression, get_upload_suffix, list_json_members
+)
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +62,7 @@ class FileProcessor:
         self.data_extractor = DataExtractor()
         self.qa_classifier = QAClassifier()
         self.max_file_size = 50 * 1024 * 1024  # 50MB
-        self.allowed_extensions = {'.json'}
+        self.allowed_extensions = set(JSON_SUFFIXES)  # .json 以及 .json.gz / .json.zst / .zip
         self.max_concurrent_processes = 3
         self.memory_monitor = get_memory_monitor()
         self.streaming_processor = StreamingJSONProcessor()
@@ -50,13 +71,38 @@ class FileProcessor:
         self.memory_warning_threshold = 200  # 200MB
         self.large_file_threshold = 10 * 1024 * 1024  # 10MB使用流式处理
         
-    def validate_file(self, file_path: Path) -> Tuple[bool, str]:
+        # 进度回调 (stage, progress 0-100)，后台任务处理时设置
+        self.progress_callback: Optional[Callable[[str, float], None]] = None
+        
+        # 批量上传时同一批文件共享的去重索引和分类缓存（IngestContext），单文件处理时为 None
+        self.ingest_context = None
+        
+        # 正在运行的入库流水线（用于取消）
+        self.pipeline: Optional[Pipeline] = None
+        
+        # 处理截止时间（time.monotonic()，后台任务设置），到期后取消流水线，进度保留在检查点中
+        self.deadline: Optional[float] = None
+        self.checkpoint: Optional[IngestCheckpoint] = None
+        
+        # 本次处理的消息归档（MESSAGE_ARCHIVE_ENABLED 关闭时为 None）
+        self.archive: Optional[MessageArchiveWriter] = None
+    
+    def _report_progress(self, stage: str, progress: float):
+        """报告处理进度"""
+        if self.progress_callback:
+            try:
+                self.progress_callback(stage, progress)
+            except Exception as e:
+                logger.debug(f"Progress callback failed: {str(e)}")
+    
+    def validate_file(self, file_path: Path, budget: Optional[SizeBudget] = None) -> Tuple[bool, str]:
         """
         验证上传文件
         
         Args:
             file_path: 文件路径
-        
+            budget: 本次上传的解压额度（之后的流式处理继续使用），为 None 时新建
+            
         Returns:
             Tuple[bool, str]: (是否有效, 错误信息)
         """
@@ -67,24 +113,41 @@ class FileProcessor:
             
             # 检查文件大小
             file_size = file_path.stat().st_size
-            if file_size > self.max_file_size:
-                return False, f"文件大小超过限制({self.max_file_size // (1024*1024)}MB)"
+            max_file_size = self._get_max_file_size()
+            if file_size > max_file_size:
+                return False, f"文件大小超过限制({max_file_size // (1024*1024)}MB)"
             
             if file_size == 0:
                 return False, "文件为空"
             
             # 检查文件扩展名
-            if file_path.suffix.lower() not in self.allowed_extensions:
-                return False, f"不支持的文件类型，仅支持: {', '.join(self.allowed_extensions)}"
+            if get_upload_suffix(file_path) not in self.allowed_extensions:
+                return False, f"不支持的文件类型，仅支持: {', '.join(sorted(self.allowed_extensions))}"
+            
+            compression = get_compression(file_path)
+            if compression == 'zstd' and not ZSTD_AVAILABLE:
+                return False, "服务器未安装 zstandard，暂不支持 .json.zst 文件"
             
-            # 验证JSON格式
+            # 验证JSON格式（大文件和压缩文件只流式检查到消息数组开始处，完整性在流式处理时发现）
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    json.load(f)
-            except json.JSONDecodeError as e:
-                return False, f"JSON格式错误: {str(e)}"
+                if compression or file_size > self.large_file_threshold:
+                    members = list_json_members(file_path)
+                    if not members:
+                        return False, "压缩包中没有JSON文件"
+                    budget = budget or SizeBudget(self._get_max_decompressed_size())
+                    for member in members:
+                        self.streaming_processor.detect_messages_prefix(file_path, member, budget)
+                else:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        json.load(f)
             except UnicodeDecodeError:
                 return False, "文件编码错误，请使用UTF-8编码"
+            except DecompressedSizeError as e:
+                return False, str(e)
+            except CORRUPT_ERRORS as e:
+                return False, f"压缩文件损坏: {str(e)}"
+            except (json.JSONDecodeError, ijson.JSONError, ValueError) as e:
+                return False, f"JSON格式错误: {str(e)}"
             
             return True, ""
             
@@ -92,36 +155,120 @@ class FileProcessor:
             logger.error(f"Failed to validate file {file_path}: {str(e)}")
             return False, f"文件验证失败: {str(e)}"
     
+    def _get_max_file_size(self) -> int:
+        """可处理的文件大小上限（分块上传的大文件走流式处理，不受单次请求大小限制）"""
+        try:
+            from flask import current_app
+            return current_app.config.get('UPLOAD_MAX_FILE_SIZE', self.max_file_size)
+        except RuntimeError:
+            return self.max_file_size
+    
+    def _get_max_decompressed_size(self) -> int:
+        """压缩文件解压后的大小上限（防止压缩炸弹）"""
+        try:
+            from flask import current_app
+            return current_app.config.get('UPLOAD_MAX_DECOMPRESSED_SIZE', self._get_max_file_size())
+        except RuntimeError:
+            return self._get_max_file_size()
+    
+    def needs_legacy_md5(self) -> bool:
+        """
+        是否需要同时计算 MD5
+        
+        库里还有没有 content_hash（或用其他算法计算）但记录了 MD5 的已完成上传时，
+        新上传要计算 MD5 才能与之比较。
+        """
+        try:
+            return db.session.query(UploadHistory.id).filter(
+                UploadHistory.status == 'completed',
+                UploadHistory.file_hash.isnot(None),
+                or_(UploadHistory.content_hash.is_(None),
+                    ~UploadHistory.content_hash.startswith(CONTENT_HASH_PREFIX, autoescape=True))
+            ).first() is not None
+        except Exception as e:
+            logger.error(f"Failed to check legacy upload hashes: {str(e)}")
+            return True
+    
+    def get_file_hashes(self, file_path: Path, upload_record: Optional[UploadHistory] = None) -> FileHashes:
+        """使用接收上传时已计算的哈希，没有时读取一遍文件计算"""
+        if upload_record is not None and upload_record.content_hash:
+            return FileHashes(
+                size=upload_record.file_size,
+                content_hash=upload_record.content_hash,
+                sample_hash=upload_record.sample_hash,
+                md5=upload_record.file_hash
+            )
+        return hash_file(file_path, legacy_md5=self.needs_legacy_md5())
+    
     def calculate_file_hash(self, file_path: Path) -> str:
-        """计算文件哈希值"""
-        hasher = hashlib.md5()
+        """计算文件MD5（与旧上传记录比较用）"""
         try:
-            with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hasher.update(chunk)
-            return hasher.hexdigest()
+            return hash_file(file_path).md5
         except Exception as e:
             logger.error(f"Failed to calculate hash for {file_path}: {str(e)}")
             return ""
     
-    def check_duplicate_upload(self, file_hash: str) -> Optional[UploadHistory]:
-        """检查重复上传"""
+    def _load_watermark_filter(self) -> Optional[WatermarkFilter]:
+        """读取聊天水位线，未启用增量导入或读取失败时返回 None（全量处理）"""
+        try:
+            from flask import current_app
+            if not current_app.config.get('INCREMENTAL_INGEST', True):
+                return None
+            return WatermarkFilter.load(
+                DataExtractor.ANSWER_TIME_WINDOW, context_messages=DataExtractor.CONTEXT_LOOKBEHIND
+            )
+        except Exception as e:
+            logger.warning(f"Failed to load chat watermarks, processing full file: {str(e)}")
+            return None
+    
+    def check_duplicate_upload(self, file_hash: Optional[str] = None,
+                               content_hash: Optional[str] = None) -> Optional[UploadHistory]:
+        """
+        检查重复上传
+        
+        Args:
+            file_hash: 文件MD5（与只有MD5的旧记录比较）
+            content_hash: 带算法前缀的文件哈希
+        """
+        try:
+            conditions = []
+            if content_hash:
+                conditions.append(UploadHistory.content_hash == content_hash)
+            if file_hash:
+                conditions.append(UploadHistory.file_hash == file_hash)
+            if not conditions:
+                return None
+            
+            return UploadHistory.query.filter(
+                UploadHistory.status == 'completed',
+                or_(*conditions)
+            ).first()
+        except Exception as e:
+            logger.error(f"Failed to check duplicate upload: {str(e)}")
+            return None
+    
+    def find_probable_duplicate(self, file_size: int, sample_hash: str) -> Optional[UploadHistory]:
+        """按文件大小和开头字节的样本哈希查找疑似重复的已完成上传"""
         try:
             return UploadHistory.query.filter_by(
-                file_hash=file_hash,
+                file_size=file_size,
+                sample_hash=sample_hash,
                 status='completed'
             ).first()
         except Exception as e:
-            logger.error(f"Failed to check duplicate upload: {str(e)}")
+            logger.error(f"Failed to check probable duplicate upload: {str(e)}")
             return None
     
-    def create_upload_record(self, filename: str, file_size: int, file_hash: str) -> UploadHistory:
+    def create_upload_record(self, filename: str, file_size: int, file_hash: Optional[str],
+                             hashes: Optional[FileHashes] = None) -> UploadHistory:
         """创建上传记录"""
         try:
             upload_record = UploadHistory(
                 filename=filename,
                 file_size=file_size,
                 file_hash=file_hash,
+                content_hash=hashes.content_hash if hashes else None,
+                sample_hash=hashes.sample_hash if hashes else None,
                 status='processing',
                 uploaded_at=datetime.utcnow()
             )
@@ -138,14 +285,16 @@ class FileProcessor:
             raise
     
     @memory_profile("file_processing")
-    def process_file(self, file_path: Path, upload_record: UploadHistory) -> ProcessingResult:
+    def process_file(self, file_path: Path, upload_record: UploadHistory,
+                     budget: Optional[SizeBudget] = None) -> ProcessingResult:
         """
         处理单个文件
         
         Args:
             file_path: 文件路径
             upload_record: 上传记录
-        
+            budget: 本次上传的解压额度（与 validate_file 共用），为 None 时新建
+            
         Returns:
             ProcessingResult: 处理结果
         """
@@ -157,15 +306,15 @@ class FileProcessor:
             upload_record.started_at = start_time
             db.session.commit()
             
-            # 检查文件大小决定处理方式
+            # 检查文件大小决定处理方式（压缩文件总是边解压边流式处理）
             file_size = file_path.stat().st_size
-            use_streaming = file_size > self.large_file_threshold
+            use_streaming = file_size > self.large_file_threshold or get_compression(file_path) is not None
             
             logger.info(f"Processing file {file_path.name} ({file_size / 1024 / 1024:.1f}MB) "
                        f"using {'streaming' if use_streaming else 'standard'} method")
             
             if use_streaming:
-                return self._process_file_streaming(file_path, upload_record, start_time)
+                return self._process_file_streaming(file_path, upload_record, start_time, budget)
             else:
                 return self._process_file_standard(file_path, upload_record, start_time)
                 
@@ -189,265 +338,485 @@ class FileProcessor:
             )
     
     def _process_file_standard(self, file_path: Path, upload_record: UploadHistory, start_time: datetime) -> ProcessingResult:
-        """标准方式处理文件（小文件）"""
-        with memory_limited_operation(self.memory_warning_threshold):
-            # 读取JSON数据
-            with open(file_path, 'r', encoding='utf-8') as f:
-                json_data = f.read()
-            
-            # 提取问答对
-            logger.info(f"Starting extraction for upload {upload_record.id}")
-            print(f"[DEBUG] Starting extraction for upload {upload_record.id}")
-            print(f"[DEBUG] JSON data length: {len(json_data)} characters")
-            print(f"[DEBUG] JSON data preview: {json_data[:500]}...")
-            
-            # 先解析消息获取所有聊天记录
-            try:
-                data = json.loads(json_data)
-                messages = self.data_extractor._parse_messages(data)
-                logger.info(f"Parsed {len(messages)} messages from file")
-            except Exception as e:
-                logger.error(f"Failed to parse messages: {str(e)}")
-                messages = []
-            
-            qa_candidates = self.data_extractor.extract_from_json(json_data, str(file_path))
-            
-            print(f"[DEBUG] Extraction completed, found {len(qa_candidates)} candidates")
-            
-            # 先保存所有消息到数据库，然后再进行分析
-            all_messages = messages
-            logger.info(f"Found {len(all_messages)} valid messages, proceeding with storage and analysis")
-            
-            # 创建基础记录存储所有消息
-            raw_qa_pairs = self._create_raw_qa_pairs_from_messages(all_messages, upload_record.id)
-            
-            if not qa_candidates:
-                print(f"[DEBUG] No high-confidence QA candidates found, but saved {len(raw_qa_pairs)} raw messages")
-                logger.warning(f"No high-confidence QA pairs extracted, but saved {len(raw_qa_pairs)} raw messages for manual review")
-            
-            logger.info(f"Extracted {len(qa_candidates)} QA candidates")
-            
-            # 分类问答对（如果有的话）
-            classified_results = []
-            if qa_candidates:
-                for qa in qa_candidates:
-                    try:
-                        classification = self.qa_classifier.classify_qa(
-                            qa.question, qa.answer, qa.context
-                        )
-                        classified_results.append((qa, classification))
-                    except Exception as e:
-                        logger.error(f"Failed to classify QA: {str(e)}")
-                        # 使用默认分类
-                        from .qa_classifier import CategoryMatch
-                        classification = CategoryMatch(1, '产品咨询', 0.2, [])
-                        classified_results.append((qa, classification))
-            
-            # 保存到数据库 - 优先保存高质量问答对，其次保存原始消息
-            saved_count = 0
-            if classified_results:
-                saved_count = self._save_qa_pairs(classified_results, upload_record.id)
-                logger.info(f"Saved {saved_count} high-quality QA pairs")
-            
-            # 如果没有高质量问答对但有原始消息，则保存原始消息用于人工审核
-            if not classified_results and raw_qa_pairs:
-                saved_count = len(raw_qa_pairs)
-                logger.info(f"Saved {saved_count} raw messages for manual review")
-            
-            # 计算处理时间
-            processing_time = (datetime.utcnow() - start_time).total_seconds()
-            
-            # 更新上传记录
-            upload_record.status = 'completed'
-            upload_record.completed_at = datetime.utcnow()
-            upload_record.qa_count = saved_count
-            upload_record.processing_time = processing_time
+        """标准方式处理文件（小文件）：整体解析并按时间排序后交给入库流水线"""
+        try:
+            with memory_limited_operation(self.memory_warning_threshold):
+                # 读取JSON数据
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    json_data = f.read()
+                
+                logger.info(f"Starting extraction for upload {upload_record.id}")
+                
+                # 先解析消息获取所有聊天记录（跳过水位线之前已处理过的消息）
+                watermark_filter = self._load_watermark_filter()
+                message_filter = self._prepare_message_filter(upload_record.id, watermark_filter)
+                try:
+                    data = json.loads(json_data)
+                    messages = self.data_extractor._parse_messages(data, message_filter)
+                    logger.info(f"Parsed {len(messages)} messages from file")
+                except Exception as e:
+                    logger.error(f"Failed to parse messages: {str(e)}")
+                    messages = []
+                del json_data
+                
+                stats = IngestStats(messages=len(messages))
+                chats = [(str(file_path), (messages[i] for i in range(len(messages))))] if messages else []
+                checkpoint = self._load_checkpoint(upload_record, 'standard', watermark_filter)
+                pipeline = self.build_pipeline(
+                    upload_record.id, stats, normalized=True, checkpoint=checkpoint, archive=self.archive
+                )
+                return self._run_pipeline(pipeline, chats, stats, upload_record, start_time, watermark_filter)
+                
+        except Exception as e:
+            return self._fail_upload(upload_record, start_time, e)
+    
+    def _process_file_streaming(self, file_path: Path, upload_record: UploadHistory, start_time: datetime,
+                                budget: Optional[SizeBudget] = None) -> ProcessingResult:
+        """
+        流式处理文件（大文件）
+        
+        用 ijson 逐条读取消息数组，标准化、原始消息暂存、问答提取、分类和入库在流水线中
+        逐批进行，内存占用与文件大小无关。要求导出文件中的消息按时间顺序排列（聊天导出的默认顺序）。
+        压缩文件边解压边解析；zip 包中的每个 JSON 文件是一个聊天，逐个单独提取。
+        """
+        try:
+            with memory_limited_operation(self.memory_warning_threshold):
+                logger.info(f"Starting streaming extraction for upload {upload_record.id}")
+                
+                watermark_filter = self._load_watermark_filter()
+                budget = budget or SizeBudget(self._get_max_decompressed_size())
+                chats = (
+                    (f"{file_path}:{member}" if member else str(file_path),
+                     self.streaming_processor.stream_messages(file_path, member, budget))
+                    for member in list_json_members(file_path)
+                )
+                
+                stats = IngestStats()
+                message_filter = self._prepare_message_filter(upload_record.id, watermark_filter)
+                checkpoint = self._load_checkpoint(upload_record, 'streaming', watermark_filter)
+                pipeline = self.build_pipeline(
+                    upload_record.id, stats, message_filter=message_filter, checkpoint=checkpoint, archive=self.archive
+                )
+                return self._run_pipeline(pipeline, chats, stats, upload_record, start_time, watermark_filter)
+                
+        except Exception as e:
+            return self._fail_upload(upload_record, start_time, e)
+    
+    def process_messages(self, source: str, messages: Iterable[Dict], upload_record: UploadHistory) -> ProcessingResult:
+        """
+        处理一个聊天的原始消息流（如从 chatlog HTTP 接口分页拉取的消息）
+        
+        与流式处理文件相同：消息经聊天水位线过滤后进入入库流水线，按需从迭代器中读取，
+        内存占用与消息数无关。消息需按时间顺序排列；没有文件可供断点续传，不使用检查点。
+        
+        Args:
+            source: 消息来源标识（用于日志和流水线进度）
+            messages: chatlog 格式的原始消息
+            upload_record: 上传记录
+        """
+        start_time = datetime.utcnow()
+        try:
+            upload_record.status = 'processing'
+            upload_record.started_at = start_time
             db.session.commit()
             
-            # 生成统计信息
-            extraction_stats = self.data_extractor.get_extraction_stats(qa_candidates)
-            classification_stats = self.qa_classifier.get_classification_stats(
-                [result[1] for result in classified_results]
-            ) if classified_results else {}
-            
-            # 补充原始消息统计
-            processing_summary = {
-                'total_messages_parsed': len(messages),
-                'high_quality_qa_pairs': len(qa_candidates),
-                'raw_messages_saved': len(raw_qa_pairs) if raw_qa_pairs else 0,
-                'processing_strategy': 'high_quality' if classified_results else 'raw_import'
-            }
-            
-            statistics = {
-                'extraction': extraction_stats,
-                'classification': classification_stats,
-                'processing': processing_summary,
-                'file_info': {
-                    'filename': upload_record.filename,
-                    'file_size': upload_record.file_size,
-                    'processing_time': processing_time
-                }
-            }
-            
-            success_message = f"Successfully processed upload {upload_record.id}: "
-            if classified_results:
-                success_message += f"{len(qa_candidates)} high-quality QA pairs extracted and saved"
-            else:
-                success_message += f"{len(messages)} messages parsed, {saved_count} raw records saved for manual review"
-            
-            logger.info(success_message)
-            
-            return ProcessingResult(
-                success=True,
-                upload_id=upload_record.id,
-                total_extracted=len(qa_candidates),
-                total_saved=saved_count,
-                processing_time=processing_time,
-                statistics=statistics
-            )
-            
+            with memory_limited_operation(self.memory_warning_threshold):
+                logger.info(f"Starting message stream extraction for upload {upload_record.id} ({source})")
+                
+                watermark_filter = self._load_watermark_filter()
+                stats = IngestStats()
+                pipeline = self.build_pipeline(
+                    upload_record.id, stats, message_filter=self._prepare_message_filter(upload_record.id, watermark_filter),
+                    archive=self.archive
+                )
+                return self._run_pipeline(pipeline, [(source, messages)], stats, upload_record, start_time, watermark_filter)
+                
         except Exception as e:
-            error_message = str(e)
-            logger.error(f"Failed to process upload {upload_record.id}: {error_message}")
-            
-            # 更新上传记录为失败状态
-            upload_record.status = 'failed'
-            upload_record.error_message = error_message
-            upload_record.completed_at = datetime.utcnow()
-            db.session.commit()
+            return self._fail_upload(upload_record, start_time, e)
+    
+    def build_pipeline(self, upload_id: int, stats: IngestStats, normalized: bool = False,
+                       message_filter: Optional[Callable[[Iterable[Dict]], Iterable[Dict]]] = None,
+                       checkpoint: Optional[IngestCheckpoint] = None,
+                       archive: Optional[MessageArchiveWriter] = None) -> Pipeline:
+        """
+        构建入库流水线：parse → normalize → archive → stage_raw → extract → classify → save
+        
+        Args:
+            upload_id: 上传记录ID
+            stats: 各阶段更新的计数
+            normalized: 输入的消息已标准化并按时间排序（整体解析），省去 normalize 阶段
+            message_filter: 标准化之前作用于原始消息流的过滤（如聊天水位线）
+            checkpoint: 断点续传检查点：跳过已完成的部分，每批提交后更新进度并记录写入失败的范围
+            archive: 消息归档（message_filter 需经 archive.chat_filter 包装），为 None 时不归档
+        """
+        raw_fingerprints = self._get_dedup_index(include_raw=True)
+        qa_fingerprints = self._get_dedup_index()
+        category_ids = self._get_category_ids()
+        
+        if checkpoint is None:
+            def stage_messages(source, offset, messages, stop):
+                return len(self._create_raw_qa_pairs_from_messages(messages, upload_id, raw_fingerprints, stop=stop))
+            
+            def save_batch(batch):
+                return self._save_qa_batch(batch, upload_id, qa_fingerprints, category_ids)
+            
+            raw_position = qa_position = on_commit = None
+        else:
+            if checkpoint.resumed and self.ingest_context is None:
+                # 暂存去重只看处理开始前已有的问答对，续传时排除本上传之前各次已入库的，结果与一次处理完相同
+                raw_fingerprints = self._get_dedup_index(include_raw=True, exclude_source=f"upload_{upload_id}")
+            stats.raw_saved = checkpoint.raw_saved
+            stats.saved = checkpoint.saved
+            stats.resumed_extracted = checkpoint.extracted
+            failed_saves = []  # 当前分片中入库失败的问答对（错误信息）
+            
+            def stage_messages(source, offset, messages, stop):
+                failed = []
+                saved = len(self._create_raw_qa_pairs_from_messages(
+                    messages, upload_id, raw_fingerprints, stop=stop, failed_ranges=failed
+                ))
+                for start, end, count, error in failed:
+                    checkpoint.add_failed_range(source, 'stage_raw', offset + start, offset + end, count, error)
+                checkpoint.record_raw(source, offset + (stop if stop is not None else len(messages)), saved)
+                return saved
+            
+            def save_batch(batch):
+                return self._save_qa_batch(batch, upload_id, qa_fingerprints, category_ids, failures=failed_saves)
+            
+            def on_commit(saved, progress):
+                if progress is None:
+                    checkpoint.record_saved(saved)
+                    return
+                if failed_saves:
+                    checkpoint.add_failed_range(
+                        progress.source, 'save', checkpoint.qa_position(progress.source), progress.position,
+                        len(failed_saves), failed_saves[-1]
+                    )
+                    failed_saves.clear()
+                checkpoint.record_qa(progress.source, progress.position, progress.extracted, saved)
             
-            return ProcessingResult(
-                success=False,
-                upload_id=upload_record.id,
-                total_extracted=0,
-                total_saved=0,
-                processing_time=(datetime.utcnow() - start_time).total_seconds(),
-                error_message=error_message
-            )
+            raw_position = checkpoint.raw_position
+            qa_position = checkpoint.qa_position
+        
+        stages = [parse_stage(message_filter)]
+        if not normalized:
+            stages.append(normalize_stage(self.data_extractor, stats))
+        if archive is not None:
+            archive.prepare(resumed=checkpoint is not None and checkpoint.resumed)
+            stages.append(archive_stage(archive.write, archive.segment_size, resume_position=archive.position))
+        stages += [
+            stage_raw_stage(stage_messages, stats, resume_position=raw_position),
+            extract_stage(self.data_extractor, stats, resume_position=qa_position),
+            classify_stage(self.qa_classifier, stats),
+            save_stage(save_batch, stats, on_commit=on_commit)
+        ]
+        return Pipeline(f'upload-{upload_id}', stages)
+    
+    def _prepare_message_filter(self, upload_id: int, watermark_filter: Optional[WatermarkFilter]
+                                ) -> Optional[Callable[[Iterable[Dict]], Iterable[Dict]]]:
+        """创建本次上传的消息归档，返回作用于原始消息流的过滤（聊天水位线，并为归档记录聊天标识）"""
+        message_filter = watermark_filter.filter if watermark_filter else None
+        self.archive = create_archive_writer(upload_id)
+        if self.archive is not None:
+            message_filter = self.archive.chat_filter(message_filter)
+        return message_filter
+    
+    def _load_checkpoint(self, upload_record: UploadHistory, method: str,
+                         watermark_filter: Optional[WatermarkFilter]) -> IngestCheckpoint:
+        """读取断点续传检查点（只对同一文件、同一处理方式，且覆盖的聊天水位线没有变化时有效）"""
+        key = {
+            'file': upload_record.content_hash or upload_record.file_hash,
+            'method': method
+        }
+        self.checkpoint = IngestCheckpoint.load(upload_record, key, watermark_filter)
+        return self.checkpoint
+    
+    def cancel(self) -> bool:
+        """取消正在运行的入库流水线，没有正在处理的文件时返回 False"""
+        pipeline = self.pipeline
+        if pipeline is None:
+            return False
+        pipeline.cancel()
+        return True
+    
+    def _run_pipeline(self, pipeline: Pipeline, chats: Iterable, stats: IngestStats,
+                      upload_record: UploadHistory, start_time: datetime,
+                      watermark_filter: Optional[WatermarkFilter] = None) -> ProcessingResult:
+        """运行入库流水线，更新上传记录并生成统计（标准和流式处理共用）"""
+        self._report_progress('extracting', 20)
+        self.pipeline = pipeline
+        
+        # 到达截止时间时取消流水线（后台任务的超时不会停止执行中的线程）
+        timer = None
+        if self.deadline is not None:
+            timer = threading.Timer(max(self.deadline - time.monotonic(), 0), pipeline.cancel)
+            timer.daemon = True
+            timer.start()
+        try:
+            pipeline.drain(chats)
+        finally:
+            self.pipeline = None
+            if timer is not None:
+                timer.cancel()
+        self._report_progress('saving', 80)
+        
+        pipeline_metrics = pipeline.get_metrics()
+        logger.info(f"Upload {upload_record.id} pipeline finished in {pipeline_metrics['elapsed_time']}s, "
+                    f"bottleneck: {pipeline_metrics['bottleneck']}")
+        logger.info(f"Streamed {stats.messages} valid messages, staged {stats.raw_saved} raw pairs for review, "
+                    f"extracted {stats.total_extracted} QA candidates")
+        
+        saved_count = stats.saved
+        has_qa_pairs = stats.total_extracted > 0
+        if has_qa_pairs:
+            logger.info(f"Saved {saved_count} high-quality QA pairs")
+        
+        # 如果没有高质量问答对但有原始消息，则保存原始消息用于人工审核
+        if not has_qa_pairs and stats.raw_saved:
+            saved_count = stats.raw_saved
+            logger.info(f"Saved {saved_count} raw messages for manual review")
+        
+        # 计算处理时间
+        processing_time = (datetime.utcnow() - start_time).total_seconds()
+        
+        # 更新上传记录
+        upload_record.status = 'completed'
+        upload_record.completed_at = datetime.utcnow()
+        upload_record.qa_count = saved_count
+        upload_record.processing_time = processing_time
+        db.session.commit()
+        
+        # 处理成功后才推进聊天水位线
+        if watermark_filter:
+            watermark_filter.save(upload_record.id)
+        
+        # 生成统计信息（从检查点继续时只统计本次提取的候选）
+        extraction_stats = stats.extraction.to_stats()
+        classification_stats = stats.classification.to_stats() if stats.classified else {}
+        
+        # 补充原始消息统计
+        processing_summary = {
+            'total_messages_parsed': stats.messages,
+            'high_quality_qa_pairs': stats.total_extracted,
+            'raw_messages_saved': stats.raw_saved,
+            'processing_strategy': 'high_quality' if has_qa_pairs else 'raw_import',
+            'pipeline': pipeline_metrics
+        }
+        if watermark_filter:
+            processing_summary['watermark'] = watermark_filter.get_stats()
+        if self.archive is not None:
+            processing_summary['archive'] = self.archive.get_stats()
+        if self.checkpoint is not None:
+            self.checkpoint.complete()
+            processing_summary['checkpoint'] = {
+                'attempts': self.checkpoint.attempts,
+                'resumed': self.checkpoint.resumed,
+                'failed_ranges': self.checkpoint.failed_ranges
+            }
+        
+        statistics = {
+            'extraction': extraction_stats,
+            'classification': classification_stats,
+            'processing': processing_summary,
+            'file_info': {
+                'filename': upload_record.filename,
+                'file_size': upload_record.file_size,
+                'processing_time': processing_time
+            }
+        }
+        
+        success_message = f"Successfully processed upload {upload_record.id}: "
+        if has_qa_pairs:
+            success_message += f"{stats.total_extracted} high-quality QA pairs extracted and saved"
+        else:
+            success_message += f"{stats.messages} messages parsed, {saved_count} raw records saved for manual review"
+        
+        logger.info(success_message)
+        
+        return ProcessingResult(
+            success=True,
+            upload_id=upload_record.id,
+            total_extracted=stats.total_extracted,
+            total_saved=saved_count,
+            processing_time=processing_time,
+            statistics=statistics
+        )
     
-    def _save_qa_pairs(self, classified_results: List, upload_id: int) -> int:
-        """保存问答对到数据库"""
-        saved_count = 0
-        batch_size = 1000  # 进一步增大批量大小以提高性能
+    def _fail_upload(self, upload_record: UploadHistory, start_time: datetime, error: Exception) -> ProcessingResult:
+        """把上传记录标记为失败（已提交的进度保留在检查点中，重试时继续）"""
+        if isinstance(error, PipelineCancelled):
+            timed_out = self.deadline is not None and time.monotonic() >= self.deadline
+            error_message = '处理超时' if timed_out else '处理已取消'
+        else:
+            error_message = str(error)
+        logger.error(f"Failed to process upload {upload_record.id}: {error_message}")
+        
+        # 更新上传记录为失败状态
+        db.session.rollback()
+        upload_record.status = 'failed'
+        upload_record.error_message = error_message
+        upload_record.completed_at = datetime.utcnow()
+        db.session.commit()
         
+        if self.checkpoint is not None:
+            self.checkpoint.fail(error_message)
+        
+        return ProcessingResult(
+            success=False,
+            upload_id=upload_record.id,
+            total_extracted=0,
+            total_saved=0,
+            processing_time=(datetime.utcnow() - start_time).total_seconds(),
+            error_message=error_message
+        )
+    
+    def _save_qa_batch(self, batch: List, upload_id: int, existing_fingerprints: DedupIndex,
+                       category_ids: set, failures: Optional[List[str]] = None) -> int:
+        """
+        保存一批 (问答候选, 分类结果)，跳过指纹已存在的，返回实际保存的数量
+        
+        Args:
+            failures: 无法创建记录的问答对的错误信息追加到这里（用于记录失败范围）
+        """
         try:
-            # 优化：预加载所有分类到内存中，避免重复查询
-            categories_dict = {cat.id: cat for cat in Category.query.all()}
+            batch_objects = []
             
-            # 内容去重：预加载现有问答对的内容指纹
-            existing_fingerprints = self._get_existing_content_fingerprints()
+            # 创建内容指纹进行去重检查，过滤器命中的整批查一次数据库
+            fingerprints = [
+                self._generate_content_fingerprint(qa.question, qa.answer, qa.asker, qa.advisor)
+                for qa, _ in batch
+            ]
+            existing_fingerprints.prefetch(fingerprints)
             
-            for i in range(0, len(classified_results), batch_size):
-                batch = classified_results[i:i + batch_size]
-                batch_objects = []
-                
-                for qa_candidate, classification in batch:
-                    try:
-                        # 使用预加载的分类字典
-                        category_id = classification.category_id if classification.category_id in categories_dict else 1
-                        
-                        # 创建内容指纹进行去重检查
-                        content_fingerprint = self._generate_content_fingerprint(
-                            qa_candidate.question, 
-                            qa_candidate.answer,
-                            qa_candidate.asker,
-                            qa_candidate.advisor
-                        )
-                        
-                        # 检查是否重复
-                        if content_fingerprint in existing_fingerprints:
-                            logger.debug(f"Skipping duplicate QA pair: {qa_candidate.question[:50]}...")
-                            continue
-                        
-                        # 安全的上下文JSON序列化
-                        safe_context = None
-                        if qa_candidate.context:
-                            try:
-                                # 将上下文转换为可序列化格式
-                                context_data = []
-                                for item in qa_candidate.context[:10]:
-                                    if isinstance(item, str):
-                                        context_data.append(item)
-                                    elif hasattr(item, '__dict__'):
-                                        # 转换对象为字典，处理datetime等特殊类型
-                                        item_dict = {}
-                                        for key, value in item.__dict__.items():
-                                            if isinstance(value, datetime):
-                                                item_dict[key] = value.isoformat()
-                                            else:
-                                                item_dict[key] = str(value)
-                                        context_data.append(item_dict)
-                                    else:
-                                        context_data.append(str(item))
-                                safe_context = json.dumps(context_data, ensure_ascii=False)
-                            except Exception as e:
-                                logger.warning(f"Failed to serialize context: {str(e)}")
-                                safe_context = json.dumps({"error": "Context serialization failed"}, ensure_ascii=False)
-                        
-                        # 创建问答对对象但不立即添加到session
-                        qa_pair = QAPair(
-                            question=qa_candidate.question[:2000],  # 限制长度
-                            answer=qa_candidate.answer[:2000],
-                            category_id=category_id,
-                            asker=qa_candidate.asker[:100] if qa_candidate.asker else None,
-                            advisor=qa_candidate.advisor[:100] if qa_candidate.advisor else None,
-                            confidence=qa_candidate.confidence,
-                            source_file=f"upload_{upload_id}",
-                            original_context=safe_context
-                        )
-                        
-                        batch_objects.append(qa_pair)
-                        existing_fingerprints.add(content_fingerprint)  # 添加到已存在指纹集合
-                        
-                    except Exception as e:
-                        logger.error(f"Failed to create QA pair: {str(e)}")
+            for (qa_candidate, classification), content_fingerprint in zip(batch, fingerprints):
+                try:
+                    # 使用预加载的分类字典
+                    category_id = classification.category_id if classification.category_id in category_ids else 1
+                    
+                    # 检查是否重复（同时登记指纹）
+                    if not existing_fingerprints.claim(content_fingerprint):
+                        logger.debug(f"Skipping duplicate QA pair: {qa_candidate.question[:50]}...")
                         continue
-                
-                # 批量添加到session
-                if batch_objects:
-                    db.session.bulk_save_objects(batch_objects)
-                    db.session.commit()
                     
-                    # 计数实际保存的对象数量
-                    saved_count += len(batch_objects)
+                    # 安全的上下文JSON序列化
+                    safe_context = None
+                    if qa_candidate.context:
+                        try:
+                            # 将上下文转换为可序列化格式
+                            context_data = []
+                            for item in qa_candidate.context[:10]:
+                                if isinstance(item, str):
+                                    context_data.append(item)
+                                elif hasattr(item, '__dict__'):
+                                    # 转换对象为字典，处理datetime等特殊类型
+                                    item_dict = {}
+                                    for key, value in item.__dict__.items():
+                                        if isinstance(value, datetime):
+                                            item_dict[key] = value.isoformat()
+                                        else:
+                                            item_dict[key] = str(value)
+                                    context_data.append(item_dict)
+                                else:
+                                    context_data.append(str(item))
+                            safe_context = json.dumps(context_data, ensure_ascii=False)
+                        except Exception as e:
+                            logger.warning(f"Failed to serialize context: {str(e)}")
+                            safe_context = json.dumps({"error": "Context serialization failed"}, ensure_ascii=False)
                     
-                    # 更新FTS索引（如果启用）
-                    try:
-                        from .search_service import SearchService
-                        search_service = SearchService()
-                        if search_service.fts_enabled:
-                            # 批量插入到FTS索引
-                            for qa_pair in batch_objects:
-                                # 获取实际保存的ID
-                                db.session.refresh(qa_pair)
-                                search_service.update_fts_record(qa_pair, 'insert')
-                    except Exception as fts_error:
-                        logger.warning(f"Failed to update FTS index: {fts_error}")
+                    # 创建问答对对象但不立即添加到session
+                    qa_pair = QAPair(
+                        question=qa_candidate.question[:2000],  # 限制长度
+                        answer=qa_candidate.answer[:2000],
+                        category_id=category_id,
+                        asker=qa_candidate.asker[:100] if qa_candidate.asker else None,
+                        advisor=qa_candidate.advisor[:100] if qa_candidate.advisor else None,
+                        confidence=qa_candidate.confidence,
+                        source_file=f"upload_{upload_id}",
+                        content_fingerprint=content_fingerprint,
+                        original_context=safe_context
+                    )
+                    
+                    batch_objects.append(qa_pair)
                     
-                    logger.debug(f"Saved batch {i//batch_size + 1}, batch size: {len(batch_objects)}, total saved: {saved_count}")
+                except Exception as e:
+                    logger.error(f"Failed to create QA pair: {str(e)}")
+                    if failures is not None:
+                        failures.append(str(e))
+                    continue
             
-            return saved_count
+            # 批量添加到session
+            if batch_objects:
+                db.session.bulk_save_objects(batch_objects)
+                get_stats_rollup_service().record_qa_inserts(batch_objects)
+                db.session.commit()
+                
+                # 更新FTS索引（如果启用）
+                try:
+                    from .search_service import SearchService
+                    search_service = SearchService()
+                    if search_service.fts_enabled:
+                        # 批量插入到FTS索引
+                        for qa_pair in batch_objects:
+                            # 获取实际保存的ID
+                            db.session.refresh(qa_pair)
+                            search_service.update_fts_record(qa_pair, 'insert')
+                except Exception as fts_error:
+                    logger.warning(f"Failed to update FTS index: {fts_error}")
+                    
+                logger.debug(f"Saved batch of {len(batch_objects)} QA pairs for upload {upload_id}")
+                
+            return len(batch_objects)
             
         except Exception as e:
             db.session.rollback()
             logger.error(f"Failed to save QA pairs: {str(e)}")
             raise
     
-    def process_file_async(self, file_path: Path, filename: str) -> Dict[str, Any]:
+    def prepare_upload_record(self, filename: str, file_size: int, hashes: FileHashes,
+                              upload_record: Optional[UploadHistory] = None) -> UploadHistory:
+        """使用上传接口预先创建的记录（后台处理），没有时新建记录"""
+        if upload_record is None:
+            return self.create_upload_record(filename, file_size, hashes.md5, hashes)
+        
+        upload_record.file_size = file_size
+        upload_record.file_hash = hashes.md5
+        upload_record.content_hash = hashes.content_hash
+        upload_record.sample_hash = hashes.sample_hash
+        upload_record.status = 'processing'
+        db.session.commit()
+        return upload_record
+    
+    def finish_upload_record(self, upload_record: Optional[UploadHistory], error_message: Optional[str] = None):
+        """结束未进入处理流程的预建记录（验证失败或重复上传）"""
+        if upload_record is None:
+            return
+        
+        upload_record.status = 'failed' if error_message else 'completed'
+        upload_record.error_message = error_message
+        upload_record.qa_count = 0
+        upload_record.processing_time = 0
+        upload_record.completed_at = datetime.utcnow()
+        db.session.commit()
+    
+    def process_file_async(self, file_path: Path, filename: str,
+                           upload_record: Optional[UploadHistory] = None) -> Dict[str, Any]:
         """
         异步处理文件（用于API调用）
         
         Args:
             file_path: 文件路径
             filename: 文件名
+            upload_record: 预先创建的上传记录（后台处理时由上传接口创建）
         
         Returns:
             Dict: 包含upload_id和基本信息的响应
         """
         try:
-            # 文件验证
-            is_valid, error_msg = self.validate_file(file_path)
+            # 文件验证（解压额度在校验和处理之间共用）
+            budget = SizeBudget(self._get_max_decompressed_size())
+            is_valid, error_msg = self.validate_file(file_path, budget)
             if not is_valid:
+                self.finish_upload_record(upload_record, error_msg)
                 return {
                     'success': False,
                     'error': error_msg
@@ -455,25 +824,27 @@ class FileProcessor:
             
             # 计算文件信息
             file_size = file_path.stat().st_size
-            file_hash = self.calculate_file_hash(file_path)
+            hashes = self.get_file_hashes(file_path, upload_record)
             
             # 检查重复上传
-            duplicate = self.check_duplicate_upload(file_hash)
+            duplicate = self.check_duplicate_upload(hashes.md5, hashes.content_hash)
             if duplicate:
+                self.finish_upload_record(upload_record)
                 return {
                     'success': True,
-                    'upload_id': duplicate.id,
+                    'upload_id': upload_record.id if upload_record else duplicate.id,
+                    'duplicate_of': duplicate.id,
                     'message': '文件已存在，跳过处理',
                     'qa_count': duplicate.qa_count,
                     'status': duplicate.status
                 }
             
             # 创建上传记录
-            upload_record = self.create_upload_record(filename, file_size, file_hash)
+            upload_record = self.prepare_upload_record(filename, file_size, hashes, upload_record)
             
             # 在后台处理（实际生产中应该使用Celery等任务队列）
             # 这里简化为直接处理
-            result = self.process_file(file_path, upload_record)
+            result = self.process_file(file_path, upload_record, budget)
             
             # 生成用户友好的处理结果消息
             if result.success:
@@ -557,64 +928,88 @@ class FileProcessor:
             logger.error(f"Failed to cleanup temp files: {str(e)}")
             return 0
     
-    def _create_raw_qa_pairs_from_messages(self, messages: List[Dict], upload_id: int) -> List[object]:
-        """从所有消息创建原始Q&A记录用于后续人工审核"""
+    def _create_raw_qa_pairs_from_messages(self, messages: Sequence[Dict], upload_id: int,
+                                           existing_fingerprints: Optional[DedupIndex] = None,
+                                           stop: Optional[int] = None,
+                                           failed_ranges: Optional[List[Tuple[int, int, int, str]]] = None) -> List[object]:
+        """
+        从所有消息创建原始Q&A记录，写入待审核暂存表（raw_qa_pairs）
+        
+        Args:
+            messages: 标准化后的消息（列表或 MessageBuffer）
+            upload_id: 上传记录ID
+            existing_fingerprints: 已有指纹索引（流式分批调用时复用，会被更新）
+            stop: 只配对到该位置之前（流式分批时保留末尾消息给下一批）
+            failed_ranges: 写入失败的消息范围追加到这里：(起始序号, 结束序号, 失败记录数, 错误信息)
+        
+        Returns:
+            List: 已保存的原始记录
+        """
+        candidates = []  # (原始记录, 消息范围 [问题, 答案])
         raw_pairs = []
+        pair_ranges = []  # 每条记录对应的消息范围 [问题, 答案]
+        saved_pairs = []
         batch_size = 100
         
         try:
             logger.info(f"Creating raw QA pairs from {len(messages)} messages")
             
-            # 获取现有指纹进行去重
-            existing_fingerprints = self._get_existing_content_fingerprints()
+            # 获取现有指纹进行去重（正式表和暂存表）
+            if existing_fingerprints is None:
+                existing_fingerprints = self._get_dedup_index(include_raw=True)
             
             # 将连续的消息组合成问答对
-            for i in range(0, len(messages) - 1, 2):  # 每2条消息组成一对
+            end = stop if stop is not None else len(messages) - 1
+            for i in range(0, end, 2):  # 每2条消息组成一对
                 try:
                     question_msg = messages[i]
-                    answer_msg = messages[i + 1] if i + 1 < len(messages) else question_msg
+                    answer_index = i + 1 if i + 1 < len(messages) else i
+                    answer_msg = messages[answer_index]
                     
                     # 避免同一人的连续消息
                     if question_msg['sender'] == answer_msg['sender'] and i + 2 < len(messages):
-                        answer_msg = messages[i + 2]
+                        answer_index = i + 2
+                        answer_msg = messages[answer_index]
                     
                     # 检查内容去重
+                    has_answer = answer_index != i
                     question_content = question_msg['content'][:2000]
-                    answer_content = answer_msg['content'][:2000] if question_msg != answer_msg else "待补充回答"
+                    answer_content = answer_msg['content'][:2000] if has_answer else "待补充回答"
                     asker = question_msg['sender'][:100]
-                    advisor = answer_msg['sender'][:100] if question_msg != answer_msg else "系统"
+                    advisor = answer_msg['sender'][:100] if has_answer else "系统"
                     
                     content_fingerprint = self._generate_content_fingerprint(
                         question_content, answer_content, asker, advisor
                     )
                     
-                    # 跳过重复内容
-                    if content_fingerprint in existing_fingerprints:
-                        logger.debug(f"Skipping duplicate raw message pair: {question_content[:30]}...")
-                        continue
-                    
-                    qa_pair = QAPair(
+                    raw_pair = RawQAPair(
+                        upload_id=upload_id,
                         question=question_content,
                         answer=answer_content,
-                        category_id=1,  # 默认分类：产品咨询
                         asker=asker,
                         advisor=advisor,
-                        confidence=0.1,  # 低置信度标记为待审核
-                        source_file=f"upload_{upload_id}_raw",
-                        original_context=json.dumps({
-                            'question_timestamp': question_msg['timestamp'].isoformat() if isinstance(question_msg['timestamp'], datetime) else str(question_msg['timestamp']),
-                            'answer_timestamp': answer_msg['timestamp'].isoformat() if isinstance(answer_msg['timestamp'], datetime) else str(answer_msg['timestamp']),
-                            'raw_import': True,
-                            'needs_review': True
-                        }, ensure_ascii=False)
+                        question_timestamp=question_msg['timestamp'].isoformat() if isinstance(question_msg['timestamp'], datetime) else str(question_msg['timestamp']),
+                        answer_timestamp=answer_msg['timestamp'].isoformat() if isinstance(answer_msg['timestamp'], datetime) else str(answer_msg['timestamp']),
+                        content_fingerprint=content_fingerprint,
+                        status='pending'
                     )
-                    raw_pairs.append(qa_pair)
-                    existing_fingerprints.add(content_fingerprint)  # 添加到已存在集合
+                    candidates.append((raw_pair, (i, answer_index + 1)))
                     
                 except Exception as e:
                     logger.error(f"Failed to create raw QA pair from messages {i}, {i+1}: {str(e)}")
+                    if failed_ranges is not None:
+                        failed_ranges.append((i, min(i + 2, len(messages)), 1, str(e)))
                     continue
             
+            # 跳过重复内容（同时登记指纹），过滤器命中的整批查一次数据库
+            existing_fingerprints.prefetch([raw_pair.content_fingerprint for raw_pair, _ in candidates])
+            for raw_pair, pair_range in candidates:
+                if not existing_fingerprints.claim(raw_pair.content_fingerprint):
+                    logger.debug(f"Skipping duplicate raw message pair: {raw_pair.question[:30]}...")
+                    continue
+                raw_pairs.append(raw_pair)
+                pair_ranges.append(pair_range)
+            
             # 批量保存原始记录
             if raw_pairs:
                 saved_count = 0
@@ -624,29 +1019,36 @@ class FileProcessor:
                         db.session.bulk_save_objects(batch)
                         db.session.commit()
                         saved_count += len(batch)
+                        saved_pairs.extend(batch)
                         logger.debug(f"Saved raw batch {i//batch_size + 1}, total: {saved_count}")
                     except Exception as e:
                         logger.error(f"Failed to save raw batch: {str(e)}")
                         db.session.rollback()
+                        if failed_ranges is not None:
+                            ranges = pair_ranges[i:i + batch_size]
+                            failed_ranges.append((ranges[0][0], max(end for _, end in ranges), len(batch), str(e)))
                         continue
-                
+                        
                 logger.info(f"Successfully saved {saved_count} raw QA pairs for manual review")
-            
-            return raw_pairs
+                
+            return saved_pairs
             
         except Exception as e:
             logger.error(f"Failed to create raw QA pairs: {str(e)}")
             return []
     
-    def _get_existing_content_fingerprints(self) -> set:
-        """获取现有问答对的内容指纹"""
+    def _get_existing_content_fingerprints(self, exclude_source: Optional[str] = None) -> set:
+        """获取现有问答对的内容指纹（exclude_source 为要排除的来源，如 upload_12）"""
         try:
-            existing_pairs = db.session.query(
+            query = db.session.query(
                 QAPair.question, 
                 QAPair.answer, 
                 QAPair.asker, 
                 QAPair.advisor
-            ).all()
+            )
+            if exclude_source:
+                query = query.filter(or_(QAPair.source_file.is_(None), QAPair.source_file != exclude_source))
+            existing_pairs = query.all()
             
             fingerprints = set()
             for question, answer, asker, advisor in existing_pairs:
@@ -660,35 +1062,51 @@ class FileProcessor:
             logger.error(f"Failed to load existing fingerprints: {str(e)}")
             return set()
     
+    def _get_dedup_index(self, include_raw: bool = False, exclude_source: Optional[str] = None) -> DedupIndex:
+        """
+        获取去重指纹索引
+        
+        Args:
+            include_raw: 是否包含待审核暂存表的指纹（暂存原始消息时使用）
+            exclude_source: 不把该来源已入库的问答对算作已存在（断点续传时暂存去重使用）
+        """
+        if self.ingest_context is not None:
+            return self.ingest_context.get_dedup_index(include_raw, self._create_dedup_index)
+        return self._create_dedup_index(include_raw, exclude_source)
+    
+    def _create_dedup_index(self, include_raw: bool = False, exclude_source: Optional[str] = None) -> DedupIndex:
+        """
+        新建去重指纹索引
+        
+        优先使用持久化的指纹过滤器，过滤器命中的指纹才查数据库确认；暂存去重只把
+        处理开始前已有的问答对算作已存在（与之前加载指纹快照的行为一致）。
+        过滤器不可用时从数据库加载全部指纹。
+        """
+        filter_service = get_fingerprint_filter_service()
+        bloom = filter_service.get_filter()
+        if bloom is None:
+            fingerprints = self._get_existing_content_fingerprints(exclude_source=exclude_source)
+            if include_raw:
+                fingerprints |= RawQAPair.get_fingerprints()
+            return DedupIndex(fingerprints)
+            
+        return DedupIndex(bloom=bloom, lookup=partial(
+            filter_service.lookup,
+            include_raw=include_raw,
+            created_before=datetime.utcnow() if include_raw else None,
+            exclude_source=exclude_source
+        ))
+    
+    def _get_category_ids(self) -> set:
+        """已有分类ID"""
+        if self.ingest_context is not None:
+            return self.ingest_context.get_category_ids()
+        return {category_id for (category_id,) in db.session.query(Category.id).all()}
+    
     def _generate_content_fingerprint(self, question: str, answer: str, asker: str, advisor: str) -> str:
-        """生成内容指纹用于去重"""
+        """生成内容指纹用于去重（见 app.utils.content_fingerprint）"""
         try:
-            import hashlib
-            import re
-            
-            # 标准化文本：移除多余空白、标点，转为小写
-            def normalize_text(text):
-                if not text:
-                    return ""
-                # 移除多余空白和标点
-                text = re.sub(r'[^\w\s\u4e00-\u9fff]', '', text)
-                text = re.sub(r'\s+', ' ', text)
-                return text.lower().strip()
-            
-            # 标准化各字段
-            norm_question = normalize_text(question)[:200]  # 限制长度避免过长指纹
-            norm_answer = normalize_text(answer)[:200]
-            norm_asker = normalize_text(asker) if asker else ""
-            norm_advisor = normalize_text(advisor) if advisor else ""
-            
-            # 生成组合指纹
-            content = f"{norm_question}|{norm_answer}|{norm_asker}|{norm_advisor}"
-            
-            # 使用MD5生成短指纹
-            fingerprint = hashlib.md5(content.encode('utf-8')).hexdigest()
-            
-            return fingerprint
-            
+            return compute_content_fingerprint(question, answer, asker, advisor)
         except Exception as e:
             logger.error(f"Failed to generate content fingerprint: {str(e)}")
             # 返回基于内容长度的简单指纹作为降级方案
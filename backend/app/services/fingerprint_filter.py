@@ -0,0 +1,275 @@
+"""
+内容指纹过滤器 - 上传去重用的持久化布隆过滤器
+
+原来每次上传处理都要把 qa_pairs（和 raw_qa_pairs）的全部内容指纹读进一个 set，
+内存和加载时间都随库的大小增长。现在所有已入库的指纹记在一个内存映射的布隆过滤器里：
+- 过滤器判断不存在的指纹直接通过；可能存在的再按 content_fingerprint 索引查数据库确认
+- 过滤器大小由 DEDUP_FILTER_CAPACITY 和 DEDUP_FILTER_ERROR_RATE 决定（默认200万条、
+  千分之一误判，约3.6MB），与库中的数据量无关
+- 文件按数据库区分（DEDUP_FILTER_DIR 下以数据库地址的摘要命名），内存数据库使用匿名内存
+
+过滤器的更新：
+- 上传去重登记的指纹立即加入（DedupIndex.claim）
+- ORM 会话插入或修改问答内容时，flush 后加入（见 init_fingerprint_filter）
+- 每次取用时按记录ID追上其他途径新增的记录（其他进程、批量写入），meta 中记录已同步到的ID
+  和最后一条的指纹；发现数据库被重建（最大ID变小或最后一条不同）或条数超过容量时整体重建
+删除的记录不会从过滤器中移除，只会让对应指纹多一次数据库查询。
+"""
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from flask import current_app
+from sqlalchemy import event, func, inspect, or_
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import QAPair, RawQAPair
+from app.utils.bloom_filter import BloomFilter
+from app.utils.content_fingerprint import content_fingerprint
+
+logger = logging.getLogger(__name__)
+
+SYNC_BATCH_SIZE = 5000    # 同步时每次读取的记录数
+LOOKUP_BATCH_SIZE = 500   # 查询数据库时每条语句的指纹数（SQLite 参数个数限制）
+
+_FINGERPRINT_FIELDS = ('question', 'answer', 'asker', 'advisor')
+
+
+class FingerprintFilterService:
+    """内容指纹过滤器服务（每个数据库一个过滤器，进程内共享）"""
+    
+    def __init__(self):
+        self._filters: Dict[str, BloomFilter] = {}
+        self._lock = threading.Lock()
+    
+    def get_filter(self) -> Optional[BloomFilter]:
+        """
+        当前数据库的过滤器（先追上新增的记录）
+        
+        未启用（DEDUP_FILTER_ENABLED=false）或打开、同步失败时返回 None，
+        调用方退回到从数据库加载全部指纹。
+        """
+        if not current_app.config.get('DEDUP_FILTER_ENABLED', True):
+            return None
+            
+        key = self._database_key(db.engine.url)
+        try:
+            with self._lock:
+                bloom = self._filters.get(key)
+                if bloom is None:
+                    bloom = self._open(key)
+                return self._sync(key, bloom)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Fingerprint filter unavailable, falling back to loading fingerprints: {str(e)}")
+            return None
+    
+    def rebuild(self, capacity: Optional[int] = None) -> BloomFilter:
+        """从数据库重建当前数据库的过滤器"""
+        key = self._database_key(db.engine.url)
+        with self._lock:
+            return self._rebuild(key, capacity)
+    
+    def lookup(self, fingerprints: List[str], include_raw: bool = False,
+               created_before: Optional[datetime] = None,
+               exclude_source: Optional[str] = None) -> Set[str]:
+        """
+        查询数据库中确实存在的指纹
+        
+        Args:
+            include_raw: 同时查暂存表
+            created_before: 只看该时间之前创建的问答对（暂存去重只看处理开始前已有的问答对）
+            exclude_source: 排除该来源的问答对（如 upload_12，断点续传时本上传之前入库的）
+        """
+        existing = set()
+        for start in range(0, len(fingerprints), LOOKUP_BATCH_SIZE):
+            chunk = fingerprints[start:start + LOOKUP_BATCH_SIZE]
+            query = db.session.query(QAPair.content_fingerprint).filter(QAPair.content_fingerprint.in_(chunk))
+            if created_before is not None:
+                query = query.filter(QAPair.created_at < created_before)
+            if exclude_source:
+                query = query.filter(or_(QAPair.source_file.is_(None), QAPair.source_file != exclude_source))
+            existing.update(fp for (fp,) in query.distinct())
+            
+            if include_raw:
+                remaining = [fp for fp in chunk if fp not in existing]
+                if remaining:
+                    existing.update(
+                        fp for (fp,) in db.session.query(RawQAPair.content_fingerprint)
+                                                  .filter(RawQAPair.content_fingerprint.in_(remaining))
+                                                  .distinct()
+                    )
+        return existing
+    
+    def add(self, bind_url, fingerprints: Iterable[str]):
+        """把新写入的指纹加入已打开的过滤器（未打开时由下次取用的同步补上）"""
+        bloom = self._filters.get(self._database_key(bind_url))
+        if bloom is not None:
+            for fingerprint in fingerprints:
+                bloom.add(fingerprint)
+    
+    def get_stats(self) -> Optional[Dict[str, Any]]:
+        """当前数据库过滤器的状态"""
+        bloom = self._filters.get(self._database_key(db.engine.url))
+        if bloom is None:
+            return None
+        return {
+            'path': str(bloom.path) if bloom.path else None,
+            'capacity': bloom.capacity,
+            'count': bloom.count,
+            'size_bytes': bloom.size_bytes,
+            'num_hashes': bloom.num_hashes,
+            'estimated_error_rate': bloom.estimated_error_rate,
+            'synced': dict(bloom.meta)
+        }
+    
+    @staticmethod
+    def _database_key(url) -> str:
+        return hashlib.md5(url.render_as_string(hide_password=False).encode('utf-8')).hexdigest()[:16]
+    
+    def _path(self, key: str) -> Optional[Path]:
+        url = db.engine.url
+        if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+            return None
+        directory = Path(current_app.config.get('DEDUP_FILTER_DIR') or Path(current_app.root_path).parent / 'dedup')
+        return directory / f'fingerprints-{key}.bloom'
+    
+    def _open(self, key: str) -> BloomFilter:
+        """打开已有的过滤器文件；不存在、损坏或参数与配置不符时重建"""
+        path = self._path(key)
+        if path is not None and path.exists():
+            try:
+                bloom = BloomFilter.open(path)
+                if (bloom.capacity >= current_app.config.get('DEDUP_FILTER_CAPACITY', 2000000)
+                        and bloom.meta.get('error_rate') == current_app.config.get('DEDUP_FILTER_ERROR_RATE', 0.001)):
+                    self._filters[key] = bloom
+                    return bloom
+                logger.info(f"Fingerprint filter settings changed, rebuilding {path}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Failed to open fingerprint filter {path}, rebuilding: {str(e)}")
+        return self._rebuild(key)
+    
+    def _rebuild(self, key: str, capacity: Optional[int] = None) -> BloomFilter:
+        """新建过滤器并载入全部指纹（写临时文件后替换，正在使用旧过滤器的处理不受影响）"""
+        error_rate = current_app.config.get('DEDUP_FILTER_ERROR_RATE', 0.001)
+        capacity = max(capacity or 0, current_app.config.get('DEDUP_FILTER_CAPACITY', 2000000))
+        path = self._path(key)
+        
+        started = datetime.utcnow()
+        bloom = BloomFilter.create(path.with_suffix('.tmp') if path else None, capacity, error_rate)
+        bloom.meta = {'error_rate': error_rate, 'qa_id': 0, 'raw_id': 0}
+        self._load(bloom)
+        bloom.flush()
+        if path is not None:
+            bloom.replace_file(path)
+            
+        self._filters[key] = bloom
+        logger.info(f"Built fingerprint filter with {bloom.count} fingerprints "
+                    f"({bloom.size_bytes // 1024}KB) in {(datetime.utcnow() - started).total_seconds():.1f}s")
+        return bloom
+    
+    def _sync(self, key: str, bloom: BloomFilter) -> BloomFilter:
+        """追上过滤器上次同步之后新增的记录"""
+        max_qa_id = db.session.query(func.max(QAPair.id)).scalar() or 0
+        max_raw_id = db.session.query(func.max(RawQAPair.id)).scalar() or 0
+        if (max_qa_id < bloom.meta.get('qa_id', 0) or max_raw_id < bloom.meta.get('raw_id', 0)
+                or self._last_fingerprint(QAPair, bloom.meta.get('qa_id', 0)) != bloom.meta.get('qa_last')):
+            logger.info("Database was reset since the fingerprint filter was built, rebuilding")
+            return self._rebuild(key)
+        if max_qa_id == bloom.meta.get('qa_id', 0) and max_raw_id == bloom.meta.get('raw_id', 0):
+            return bloom
+            
+        self._load(bloom)
+        if bloom.count > bloom.capacity:
+            logger.warning(f"Fingerprint filter is over capacity ({bloom.count} > {bloom.capacity}), rebuilding larger")
+            return self._rebuild(key, bloom.count * 2)
+        bloom.flush()
+        return bloom
+    
+    def _load(self, bloom: BloomFilter):
+        """把ID大于 meta 中记录的问答对和暂存记录的指纹加入过滤器（补算缺失的问答对指纹）"""
+        last_id = bloom.meta.get('qa_id', 0)
+        while True:
+            rows = db.session.query(QAPair.id, QAPair.content_fingerprint)\
+                             .filter(QAPair.id > last_id)\
+                             .order_by(QAPair.id).limit(SYNC_BATCH_SIZE).all()
+            if not rows:
+                break
+            missing = [qa_id for qa_id, fingerprint in rows if not fingerprint]
+            backfilled = self._backfill(missing) if missing else {}
+            bloom.update(fingerprint or backfilled[qa_id] for qa_id, fingerprint in rows)
+            last_id = rows[-1][0]
+        bloom.meta['qa_id'] = last_id
+        bloom.meta['qa_last'] = self._last_fingerprint(QAPair, last_id)
+        
+        last_id = bloom.meta.get('raw_id', 0)
+        while True:
+            rows = db.session.query(RawQAPair.id, RawQAPair.content_fingerprint)\
+                             .filter(RawQAPair.id > last_id)\
+                             .order_by(RawQAPair.id).limit(SYNC_BATCH_SIZE).all()
+            if not rows:
+                break
+            bloom.update(fingerprint for _, fingerprint in rows if fingerprint)
+            last_id = rows[-1][0]
+        bloom.meta['raw_id'] = last_id
+    
+    @staticmethod
+    def _last_fingerprint(model, record_id: int) -> Optional[str]:
+        """已同步的最后一条记录的指纹（与 meta 中的不一致说明数据库已被重建）"""
+        if not record_id:
+            return None
+        return db.session.query(model.content_fingerprint).filter(model.id == record_id).scalar()
+    
+    def _backfill(self, qa_ids: List[int]) -> Dict[int, str]:
+        """计算并写入缺失的问答对指纹（迁移之前或绕过 ORM 写入的记录，提取指纹取同一个值）"""
+        rows = db.session.query(QAPair.id, QAPair.question, QAPair.answer, QAPair.asker, QAPair.advisor)\
+                         .filter(QAPair.id.in_(qa_ids)).all()
+        fingerprints = {row[0]: content_fingerprint(*row[1:]) for row in rows}
+        db.session.execute(
+            QAPair.__table__.update().where(QAPair.__table__.c.id == db.bindparam('qa_id')),
+            [{'qa_id': qa_id, 'content_fingerprint': fingerprint, 'extraction_fingerprint': fingerprint}
+             for qa_id, fingerprint in fingerprints.items()]
+        )
+        db.session.commit()
+        return fingerprints
+
+
+fingerprint_filter_service = FingerprintFilterService()
+_listener_registered = False
+
+
+def get_fingerprint_filter_service() -> FingerprintFilterService:
+    """获取内容指纹过滤器服务实例"""
+    return fingerprint_filter_service
+
+
+def _set_qa_fingerprint(mapper, connection, target):
+    """ORM 插入问答对、或修改其问答内容时计算 content_fingerprint（批量写入由调用方设置）"""
+    state = inspect(target)
+    if (target.content_fingerprint is None
+            or any(state.attrs[field].history.has_changes() for field in _FINGERPRINT_FIELDS)):
+        target.content_fingerprint = content_fingerprint(target.question, target.answer, target.asker, target.advisor)
+
+
+def _on_after_flush(session, flush_context):
+    fingerprints = [
+        obj.content_fingerprint for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, (QAPair, RawQAPair)) and obj.content_fingerprint
+    ]
+    if fingerprints:
+        fingerprint_filter_service.add(session.get_bind().url, fingerprints)
+
+
+def init_fingerprint_filter(app):
+    """注册模型和会话事件：ORM 写入的问答对自动计算指纹并加入过滤器"""
+    global _listener_registered
+    if not _listener_registered:
+        event.listen(QAPair, 'before_insert', _set_qa_fingerprint)
+        event.listen(QAPair, 'before_update', _set_qa_fingerprint)
+        event.listen(Session, 'after_flush', _on_after_flush)
+        _listener_registered = True
+    return fingerprint_filter_service
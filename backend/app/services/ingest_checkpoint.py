@@ -0,0 +1,181 @@
+"""
+上传处理检查点 - 大文件处理失败或超时后从断点继续
+
+入库流水线每提交一批数据就把进度写入 upload_history.ingest_checkpoint（JSON）：
+- chats：每个聊天（来源）的进度，位置是该聊天标准化后消息的序号
+  - qa：该位置之前的消息提取出的问答对都已入库（总在提取分片的边界上）
+  - raw：该位置之前的消息已配对写入暂存表
+- saved / raw_saved / extracted：各次处理累计的入库数、暂存数和候选数
+- failed_ranges：写入失败、不会再重试的消息范围 [start, end)
+- last_error：最近一次处理失败的原因
+
+- watermarks：检查点覆盖的聊天（水位线过滤已读到的）及它们加载时的水位线摘要
+
+后台任务重试同一个上传时，流水线跳过已完成的部分：暂存从 raw 继续，提取从 qa 继续
+（向前带 CONTEXT_LOOKBEHIND 条上下文，分片与从头处理时相同）。检查点只对同一文件、
+同一处理方式（key）且覆盖的聊天水位线没有变化时有效，否则从头处理，已入库的内容由
+指纹去重跳过。其他聊天（如同时在同步的群）推进水位线不会使检查点失效。
+"""
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app import db
+from app.models import UploadHistory
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+
+class IngestCheckpoint:
+    """
+    单个上传的入库进度
+    
+    流水线的暂存（提取线程）和入库（调用线程）两个阶段都会更新进度，
+    每次更新都在锁内立即写回数据库，写入的总是最新的状态。
+    """
+    
+    def __init__(self, upload_id: int, key: Dict[str, Any], data: Optional[Dict[str, Any]] = None,
+                 watermark_filter=None):
+        self.upload_id = upload_id
+        self.key = key
+        self.watermark_filter = watermark_filter
+        self.resumed = bool(data)
+        
+        data = data or {}
+        self.chats: Dict[str, Dict[str, int]] = data.get('chats', {})
+        self.saved: int = data.get('saved', 0)
+        self.raw_saved: int = data.get('raw_saved', 0)
+        self.extracted: int = data.get('extracted', 0)
+        self.failed_ranges: List[Dict[str, Any]] = data.get('failed_ranges', [])
+        self.attempts: int = data.get('attempts', 0) + 1
+        self.last_error: Optional[str] = data.get('last_error')
+        self.completed = False
+        
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def load(cls, upload_record: UploadHistory, key: Dict[str, Any],
+             watermark_filter=None) -> 'IngestCheckpoint':
+        """
+        读取上传记录上的检查点，与本次处理不匹配时从头开始
+        
+        Args:
+            watermark_filter: 本次处理的聊天水位线过滤（WatermarkFilter），为 None 时不做增量过滤
+        """
+        data = upload_record.get_ingest_checkpoint()
+        if data and (data.get('version') != CHECKPOINT_VERSION or data.get('key') != key or data.get('completed')
+                     or not cls._watermarks_match(data.get('watermarks'), watermark_filter)):
+            logger.info(f"Discarding stale ingest checkpoint of upload {upload_record.id}")
+            data = None
+            
+        checkpoint = cls(upload_record.id, key, data, watermark_filter)
+        if checkpoint.resumed:
+            logger.info(f"Resuming upload {upload_record.id} from checkpoint (attempt {checkpoint.attempts}): "
+                        f"{checkpoint.saved} QA pairs and {checkpoint.raw_saved} raw pairs already saved")
+        return checkpoint
+    
+    @staticmethod
+    def _watermarks_match(saved: Optional[Dict[str, Any]], watermark_filter) -> bool:
+        """检查点覆盖的聊天的水位线与本次加载的相同（两次都没有增量过滤也算相同）"""
+        if watermark_filter is None or saved is None:
+            return watermark_filter is None and saved is None
+        return watermark_filter.signature(saved.get('chats', [])) == saved.get('signature')
+    
+    def _watermark_state(self) -> Optional[Dict[str, Any]]:
+        if self.watermark_filter is None:
+            return None
+        chats = self.watermark_filter.seen_chats()
+        return {'chats': chats, 'signature': self.watermark_filter.signature(chats)}
+    
+    def raw_position(self, source: str) -> int:
+        """聊天中已暂存到的位置"""
+        return self.chats.get(source, {}).get('raw', 0)
+    
+    def qa_position(self, source: str) -> int:
+        """聊天中问答对已入库到的位置"""
+        return self.chats.get(source, {}).get('qa', 0)
+    
+    def record_raw(self, source: str, position: int, saved: int):
+        """一批原始消息已暂存"""
+        with self._lock:
+            self.chats.setdefault(source, {})['raw'] = position
+            self.raw_saved += saved
+            self._save()
+    
+    def record_saved(self, saved: int):
+        """一批问答对已入库（分片中途提交，进度位置不变）"""
+        with self._lock:
+            self.saved += saved
+            self._save()
+    
+    def record_qa(self, source: str, position: int, extracted: int, saved: int):
+        """聊天中 position 之前的问答对都已入库（extracted 为这一段产出的候选数，saved 为最后一批的保存数）"""
+        with self._lock:
+            self.chats.setdefault(source, {})['qa'] = position
+            self.extracted += extracted
+            self.saved += saved
+            self._save()
+    
+    def add_failed_range(self, source: str, stage: str, start: int, end: int,
+                         count: int, error: Optional[str] = None):
+        """
+        记录写入失败的消息范围（不会在重试时重新处理）
+        
+        Args:
+            stage: 'stage_raw'（暂存）或 'save'（入库）
+            count: 范围内失败的记录数
+        """
+        with self._lock:
+            self.failed_ranges.append({
+                'source': source,
+                'stage': stage,
+                'start': start,
+                'end': end,
+                'count': count,
+                'error': error
+            })
+            self._save()
+    
+    def fail(self, error_message: str):
+        """处理失败：保留进度，记录失败原因"""
+        with self._lock:
+            self.last_error = error_message
+            self._save()
+    
+    def complete(self):
+        """处理完成：检查点不再用于续传，保留作为最终的处理记录"""
+        with self._lock:
+            self.completed = True
+            self._save()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'version': CHECKPOINT_VERSION,
+            'key': self.key,
+            'watermarks': self._watermark_state(),
+            'attempts': self.attempts,
+            'completed': self.completed,
+            'chats': self.chats,
+            'saved': self.saved,
+            'raw_saved': self.raw_saved,
+            'extracted': self.extracted,
+            'failed_ranges': self.failed_ranges,
+            'last_error': self.last_error,
+            'updated_at': datetime.utcnow().isoformat()
+        }
+    
+    def _save(self):
+        """写回上传记录（在当前线程的会话中单独提交，不影响调用方加载的对象）"""
+        try:
+            db.session.query(UploadHistory).filter(UploadHistory.id == self.upload_id).update(
+                {'ingest_checkpoint': json.dumps(self.to_dict(), ensure_ascii=False)},
+                synchronize_session=False
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Failed to save ingest checkpoint of upload {self.upload_id}: {str(e)}")
@@ -0,0 +1,294 @@
+"""
+上传处理流水线配置
+
+各文件处理器的入库流程都由同一组阶段组合而成（流水线本身见 app.utils.pipeline）：
+
+    parse → normalize → archive → stage_raw → extract → classify → save
+
+- parse：读取原始消息（ijson 流式解析或整体 json.loads），应用聊天水位线；
+  每个聊天（zip 包里的一个 JSON 文件）以 ChatStart 开头
+- normalize：标准化消息（整体解析时已在 parse 中完成并按时间排序，不需要这一阶段）
+- archive：标准化消息按段压缩归档，供调整规则后重新提取（见 message_archive，可关闭）
+- stage_raw：按滑动窗口把原始消息两两配对写入待审核暂存表
+- extract：按分片提取问答候选，每个分片提取完即交给下游，随后是分片的 ChatProgress 标记
+- classify：规则或 AI 分类（进度标记原样传递）
+- save：按批写入 qa_pairs，遇到进度标记时先提交当前批次
+
+暂存和入库阶段可以接收断点续传的起始位置和提交回调（见 ingest_checkpoint），
+位置都是聊天中标准化后消息的序号。
+
+读取解析和问答提取各在独立线程中运行，分类和入库在调用线程中进行，三者之间
+用有界队列衔接。每个阶段的吞吐量、耗时和队列深度记录在处理统计的 processing.pipeline 中。
+"""
+import logging
+from itertools import chain
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.utils.pipeline import Stage, iter_batches
+from .data_extractor import DataExtractor, ExtractionTally, QACandidate
+from .qa_classifier import CategoryMatch, ClassificationTally, QAClassifier
+
+logger = logging.getLogger(__name__)
+
+RAW_BATCH_SIZE = 1000   # 原始消息每批暂存的条数（每批多保留2条供跨批配对）
+SAVE_BATCH_SIZE = 1000  # 问答对每批入库的条数
+
+
+@dataclass
+class ChatStart:
+    """消息流中一个聊天的开始"""
+    source: str
+
+
+@dataclass
+class ChatProgress:
+    """提取进度标记：聊天中 position 之前的消息已提取完（extracted 为该分片产出的候选数）"""
+    source: str
+    position: int
+    extracted: int
+
+
+@dataclass
+class IngestStats:
+    """
+    一次上传处理的计数（由各阶段更新）
+    
+    提取和分类只累计计数、置信度和按回答者/分类的计数，内存占用与问答数无关。
+    从检查点继续时 raw_saved、saved 从之前的累计值开始，resumed_extracted 为之前产出的候选数
+    """
+    messages: int = 0
+    raw_saved: int = 0
+    saved: int = 0
+    extraction: ExtractionTally = field(default_factory=ExtractionTally)
+    classification: ClassificationTally = field(default_factory=ClassificationTally)
+    resumed_extracted: int = 0
+    
+    @property
+    def extracted(self) -> int:
+        """本次提取的候选数"""
+        return self.extraction.count
+    
+    @property
+    def classified(self) -> int:
+        """本次分类的问答数"""
+        return self.classification.count
+    
+    @property
+    def total_extracted(self) -> int:
+        return self.resumed_extracted + self.extraction.count
+
+
+def parse_stage(message_filter: Optional[Callable[[Iterable[Dict[str, Any]]], Iterable[Dict[str, Any]]]] = None) -> Stage:
+    """
+    读取消息：输入为 (来源, 消息迭代器) 形式的聊天，输出 ChatStart 和其后的各条消息
+    
+    Args:
+        message_filter: 作用于原始消息流的过滤（如聊天水位线），整体解析时已在解析中应用
+    """
+    def run(chats):
+        for source, messages in chats:
+            yield ChatStart(source)
+            yield from (message_filter(messages) if message_filter is not None else messages)
+    return Stage('parse', run, threaded=True)
+
+
+def normalize_stage(extractor: DataExtractor, stats: IngestStats) -> Stage:
+    """逐条标准化原始消息（每个聊天单独识别时间戳格式）"""
+    def run(items):
+        for chat, messages in split_chats(items):
+            yield chat
+            for message in extractor.iter_normalized_messages(messages):
+                stats.messages += 1
+                yield message
+    return Stage('normalize', run)
+
+
+def stage_raw_stage(stage_messages: Callable[[str, int, List[Dict[str, Any]], Optional[int]], int],
+                    stats: IngestStats, batch_size: int = RAW_BATCH_SIZE,
+                    resume_position: Optional[Callable[[str], int]] = None) -> Stage:
+    """
+    暂存原始消息：每个聊天的消息按批交给 stage_messages(来源, 批次起始位置, 消息, stop)，
+    消息原样传给下游
+    
+    stage_messages 只配对 stop 之前的消息并返回暂存的条数；每批多保留2条，
+    下一批从第 batch_size 条开始，配对结果与一次暂存整个聊天相同。
+    
+    Args:
+        resume_position: 返回聊天已暂存到的位置（断点续传），之前的消息不再暂存
+    """
+    def run(items):
+        for chat, messages in split_chats(items):
+            yield chat
+            offset = resume_position(chat.source) if resume_position is not None else 0
+            pending = []
+            for index, message in enumerate(messages):
+                if index >= offset:
+                    pending.append(message)
+                    if len(pending) >= batch_size + 2:
+                        stats.raw_saved += stage_messages(chat.source, offset, pending, batch_size)
+                        del pending[:batch_size]
+                        offset += batch_size
+                yield message
+                
+            if pending:
+                stats.raw_saved += stage_messages(chat.source, offset, pending, None)
+    return Stage('stage_raw', run)
+
+
+def archive_stage(archive_messages: Callable[[int, str, int, List[Dict[str, Any]]], None],
+                  segment_size: int, resume_position: Optional[Callable[[str], int]] = None) -> Stage:
+    """
+    归档标准化消息：每个聊天的消息按 segment_size 条一段交给
+    archive_messages(聊天序号, 来源, 段起始位置, 消息)，消息原样传给下游
+    
+    Args:
+        resume_position: 返回聊天已归档到的位置（断点续传），之前的消息不再归档
+    """
+    def run(items):
+        for chat_index, (chat, messages) in enumerate(split_chats(items)):
+            yield chat
+            offset = resume_position(chat.source) if resume_position is not None else 0
+            segment = []
+            for index, message in enumerate(messages):
+                if index >= offset:
+                    segment.append(message)
+                    if len(segment) >= segment_size:
+                        archive_messages(chat_index, chat.source, offset, segment)
+                        offset += len(segment)
+                        segment = []
+                yield message
+                
+            if segment:
+                archive_messages(chat_index, chat.source, offset, segment)
+    return Stage('archive', run)
+
+
+def extract_stage(extractor: DataExtractor, stats: IngestStats,
+                  resume_position: Optional[Callable[[str], int]] = None) -> Stage:
+    """
+    逐个聊天提取问答候选：每个分片提取完即产出候选，随后产出该分片的 ChatProgress
+    （见 DataExtractor.iter_extract）
+    
+    Args:
+        resume_position: 返回聊天中问答对已入库到的位置（断点续传），从该位置继续提取
+    """
+    def run(items):
+        for chat, messages in split_chats(items):
+            offset = resume_position(chat.source) if resume_position is not None else 0
+            for position, candidates in extractor.iter_extract(messages, chat.source, offset):
+                for qa in candidates:
+                    stats.extraction.add(qa.confidence, qa.advisor)
+                    yield qa
+                yield ChatProgress(chat.source, position, len(candidates))
+    return Stage('extract', run, threaded=True)
+
+
+def classify_stage(classifier: QAClassifier, stats: IngestStats, skip_failed: bool = False) -> Stage:
+    """
+    规则分类，输出 (问答候选, 分类结果)
+    
+    Args:
+        skip_failed: 分类失败时丢弃该问答对；默认使用默认分类
+    """
+    def run(candidates):
+        for qa in candidates:
+            if isinstance(qa, ChatProgress):
+                yield qa
+                continue
+            try:
+                classification = classifier.classify_qa(qa.question, qa.answer, qa.context)
+            except Exception as e:
+                logger.error(f"Failed to classify QA: {str(e)}")
+                if skip_failed:
+                    continue
+                classification = CategoryMatch(1, '产品咨询', 0.2, [])
+            stats.classification.add(classification)
+            yield qa, classification
+    return Stage('classify', run)
+
+
+def save_stage(save_batch: Callable[[List[Tuple[QACandidate, CategoryMatch]]], int],
+               stats: IngestStats, batch_size: int = SAVE_BATCH_SIZE,
+               on_commit: Optional[Callable[[int, Optional[ChatProgress]], None]] = None) -> Stage:
+    """
+    按批入库：save_batch 返回实际保存的条数（重复的被跳过），输出每批的保存数
+    
+    Args:
+        on_commit: 每批提交后调用 on_commit(保存数, None)；遇到进度标记时先提交当前批次，
+            再调用 on_commit(保存数, 标记)，此时标记之前的问答对都已入库。
+            为 None 时忽略进度标记，按 batch_size 打包
+    """
+    if on_commit is None:
+        def run(classified):
+            items = (item for item in classified if not isinstance(item, ChatProgress))
+            for batch in iter_batches(items, batch_size):
+                saved = save_batch(batch)
+                stats.saved += saved
+                yield saved
+        return Stage('save', run)
+    
+    def run_with_progress(classified):
+        batch = []
+        for item in classified:
+            if isinstance(item, ChatProgress):
+                saved = save_batch(batch) if batch else 0
+                stats.saved += saved
+                batch = []
+                on_commit(saved, item)
+                if saved:
+                    yield saved
+                continue
+                
+            batch.append(item)
+            if len(batch) >= batch_size:
+                saved = save_batch(batch)
+                stats.saved += saved
+                batch = []
+                on_commit(saved, None)
+                yield saved
+                
+        if batch:
+            saved = save_batch(batch)
+            stats.saved += saved
+            on_commit(saved, None)
+            yield saved
+    return Stage('save', run_with_progress)
+
+
+def split_chats(items: Iterable[Any]) -> Iterator[Tuple[ChatStart, Iterator[Dict[str, Any]]]]:
+    """
+    把带 ChatStart 分隔的消息流拆成 (聊天, 消息迭代器)
+    
+    调用方需要先读完一个聊天的消息迭代器再取下一个聊天；ChatStart 之前的消息属于
+    一个没有来源名的聊天。
+    """
+    items = iter(items)
+    state = {'next': None, 'done': False}
+    
+    def messages():
+        for item in items:
+            if isinstance(item, ChatStart):
+                state['next'] = item
+                return
+            yield item
+        state['done'] = True
+        
+    first = next(items, None)
+    if first is None:
+        return
+    if not isinstance(first, ChatStart):
+        items = chain([first], items)
+        first = ChatStart('')
+        
+    chat = first
+    while True:
+        state['next'] = None
+        chat_messages = messages()
+        yield chat, chat_messages
+        for _ in chat_messages:  # 调用方没有读完时跳过剩余消息
+            pass
+        if state['done'] or state['next'] is None:
+            return
+        chat = state['next']
+
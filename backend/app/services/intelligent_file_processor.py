@@ -79,13 +79,15 @@ class IntelligentFileProcessor:
     async def process_file_intelligently(self, 
                                        file_path: Path, 
                                        original_filename: str,
-                                       force_ai: bool = False) -> IntelligentProcessingResult:
+                                       force_ai: bool = False,
+                                       upload_record: Optional[UploadHistory] = None) -> IntelligentProcessingResult:
         """智能处理聊天记录文件
         
         Args:
             file_path: 文件路径
             original_filename: 原始文件名
             force_ai: 是否强制使用AI处理
+            upload_record: 预先创建的上传记录（后台处理时由上传接口创建）
             
         Returns:
             处理结果详情
@@ -94,12 +96,15 @@ class IntelligentFileProcessor:
         start_time = time.time()
         
         # 创建上传记录
-        upload_record = UploadHistory(
-            filename=original_filename,
-            file_size=file_path.stat().st_size,
-            status='processing'
-        )
-        db.session.add(upload_record)
+        if upload_record is None:
+            upload_record = UploadHistory(
+                filename=original_filename,
+                file_size=file_path.stat().st_size,
+                status='processing'
+            )
+            db.session.add(upload_record)
+        else:
+            upload_record.status = 'processing'
         db.session.commit()
         
         try:
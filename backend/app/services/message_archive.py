@@ -0,0 +1,225 @@
+"""
+消息归档服务 - 保存标准化后的消息，调整规则后无需重新上传即可重新提取
+
+上传处理完成后原始导出文件会被删除，只留下提取出的问答对。入库流水线在标准化之后
+把每个聊天的消息按顺序切成段（默认 2000 条），每段编码为 NDJSON、用问答上下文的
+压缩编解码器（zlib 预置字典或 zstd，见 context_codec）压缩后追加写入 message_archive_segments。
+归档的是送入问答提取的消息流本身（已经过聊天水位线过滤），重新提取时逐段读取、
+逐个聊天重放，结果与上传时的提取一致（见 reextraction）。
+
+每行消息为 [时间戳（微秒，与 MessageBuffer 相同）, 发送者, 内容, 消息类型]。
+"""
+import json
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from app import db
+from app.models import MessageArchiveSegment
+from app.services.chat_watermark import get_chat_id
+from app.utils.context_codec import get_context_codec
+from app.utils.message_buffer import datetime_to_micros, micros_to_datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_SIZE = 2000
+_READ_BATCH = 16  # 读取归档时每次从数据库取的分段数
+
+
+def encode_segment(messages: Iterable[Dict[str, Any]]) -> bytes:
+    """标准化消息编码为压缩的 NDJSON"""
+    lines = []
+    for message in messages:
+        try:
+            msg_type = int(message.get('msg_type', 1))
+        except (TypeError, ValueError):
+            msg_type = 0
+        lines.append(json.dumps(
+            [datetime_to_micros(message['timestamp']), message['sender'], message['content'], msg_type],
+            ensure_ascii=False, separators=(',', ':')
+        ))
+    return get_context_codec().encode('\n'.join(lines))
+
+
+def decode_segment(payload: bytes) -> Iterator[Dict[str, Any]]:
+    """解码一个分段，返回标准化消息"""
+    text = get_context_codec().decode(payload)
+    if not text:
+        return
+    for line in text.split('\n'):
+        timestamp, sender, content, msg_type = json.loads(line)
+        yield {
+            'content': content,
+            'sender': sender,
+            'timestamp': micros_to_datetime(timestamp),
+            'msg_type': msg_type
+        }
+
+
+class MessageArchiveWriter:
+    """
+    一次上传的消息归档
+    
+    chat_filter() 包装每个聊天的原始消息流，记录聊天标识（标准化后的消息不再包含 talker）；
+    write() 由流水线的 archive 阶段按段调用。聊天按 ChatStart 的顺序与 chat_filter 的调用顺序对应。
+    """
+    
+    def __init__(self, upload_id: int, segment_size: int = DEFAULT_SEGMENT_SIZE):
+        self.upload_id = upload_id
+        self.segment_size = max(1, segment_size)
+        self._chats: List[Dict[str, Optional[str]]] = []
+        self._positions: Dict[str, int] = {}  # 来源 -> 已归档的消息数
+        self._next_index: Dict[str, int] = {}  # 来源 -> 下一个分段序号
+        self.segments = 0
+        self.messages = 0
+        self.bytes = 0
+    
+    def prepare(self, resumed: bool = False):
+        """
+        开始处理前调用：从头处理时清除本上传之前的归档；断点续传时读取已归档的位置
+        （标准化后的消息序列与上次相同，已归档的部分跳过）
+        """
+        if not resumed:
+            deleted = MessageArchiveSegment.query.filter_by(upload_id=self.upload_id).delete(synchronize_session=False)
+            db.session.commit()
+            if deleted:
+                logger.info(f"Cleared {deleted} archived segments of upload {self.upload_id} before reprocessing")
+            return
+            
+        rows = db.session.query(
+            MessageArchiveSegment.source,
+            func.coalesce(func.sum(MessageArchiveSegment.message_count), 0),
+            func.coalesce(func.max(MessageArchiveSegment.segment_index), -1)
+        ).filter(MessageArchiveSegment.upload_id == self.upload_id).group_by(MessageArchiveSegment.source).all()
+        self._positions = {source: int(count) for source, count, _ in rows}
+        self._next_index = {source: int(index) + 1 for source, _, index in rows}
+    
+    def position(self, source: str) -> int:
+        """聊天已归档到的位置"""
+        return self._positions.get(source[:255], 0)
+    
+    def chat_filter(self, message_filter: Optional[Callable[[Iterable[Dict[str, Any]]], Iterable[Dict[str, Any]]]] = None
+                    ) -> Callable[[Iterable[Dict[str, Any]]], Iterable[Dict[str, Any]]]:
+        """包装原始消息过滤（如聊天水位线）：每个聊天调用一次，记录其中第一条带聊天标识的消息"""
+        def run(raw_messages):
+            chat = {'chat': None, 'chat_name': None}
+            self._chats.append(chat)
+            
+            def track(messages):
+                for msg in messages:
+                    if chat['chat'] is None and isinstance(msg, dict):
+                        chat_id = get_chat_id(msg)
+                        if chat_id:
+                            chat['chat'] = chat_id[:255]
+                            chat['chat_name'] = str(msg.get('talkerName') or '')[:255] or None
+                    yield msg
+                    
+            tracked = track(raw_messages)
+            return message_filter(tracked) if message_filter is not None else tracked
+        return run
+    
+    def write(self, chat_index: int, source: str, start: int, messages: List[Dict[str, Any]]):
+        """追加一个分段（流水线 archive 阶段调用）"""
+        source = source[:255]
+        chat = self._chats[chat_index] if chat_index < len(self._chats) else {}
+        timestamps = [datetime_to_micros(message['timestamp']) for message in messages]
+        payload = encode_segment(messages)
+        
+        segment_index = self._next_index.get(source, 0)
+        db.session.add(MessageArchiveSegment(
+            upload_id=self.upload_id,
+            source=source,
+            segment_index=segment_index,
+            start_position=start,
+            chat=chat.get('chat'),
+            chat_name=chat.get('chat_name'),
+            first_timestamp=micros_to_datetime(min(timestamps)),
+            last_timestamp=micros_to_datetime(max(timestamps)),
+            message_count=len(messages),
+            payload=payload
+        ))
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+            
+        self._next_index[source] = segment_index + 1
+        self._positions[source] = start + len(messages)
+        self.segments += 1
+        self.messages += len(messages)
+        self.bytes += len(payload)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """本次归档统计"""
+        return {
+            'segments': self.segments,
+            'messages': self.messages,
+            'compressed_bytes': self.bytes
+        }
+
+
+def get_archived_upload_ids() -> List[int]:
+    """有消息归档的上传记录ID（按ID排序）"""
+    rows = db.session.query(MessageArchiveSegment.upload_id).distinct().order_by(MessageArchiveSegment.upload_id).all()
+    return [upload_id for (upload_id,) in rows]
+
+
+def iter_archived_chats(upload_id: int) -> Iterator[Tuple[str, Iterator[Dict[str, Any]]]]:
+    """
+    逐个聊天读取一次上传的归档，返回 (来源, 消息迭代器)
+    
+    消息按归档顺序逐段解码，同一时间只有少量分段在内存中；调用方需要先读完一个聊天的消息
+    再取下一个聊天。
+    """
+    sources = db.session.query(MessageArchiveSegment.source).filter(
+        MessageArchiveSegment.upload_id == upload_id
+    ).group_by(MessageArchiveSegment.source).order_by(func.min(MessageArchiveSegment.id)).all()
+    
+    for (source,) in sources:
+        yield source, _iter_source_messages(upload_id, source)
+
+
+def _iter_source_messages(upload_id: int, source: str) -> Iterator[Dict[str, Any]]:
+    last_index = -1
+    while True:
+        rows = db.session.query(MessageArchiveSegment.segment_index, MessageArchiveSegment.payload).filter(
+            MessageArchiveSegment.upload_id == upload_id,
+            MessageArchiveSegment.source == source,
+            MessageArchiveSegment.segment_index > last_index
+        ).order_by(MessageArchiveSegment.segment_index).limit(_READ_BATCH).all()
+        if not rows:
+            return
+        for segment_index, payload in rows:
+            yield from decode_segment(payload)
+            last_index = segment_index
+
+
+def get_archive_stats() -> Dict[str, Any]:
+    """归档总量"""
+    uploads, chats, segments, messages, compressed = db.session.query(
+        func.count(func.distinct(MessageArchiveSegment.upload_id)),
+        func.count(func.distinct(MessageArchiveSegment.chat)),
+        func.count(MessageArchiveSegment.id),
+        func.coalesce(func.sum(MessageArchiveSegment.message_count), 0),
+        func.coalesce(func.sum(func.length(MessageArchiveSegment.payload)), 0)
+    ).one()
+    return {
+        'uploads': uploads,
+        'chats': chats,
+        'segments': segments,
+        'messages': int(messages),
+        'compressed_bytes': int(compressed)
+    }
+
+
+def create_archive_writer(upload_id: int) -> Optional[MessageArchiveWriter]:
+    """按配置创建上传的归档（MESSAGE_ARCHIVE_ENABLED 关闭或不在应用上下文中时返回 None）"""
+    try:
+        from flask import current_app
+        if not current_app.config.get('MESSAGE_ARCHIVE_ENABLED', True):
+            return None
+        return MessageArchiveWriter(upload_id, current_app.config.get('MESSAGE_ARCHIVE_SEGMENT_SIZE', DEFAULT_SEGMENT_SIZE))
+    except RuntimeError:
+        return None
@@ -6,15 +6,21 @@ import logging
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple, Sequence
 import gc
 
 from app import db
-from app.models import QAPair, Category, UploadHistory
+from app.models import QAPair, Category, UploadHistory, RawQAPair
 from app.services.data_extractor import DataExtractor
 from app.services.qa_classifier import QAClassifier
 from app.services.file_processor import ProcessingResult
+from app.services.ingest_pipeline import (
+    IngestStats, classify_stage, extract_stage, normalize_stage, parse_stage, save_stage
+)
+from app.services.stats_rollup import get_stats_rollup_service
+from app.utils.content_fingerprint import content_fingerprint as compute_content_fingerprint
 from app.utils.memory_monitor import get_memory_monitor, memory_profile
+from app.utils.pipeline import Pipeline
 from app.utils.streaming_processor import StreamingJSONProcessor, memory_limited_operation
 
 logger = logging.getLogger(__name__)
@@ -114,7 +120,6 @@ class OptimizedFileProcessor:
         
         with memory_limited_operation(self.memory_warning_threshold):
             try:
-                # 分块读取和处理JSON数据
                 logger.info(f"Reading file {file_path} in memory-optimized mode")
                 
                 with open(file_path, 'r', encoding='utf-8') as f:
@@ -123,35 +128,12 @@ class OptimizedFileProcessor:
                 # 解析消息
                 messages = self.data_extractor._parse_messages(json_data)
                 logger.info(f"Parsed {len(messages)} messages")
+                del json_data
                 
-                # 分批处理消息以节省内存
-                all_qa_candidates = []
-                processed_messages = 0
-                
-                for i in range(0, len(messages), self.batch_size):
-                    batch_messages = messages[i:i + self.batch_size]
-                    
-                    # 提取QA对
-                    batch_candidates = self.data_extractor._extract_qa_pairs(
-                        batch_messages, str(file_path)
-                    )
-                    
-                    if batch_candidates:
-                        all_qa_candidates.extend(batch_candidates)
-                    
-                    processed_messages += len(batch_messages)
-                    
-                    # 定期垃圾回收和内存检查
-                    if processed_messages % self.gc_frequency == 0:
-                        current_memory = self.memory_monitor.get_current_snapshot().rss_mb
-                        if current_memory > self.memory_warning_threshold:
-                            logger.warning(f"Memory usage high: {current_memory:.1f}MB, running GC")
-                            gc.collect()
-                
-                logger.info(f"Extracted {len(all_qa_candidates)} QA candidates")
-                
-                # 分批分类和保存
-                return self._classify_and_save_batched(all_qa_candidates, upload_record, start_time, messages)
+                stats = IngestStats(messages=len(messages))
+                chats = [(str(file_path), (messages[i] for i in range(len(messages))))]
+                pipeline = self.build_pipeline(upload_record.id, stats, normalized=True)
+                return self._run_pipeline(pipeline, chats, stats, upload_record, start_time, messages)
                 
             except Exception as e:
                 logger.error(f"Standard optimized processing failed: {str(e)}")
@@ -164,64 +146,10 @@ class OptimizedFileProcessor:
         logger.info(f"Starting streaming processing for {file_path}")
         
         try:
-            all_qa_candidates = []
-            total_messages = 0
-            
-            # 检查是否需要拆分文件
-            file_size = file_path.stat().st_size
-            if file_size > 20 * 1024 * 1024:  # 20MB以上拆分处理
-                split_files = self.streaming_processor.split_large_file(file_path, max_size_mb=10)
-                process_files = split_files
-                logger.info(f"Split large file into {len(split_files)} parts")
-            else:
-                process_files = [file_path]
-            
-            # 处理每个文件
-            for file_to_process in process_files:
-                try:
-                    # 流式解析JSON
-                    json_objects = self.streaming_processor.stream_parse_large_json(file_to_process)
-                    
-                    # 批量处理消息
-                    def process_batch(batch_objects):
-                        batch_messages = []
-                        for obj in batch_objects:
-                            if isinstance(obj, dict):
-                                if 'messages' in obj:
-                                    batch_messages.extend(obj['messages'])
-                                elif isinstance(obj, list):
-                                    batch_messages.extend(obj)
-                                else:
-                                    batch_messages.append(obj)
-                        
-                        return self.data_extractor._extract_qa_pairs(
-                            batch_messages, str(file_to_process)
-                        )
-                    
-                    # 流式批量处理
-                    batch_results = self.streaming_processor.process_in_batches(
-                        json_objects, batch_size=50, processor=process_batch
-                    )
-                    
-                    for batch_candidates in batch_results:
-                        if batch_candidates:
-                            all_qa_candidates.extend(batch_candidates)
-                            total_messages += len(batch_candidates)
-                        
-                        # 内存监控
-                        current_memory = self.memory_monitor.get_current_snapshot().rss_mb
-                        if current_memory > self.memory_warning_threshold:
-                            logger.warning(f"High memory during streaming: {current_memory:.1f}MB")
-                            gc.collect()
-                
-                except Exception as e:
-                    logger.error(f"Error processing file part {file_to_process}: {str(e)}")
-                    continue
-            
-            logger.info(f"Streaming processing completed: {len(all_qa_candidates)} QA candidates from {total_messages} messages")
-            
-            # 分类和保存
-            return self._classify_and_save_batched(all_qa_candidates, upload_record, start_time, [])
+            stats = IngestStats()
+            chats = [(str(file_path), self.streaming_processor.stream_messages(file_path))]
+            pipeline = self.build_pipeline(upload_record.id, stats)
+            return self._run_pipeline(pipeline, chats, stats, upload_record, start_time, [])
             
         except Exception as e:
             logger.error(f"Streaming processing failed: {str(e)}")
@@ -231,55 +159,50 @@ class OptimizedFileProcessor:
             # 清理临时文件
             self.streaming_processor.cleanup_temp_files()
     
-    def _classify_and_save_batched(self, qa_candidates: List, upload_record: UploadHistory,
-                                  start_time: datetime, original_messages: List = None) -> ProcessingResult:
-        """批量分类和保存QA对"""
+    def build_pipeline(self, upload_id: int, stats: IngestStats, normalized: bool = False) -> Pipeline:
+        """
+        入库流水线：parse → normalize → extract → classify → save
+        
+        与 FileProcessor 的流水线相比没有 stage_raw 阶段（只在没有问答候选时才整体暂存原始消息），
+        分类失败的问答对直接跳过，入库按 batch_size 分批并在每批后检查内存。
+        """
+        # 预加载分类信息
+        categories_dict = {cat.id: cat for cat in Category.query.all()}
+        existing_fingerprints = self._get_existing_content_fingerprints()
+        
+        def save_batch(batch):
+            saved = self._save_qa_pairs_optimized(batch, categories_dict, existing_fingerprints, upload_id)
+            
+            # 内存管理
+            current_memory = self.memory_monitor.get_current_snapshot().rss_mb
+            if current_memory > self.memory_warning_threshold:
+                logger.warning(f"Memory usage during save: {current_memory:.1f}MB")
+                gc.collect()
+            return saved
         
-        logger.info(f"Starting classification and saving of {len(qa_candidates)} candidates")
+        stages = [parse_stage()]
+        if not normalized:
+            stages.append(normalize_stage(self.data_extractor, stats))
+        stages += [
+            extract_stage(self.data_extractor, stats),
+            classify_stage(self.qa_classifier, stats, skip_failed=True),
+            save_stage(save_batch, stats, self.batch_size)
+        ]
+        return Pipeline(f'optimized-upload-{upload_id}', stages)
+    
+    def _run_pipeline(self, pipeline: Pipeline, chats: List, stats: IngestStats, upload_record: UploadHistory,
+                      start_time: datetime, original_messages: Sequence = None) -> ProcessingResult:
+        """运行流水线（分批分类和保存QA对）并更新上传记录"""
         
         try:
-            classified_results = []
-            saved_count = 0
+            pipeline.drain(chats)
+            saved_count = stats.saved
             
-            # 预加载分类信息
-            categories_dict = {cat.id: cat for cat in Category.query.all()}
-            existing_fingerprints = self._get_existing_content_fingerprints()
-            
-            # 分批处理
-            for i in range(0, len(qa_candidates), self.batch_size):
-                batch = qa_candidates[i:i + self.batch_size]
-                
-                # 分类批次
-                batch_classified = []
-                for qa in batch:
-                    try:
-                        classification = self.qa_classifier.classify_qa(
-                            qa.question, qa.answer, qa.context
-                        )
-                        batch_classified.append((qa, classification))
-                    except Exception as e:
-                        logger.warning(f"Classification failed for QA: {str(e)}")
-                        continue
-                
-                # 保存批次
-                if batch_classified:
-                    batch_saved = self._save_qa_pairs_optimized(
-                        batch_classified, categories_dict, existing_fingerprints, upload_record.id
-                    )
-                    saved_count += batch_saved
-                    classified_results.extend(batch_classified)
-                
-                # 内存管理
-                if i % (self.gc_frequency * 10) == 0:
-                    current_memory = self.memory_monitor.get_current_snapshot().rss_mb
-                    if current_memory > self.memory_warning_threshold:
-                        logger.warning(f"Memory usage during save: {current_memory:.1f}MB")
-                        gc.collect()
-                
-                logger.debug(f"Processed batch {i // self.batch_size + 1}, saved {batch_saved} items")
+            logger.info(f"Pipeline completed: {stats.extracted} QA candidates from {stats.messages} messages, "
+                        f"bottleneck: {pipeline.get_metrics()['bottleneck']}")
             
             # 处理原始消息（如果没有QA候选）
-            if not classified_results and original_messages:
+            if not stats.classified and original_messages:
                 raw_pairs = self._create_raw_qa_pairs_optimized(original_messages, upload_record.id)
                 saved_count = len(raw_pairs)
                 logger.info(f"Saved {saved_count} raw messages for manual review")
@@ -293,20 +216,19 @@ class OptimizedFileProcessor:
             db.session.commit()
             
             # 生成统计信息
-            extraction_stats = self.data_extractor.get_extraction_stats(qa_candidates)
-            classification_stats = self.qa_classifier.get_classification_stats(
-                [result[1] for result in classified_results]
-            ) if classified_results else {}
+            extraction_stats = stats.extraction.to_stats()
+            classification_stats = stats.classification.to_stats() if stats.classified else {}
             
             statistics = {
                 'extraction': extraction_stats,
                 'classification': classification_stats,
                 'processing': {
-                    'total_candidates': len(qa_candidates),
+                    'total_candidates': stats.extracted,
                     'successfully_saved': saved_count,
                     'processing_method': 'optimized',
                     'memory_efficient': True,
-                    'batch_size': self.batch_size
+                    'batch_size': self.batch_size,
+                    'pipeline': pipeline.get_metrics()
                 }
             }
             
@@ -315,7 +237,7 @@ class OptimizedFileProcessor:
             return ProcessingResult(
                 success=True,
                 upload_id=upload_record.id,
-                total_extracted=len(qa_candidates),
+                total_extracted=stats.extracted,
                 total_saved=saved_count,
                 processing_time=processing_time,
                 statistics=statistics
@@ -355,6 +277,7 @@ class OptimizedFileProcessor:
                         advisor=qa_candidate.advisor[:100] if qa_candidate.advisor else None,
                         confidence=qa_candidate.confidence,
                         source_file=f"upload_{upload_id}",
+                        content_fingerprint=content_fingerprint,
                         original_context=self._safe_serialize_context(qa_candidate.context)
                     )
                     
@@ -368,6 +291,7 @@ class OptimizedFileProcessor:
             # 批量保存
             if batch_objects:
                 db.session.bulk_save_objects(batch_objects)
+                get_stats_rollup_service().record_qa_inserts(batch_objects)
                 db.session.commit()
                 saved_count = len(batch_objects)
                 
@@ -381,12 +305,13 @@ class OptimizedFileProcessor:
             raise
     
     def _create_raw_qa_pairs_optimized(self, messages: List[Dict], upload_id: int) -> List:
-        """优化的原始QA对创建"""
+        """优化的原始QA对创建（写入待审核暂存表）"""
         
         logger.info(f"Creating optimized raw QA pairs from {len(messages)} messages")
         
         raw_pairs = []
         existing_fingerprints = self._get_existing_content_fingerprints()
+        existing_fingerprints |= RawQAPair.get_fingerprints()
         
         # 分批处理消息
         for i in range(0, len(messages) - 1, 2):
@@ -411,23 +336,19 @@ class OptimizedFileProcessor:
                 if content_fingerprint in existing_fingerprints:
                     continue
                 
-                qa_pair = QAPair(
+                raw_pair = RawQAPair(
+                    upload_id=upload_id,
                     question=question_content,
                     answer=answer_content,
-                    category_id=1,
                     asker=question_msg['sender'][:100],
                     advisor=answer_msg['sender'][:100] if question_msg != answer_msg else "系统",
-                    confidence=0.1,
-                    source_file=f"upload_{upload_id}_raw",
-                    original_context=json.dumps({
-                        'raw_import': True,
-                        'needs_review': True,
-                        'question_timestamp': str(question_msg.get('timestamp', '')),
-                        'answer_timestamp': str(answer_msg.get('timestamp', ''))
-                    }, ensure_ascii=False)
+                    question_timestamp=str(question_msg.get('timestamp', '')),
+                    answer_timestamp=str(answer_msg.get('timestamp', '')),
+                    content_fingerprint=content_fingerprint,
+                    status='pending'
                 )
                 
-                raw_pairs.append(qa_pair)
+                raw_pairs.append(raw_pair)
                 existing_fingerprints.add(content_fingerprint)
                 
             except Exception as e:
@@ -513,24 +434,8 @@ class OptimizedFileProcessor:
     
     def _generate_content_fingerprint(self, question: str, answer: str, asker: str, advisor: str) -> str:
         """生成内容指纹"""
-        import hashlib
-        import re
-        
         try:
-            def normalize_text(text):
-                if not text:
-                    return ""
-                text = re.sub(r'[^\w\s\u4e00-\u9fff]', '', text)
-                text = re.sub(r'\s+', ' ', text)
-                return text.lower().strip()
-            
-            norm_question = normalize_text(question)[:200]
-            norm_answer = normalize_text(answer)[:200]
-            norm_asker = normalize_text(asker) if asker else ""
-            norm_advisor = normalize_text(advisor) if advisor else ""
-            
-            content = f"{norm_question}|{norm_answer}|{norm_asker}|{norm_advisor}"
-            return hashlib.md5(content.encode('utf-8')).hexdigest()
+            return compute_content_fingerprint(question, answer, asker, advisor)
             
         except Exception as e:
             logger.error(f"Fingerprint generation failed: {str(e)}")
@@ -1,10 +1,11 @@
 """
 问答分类服务
 """
-import re
 import logging
-from typing import Dict, List, Tuple, Optional
-from dataclasses import dataclass
+from collections import Counter
+from typing import Dict, List, Tuple, Optional, Set
+from dataclasses import dataclass, field
+from app.utils.pattern_engine import PatternSet, KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +19,47 @@ class CategoryMatch:
     matched_keywords: List[str]
 
 
+@dataclass
+class ClassificationTally:
+    """分类统计的累计值（逐个结果累加，不保留结果本身）"""
+    count: int = 0
+    confidence_sum: float = 0.0
+    high_confidence: int = 0
+    categories: Counter = field(default_factory=Counter)
+    
+    def add(self, result: CategoryMatch):
+        self.count += 1
+        self.confidence_sum += result.confidence
+        if result.confidence >= 0.6:
+            self.high_confidence += 1
+        self.categories[result.category_name] += 1
+    
+    def to_stats(self) -> Dict[str, any]:
+        """与 QAClassifier.get_classification_stats 相同结构的统计"""
+        if not self.count:
+            return {
+                'total_classified': 0,
+                'avg_confidence': 0,
+                'category_distribution': {},
+                'classification_quality': 'poor'
+            }
+            
+        avg_confidence = self.confidence_sum / self.count
+        
+        # 分类质量评估
+        quality = 'excellent' if avg_confidence >= 0.8 else \
+                  'good' if avg_confidence >= 0.6 else \
+                  'fair' if avg_confidence >= 0.4 else 'poor'
+                  
+        return {
+            'total_classified': self.count,
+            'avg_confidence': round(avg_confidence, 3),
+            'category_distribution': dict(self.categories),
+            'classification_quality': quality,
+            'high_confidence_ratio': self.high_confidence / self.count
+        }
+
+
 class QAClassifier:
     """问答智能分类器"""
     
@@ -25,6 +67,7 @@ class QAClassifier:
         self.category_rules = self._init_category_rules()
         self.default_category_id = 1  # 默认为"产品咨询"
         self.confidence_threshold = 0.3
+        self._rule_matchers = None  # 规则变更后置空，下次使用时重新编译
     
     def _init_category_rules(self) -> Dict[int, Dict[str, any]]:
         """初始化分类规则"""
@@ -132,12 +175,11 @@ class QAClassifier:
             combined_text += " " + " ".join(context)
         
         # 计算每个分类的得分
-        category_scores = {}
-        
-        for category_id, rule in self.category_rules.items():
-            score = self._calculate_category_score(combined_text, rule)
-            if score > 0:
-                category_scores[category_id] = score
+        category_scores = {
+            category_id: score
+            for category_id, score in self._calculate_category_scores(combined_text).items()
+            if score > 0
+        }
         
         # 选择得分最高的分类
         if category_scores:
@@ -165,26 +207,53 @@ class QAClassifier:
             matched_keywords=[]
         )
     
-    def _calculate_category_score(self, text: str, rule: Dict[str, any]) -> float:
-        """计算分类得分"""
+    def _get_rule_matchers(self) -> Tuple[KeywordMatcher, PatternSet]:
+        """把所有分类的关键词和模式编译成一个关键词自动机和一个组合正则"""
+        if self._rule_matchers is None:
+            keywords = [keyword for rule in self.category_rules.values() for keyword in rule['keywords']]
+            patterns = {
+                (category_id, index): [pattern]
+                for category_id, rule in self.category_rules.items()
+                for index, pattern in enumerate(rule['patterns'])
+            }
+            self._rule_matchers = (KeywordMatcher(keywords), PatternSet(patterns))
+        return self._rule_matchers
+    
+    def _calculate_category_scores(self, text: str) -> Dict[int, float]:
+        """一次扫描计算所有分类的得分"""
+        keyword_matcher, pattern_set = self._get_rule_matchers()
+        found_keywords = keyword_matcher.find(text.lower())
+        matched_patterns = pattern_set.matches(text)
+        
+        return {
+            category_id: self._calculate_category_score(text, rule, found_keywords, {
+                index for matched_id, index in matched_patterns if matched_id == category_id
+            })
+            for category_id, rule in self.category_rules.items()
+        }
+    
+    def _calculate_category_score(self, text: str, rule: Dict[str, any],
+                                  found_keywords: Set[str], matched_patterns: Set[int]) -> float:
+        """
+        计算分类得分
+        
+        Args:
+            text: 待分类文本
+            rule: 分类规则
+            found_keywords: 文本（小写）中出现过的关键词
+            matched_patterns: 该规则命中的模式序号
+        """
         score = 0.0
-        text_lower = text.lower()
         
         # 关键词匹配
-        keyword_matches = 0
-        for keyword in rule['keywords']:
-            if keyword in text_lower:
-                keyword_matches += 1
+        keyword_matches = sum(1 for keyword in rule['keywords'] if keyword in found_keywords)
         
         if keyword_matches > 0:
             keyword_score = (keyword_matches / len(rule['keywords'])) * 0.6
             score += keyword_score
         
         # 模式匹配
-        pattern_matches = 0
-        for pattern in rule['patterns']:
-            if re.search(pattern, text, re.IGNORECASE):
-                pattern_matches += 1
+        pattern_matches = len(matched_patterns)
         
         if pattern_matches > 0:
             pattern_score = (pattern_matches / len(rule['patterns'])) * 0.4
@@ -201,14 +270,10 @@ class QAClassifier:
     
     def _get_matched_keywords(self, text: str, rule: Dict[str, any]) -> List[str]:
         """获取匹配的关键词"""
-        matched = []
-        text_lower = text.lower()
+        keyword_matcher, _ = self._get_rule_matchers()
+        found_keywords = keyword_matcher.find(text.lower())
         
-        for keyword in rule['keywords']:
-            if keyword in text_lower:
-                matched.append(keyword)
-        
-        return matched
+        return [keyword for keyword in rule['keywords'] if keyword in found_keywords]
     
     def batch_classify(self, qa_pairs: List[Tuple[str, str, List[str]]]) -> List[CategoryMatch]:
         """
@@ -240,37 +305,10 @@ class QAClassifier:
     
     def get_classification_stats(self, results: List[CategoryMatch]) -> Dict[str, any]:
         """获取分类统计信息"""
-        if not results:
-            return {
-                'total_classified': 0,
-                'avg_confidence': 0,
-                'category_distribution': {},
-                'classification_quality': 'poor'
-            }
-        
-        # 分类分布
-        category_dist = {}
-        confidences = []
-        
+        tally = ClassificationTally()
         for result in results:
-            category_name = result.category_name
-            category_dist[category_name] = category_dist.get(category_name, 0) + 1
-            confidences.append(result.confidence)
-        
-        avg_confidence = sum(confidences) / len(confidences)
-        
-        # 分类质量评估
-        quality = 'excellent' if avg_confidence >= 0.8 else \
-                  'good' if avg_confidence >= 0.6 else \
-                  'fair' if avg_confidence >= 0.4 else 'poor'
-        
-        return {
-            'total_classified': len(results),
-            'avg_confidence': round(avg_confidence, 3),
-            'category_distribution': category_dist,
-            'classification_quality': quality,
-            'high_confidence_ratio': len([c for c in confidences if c >= 0.6]) / len(confidences)
-        }
+            tally.add(result)
+        return tally.to_stats()
     
     def add_custom_rule(self, category_id: int, name: str, keywords: List[str], 
                        patterns: List[str] = None, weight: float = 1.0):
@@ -281,20 +319,21 @@ class QAClassifier:
             'patterns': patterns or [],
             'weight': weight
         }
+        self._rule_matchers = None
     
     def update_category_rule(self, category_id: int, **kwargs):
         """更新分类规则"""
         if category_id in self.category_rules:
             self.category_rules[category_id].update(kwargs)
+            self._rule_matchers = None
     
     def get_category_suggestions(self, text: str, top_k: int = 3) -> List[Tuple[int, str, float]]:
         """获取分类建议"""
         scores = []
         
-        for category_id, rule in self.category_rules.items():
-            score = self._calculate_category_score(text, rule)
+        for category_id, score in self._calculate_category_scores(text).items():
             if score > 0:
-                scores.append((category_id, rule['name'], score))
+                scores.append((category_id, self.category_rules[category_id]['name'], score))
         
         # 按得分排序并返回前K个
         scores.sort(key=lambda x: x[2], reverse=True)
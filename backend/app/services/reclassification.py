@@ -0,0 +1,371 @@
+"""
+重新分类服务 - 分类规则或分类变化后，批量重新分类已入库的问答对
+
+分类只在入库时进行，修改 QAClassifier.category_rules 或分类后已有问答对仍保留旧的
+category_id。重新分类任务在后台遍历 qa_pairs：
+- 按 id 键集分批读取（WHERE id > 上一批最后的 id ORDER BY id LIMIT n），每批读完即结束读事务
+- 每批在进程池中分类（工作进程用任务的分类规则初始化），在途批次数有上限，读取、分类和写回重叠进行
+- 只写回分类变化的行：每行的 UPDATE 带读取时的分类作为条件（期间手工修改过分类或已删除的
+  行不写回），同一事务中按实际更新的行增量更新统计汇总表和FTS索引，每批单独提交，不会长时间持有写锁
+分类时使用入库时保存的上下文，与入库时的分类输入一致。AI 处理的问答对默认跳过。
+任务状态保存在内存中。
+"""
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app import db
+from app.models import Category, QAPair
+from app.services.qa_classifier import QAClassifier
+from app.services.search_service import SearchService
+from app.services.stats_rollup import get_stats_rollup_service
+from app.services.task_queue import get_task_queue
+from app.utils.cache import cache_clear
+from app.utils.context_codec import get_context_codec
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_WORKERS = 2  # 默认分类进程数（不超过 CPU 核数）
+MAX_WORKERS = 8  # 分类进程数上限
+
+
+@dataclass
+class ReclassificationJob:
+    """一次重新分类"""
+    job_id: str
+    batch_size: int = DEFAULT_BATCH_SIZE
+    workers: int = 1
+    include_ai: bool = False  # 是否包含 AI 处理的问答对
+    task_id: Optional[str] = None
+    status: str = 'pending'  # pending / running / completed / failed
+    error: Optional[str] = None
+    total: int = 0
+    processed: int = 0
+    changed: int = 0
+    conflicts: int = 0  # 读取后分类被修改或已删除、没有写回的问答对
+    fts_updated: int = 0
+    last_id: int = 0  # 已处理到的问答对ID
+    transitions: Counter = field(default_factory=Counter)  # (原分类, 新分类) -> 数量
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    
+    @property
+    def active(self) -> bool:
+        return self.status in ('pending', 'running')
+    
+    def get_progress(self) -> float:
+        if not self.total:
+            return 0.0 if self.active else 100.0
+        return round(min(self.processed * 100.0 / self.total, 100.0), 1)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = ((self.completed_at or datetime.utcnow()) - self.started_at).total_seconds() if self.started_at else 0
+        return {
+            'job_id': self.job_id,
+            'task_id': self.task_id,
+            'status': self.status,
+            'error': self.error,
+            'batch_size': self.batch_size,
+            'workers': self.workers,
+            'include_ai': self.include_ai,
+            'total': self.total,
+            'processed': self.processed,
+            'changed': self.changed,
+            'conflicts': self.conflicts,
+            'fts_updated': self.fts_updated,
+            'last_id': self.last_id,
+            'progress': self.get_progress(),
+            'rows_per_second': round(self.processed / elapsed, 1) if elapsed > 0 else 0.0,
+            'transitions': [
+                {'from': old, 'to': new, 'count': count}
+                for (old, new), count in self.transitions.most_common()
+            ],
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+
+def _context_lines(context: Optional[str]) -> List[str]:
+    """入库时保存的上下文（JSON 列表）还原为分类用的文本行"""
+    if not context:
+        return []
+    try:
+        items = json.loads(context)
+    except (TypeError, ValueError):
+        return []
+    return [item for item in items if isinstance(item, str)] if isinstance(items, list) else []
+
+
+# 工作进程内的分类器（由进程池 initializer 按任务的分类规则创建）
+_worker_classifier = None
+
+
+def _init_worker(category_rules: Dict[int, Dict[str, Any]], default_category_id: int, confidence_threshold: float):
+    global _worker_classifier
+    _worker_classifier = QAClassifier()
+    _worker_classifier.category_rules = category_rules
+    _worker_classifier.default_category_id = default_category_id
+    _worker_classifier.confidence_threshold = confidence_threshold
+
+
+def _classify_rows(classifier: QAClassifier, rows: List[Tuple[str, str, List[str]]]) -> List[int]:
+    return [classifier.classify_qa(question, answer, context).category_id for question, answer, context in rows]
+
+
+def _classify_in_worker(rows: List[Tuple[str, str, List[str]]]) -> List[int]:
+    """进程池任务：分类一批问答，返回分类ID"""
+    return _classify_rows(_worker_classifier, rows)
+
+
+class ReclassificationService:
+    """重新分类任务管理（同一时间只运行一个任务）"""
+    
+    MAX_JOBS = 20  # 内存中保留的任务数
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs: Dict[str, ReclassificationJob] = {}
+    
+    def create_job(self, batch_size: int = DEFAULT_BATCH_SIZE, workers: Optional[int] = None,
+                   include_ai: bool = False) -> Tuple[ReclassificationJob, bool]:
+        """
+        登记一次重新分类
+        
+        Args:
+            workers: 分类进程数，默认 DEFAULT_WORKERS（不超过 CPU 核数），最多 MAX_WORKERS；为 1 时在当前进程中分类
+            
+        Returns:
+            Tuple[ReclassificationJob, bool]: (任务, 是否新建)；已有任务在进行时返回该任务和 False
+        """
+        with self._lock:
+            active = next((job for job in self.jobs.values() if job.active), None)
+            if active is not None:
+                return active, False
+                
+            job = ReclassificationJob(
+                job_id=uuid.uuid4().hex[:12],
+                batch_size=max(1, batch_size),
+                workers=max(1, min(workers or min(DEFAULT_WORKERS, os.cpu_count() or 1), MAX_WORKERS)),
+                include_ai=include_ai
+            )
+            self.jobs[job.job_id] = job
+            if len(self.jobs) > self.MAX_JOBS:
+                finished = sorted((j for j in self.jobs.values() if not j.active), key=lambda j: j.created_at)
+                for old in finished[:len(self.jobs) - self.MAX_JOBS]:
+                    self.jobs.pop(old.job_id, None)
+        return job, True
+    
+    def submit(self, app, job: ReclassificationJob, timeout: int = 3600) -> str:
+        """把任务提交到任务队列"""
+        job.task_id = get_task_queue().submit_task(
+            "reclassify",
+            self.run_job,
+            app, job.job_id,
+            max_retries=0,  # 已提交的批次不会回滚，需要时重新提交任务即可
+            timeout=timeout
+        )
+        return job.task_id
+    
+    def get_job(self, job_id: str) -> Optional[ReclassificationJob]:
+        return self.jobs.get(job_id)
+    
+    def run_job(self, app, job_id: str, classifier: Optional[QAClassifier] = None) -> Dict[str, Any]:
+        """
+        执行重新分类（任务队列线程或命令行中执行）
+        
+        Args:
+            classifier: 使用的分类器（规则），默认新建 QAClassifier
+        """
+        job = self.jobs[job_id]
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        classifier = classifier or QAClassifier()
+        
+        with app.app_context():
+            try:
+                categories = {category_id: name for category_id, name in db.session.query(Category.id, Category.name)}
+                query = self._base_query(job)
+                job.total = query.count()
+                max_id = db.session.query(db.func.max(QAPair.id)).scalar() or 0
+                db.session.commit()
+                logger.info(f"Reclassification {job_id}: {job.total} QA pairs in batches of {job.batch_size} "
+                            f"with {job.workers} workers")
+                            
+                search_service = SearchService()
+                for rows, category_ids in self._classify_batches(job, classifier, max_id):
+                    self._write_changes(job, rows, category_ids, categories, classifier.default_category_id,
+                                        search_service)
+                    job.processed += len(rows)
+                    job.last_id = rows[-1].id
+                    self._report_progress(job)
+                    
+                if job.changed:
+                    cache_clear()
+                job.status = 'completed'
+                
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Reclassification {job_id} failed: {str(e)}")
+                job.status = 'failed'
+                job.error = str(e)
+            finally:
+                job.completed_at = datetime.utcnow()
+                db.session.remove()
+                
+        self._report_progress(job)
+        logger.info(f"Reclassification {job_id} {job.status}: {job.changed} of {job.processed} QA pairs changed")
+        return job.to_dict()
+    
+    def _base_query(self, job: ReclassificationJob):
+        query = QAPair.query
+        if not job.include_ai:
+            query = query.filter(db.or_(QAPair.source_file.is_(None), ~QAPair.source_file.like('%\\_ai', escape='\\')))
+        return query
+    
+    def _iter_batches(self, job: ReclassificationJob, max_id: int) -> Iterator[List[Any]]:
+        """按 id 键集分批读取（任务开始后新增的问答对入库时已按当前规则分类，不再处理）"""
+        last_id = 0
+        query = self._base_query(job).with_entities(
+            QAPair.id, QAPair.question, QAPair.answer, QAPair.context_blob, QAPair.category_id,
+            QAPair.advisor, QAPair.confidence, QAPair.source_file, QAPair.created_at
+        )
+        while True:
+            rows = query.filter(QAPair.id > last_id, QAPair.id <= max_id).order_by(QAPair.id).limit(job.batch_size).all()
+            db.session.commit()  # 结束读事务，写回之间不持有快照
+            if not rows:
+                return
+            last_id = rows[-1].id
+            yield rows
+    
+    def _classify_batches(self, job: ReclassificationJob, classifier: QAClassifier,
+                          max_id: int) -> Iterator[Tuple[List[Any], List[int]]]:
+        """按顺序产出 (一批问答对, 新分类ID)，workers > 1 时在进程池中分类"""
+        codec = get_context_codec()
+        
+        def inputs(rows):
+            return [(row.question or '', row.answer or '', _context_lines(codec.decode(row.context_blob))) for row in rows]
+            
+        if job.workers == 1:
+            for rows in self._iter_batches(job, max_id):
+                yield rows, _classify_rows(classifier, inputs(rows))
+            return
+            
+        pending = deque()
+        # 任务在任务队列线程中运行：用 spawn 启动工作进程，不从多线程进程 fork（规则通过 initializer 传入）
+        executor = ProcessPoolExecutor(
+            max_workers=job.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(classifier.category_rules, classifier.default_category_id, classifier.confidence_threshold)
+        )
+        try:
+            for rows in self._iter_batches(job, max_id):
+                batch = inputs(rows)
+                pending.append((rows, batch, executor.submit(_classify_in_worker, batch)))
+                # 限制在途批次数量，内存占用与问答总数无关
+                if len(pending) >= job.workers * 2:
+                    yield self._collect(pending.popleft(), classifier)
+            while pending:
+                yield self._collect(pending.popleft(), classifier)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    @staticmethod
+    def _collect(item, classifier: QAClassifier) -> Tuple[List[Any], List[int]]:
+        rows, batch, future = item
+        try:
+            return rows, future.result()
+        except Exception as e:
+            logger.warning(f"Reclassification batch failed in worker, retrying in-process: {str(e)}")
+            return rows, _classify_rows(classifier, batch)
+    
+    def _write_changes(self, job: ReclassificationJob, rows: List[Any], category_ids: List[int],
+                       categories: Dict[int, str], default_category_id: int, search_service: SearchService):
+        """写回一批中分类变化的问答对（一个事务）"""
+        changes = []
+        for row, category_id in zip(rows, category_ids):
+            if category_id not in categories:
+                category_id = default_category_id if default_category_id in categories else row.category_id
+            if category_id != row.category_id:
+                changes.append((row, category_id))
+        if not changes:
+            return
+            
+        table = QAPair.__table__
+        # 只更新分类仍是读取时的值的行：读取后手工改了分类或已删除的问答对保持原样，也不计入统计增量
+        update = table.update().where(
+            table.c.id == db.bindparam('qa_id'), table.c.category_id == db.bindparam('old_category_id')
+        )
+        try:
+            now = datetime.utcnow()
+            updated_ids = [
+                row.id for row, category_id in changes
+                if db.session.execute(update, {
+                    'qa_id': row.id, 'old_category_id': row.category_id, 'category_id': category_id, 'updated_at': now
+                }).rowcount == 1
+            ]
+            # 统计增量和FTS索引按写回时的内容计算（读取后其他字段可能被修改过）
+            current = {
+                qa.id: qa for qa in db.session.query(
+                    QAPair.id, QAPair.question, QAPair.answer, QAPair.advisor, QAPair.confidence,
+                    QAPair.source_file, QAPair.created_at
+                ).filter(QAPair.id.in_(updated_ids))
+            } if updated_ids else {}
+            applied = [(current[row.id], row.category_id, category_id) for row, category_id in changes if row.id in current]
+            
+            rollup = get_stats_rollup_service()
+            deltas = []
+            for qa, old_category_id, category_id in applied:
+                deltas.append((rollup.snapshot_qa(qa, category_id=old_category_id), -1))
+                deltas.append((rollup.snapshot_qa(qa, category_id=category_id), 1))
+            rollup.apply_qa_deltas(deltas)
+            
+            fts_updated = search_service.update_fts_categories([
+                {
+                    'id': qa.id, 'question': qa.question, 'answer': qa.answer, 'advisor': qa.advisor,
+                    'old_category_name': categories.get(old_category_id, ''), 'category_name': categories[category_id]
+                }
+                for qa, old_category_id, category_id in applied
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+            
+        job.changed += len(applied)
+        job.conflicts += len(changes) - len(applied)
+        job.fts_updated += fts_updated
+        job.transitions.update(
+            (categories.get(old_category_id, str(old_category_id)), categories[category_id])
+            for _, old_category_id, category_id in applied
+        )
+    
+    def _report_progress(self, job: ReclassificationJob):
+        """更新任务进度并推送WebSocket通知"""
+        if not job.task_id:
+            return
+            
+        get_task_queue().update_progress(job.task_id, job.get_progress(), f'{job.processed}/{job.total} QA pairs')
+        
+        from app.services.websocket_service import get_websocket_manager
+        get_websocket_manager().notify_task_update(job.task_id)
+
+
+# 全局重新分类服务实例
+reclassification_service = ReclassificationService()
+
+
+def get_reclassification_service() -> ReclassificationService:
+    """获取重新分类服务实例"""
+    return reclassification_service
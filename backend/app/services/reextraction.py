@@ -0,0 +1,309 @@
+"""
+重新提取服务 - 调整提取或分类规则后，从消息归档重新提取问答对
+
+以前调整 DataExtractor 的规则后只能重新上传原始导出文件。重新提取任务逐个上传读取
+消息归档（见 message_archive），按上传时相同的 parse → extract → classify 阶段重放，
+把结果与已有问答对按内容指纹比较：
+- 已存在（matched）：指纹已在 qa_pairs 中（或是某条问答提取时的指纹，该问答之后被手工修改过）
+- 新增（added）：新规则多提取出的问答对，apply 时按上传时的方式入库
+- 过时（stale）：该上传原来提取出、新规则不再提取的问答对（按提取时的指纹 extraction_fingerprint
+  比较，不含审核通过和 AI 处理的），apply 且 prune 时删除
+- 手工修改过的问答（content_fingerprint 与提取时不同，或迁移前修改过、没有提取指纹的）
+  不算过时，只计入 edited
+默认只做比较（dry run），结果中附带新增和过时问答的样例。任务状态保存在内存中。
+"""
+import logging
+import threading
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app import db
+from app.models import QAPair
+from app.services.file_processor import FileProcessor
+from app.services.ingest_pipeline import IngestStats, classify_stage, extract_stage, parse_stage, save_stage
+from app.services.message_archive import get_archived_upload_ids, iter_archived_chats
+from app.services.task_queue import get_task_queue
+from app.utils.pipeline import Pipeline
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_SIZE = 10  # 新增和过时问答各保留的样例数
+_QUERY_CHUNK = 500  # 按指纹或ID查询时每次的数量
+
+
+@dataclass
+class ReextractionJob:
+    """一次重新提取"""
+    job_id: str
+    upload_ids: Optional[List[int]] = None  # 为 None 时处理所有有归档的上传
+    apply: bool = False  # 保存新增的问答对
+    prune: bool = False  # 同时删除过时的问答对（仅 apply 时）
+    task_id: Optional[str] = None
+    status: str = 'pending'  # pending / running / completed / failed
+    error: Optional[str] = None
+    total_uploads: int = 0
+    processed_uploads: int = 0
+    chats: int = 0
+    messages: int = 0
+    candidates: int = 0  # 重新提取出的问答候选（含重复）
+    matched: int = 0
+    added: int = 0
+    saved: int = 0
+    stale: int = 0
+    removed: int = 0
+    edited: int = 0  # 新规则不再提取、但手工修改过而保留的问答对
+    added_samples: List[Dict[str, Any]] = field(default_factory=list)
+    stale_samples: List[Dict[str, Any]] = field(default_factory=list)
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    
+    @property
+    def active(self) -> bool:
+        return self.status in ('pending', 'running')
+    
+    def get_progress(self) -> float:
+        if not self.total_uploads:
+            return 0.0 if self.active else 100.0
+        return round(self.processed_uploads * 100.0 / self.total_uploads, 1)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'task_id': self.task_id,
+            'status': self.status,
+            'error': self.error,
+            'mode': 'apply' if self.apply else 'dry_run',
+            'prune': self.prune,
+            'upload_ids': self.upload_ids,
+            'total_uploads': self.total_uploads,
+            'processed_uploads': self.processed_uploads,
+            'progress': self.get_progress(),
+            'chats': self.chats,
+            'messages': self.messages,
+            'candidates': self.candidates,
+            'matched': self.matched,
+            'added': self.added,
+            'saved': self.saved,
+            'stale': self.stale,
+            'removed': self.removed,
+            'edited': self.edited,
+            'added_samples': self.added_samples,
+            'stale_samples': self.stale_samples,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+
+def _sample(qa_id: Optional[int], question: str, answer: str) -> Dict[str, Any]:
+    return {'id': qa_id, 'question': (question or '')[:80], 'answer': (answer or '')[:80]}
+
+
+class ReextractionService:
+    """重新提取任务管理（同一时间只运行一个任务）"""
+    
+    MAX_JOBS = 20  # 内存中保留的任务数
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs: Dict[str, ReextractionJob] = {}
+    
+    def create_job(self, upload_ids: Optional[Iterable[int]] = None, apply: bool = False,
+                   prune: bool = False) -> Tuple[ReextractionJob, bool]:
+        """
+        登记一次重新提取
+        
+        Returns:
+            Tuple[ReextractionJob, bool]: (任务, 是否新建)；已有任务在进行时返回该任务和 False
+        """
+        upload_ids = sorted({int(upload_id) for upload_id in upload_ids}) if upload_ids else None
+        
+        with self._lock:
+            active = next((job for job in self.jobs.values() if job.active), None)
+            if active is not None:
+                return active, False
+                
+            job = ReextractionJob(job_id=uuid.uuid4().hex[:12], upload_ids=upload_ids,
+                                  apply=apply, prune=apply and prune)
+            self.jobs[job.job_id] = job
+            if len(self.jobs) > self.MAX_JOBS:
+                finished = sorted((j for j in self.jobs.values() if not j.active), key=lambda j: j.created_at)
+                for old in finished[:len(self.jobs) - self.MAX_JOBS]:
+                    self.jobs.pop(old.job_id, None)
+        return job, True
+    
+    def submit(self, app, job: ReextractionJob, timeout: int = 3600) -> str:
+        """把任务提交到任务队列"""
+        job.task_id = get_task_queue().submit_task(
+            "reextract",
+            self.run_job,
+            app, job.job_id,
+            max_retries=0,  # 部分入库后重试会重新比较，没有必要
+            timeout=timeout
+        )
+        return job.task_id
+    
+    def get_job(self, job_id: str) -> Optional[ReextractionJob]:
+        return self.jobs.get(job_id)
+    
+    def run_job(self, app, job_id: str) -> Dict[str, Any]:
+        """执行重新提取（任务队列线程或命令行中执行）"""
+        job = self.jobs[job_id]
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        
+        with app.app_context():
+            try:
+                archived = get_archived_upload_ids()
+                if job.upload_ids:
+                    upload_ids = [upload_id for upload_id in job.upload_ids if upload_id in set(archived)]
+                else:
+                    upload_ids = archived
+                job.total_uploads = len(upload_ids)
+                logger.info(f"Reextraction {job_id}: {len(upload_ids)} archived uploads "
+                            f"({'apply' if job.apply else 'dry run'})")
+                            
+                processor = FileProcessor()
+                qa_index = processor._get_dedup_index() if job.apply else None
+                category_ids = processor._get_category_ids()
+                produced: Set[str] = set()
+                
+                for upload_id in upload_ids:
+                    self._reextract_upload(job, processor, upload_id, produced, qa_index, category_ids)
+                    job.processed_uploads += 1
+                    self._report_progress(job)
+                    
+                self._find_stale(job, upload_ids, produced)
+                job.status = 'completed'
+                
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Reextraction {job_id} failed: {str(e)}")
+                job.status = 'failed'
+                job.error = str(e)
+            finally:
+                job.completed_at = datetime.utcnow()
+                db.session.remove()
+                
+        self._report_progress(job)
+        logger.info(f"Reextraction {job_id} {job.status}: matched {job.matched}, added {job.added} "
+                    f"(saved {job.saved}), stale {job.stale} (removed {job.removed}), kept {job.edited} edited")
+        return job.to_dict()
+    
+    def _reextract_upload(self, job: ReextractionJob, processor: FileProcessor, upload_id: int,
+                          produced: Set[str], qa_index, category_ids: set):
+        """重放一次上传的归档，比较（apply 时保存）重新提取出的问答对"""
+        stats = IngestStats()
+        
+        def diff_batch(batch) -> int:
+            job.candidates += len(batch)
+            fresh = {}
+            for item in batch:
+                qa = item[0]
+                fingerprint = processor._generate_content_fingerprint(qa.question, qa.answer, qa.asker, qa.advisor)
+                if fingerprint not in produced and fingerprint not in fresh:
+                    fresh[fingerprint] = item
+            produced.update(fresh)
+            
+            existing = self._existing_fingerprints(list(fresh))
+            added = [item for fingerprint, item in fresh.items() if fingerprint not in existing]
+            job.matched += len(fresh) - len(added)
+            job.added += len(added)
+            for qa, _ in added[:SAMPLE_SIZE - len(job.added_samples)]:
+                job.added_samples.append(_sample(None, qa.question, qa.answer))
+                
+            if job.apply and added:
+                return processor._save_qa_batch(added, upload_id, qa_index, category_ids)
+            return 0
+            
+        pipeline = Pipeline(f'reextract-{upload_id}', [
+            parse_stage(),
+            extract_stage(processor.data_extractor, stats),
+            classify_stage(processor.qa_classifier, stats),
+            save_stage(diff_batch, stats)
+        ])
+        pipeline.drain(self._counted(job, iter_archived_chats(upload_id)))
+        job.saved += stats.saved
+    
+    def _counted(self, job: ReextractionJob, chats) -> Iterator:
+        def count(messages):
+            for message in messages:
+                job.messages += 1
+                yield message
+                
+        for source, messages in chats:
+            job.chats += 1
+            yield source, count(messages)
+    
+    def _existing_fingerprints(self, fingerprints: List[str]) -> Set[str]:
+        """已有问答对的当前指纹或提取时的指纹（提取出的问答被手工修改过时不再重复添加）"""
+        existing = set()
+        for start in range(0, len(fingerprints), _QUERY_CHUNK):
+            chunk = fingerprints[start:start + _QUERY_CHUNK]
+            for column in (QAPair.content_fingerprint, QAPair.extraction_fingerprint):
+                existing.update(
+                    fingerprint for (fingerprint,) in db.session.query(column).filter(column.in_(chunk))
+                )
+        return existing
+    
+    def _find_stale(self, job: ReextractionJob, upload_ids: List[int], produced: Set[str]):
+        """
+        找出各上传原来提取、本次没有提取出的问答对，prune 时删除
+        
+        按提取时的指纹比较（content_fingerprint 在修改问答时会重新计算）；手工修改过的问答
+        即使新规则不再提取也保留。
+        """
+        stale_ids = []
+        for upload_id in upload_ids:
+            rows = db.session.query(
+                QAPair.id, QAPair.extraction_fingerprint, QAPair.content_fingerprint, QAPair.question, QAPair.answer
+            ).filter(QAPair.source_file == f"upload_{upload_id}").yield_per(1000)
+            for qa_id, extracted, fingerprint, question, answer in rows:
+                if extracted in produced:
+                    continue
+                if extracted is None or fingerprint != extracted:
+                    job.edited += 1
+                    continue
+                stale_ids.append(qa_id)
+                if len(job.stale_samples) < SAMPLE_SIZE:
+                    job.stale_samples.append(_sample(qa_id, question, answer))
+        job.stale = len(stale_ids)
+        
+        if not (job.apply and job.prune and stale_ids):
+            return
+            
+        from app.services.search_service import SearchService
+        search_service = SearchService()
+        for start in range(0, len(stale_ids), _QUERY_CHUNK):
+            qa_pairs = QAPair.query.filter(QAPair.id.in_(stale_ids[start:start + _QUERY_CHUNK])).all()
+            for qa_pair in qa_pairs:
+                if search_service.fts_enabled:
+                    search_service.update_fts_record(qa_pair, 'delete')
+                db.session.delete(qa_pair)
+            db.session.commit()
+            job.removed += len(qa_pairs)
+        logger.info(f"Reextraction {job.job_id}: removed {job.removed} stale QA pairs")
+    
+    def _report_progress(self, job: ReextractionJob):
+        """更新任务进度并推送WebSocket通知"""
+        if not job.task_id:
+            return
+            
+        get_task_queue().update_progress(
+            job.task_id, job.get_progress(), f'{job.processed_uploads}/{job.total_uploads} uploads'
+        )
+        
+        from app.services.websocket_service import get_websocket_manager
+        get_websocket_manager().notify_task_update(job.task_id)
+
+
+# 全局重新提取服务实例
+reextraction_service = ReextractionService()
+
+
+def get_reextraction_service() -> ReextractionService:
+    """获取重新提取服务实例"""
+    return reextraction_service
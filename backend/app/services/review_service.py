@@ -0,0 +1,166 @@
+"""
+原始问答审核服务 - 暂存表（raw_qa_pairs）的审核与提升
+"""
+import json
+import logging
+from typing import List, Dict, Any, Optional
+from app import db
+from app.models import QAPair, RawQAPair
+from .qa_classifier import QAClassifier
+from .search_service import SearchService
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewService:
+    """原始问答审核服务"""
+    
+    def __init__(self):
+        self.qa_classifier = QAClassifier()
+    
+    def list_raw_pairs(self, upload_id: Optional[int] = None, status: str = 'pending',
+                       query: Optional[str] = None, page: int = 1, per_page: int = 20):
+        """
+        分页获取暂存的原始问答
+        
+        Args:
+            upload_id: 上传记录ID
+            status: 审核状态，'all' 表示不过滤
+            query: 关键词（LIKE 匹配问题和回答）
+            page: 页码
+            per_page: 每页数量
+            
+        Returns:
+            Pagination: 分页结果
+        """
+        raw_query = RawQAPair.query
+        
+        if upload_id is not None:
+            raw_query = raw_query.filter(RawQAPair.upload_id == upload_id)
+        if status and status != 'all':
+            raw_query = raw_query.filter(RawQAPair.status == status)
+        if query:
+            raw_query = raw_query.filter(db.or_(
+                RawQAPair.question.contains(query),
+                RawQAPair.answer.contains(query)
+            ))
+            
+        return raw_query.order_by(RawQAPair.id).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+    
+    def approve(self, raw_ids: List[int], category_id: Optional[int] = None,
+                confidence: Optional[float] = None) -> Dict[str, Any]:
+        """
+        审核通过：把原始问答提升到 qa_pairs
+        
+        Args:
+            raw_ids: 暂存记录ID列表
+            category_id: 指定分类；为空时用规则分类器自动分类
+            confidence: 指定置信度；为空时使用模型默认值
+            
+        Returns:
+            dict: 提升结果
+        """
+        raw_pairs = RawQAPair.query.filter(
+            RawQAPair.id.in_(raw_ids),
+            RawQAPair.status == 'pending'
+        ).all()
+        
+        promoted = []
+        try:
+            for raw in raw_pairs:
+                target_category = category_id
+                if target_category is None:
+                    target_category = self.qa_classifier.classify_qa(raw.question, raw.answer).category_id
+                    
+                qa_pair = QAPair(
+                    question=raw.question,
+                    answer=raw.answer,
+                    category_id=target_category,
+                    asker=raw.asker,
+                    advisor=raw.advisor,
+                    source_file=f"upload_{raw.upload_id}_reviewed",
+                    original_context=json.dumps({
+                        'question_timestamp': raw.question_timestamp,
+                        'answer_timestamp': raw.answer_timestamp,
+                        'raw_qa_id': raw.id,
+                        'reviewed': True
+                    }, ensure_ascii=False)
+                )
+                if confidence is not None:
+                    qa_pair.confidence = confidence
+                    
+                db.session.add(qa_pair)
+                db.session.flush()  # 获取ID；统计汇总由会话事件更新
+                
+                raw.mark_reviewed('approved', promoted_qa_id=qa_pair.id)
+                promoted.append(qa_pair)
+                
+            db.session.commit()
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to approve raw QA pairs: {str(e)}")
+            raise
+        
+        # 更新FTS索引
+        search_service = SearchService()
+        if search_service.fts_enabled:
+            for qa_pair in promoted:
+                search_service.update_fts_record(qa_pair, 'insert')
+                
+        logger.info(f"Promoted {len(promoted)} raw QA pairs into qa_pairs")
+        return {
+            'approved': len(promoted),
+            'skipped': len(raw_ids) - len(promoted),
+            'qa_ids': [qa.id for qa in promoted]
+        }
+    
+    def reject(self, raw_ids: List[int]) -> Dict[str, Any]:
+        """
+        审核拒绝：保留暂存记录（用于去重），标记为 rejected
+        
+        Args:
+            raw_ids: 暂存记录ID列表
+            
+        Returns:
+            dict: 拒绝结果
+        """
+        raw_pairs = RawQAPair.query.filter(
+            RawQAPair.id.in_(raw_ids),
+            RawQAPair.status == 'pending'
+        ).all()
+        
+        try:
+            for raw in raw_pairs:
+                raw.mark_reviewed('rejected')
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to reject raw QA pairs: {str(e)}")
+            raise
+            
+        return {
+            'rejected': len(raw_pairs),
+            'skipped': len(raw_ids) - len(raw_pairs)
+        }
+    
+    def get_review_stats(self, upload_id: Optional[int] = None) -> Dict[str, int]:
+        """按审核状态统计暂存记录"""
+        stats_query = db.session.query(RawQAPair.status, db.func.count(RawQAPair.id))
+        if upload_id is not None:
+            stats_query = stats_query.filter(RawQAPair.upload_id == upload_id)
+            
+        stats = {'pending': 0, 'approved': 0, 'rejected': 0}
+        stats.update({status: count for status, count in stats_query.group_by(RawQAPair.status).all()})
+        return stats
+
+
+# 全局审核服务实例
+review_service = ReviewService()
+
+
+def get_review_service() -> ReviewService:
+    """获取审核服务实例"""
+    return review_service
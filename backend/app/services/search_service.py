@@ -4,15 +4,31 @@
 import re
 import jieba
 import logging
+from datetime import datetime
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
-from sqlalchemy import text, func
+from sqlalchemy import bindparam, text, func
 from app import db
 from app.models import QAPair, Category
 from app.utils.cache import search_cache, category_cache
 
 logger = logging.getLogger(__name__)
 
+# 稀疏字段对应的FTS查询列（category 单独处理）
+FTS_FIELD_COLUMNS = {
+    'id': 'qa.id',
+    'question': 'qa.question',
+    'answer': 'qa.answer',
+    'answer_preview': f'substr(qa.answer, 1, {QAPair.ANSWER_PREVIEW_LENGTH})',
+    'category_id': 'qa.category_id',
+    'asker': 'qa.asker',
+    'advisor': 'qa.advisor',
+    'confidence': 'qa.confidence',
+    'source_file': 'qa.source_file',
+    'created_at': 'qa.created_at',
+    'updated_at': 'qa.updated_at',
+}
+
 
 @dataclass
 class SearchResult:
@@ -85,8 +101,8 @@ class SearchService:
             if not self.fts_enabled:
                 return
             
-            # 清空FTS表
-            db.session.execute(text("DELETE FROM qa_pairs_fts"))
+            # 清空FTS表（外部内容表含 category_name 列，不能直接 DELETE）
+            db.session.execute(text("INSERT INTO qa_pairs_fts(qa_pairs_fts) VALUES('delete-all')"))
             
             # 重新插入所有数据
             db.session.execute(text("""
@@ -106,7 +122,7 @@ class SearchService:
     @search_cache(ttl=300)  # 缓存搜索结果5分钟
     def search(self, query: str, category_ids: List[int] = None, 
                advisor: str = None, page: int = 1, per_page: int = 20,
-               sort_by: str = 'relevance') -> SearchResult:
+               sort_by: str = 'relevance', fields: Tuple[str, ...] = None) -> SearchResult:
         """
         执行搜索
         
@@ -117,6 +133,7 @@ class SearchService:
             page: 页码
             per_page: 每页数量
             sort_by: 排序方式 ('relevance', 'time', 'confidence')
+            fields: 只加载这些字段（见 QAPair.resolve_fields），为空时加载完整字段
         
         Returns:
             SearchResult: 搜索结果
@@ -131,12 +148,17 @@ class SearchService:
             if self.fts_enabled and processed_query:
                 # 使用FTS5搜索
                 qa_pairs, total_count = self._fts_search(
-                    processed_query, category_ids, advisor, page, per_page, sort_by
+                    processed_query, category_ids, advisor, page, per_page, sort_by, fields
+                )
+                if total_count == 0:
+                    # unicode61 分词不切分连续中文，FTS无结果时用LIKE兜底
+                    qa_pairs, total_count = self._like_search(
+                        query, category_ids, advisor, page, per_page, sort_by, fields
                 )
             else:
                 # 使用LIKE搜索作为后备
                 qa_pairs, total_count = self._like_search(
-                    query, category_ids, advisor, page, per_page, sort_by
+                    query, category_ids, advisor, page, per_page, sort_by, fields
                 )
             
             # 计算页数
@@ -201,36 +223,47 @@ class SearchService:
             return query
     
     def _fts_search(self, query: str, category_ids: List[int], advisor: str,
-                   page: int, per_page: int, sort_by: str) -> Tuple[List[QAPair], int]:
+                   page: int, per_page: int, sort_by: str,
+                   fields: Tuple[str, ...] = None) -> Tuple[List[QAPair], int]:
         """FTS5全文搜索"""
         try:
             # 构建FTS查询
             fts_query = self._build_fts_query(query)
             
+            # 列投影：只读取请求的字段，排序用的列始终保留；
+            # 未指定字段时只查ID，再按ID加载完整对象
+            projected = fields or ('id',)
+            select_columns = [f"{FTS_FIELD_COLUMNS[f]} AS {f}" for f in projected if f in FTS_FIELD_COLUMNS]
+            for sort_field in ('confidence', 'created_at'):
+                if sort_field not in projected:
+                    select_columns.append(f"{FTS_FIELD_COLUMNS[sort_field]} AS {sort_field}")
+            if 'category' in projected:
+                if 'category_id' not in projected:
+                    select_columns.append('qa.category_id AS category_id')
+                select_columns.extend(['c.name AS category_name', 'c.color AS category_color'])
+            
             # 优化：使用CTE和单一查询同时获取数据和计数
-            base_sql = """
+            base_sql = f"""
                 WITH search_results AS (
-                    SELECT qa.id, qa.question, qa.answer, qa.category_id, qa.asker, qa.advisor,
-                           qa.confidence, qa.source_file, qa.original_context, qa.created_at, 
-                           qa.updated_at, c.name as category_name,
+                    SELECT {', '.join(select_columns)},
                            bm25(qa_pairs_fts) as rank
                     FROM qa_pairs_fts fts
                     JOIN qa_pairs qa ON qa.id = fts.rowid
                     LEFT JOIN categories c ON qa.category_id = c.id
-                    WHERE qa_pairs_fts MATCH ?
+                    WHERE qa_pairs_fts MATCH :fts_query
             """
             
-            params = [fts_query]
+            params = {'fts_query': fts_query}
             
             # 添加筛选条件
             if category_ids:
-                placeholders = ','.join(['?' for _ in category_ids])
+                placeholders = ','.join([f':category_{i}' for i in range(len(category_ids))])
                 base_sql += f" AND qa.category_id IN ({placeholders})"
-                params.extend(category_ids)
+                params.update({f'category_{i}': cid for i, cid in enumerate(category_ids)})
             
             if advisor:
-                base_sql += " AND qa.advisor = ?"
-                params.append(advisor)
+                base_sql += " AND qa.advisor = :advisor"
+                params['advisor'] = advisor
             
             base_sql += """
                 ),
@@ -242,20 +275,17 @@ class SearchService:
                 CROSS JOIN total_count tc
             """
             
-            # 添加排序
-            if sort_by == 'relevance':
-                base_sql += " ORDER BY sr.rank DESC"
-            elif sort_by == 'time':
+            # 添加排序（bm25 越小越相关）
+            if sort_by == 'time':
                 base_sql += " ORDER BY sr.created_at DESC"
             elif sort_by == 'confidence':
                 base_sql += " ORDER BY sr.confidence DESC, sr.created_at DESC"
             else:
-                base_sql += " ORDER BY sr.rank DESC"
+                base_sql += " ORDER BY sr.rank"
             
             # 添加分页
-            offset = (page - 1) * per_page
-            base_sql += " LIMIT ? OFFSET ?"
-            params.extend([per_page, offset])
+            base_sql += " LIMIT :limit OFFSET :offset"
+            params.update({'limit': per_page, 'offset': (page - 1) * per_page})
             
             # 执行单一查询获取所有数据
             results = db.session.execute(text(base_sql), params).fetchall()
@@ -263,29 +293,31 @@ class SearchService:
             if not results:
                 return [], 0
             
-            total_count = results[0][-1]  # 最后一列是total
+            total_count = results[0].total
             
-            # 直接构造QAPair对象，避免额外数据库查询
+            if not fields:
+                ids = [row.id for row in results]
+                loaded = {qa.id: qa for qa in QAPair.query.filter(QAPair.id.in_(ids)).all()}
+                return [loaded[qa_id] for qa_id in ids if qa_id in loaded], total_count
+            
+            # 按投影直接构造QAPair对象，避免额外数据库查询
             qa_pairs = []
             for row in results:
+                values = row._mapping
                 qa = QAPair()
-                qa.id = row[0]
-                qa.question = row[1]
-                qa.answer = row[2]
-                qa.category_id = row[3]
-                qa.asker = row[4]
-                qa.advisor = row[5]
-                qa.confidence = row[6]
-                qa.source_file = row[7]
-                qa.original_context = row[8]
-                qa.created_at = row[9]
-                qa.updated_at = row[10]
+                for field in fields:
+                    if field not in FTS_FIELD_COLUMNS:
+                        continue
+                    value = values[field]
+                    if field in ('created_at', 'updated_at') and isinstance(value, str):
+                        value = datetime.fromisoformat(value)
+                    setattr(qa, field, value)
                 # 创建category对象以避免懒加载
-                if row[11]:  # category_name
-                    from app.models import Category
+                if 'category' in fields and values['category_name']:
                     category = Category()
-                    category.id = row[3]
-                    category.name = row[11]
+                    category.id = values['category_id']
+                    category.name = values['category_name']
+                    category.color = values['category_color']
                     qa.category = category
                 qa_pairs.append(qa)
             
@@ -294,7 +326,7 @@ class SearchService:
         except Exception as e:
             logger.error(f"FTS search failed: {str(e)}")
             # 降级到LIKE搜索
-            return self._like_search(query, category_ids, advisor, page, per_page, sort_by)
+            return self._like_search(query, category_ids, advisor, page, per_page, sort_by, fields)
     
     def _build_fts_query(self, query: str) -> str:
         """构建FTS查询字符串"""
@@ -312,10 +344,13 @@ class SearchService:
         return ' AND '.join(fts_terms) if fts_terms else query
     
     def _like_search(self, query: str, category_ids: List[int], advisor: str,
-                    page: int, per_page: int, sort_by: str) -> Tuple[List[QAPair], int]:
+                    page: int, per_page: int, sort_by: str,
+                    fields: Tuple[str, ...] = None) -> Tuple[List[QAPair], int]:
         """LIKE搜索作为后备"""
         # 构建基础查询
         qa_query = QAPair.query
+        if fields:
+            qa_query = qa_query.options(*QAPair.sparse_load_options(fields))
         
         # 关键词搜索
         if query:
@@ -447,13 +482,9 @@ class SearchService:
     def get_search_statistics(self) -> Dict[str, Any]:
         """获取搜索统计信息"""
         try:
-            total_qa = QAPair.query.count()
-            
-            # 按分类统计
-            category_stats = db.session.query(
-                Category.name,
-                func.count(QAPair.id).label('count')
-            ).outerjoin(QAPair).group_by(Category.id).all()
+            # 总数和分类分布读取统计汇总表
+            from .stats_rollup import get_stats_rollup_service
+            totals = get_stats_rollup_service().get_category_totals()
             
             # FTS状态
             fts_status = {
@@ -473,11 +504,8 @@ class SearchService:
                     pass
             
             return {
-                'total_qa_pairs': total_qa,
-                'category_distribution': [
-                    {'category': stat[0], 'count': stat[1]} 
-                    for stat in category_stats
-                ],
+                'total_qa_pairs': totals['total_qa_pairs'],
+                'category_distribution': totals['category_distribution'],
                 'fts_status': fts_status,
                 'search_capabilities': {
                     'full_text_search': self.fts_enabled,
@@ -504,29 +532,85 @@ class SearchService:
             if operation == 'insert':
                 db.session.execute(text("""
                     INSERT INTO qa_pairs_fts(rowid, question, answer, category_name, advisor)
-                    SELECT ?, ?, ?, COALESCE(c.name, ''), COALESCE(?, '')
-                    FROM categories c WHERE c.id = ?
-                """), [qa_pair.id, qa_pair.question, qa_pair.answer, qa_pair.advisor, qa_pair.category_id])
+                    SELECT :id, :question, :answer,
+                           COALESCE((SELECT name FROM categories WHERE id = :category_id), ''),
+                           COALESCE(:advisor, '')
+                """), {
+                    'id': qa_pair.id, 'question': qa_pair.question, 'answer': qa_pair.answer,
+                    'advisor': qa_pair.advisor, 'category_id': qa_pair.category_id
+                })
                 
             elif operation == 'update':
                 db.session.execute(text("""
                     UPDATE qa_pairs_fts SET 
-                        question = ?, answer = ?, 
-                        category_name = COALESCE((SELECT name FROM categories WHERE id = ?), ''),
-                        advisor = COALESCE(?, '')
-                    WHERE rowid = ?
-                """), [qa_pair.question, qa_pair.answer, qa_pair.category_id, qa_pair.advisor, qa_pair.id])
+                        question = :question, answer = :answer, 
+                        category_name = COALESCE((SELECT name FROM categories WHERE id = :category_id), ''),
+                        advisor = COALESCE(:advisor, '')
+                    WHERE rowid = :id
+                """), {
+                    'id': qa_pair.id, 'question': qa_pair.question, 'answer': qa_pair.answer,
+                    'advisor': qa_pair.advisor, 'category_id': qa_pair.category_id
+                })
+                
+            elif operation == 'delete' and self.get_indexed_ids([qa_pair.id]):
+                # 外部内容表不能直接 DELETE，用 'delete' 命令传入索引时的内容
+                db.session.execute(text("""
+                    INSERT INTO qa_pairs_fts(qa_pairs_fts, rowid, question, answer, category_name, advisor)
+                    SELECT 'delete', :id, :question, :answer,
+                           COALESCE((SELECT name FROM categories WHERE id = :category_id), ''),
+                           COALESCE(:advisor, '')
+                """), {
+                    'id': qa_pair.id, 'question': qa_pair.question, 'answer': qa_pair.answer,
+                    'advisor': qa_pair.advisor, 'category_id': qa_pair.category_id
+                })
                 
-            elif operation == 'delete':
-                db.session.execute(text(
-                    "DELETE FROM qa_pairs_fts WHERE rowid = ?"
-                ), [qa_pair.id])
-            
             db.session.commit()
             
         except Exception as e:
             logger.error(f"Failed to update FTS record: {str(e)}")
     
+    def get_indexed_ids(self, ids: List[int]) -> set:
+        """
+        已在FTS索引中的问答对ID
+        
+        外部内容表的查询总是读内容表，这里读 docsize 影子表判断是否已建索引
+        （批量上传的问答对在重建索引前不在索引中）
+        """
+        if not self.fts_enabled or not ids:
+            return set()
+            
+        indexed = set()
+        statement = text(
+            "SELECT id FROM qa_pairs_fts_docsize WHERE id IN :ids"
+        ).bindparams(bindparam('ids', expanding=True))
+        for start in range(0, len(ids), 500):
+            indexed.update(row[0] for row in db.session.execute(statement, {'ids': list(ids[start:start + 500])}))
+        return indexed
+    
+    def update_fts_categories(self, changes: List[Dict[str, Any]]) -> int:
+        """
+        批量更新FTS索引中的分类名称（不提交事务），返回更新的记录数
+        
+        changes 每项含 id、question、answer、advisor、old_category_name、category_name。
+        外部内容表不能直接 UPDATE：先用 'delete' 命令删除索引时的内容再插入新内容；
+        不在索引中的问答对跳过（重建索引时会带上新分类）。
+        """
+        if not self.fts_enabled or not changes:
+            return 0
+            
+        indexed = self.get_indexed_ids([change['id'] for change in changes])
+        changes = [change for change in changes if change['id'] in indexed]
+        if changes:
+            db.session.execute(text("""
+                INSERT INTO qa_pairs_fts(qa_pairs_fts, rowid, question, answer, category_name, advisor)
+                VALUES ('delete', :id, :question, :answer, :old_category_name, COALESCE(:advisor, ''))
+            """), changes)
+            db.session.execute(text("""
+                INSERT INTO qa_pairs_fts(rowid, question, answer, category_name, advisor)
+                VALUES (:id, :question, :answer, :category_name, COALESCE(:advisor, ''))
+            """), changes)
+        return len(changes)
+    
     def rebuild_index(self):
         """重建搜索索引"""
         try:
@@ -0,0 +1,666 @@
+"""
+统计汇总服务 - 增量维护仪表盘统计表
+
+qa_pairs / upload_history 的每次插入、修改、删除都会折算成各汇总表上的
+增量（UPSERT 累加），仪表盘读取汇总表即可，复杂度为 O(分类数 + 回答者数)。
+增量路径有两条：
+- ORM 会话中的 add / 修改 / delete 通过 after_flush 监听自动记录；
+- bulk_save_objects 等批量写入不触发会话事件，由调用方在提交前显式调用
+  record_qa_inserts()。
+reconcile() 用全表聚合重建所有汇总表，用于迁移后初始化和定期校准；只在命令行、
+管理接口或任务队列中执行。读取统计时只检查过期标记，过期时提交后台校准任务。
+"""
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Iterable
+
+from sqlalchemy import String, case, cast, event, func, inspect, literal, select, text, union_all
+from sqlalchemy.orm import Session
+from app import db
+from app.models import (
+    QAPair, Category, UploadHistory,
+    CategoryStats, AdvisorStats, ConfidenceStats, DailyStats,
+    UploadStatusStats, StatsState
+)
+from app.models.stats import QUALITY_THRESHOLD, UNCATEGORIZED_ID
+
+logger = logging.getLogger(__name__)
+
+
+# 置信度分档边界：bucket = 满足 confidence >= b/10 的最大 b
+CONFIDENCE_BUCKETS = 10
+
+# 与原统计口径对应的分档区间
+HIGH_CONFIDENCE_BUCKETS = range(8, 11)     # >= 0.8
+MEDIUM_CONFIDENCE_BUCKETS = range(5, 8)    # 0.5 - 0.8
+LOW_CONFIDENCE_BUCKETS = range(0, 5)       # < 0.5
+
+_UPSERT_CATEGORY = text("""
+    INSERT INTO stats_category (category_id, qa_count, quality_count, updated_at)
+    VALUES (:category_id, :qa_count, :quality_count, :now)
+    ON CONFLICT (category_id) DO UPDATE SET
+        qa_count = stats_category.qa_count + excluded.qa_count,
+        quality_count = stats_category.quality_count + excluded.quality_count,
+        updated_at = excluded.updated_at
+""")
+
+_UPSERT_ADVISOR = text("""
+    INSERT INTO stats_advisor (advisor, qa_count, quality_count, updated_at)
+    VALUES (:advisor, :qa_count, :quality_count, :now)
+    ON CONFLICT (advisor) DO UPDATE SET
+        qa_count = stats_advisor.qa_count + excluded.qa_count,
+        quality_count = stats_advisor.quality_count + excluded.quality_count,
+        updated_at = excluded.updated_at
+""")
+
+_UPSERT_CONFIDENCE = text("""
+    INSERT INTO stats_confidence
+        (source_kind, bucket, qa_count, confidence_sum, confidence_min, confidence_max, updated_at)
+    VALUES (:source_kind, :bucket, :qa_count, :confidence_sum, :confidence_min, :confidence_max, :now)
+    ON CONFLICT (source_kind, bucket) DO UPDATE SET
+        qa_count = stats_confidence.qa_count + excluded.qa_count,
+        confidence_sum = CASE WHEN stats_confidence.qa_count + excluded.qa_count <= 0
+            THEN 0 ELSE stats_confidence.confidence_sum + excluded.confidence_sum END,
+        confidence_min = CASE WHEN stats_confidence.qa_count + excluded.qa_count <= 0 THEN NULL
+            ELSE MIN(COALESCE(stats_confidence.confidence_min, excluded.confidence_min),
+                     COALESCE(excluded.confidence_min, stats_confidence.confidence_min)) END,
+        confidence_max = CASE WHEN stats_confidence.qa_count + excluded.qa_count <= 0 THEN NULL
+            ELSE MAX(COALESCE(stats_confidence.confidence_max, excluded.confidence_max),
+                     COALESCE(excluded.confidence_max, stats_confidence.confidence_max)) END,
+        updated_at = excluded.updated_at
+""")
+
+_UPSERT_DAILY = text("""
+    INSERT INTO stats_daily (day, qa_count, quality_count, upload_count, updated_at)
+    VALUES (:day, :qa_count, :quality_count, :upload_count, :now)
+    ON CONFLICT (day) DO UPDATE SET
+        qa_count = stats_daily.qa_count + excluded.qa_count,
+        quality_count = stats_daily.quality_count + excluded.quality_count,
+        upload_count = stats_daily.upload_count + excluded.upload_count,
+        updated_at = excluded.updated_at
+""")
+
+_MARK_STALE = text("""
+    INSERT INTO stats_state (key, value, updated_at) VALUES ('needs_reconcile', :value, :now)
+    ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+""")
+
+_UPSERT_UPLOAD_STATUS = text("""
+    INSERT INTO stats_upload_status
+        (status, upload_count, qa_total, processing_time_sum, processing_time_count, file_size_sum, updated_at)
+    VALUES (:status, :upload_count, :qa_total, :processing_time_sum, :processing_time_count, :file_size_sum, :now)
+    ON CONFLICT (status) DO UPDATE SET
+        upload_count = stats_upload_status.upload_count + excluded.upload_count,
+        qa_total = stats_upload_status.qa_total + excluded.qa_total,
+        processing_time_sum = stats_upload_status.processing_time_sum + excluded.processing_time_sum,
+        processing_time_count = stats_upload_status.processing_time_count + excluded.processing_time_count,
+        file_size_sum = stats_upload_status.file_size_sum + excluded.file_size_sum,
+        updated_at = excluded.updated_at
+""")
+
+# 跟踪的字段：变化时需要重算汇总增量
+_QA_TRACKED_FIELDS = ('category_id', 'advisor', 'confidence', 'source_file', 'created_at')
+_UPLOAD_TRACKED_FIELDS = ('status', 'qa_count', 'processing_time', 'file_size', 'uploaded_at', 'created_at')
+
+
+def confidence_bucket(confidence: Optional[float]) -> Optional[int]:
+    """
+    计算置信度分档（0-10），与 SQL 中 confidence >= 0.x 的比较结果严格一致
+    
+    Returns:
+        int: 分档编号，confidence 为 None 时返回 None
+    """
+    if confidence is None:
+        return None
+    for bucket in range(CONFIDENCE_BUCKETS, 0, -1):
+        if confidence >= bucket / CONFIDENCE_BUCKETS:
+            return bucket
+    return 0
+
+
+def source_kind(source_file: Optional[str]) -> str:
+    """
+    根据来源文件判断问答对的来源类型
+    
+    上下文已压缩存储，不再参与判断；AI 处理结果的 source_file 均以 _ai 结尾
+    
+    Returns:
+        str: ai（AI处理）、raw（原始导入待审核）或 rule（规则提取）
+    """
+    source_file = source_file or ''
+    if source_file.endswith('_ai'):
+        return 'ai'
+    if source_file.endswith('_raw'):
+        return 'raw'
+    return 'rule'
+
+
+def _day_of(value: Optional[datetime]) -> str:
+    return (value or datetime.utcnow()).strftime('%Y-%m-%d')
+
+
+class StatsRollupService:
+    """统计汇总服务"""
+    
+    def __init__(self):
+        # 增量写入失败时置位（同时写入 stats_state.needs_reconcile），读取统计时提交校准任务
+        self._needs_reconcile = False
+        self._reconcile_lock = threading.Lock()
+        self._reconcile_task_id: Optional[str] = None
+    
+    # ------------------------------------------------------------------
+    # 增量记录
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def snapshot_qa(qa_pair: QAPair, **overrides) -> Dict[str, Any]:
+        """提取问答对中影响统计的字段"""
+        data = {field: getattr(qa_pair, field, None) for field in _QA_TRACKED_FIELDS}
+        data.update(overrides)
+        if data['confidence'] is None and qa_pair.id is None:
+            data['confidence'] = 0.8  # 与列默认值一致（批量插入时对象上尚未赋值）
+        return data
+    
+    @staticmethod
+    def snapshot_upload(upload: UploadHistory, **overrides) -> Dict[str, Any]:
+        """提取上传记录中影响统计的字段"""
+        data = {field: getattr(upload, field, None) for field in _UPLOAD_TRACKED_FIELDS}
+        data.update(overrides)
+        if data['status'] is None:
+            data['status'] = 'pending'
+        return data
+    
+    def record_qa_inserts(self, qa_pairs: Iterable[QAPair], connection=None):
+        """记录批量插入的问答对（bulk_save_objects 之后、commit 之前调用）"""
+        self.apply_qa_deltas([(self.snapshot_qa(qa), 1) for qa in qa_pairs], connection)
+    
+    def record_qa_deletes(self, qa_pairs: Iterable[QAPair], connection=None):
+        """记录批量删除的问答对"""
+        self.apply_qa_deltas([(self.snapshot_qa(qa), -1) for qa in qa_pairs], connection)
+    
+    def apply_qa_deltas(self, changes: List[tuple], connection=None):
+        """
+        将问答对变化折算为汇总表增量并写入
+        
+        Args:
+            changes: [(snapshot, sign)]，sign 为 +1（新增）或 -1（移除）
+            connection: 可选的数据库连接（会话事件内使用 flush 所在连接）
+        """
+        if not changes:
+            return
+            
+        categories = defaultdict(lambda: [0, 0])
+        advisors = defaultdict(lambda: [0, 0])
+        buckets = defaultdict(lambda: [0, 0.0, None, None])
+        days = defaultdict(lambda: [0, 0, 0])
+        
+        for snap, sign in changes:
+            confidence = snap.get('confidence')
+            quality = 1 if confidence is not None and confidence >= QUALITY_THRESHOLD else 0
+            
+            cat = categories[snap.get('category_id') or UNCATEGORIZED_ID]
+            cat[0] += sign
+            cat[1] += sign * quality
+            
+            if snap.get('advisor') is not None:
+                adv = advisors[snap['advisor']]
+                adv[0] += sign
+                adv[1] += sign * quality
+                
+            bucket = confidence_bucket(confidence)
+            if bucket is not None:
+                entry = buckets[(source_kind(snap.get('source_file')), bucket)]
+                entry[0] += sign
+                entry[1] += sign * confidence
+                if sign > 0:
+                    entry[2] = confidence if entry[2] is None else min(entry[2], confidence)
+                    entry[3] = confidence if entry[3] is None else max(entry[3], confidence)
+                    
+            day = days[_day_of(snap.get('created_at'))]
+            day[0] += sign
+            day[1] += sign * quality
+            
+        now = datetime.utcnow()
+        self._execute(connection, [
+            (_UPSERT_CATEGORY, [
+                {'category_id': key, 'qa_count': v[0], 'quality_count': v[1], 'now': now}
+                for key, v in categories.items() if v[0] or v[1]
+            ]),
+            (_UPSERT_ADVISOR, [
+                {'advisor': key, 'qa_count': v[0], 'quality_count': v[1], 'now': now}
+                for key, v in advisors.items() if v[0] or v[1]
+            ]),
+            (_UPSERT_CONFIDENCE, [
+                {'source_kind': key[0], 'bucket': key[1], 'qa_count': v[0], 'confidence_sum': v[1],
+                 'confidence_min': v[2], 'confidence_max': v[3], 'now': now}
+                for key, v in buckets.items() if v[0] or v[2] is not None
+            ]),
+            (_UPSERT_DAILY, [
+                {'day': key, 'qa_count': v[0], 'quality_count': v[1], 'upload_count': 0, 'now': now}
+                for key, v in days.items() if v[0] or v[1]
+            ]),
+        ])
+    
+    def apply_upload_deltas(self, changes: List[tuple], connection=None):
+        """
+        将上传记录变化折算为汇总表增量并写入
+        
+        Args:
+            changes: [(snapshot, sign)]
+        """
+        if not changes:
+            return
+            
+        statuses = defaultdict(lambda: [0, 0, 0.0, 0, 0])
+        days = defaultdict(int)
+        
+        for snap, sign in changes:
+            entry = statuses[snap['status']]
+            entry[0] += sign
+            entry[1] += sign * (snap.get('qa_count') or 0)
+            if snap.get('processing_time') is not None:
+                entry[2] += sign * snap['processing_time']
+                entry[3] += sign
+            entry[4] += sign * (snap.get('file_size') or 0)
+            
+            days[_day_of(snap.get('uploaded_at') or snap.get('created_at'))] += sign
+            
+        now = datetime.utcnow()
+        self._execute(connection, [
+            (_UPSERT_UPLOAD_STATUS, [
+                {'status': key, 'upload_count': v[0], 'qa_total': v[1], 'processing_time_sum': v[2],
+                 'processing_time_count': v[3], 'file_size_sum': v[4], 'now': now}
+                for key, v in statuses.items() if any(v)
+            ]),
+            (_UPSERT_DAILY, [
+                {'day': key, 'qa_count': 0, 'quality_count': 0, 'upload_count': count, 'now': now}
+                for key, count in days.items() if count
+            ]),
+        ])
+    
+    def record_upload_bulk_delete(self, query):
+        """记录即将通过 query.delete() 批量删除的上传记录（须在 delete 之前调用）"""
+        self.apply_upload_deltas([(self.snapshot_upload(upload), -1) for upload in query.all()])
+    
+    def _execute(self, connection, statements: List[tuple]):
+        """
+        在 SAVEPOINT 中执行 UPSERT
+        
+        失败时回滚到 SAVEPOINT（外层业务事务不受影响），并在同一事务中写入过期标记，
+        由后台校准任务修正汇总表
+        """
+        if not any(params for _, params in statements):
+            return
+            
+        conn = connection if connection is not None else db.session.connection()
+        try:
+            with conn.begin_nested():
+                for statement, params in statements:
+                    if params:
+                        conn.execute(statement, params)
+        except Exception as e:
+            logger.warning(f"Failed to update stats rollup, will reconcile later: {str(e)}")
+            self._mark_stale(conn)
+    
+    def _mark_stale(self, conn):
+        """标记汇总表需要全量校准（随业务事务提交，其他进程读取统计时也能看到）"""
+        self._needs_reconcile = True
+        now = datetime.utcnow()
+        try:
+            with conn.begin_nested():
+                conn.execute(_MARK_STALE, {'value': now.isoformat(), 'now': now})
+        except Exception as e:
+            logger.warning(f"Failed to mark stats rollup stale: {str(e)}")
+    
+    # ------------------------------------------------------------------
+    # 会话事件
+    # ------------------------------------------------------------------
+    
+    def _on_after_flush(self, session, flush_context):
+        """ORM 会话 flush 后记录问答对和上传记录的变化"""
+        qa_changes = []
+        upload_changes = []
+        
+        for obj in session.new:
+            if isinstance(obj, QAPair):
+                qa_changes.append((self.snapshot_qa(obj), 1))
+            elif isinstance(obj, UploadHistory):
+                upload_changes.append((self.snapshot_upload(obj), 1))
+                
+        for obj in session.dirty:
+            if isinstance(obj, QAPair):
+                old = self._previous_values(obj, _QA_TRACKED_FIELDS)
+                if old is not None:
+                    qa_changes.append((self.snapshot_qa(obj, **old), -1))
+                    qa_changes.append((self.snapshot_qa(obj), 1))
+            elif isinstance(obj, UploadHistory):
+                old = self._previous_values(obj, _UPLOAD_TRACKED_FIELDS)
+                if old is not None:
+                    upload_changes.append((self.snapshot_upload(obj, **old), -1))
+                    upload_changes.append((self.snapshot_upload(obj), 1))
+                    
+        for obj in session.deleted:
+            if isinstance(obj, QAPair):
+                qa_changes.append((self.snapshot_qa(obj), -1))
+            elif isinstance(obj, UploadHistory):
+                upload_changes.append((self.snapshot_upload(obj), -1))
+                
+        if qa_changes or upload_changes:
+            connection = session.connection()
+            self.apply_qa_deltas(qa_changes, connection)
+            self.apply_upload_deltas(upload_changes, connection)
+    
+    @staticmethod
+    def _previous_values(obj, fields) -> Optional[Dict[str, Any]]:
+        """返回被修改字段的旧值；跟踪字段均未修改时返回 None"""
+        state = inspect(obj)
+        old = {}
+        for field in fields:
+            history = state.attrs[field].history
+            if history.deleted:
+                old[field] = history.deleted[0]
+        return old or None
+    
+    # ------------------------------------------------------------------
+    # 全量校准
+    # ------------------------------------------------------------------
+    
+    def reconcile(self) -> Dict[str, Any]:
+        """
+        用全表聚合重建全部汇总表（INSERT ... SELECT 由 SQLAlchemy 表达式生成，不含方言专有写法）
+        
+        Returns:
+            dict: 各汇总表的行数
+        """
+        start_time = datetime.utcnow()
+        
+        try:
+            for model in (CategoryStats, AdvisorStats, ConfidenceStats, DailyStats, UploadStatusStats):
+                db.session.execute(model.__table__.delete())
+            for statement in self.reconcile_statements(start_time):
+                db.session.execute(statement)
+                
+            db.session.merge(StatsState(key='last_reconciled_at', value=start_time.isoformat()))
+            db.session.execute(StatsState.__table__.delete().where(StatsState.key == 'needs_reconcile'))
+            db.session.commit()
+            self._needs_reconcile = False
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to reconcile stats rollup: {str(e)}")
+            raise
+            
+        result = {
+            'categories': CategoryStats.query.count(),
+            'advisors': AdvisorStats.query.count(),
+            'confidence_buckets': ConfidenceStats.query.count(),
+            'days': DailyStats.query.count(),
+            'upload_statuses': UploadStatusStats.query.count(),
+            'reconciled_at': start_time.isoformat() + 'Z',
+            'duration': round((datetime.utcnow() - start_time).total_seconds(), 3)
+        }
+        logger.info(f"Stats rollup reconciled: {result}")
+        return result
+    
+    @staticmethod
+    def reconcile_statements(now_value: datetime) -> List[Any]:
+        """全量校准使用的 INSERT ... SELECT 语句（按汇总表顺序）"""
+        qa = QAPair.__table__
+        uploads = UploadHistory.__table__
+        now = literal(now_value)
+        quality = func.sum(case((qa.c.confidence >= QUALITY_THRESHOLD, 1), else_=0))
+        
+        def insert_from(model, columns, query):
+            return model.__table__.insert().from_select(list(columns), query)
+            
+        category_id = func.coalesce(qa.c.category_id, UNCATEGORIZED_ID)
+        scored = select(
+            case((qa.c.source_file.like('%\\_ai', escape='\\'), 'ai'),
+                 (qa.c.source_file.like('%\\_raw', escape='\\'), 'raw'),
+                 else_='rule').label('kind'),
+            case(*[(qa.c.confidence >= b / CONFIDENCE_BUCKETS, b) for b in range(CONFIDENCE_BUCKETS, 0, -1)],
+                 else_=0).label('bucket'),
+            qa.c.confidence
+        ).where(qa.c.confidence.isnot(None)).subquery('scored')
+        
+        # 问答数和上传数按天（UTC 日期，YYYY-MM-DD）合并后一次写入
+        daily = union_all(
+            select(cast(func.date(qa.c.created_at), String).label('day'), literal(1).label('qa_count'),
+                   case((qa.c.confidence >= QUALITY_THRESHOLD, 1), else_=0).label('quality_count'),
+                   literal(0).label('upload_count')),
+            select(cast(func.date(func.coalesce(uploads.c.uploaded_at, uploads.c.created_at)), String).label('day'),
+                   literal(0).label('qa_count'), literal(0).label('quality_count'),
+                   literal(1).label('upload_count'))
+        ).subquery('daily')
+        
+        return [
+            insert_from(CategoryStats, ('category_id', 'qa_count', 'quality_count', 'updated_at'),
+                        select(category_id, func.count(), quality, now).group_by(category_id)),
+            insert_from(AdvisorStats, ('advisor', 'qa_count', 'quality_count', 'updated_at'),
+                        select(qa.c.advisor, func.count(), quality, now)
+                        .where(qa.c.advisor.isnot(None)).group_by(qa.c.advisor)),
+            insert_from(ConfidenceStats,
+                        ('source_kind', 'bucket', 'qa_count', 'confidence_sum', 'confidence_min',
+                         'confidence_max', 'updated_at'),
+                        select(scored.c.kind, scored.c.bucket, func.count(), func.sum(scored.c.confidence),
+                               func.min(scored.c.confidence), func.max(scored.c.confidence), now)
+                        .group_by(scored.c.kind, scored.c.bucket)),
+            insert_from(DailyStats, ('day', 'qa_count', 'quality_count', 'upload_count', 'updated_at'),
+                        select(daily.c.day, func.sum(daily.c.qa_count), func.sum(daily.c.quality_count),
+                               func.sum(daily.c.upload_count), now)
+                        .where(daily.c.day.isnot(None)).group_by(daily.c.day)),
+            insert_from(UploadStatusStats,
+                        ('status', 'upload_count', 'qa_total', 'processing_time_sum', 'processing_time_count',
+                         'file_size_sum', 'updated_at'),
+                        select(uploads.c.status, func.count(), func.coalesce(func.sum(uploads.c.qa_count), 0),
+                               func.coalesce(func.sum(uploads.c.processing_time), 0),
+                               func.count(uploads.c.processing_time),
+                               func.coalesce(func.sum(uploads.c.file_size), 0), now)
+                        .group_by(uploads.c.status)),
+        ]
+    
+    def is_stale(self) -> bool:
+        """从未校准、增量写入失败或超过校准间隔时汇总表视为过期（只读 stats_state，不做聚合）"""
+        from flask import current_app
+        
+        try:
+            state = {
+                row.key: row.value for row in
+                StatsState.query.filter(StatsState.key.in_(('last_reconciled_at', 'needs_reconcile')))
+            }
+        except Exception as e:
+            logger.warning(f"Stats rollup tables unavailable: {str(e)}")
+            db.session.rollback()
+            return False
+            
+        if self._needs_reconcile or 'needs_reconcile' in state or 'last_reconciled_at' not in state:
+            return True
+            
+        interval = current_app.config.get('STATS_RECONCILE_INTERVAL', 0)
+        if not interval:
+            return False
+        last = datetime.fromisoformat(state['last_reconciled_at'])
+        return datetime.utcnow() - last > timedelta(seconds=interval)
+    
+    def submit_reconcile(self, app) -> str:
+        """提交后台校准任务；已有校准任务在等待或执行时返回该任务ID"""
+        from app.services.task_queue import TaskStatus, get_task_queue
+        
+        task_queue = get_task_queue()
+        with self._reconcile_lock:
+            if self._reconcile_task_id:
+                result = task_queue.get_task_status(self._reconcile_task_id)
+                if result and result.status in (TaskStatus.PENDING, TaskStatus.RUNNING):
+                    return self._reconcile_task_id
+                    
+            self._reconcile_task_id = task_queue.submit_task(
+                "reconcile_stats",
+                self._reconcile_task,
+                app,
+                max_retries=0,
+                timeout=600
+            )
+            return self._reconcile_task_id
+    
+    def _reconcile_task(self, app) -> Dict[str, Any]:
+        with app.app_context():
+            try:
+                return self.reconcile()
+            finally:
+                db.session.remove()
+    
+    def ensure_fresh(self):
+        """读取统计前调用：汇总表过期时提交后台校准任务，本次仍读取现有汇总数据"""
+        from flask import current_app
+        
+        if self.is_stale():
+            try:
+                self.submit_reconcile(current_app._get_current_object())
+            except Exception as e:
+                logger.warning(f"Failed to schedule stats reconcile: {str(e)}")
+    
+    # ------------------------------------------------------------------
+    # 统计读取
+    # ------------------------------------------------------------------
+    
+    def _confidence_rows(self, kind: Optional[str] = None) -> List[ConfidenceStats]:
+        query = ConfidenceStats.query.filter(ConfidenceStats.qa_count > 0)
+        if kind:
+            query = query.filter(ConfidenceStats.source_kind == kind)
+        return query.all()
+    
+    @staticmethod
+    def _bucket_total(rows: List[ConfidenceStats], buckets) -> int:
+        return sum(row.qa_count for row in rows if row.bucket in buckets)
+    
+    def get_qa_statistics(self, top_advisors: int = 10) -> Dict[str, Any]:
+        """问答统计（QAPair.get_statistics 的数据来源）"""
+        self.ensure_fresh()
+        
+        category_stats = db.session.query(
+            Category.name, db.func.coalesce(CategoryStats.quality_count, 0)
+        ).outerjoin(CategoryStats, CategoryStats.category_id == Category.id)\
+         .order_by(Category.id).all()
+         
+        total_qa = db.session.query(
+            db.func.coalesce(db.func.sum(CategoryStats.quality_count), 0)
+        ).scalar()
+        
+        advisor_stats = AdvisorStats.query.filter(AdvisorStats.quality_count > 0)\
+            .order_by(AdvisorStats.quality_count.desc())\
+            .limit(top_advisors).all()
+            
+        rows = self._confidence_rows()
+        count = sum(row.qa_count for row in rows)
+        minimums = [row.confidence_min for row in rows if row.confidence_min is not None]
+        maximums = [row.confidence_max for row in rows if row.confidence_max is not None]
+        
+        return {
+            'total_qa': int(total_qa),
+            'category_distribution': [
+                {'category': stat[0], 'count': stat[1]}
+                for stat in category_stats
+            ],
+            'top_advisors': [
+                {'advisor': stat.advisor, 'count': stat.quality_count}
+                for stat in advisor_stats if stat.advisor
+            ],
+            'confidence_stats': {
+                'average': float(sum(row.confidence_sum for row in rows) / count) if count else 0.0,
+                'minimum': float(min(minimums)) if minimums else 0.0,
+                'maximum': float(max(maximums)) if maximums else 0.0,
+                'high_confidence': self._bucket_total(rows, HIGH_CONFIDENCE_BUCKETS),
+                'medium_confidence': self._bucket_total(rows, MEDIUM_CONFIDENCE_BUCKETS),
+                'low_confidence': self._bucket_total(rows, LOW_CONFIDENCE_BUCKETS)
+            }
+        }
+    
+    def get_category_totals(self) -> Dict[str, Any]:
+        """全部问答（不区分质量）的总数和分类分布"""
+        self.ensure_fresh()
+        
+        category_stats = db.session.query(
+            Category.name, db.func.coalesce(CategoryStats.qa_count, 0)
+        ).outerjoin(CategoryStats, CategoryStats.category_id == Category.id)\
+         .order_by(Category.id).all()
+         
+        total_qa = db.session.query(
+            db.func.coalesce(db.func.sum(CategoryStats.qa_count), 0)
+        ).scalar()
+        
+        return {
+            'total_qa_pairs': int(total_qa),
+            'category_distribution': [
+                {'category': stat[0], 'count': stat[1]}
+                for stat in category_stats
+            ]
+        }
+    
+    def get_upload_statistics(self, recent_days: int = 7) -> Dict[str, Any]:
+        """上传统计（admin 统计接口的数据来源）"""
+        self.ensure_fresh()
+        
+        statuses = {row.status: row for row in UploadStatusStats.query.all()}
+        since = (datetime.utcnow() - timedelta(days=recent_days)).strftime('%Y-%m-%d')
+        recent_uploads = db.session.query(
+            db.func.coalesce(db.func.sum(DailyStats.upload_count), 0)
+        ).filter(DailyStats.day >= since).scalar()
+        
+        completed = statuses.get('completed')
+        avg_time = 0
+        if completed and completed.processing_time_count:
+            avg_time = completed.processing_time_sum / completed.processing_time_count
+            
+        return {
+            'total_uploads': sum(row.upload_count for row in statuses.values()),
+            'recent_uploads_7d': int(recent_uploads),
+            'status_distribution': {
+                status: row.upload_count for status, row in statuses.items() if row.upload_count
+            },
+            'successful_processing': {
+                'total_qa_extracted': completed.qa_total if completed else 0,
+                'avg_processing_time': round(avg_time, 2),
+                'total_file_size_mb': round((completed.file_size_sum if completed else 0) / (1024 * 1024), 2)
+            }
+        }
+    
+    def get_confidence_distribution(self, kind: str) -> Dict[str, Any]:
+        """指定来源类型的置信度分布（AI质量指标的数据来源）"""
+        self.ensure_fresh()
+        
+        rows = self._confidence_rows(kind)
+        total = sum(row.qa_count for row in rows)
+        return {
+            'total': total,
+            'avg_confidence': sum(row.confidence_sum for row in rows) / total if total else 0,
+            'buckets': {row.bucket: row.qa_count for row in rows}
+        }
+
+
+# 全局统计汇总服务实例
+stats_rollup_service = StatsRollupService()
+_listener_registered = False
+
+
+def _noop_set_listener(target, value, oldvalue, initiator):
+    return value
+
+
+def get_stats_rollup_service() -> StatsRollupService:
+    """获取统计汇总服务实例"""
+    return stats_rollup_service
+
+
+def init_stats_rollup(app):
+    """注册会话事件监听，使 ORM 写入自动维护汇总表"""
+    global _listener_registered
+    if not _listener_registered:
+        event.listen(Session, 'after_flush', stats_rollup_service._on_after_flush)
+        # active_history：修改已过期（commit 后）的属性时先加载旧值，flush 时才能算出减量
+        for model, fields in ((QAPair, _QA_TRACKED_FIELDS), (UploadHistory, _UPLOAD_TRACKED_FIELDS)):
+            for field in fields:
+                event.listen(getattr(model, field), 'set', _noop_set_listener, active_history=True)
+        _listener_registered = True
+    return stats_rollup_service
@@ -2,6 +2,8 @@
 后台任务队列服务 - 处理异步文件上传和长时间任务
 """
 import asyncio
+import heapq
+import itertools
 import logging
 import json
 import time
@@ -10,15 +12,16 @@ from enum import Enum
 from datetime import datetime, timedelta
 from pathlib import Path
 from dataclasses import dataclass, asdict
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
 import threading
-from queue import Queue, PriorityQueue
 import uuid
 
 from app import db
 from app.models import UploadHistory
 from app.services.async_file_processor import AsyncFileProcessor
 from app.utils.cache import cached, MultiLevelCache
+from app.utils.compressed_input import get_compression
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +55,8 @@ class TaskResult:
     end_time: Optional[datetime] = None
     execution_time: Optional[float] = None
     retry_count: int = 0
+    progress: float = 0.0  # 处理进度 0-100
+    stage: Optional[str] = None  # 当前处理阶段
     
     def to_dict(self) -> Dict[str, Any]:
         data = asdict(self)
@@ -89,22 +94,37 @@ class BackgroundTask:
 
 
 class TaskQueue:
-    """异步任务队列管理器"""
+    """
+    异步任务队列管理器
+    
+    max_workers 个工作线程并发执行任务。可执行的任务按优先级和创建时间放在就绪堆中，
+    定时任务（scheduled_for 和重试退避）按到期时间放在延迟堆中；工作线程在条件变量上等待，
+    有新任务提交或最早的定时任务到期时才被唤醒，空闲时不轮询。
+    同步任务函数在线程池中执行（超时后不再等待，按失败处理；超时任务的线程结束后才安排重试），
+    协程函数在工作线程中执行。
+    """
+    
+    RESULT_TTL = timedelta(hours=1)  # 已结束任务结果的保留时间
+    TIMEOUT_GRACE = 30  # 同步任务到超时时间后再等待的秒数（任务函数自己按截止时间停止、保存进度）
+    CLEANUP_INTERVAL = 60  # 清理过期任务结果的最短间隔（秒）
     
     def __init__(self, max_workers: int = 5, max_queue_size: int = 1000):
         self.max_workers = max_workers
         self.max_queue_size = max_queue_size
         
-        # 任务队列
-        self.pending_queue = PriorityQueue(maxsize=max_queue_size)
+        # 就绪堆 (优先级, 创建时间, 序号, 任务) 和延迟堆 (到期时间, 序号, 任务)，由 _condition 保护
+        self._condition = threading.Condition()
+        self._ready: List[tuple] = []
+        self._delayed: List[tuple] = []
+        self._sequence = itertools.count()
         self.running_tasks: Dict[str, BackgroundTask] = {}
         self.task_results: Dict[str, TaskResult] = {}
         
-        # 线程池和事件循环
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
-        self.loop = None
-        self.worker_thread = None
+        # 工作线程和执行同步任务函数的线程池
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='task-exec')
+        self.workers: List[threading.Thread] = []
         self.is_running = False
+        self._last_cleanup = time.monotonic()
         
         # 统计信息
         self.stats = {
@@ -119,90 +139,90 @@ class TaskQueue:
         self.cache = MultiLevelCache()
         
         # 初始化队列
-        self._init_worker()
+        self._init_workers()
     
-    def _init_worker(self):
-        """初始化工作线程"""
+    def _init_workers(self):
+        """启动工作线程"""
         try:
-            self.worker_thread = threading.Thread(target=self._run_worker, daemon=True)
             self.is_running = True
-            self.worker_thread.start()
+            for index in range(self.max_workers):
+                worker = threading.Thread(target=self._run_worker, name=f'task-worker-{index}', daemon=True)
+                worker.start()
+                self.workers.append(worker)
             logger.info(f"Task queue initialized with {self.max_workers} workers")
         except Exception as e:
             logger.error(f"Failed to initialize task queue: {str(e)}")
             raise
     
     def _run_worker(self):
-        """工作线程主循环"""
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
-        
-        try:
-            self.loop.run_until_complete(self._worker_main())
-        except Exception as e:
-            logger.error(f"Worker thread error: {str(e)}")
-        finally:
-            self.loop.close()
-    
-    async def _worker_main(self):
-        """异步工作主循环"""
-        while self.is_running:
+        """工作线程主循环：取出下一个可执行的任务并执行，队列关闭时退出"""
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
             try:
-                # 处理待执行任务
-                if not self.pending_queue.empty() and len(self.running_tasks) < self.max_workers:
-                    task = self.pending_queue.get()
+                self._execute_task(task)
+            except Exception as e:
+                logger.error(f"Worker error while running task {task.task_id}: {str(e)}")
+    
+    def _next_task(self) -> Optional[BackgroundTask]:
+        """等待下一个可执行的任务（到期的定时任务先移入就绪堆），队列关闭时返回 None"""
+        with self._condition:
+            while self.is_running:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._push_ready(heapq.heappop(self._delayed)[-1])
                     
-                    # 检查调度时间
-                    if task.scheduled_for and datetime.utcnow() < task.scheduled_for:
-                        # 重新放入队列等待
-                        self.pending_queue.put(task)
-                        await asyncio.sleep(1)
+                if self._ready:
+                    task = heapq.heappop(self._ready)[-1]
+                    if self._ready:
+                        self._condition.notify()  # 还有就绪任务，唤醒另一个空闲的工作线程
+                    result = self.task_results.get(task.task_id)
+                    if result is not None and result.status == TaskStatus.CANCELLED:
                         continue
-                    
-                    # 执行任务
-                    await self._execute_task(task)
-                
-                # 清理过期的任务结果
-                await self._cleanup_expired_results()
-                
-                # 短暂休眠避免CPU占用过高
-                await asyncio.sleep(0.1)
+                    self.running_tasks[task.task_id] = task
+                    return task
                 
-            except Exception as e:
-                logger.error(f"Worker main loop error: {str(e)}")
-                await asyncio.sleep(1)
+                # 没有就绪任务：等到最早的定时任务到期，或被新任务唤醒
+                self._condition.wait(self._delayed[0][0] - now if self._delayed else None)
+            return None
+    
+    def _push_ready(self, task: BackgroundTask):
+        heapq.heappush(self._ready, (task.priority.value, task.created_at, next(self._sequence), task))
+    
+    def _enqueue(self, task: BackgroundTask):
+        """任务放入就绪堆或延迟堆（未到 scheduled_for 时）并唤醒一个工作线程（调用方持有 _condition）"""
+        delay = (task.scheduled_for - datetime.utcnow()).total_seconds() if task.scheduled_for else 0
+        if delay > 0:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), task))
+        else:
+            self._push_ready(task)
+        # 新的定时任务可能比等待中的更早到期，同样需要唤醒工作线程重新计算等待时间
+        self._condition.notify()
     
-    async def _execute_task(self, task: BackgroundTask):
-        """执行单个任务"""
+    def _execute_task(self, task: BackgroundTask):
+        """执行单个任务（工作线程中调用）"""
+        previous = self.task_results.get(task.task_id)
         task_result = TaskResult(
             task_id=task.task_id,
             status=TaskStatus.RUNNING,
-            start_time=datetime.utcnow()
+            start_time=datetime.utcnow(),
+            retry_count=previous.retry_count if previous else 0
         )
-        
-        # 将任务标记为运行中
-        self.running_tasks[task.task_id] = task
         self.task_results[task.task_id] = task_result
+        future = None
         
         try:
             logger.info(f"Starting task {task.task_id} ({task.task_type})")
             
             # 执行任务函数
             if asyncio.iscoroutinefunction(task.func):
-                # 异步函数
-                result = await asyncio.wait_for(
-                    task.func(*task.args, **task.kwargs),
-                    timeout=task.timeout
-                )
+                # 异步函数，在工作线程自己的事件循环中执行
+                result = asyncio.run(asyncio.wait_for(task.func(*task.args, **task.kwargs), timeout=task.timeout))
             else:
                 # 同步函数，在线程池中执行
-                result = await asyncio.wait_for(
-                    self.loop.run_in_executor(
-                        self.executor,
-                        lambda: task.func(*task.args, **task.kwargs)
-                    ),
-                    timeout=task.timeout
-                )
+                future = self.executor.submit(task.func, *task.args, **task.kwargs)
+                result = future.result(timeout=task.timeout + self.TIMEOUT_GRACE)
             
             # 任务执行成功
             task_result.status = TaskStatus.COMPLETED
@@ -211,22 +231,27 @@ class TaskQueue:
             task_result.execution_time = (task_result.end_time - task_result.start_time).total_seconds()
             
             # 更新统计信息
-            self.stats['tasks_completed'] += 1
-            self.stats['total_execution_time'] += task_result.execution_time
-            
+            with self._condition:
+                self.stats['tasks_completed'] += 1
+                self.stats['total_execution_time'] += task_result.execution_time
+                
             logger.info(f"Task {task.task_id} completed in {task_result.execution_time:.2f}s")
             
-        except asyncio.TimeoutError:
-            # 任务超时
+        except (asyncio.TimeoutError, FuturesTimeoutError):
+            # 任务超时（同步函数的线程仍在运行，到处理截止时间才停止）
             task_result.status = TaskStatus.FAILED
             task_result.error = f"Task timeout after {task.timeout} seconds"
             task_result.end_time = datetime.utcnow()
             
-            self.stats['tasks_failed'] += 1
+            with self._condition:
+                self.stats['tasks_failed'] += 1
             logger.error(f"Task {task.task_id} timeout")
             
-            # 尝试重试
-            await self._retry_task(task)
+            # 尝试重试：同步函数的线程结束后才安排，不会与仍在运行的上一次执行重叠或占用更多线程
+            if future is not None:
+                future.add_done_callback(lambda _: self._retry_task(task))
+            else:
+                self._retry_task(task)
             
         except Exception as e:
             # 任务执行异常
@@ -234,18 +259,20 @@ class TaskQueue:
             task_result.error = str(e)
             task_result.end_time = datetime.utcnow()
             
-            self.stats['tasks_failed'] += 1
+            with self._condition:
+                self.stats['tasks_failed'] += 1
             logger.error(f"Task {task.task_id} failed: {str(e)}")
             
             # 尝试重试
-            await self._retry_task(task)
+            self._retry_task(task)
             
         finally:
             # 从运行队列中移除
-            self.running_tasks.pop(task.task_id, None)
+            with self._condition:
+                self.running_tasks.pop(task.task_id, None)
     
-    async def _retry_task(self, task: BackgroundTask):
-        """重试失败的任务"""
+    def _retry_task(self, task: BackgroundTask):
+        """重试失败的任务（放入延迟堆，到期后由工作线程取出）"""
         if task.max_retries > 0:
             task.max_retries -= 1
             task_result = self.task_results[task.task_id]
@@ -257,17 +284,23 @@ class TaskQueue:
             task.scheduled_for = datetime.utcnow() + timedelta(seconds=retry_delay)
             
             # 重新加入队列
-            self.pending_queue.put(task)
-            self.stats['tasks_retried'] += 1
-            
+            with self._condition:
+                self._enqueue(task)
+                self.stats['tasks_retried'] += 1
+                
             logger.info(f"Task {task.task_id} scheduled for retry in {retry_delay}s")
     
-    async def _cleanup_expired_results(self):
-        """清理过期的任务结果"""
+    def _cleanup_expired_results(self):
+        """清理过期的任务结果（提交任务时顺带进行，最多每 CLEANUP_INTERVAL 秒一次）"""
         try:
-            cutoff_time = datetime.utcnow() - timedelta(hours=1)  # 保留1小时
+            now = time.monotonic()
+            if now - self._last_cleanup < self.CLEANUP_INTERVAL:
+                return
+            self._last_cleanup = now
+            
+            cutoff_time = datetime.utcnow() - self.RESULT_TTL
             expired_tasks = [
-                task_id for task_id, result in self.task_results.items()
+                task_id for task_id, result in list(self.task_results.items())
                 if result.end_time and result.end_time < cutoff_time
             ]
             
@@ -294,15 +327,14 @@ class TaskQueue:
             priority: 任务优先级
             max_retries: 最大重试次数
             timeout: 超时时间（秒）
-            scheduled_for: 调度执行时间
+            scheduled_for: 调度执行时间（UTC）
             **kwargs: 函数关键字参数
         
         Returns:
             str: 任务ID
         """
         try:
-            if self.pending_queue.full():
-                raise Exception("Task queue is full")
+            self._cleanup_expired_results()
             
             task_id = f"{task_type}_{uuid.uuid4().hex[:8]}"
             task = BackgroundTask(
@@ -317,15 +349,18 @@ class TaskQueue:
                 scheduled_for=scheduled_for
             )
             
-            self.pending_queue.put(task)
-            self.stats['tasks_submitted'] += 1
-            
-            # 创建初始任务结果
-            self.task_results[task_id] = TaskResult(
-                task_id=task_id,
-                status=TaskStatus.PENDING
-            )
-            
+            with self._condition:
+                if len(self._ready) + len(self._delayed) >= self.max_queue_size:
+                    raise Exception("Task queue is full")
+                
+                # 先创建初始任务结果，再放入队列（工作线程可能立即开始执行）
+                self.task_results[task_id] = TaskResult(
+                    task_id=task_id,
+                    status=TaskStatus.PENDING
+                )
+                self._enqueue(task)
+                self.stats['tasks_submitted'] += 1
+                
             logger.info(f"Task {task_id} ({task_type}) submitted to queue")
             return task_id
             
@@ -337,31 +372,47 @@ class TaskQueue:
         """获取任务状态"""
         return self.task_results.get(task_id)
     
+    def update_progress(self, task_id: str, progress: float, stage: Optional[str] = None):
+        """更新任务进度"""
+        task_result = self.task_results.get(task_id)
+        if task_result:
+            task_result.progress = round(min(max(progress, 0.0), 100.0), 1)
+            if stage:
+                task_result.stage = stage
+    
     def get_queue_stats(self) -> Dict[str, Any]:
         """获取队列统计信息"""
-        return {
-            'queue_size': self.pending_queue.qsize(),
-            'running_tasks': len(self.running_tasks),
-            'total_results': len(self.task_results),
-            'worker_stats': self.stats.copy(),
-            'avg_execution_time': (
-                self.stats['total_execution_time'] / max(self.stats['tasks_completed'], 1)
-            )
-        }
+        with self._condition:
+            return {
+                'queue_size': len(self._ready) + len(self._delayed),
+                'scheduled_tasks': len(self._delayed),
+                'running_tasks': len(self.running_tasks),
+                'max_workers': self.max_workers,
+                'total_results': len(self.task_results),
+                'worker_stats': self.stats.copy(),
+                'avg_execution_time': (
+                    self.stats['total_execution_time'] / max(self.stats['tasks_completed'], 1)
+                )
+            }
     
     def cancel_task(self, task_id: str) -> bool:
-        """取消任务"""
+        """取消任务（等待中的任务从队列移除）"""
         try:
-            # 检查是否在运行中
-            if task_id in self.running_tasks:
-                logger.warning(f"Cannot cancel running task {task_id}")
-                return False
-            
-            # 标记为取消
-            if task_id in self.task_results:
-                self.task_results[task_id].status = TaskStatus.CANCELLED
-                return True
-            
+            with self._condition:
+                # 检查是否在运行中
+                if task_id in self.running_tasks:
+                    logger.warning(f"Cannot cancel running task {task_id}")
+                    return False
+                
+                # 标记为取消
+                if task_id in self.task_results:
+                    self.task_results[task_id].status = TaskStatus.CANCELLED
+                    self._ready = [entry for entry in self._ready if entry[-1].task_id != task_id]
+                    self._delayed = [entry for entry in self._delayed if entry[-1].task_id != task_id]
+                    heapq.heapify(self._ready)
+                    heapq.heapify(self._delayed)
+                    return True
+                    
             return False
             
         except Exception as e:
@@ -369,17 +420,21 @@ class TaskQueue:
             return False
     
     def shutdown(self, timeout: int = 30):
-        """关闭任务队列"""
+        """关闭任务队列（不再取出新任务，等待执行中的任务结束，最多 timeout 秒）"""
         try:
             logger.info("Shutting down task queue...")
-            self.is_running = False
-            
-            if self.worker_thread and self.worker_thread.is_alive():
-                self.worker_thread.join(timeout=timeout)
-            
+            with self._condition:
+                self.is_running = False
+                self._condition.notify_all()
+                
+            deadline = time.monotonic() + timeout
+            for worker in self.workers:
+                if worker.is_alive():
+                    worker.join(timeout=max(deadline - time.monotonic(), 0))
+                    
             if self.executor:
-                self.executor.shutdown(wait=True, timeout=timeout)
-            
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                
             logger.info("Task queue shut down successfully")
             
         except Exception as e:
@@ -392,6 +447,10 @@ class FileProcessingService:
     def __init__(self, task_queue: TaskQueue):
         self.task_queue = task_queue
         self.async_processor = AsyncFileProcessor()
+        self.upload_tasks: Dict[int, str] = {}  # upload_id -> task_id
+        self.upload_locks: Dict[int, threading.Lock] = {}  # 同一上传的处理（含重试）串行执行
+        self._upload_lock_users: Dict[int, int] = {}  # 正在持有或等待各上传锁的任务数，为0时删除锁
+        self._locks_lock = threading.Lock()
     
     def process_file_async(self, file_path: Path, original_filename: str, 
                           priority: TaskPriority = TaskPriority.NORMAL) -> str:
@@ -414,6 +473,194 @@ class FileProcessingService:
             logger.error(f"File processing task failed: {str(e)}")
             raise
     
+    def process_upload(self, app, upload_id: int, file_path: Path, original_filename: str,
+                       use_ai: bool = True, processing_mode: str = 'standard',
+                       priority: TaskPriority = TaskPriority.NORMAL, timeout: int = 1800) -> str:
+        """
+        把已保存的上传文件提交到后台处理
+        
+        Args:
+            app: Flask应用（任务线程中需要应用上下文）
+            upload_id: 上传接口预先创建的上传记录ID
+            file_path: 已保存的文件路径
+            original_filename: 原始文件名
+            use_ai: 是否使用AI
+            processing_mode: 'standard' 或 'intelligent'
+            priority: 任务优先级
+            timeout: 超时时间（秒）
+        
+        Returns:
+            str: 任务ID
+        """
+        # 标准处理器按检查点从断点继续，失败或超时后可以重试；AI和智能处理重试会从头再来
+        max_retries = app.config.get('UPLOAD_TASK_MAX_RETRIES', 2) if self.is_resumable(
+            file_path, use_ai, processing_mode
+        ) else 0
+        
+        task_id = self.task_queue.submit_task(
+            "upload_processing",
+            self._process_upload_task,
+            app, upload_id, file_path, original_filename, use_ai, processing_mode, timeout,
+            priority=priority,
+            max_retries=max_retries,
+            timeout=timeout
+        )
+        # 顺带清理结果已过期的映射
+        self.upload_tasks = {
+            uid: tid for uid, tid in self.upload_tasks.items() if tid in self.task_queue.task_results
+        }
+        self.upload_tasks[upload_id] = task_id
+        return task_id
+    
+    @staticmethod
+    def is_resumable(file_path: Path, use_ai: bool, processing_mode: str) -> bool:
+        """上传是否由标准处理器处理（支持断点续传），判断方式与 run_upload 一致"""
+        return bool(get_compression(file_path)) or (not use_ai and processing_mode != 'intelligent')
+    
+    @contextmanager
+    def _upload_lock(self, upload_id: int):
+        """持有上传的处理锁；该上传最后一个持有或等待锁的任务结束时删除锁"""
+        with self._locks_lock:
+            lock = self.upload_locks.get(upload_id)
+            if lock is None:
+                lock = self.upload_locks[upload_id] = threading.Lock()
+            self._upload_lock_users[upload_id] = self._upload_lock_users.get(upload_id, 0) + 1
+        try:
+            with lock:
+                yield
+        finally:
+            with self._locks_lock:
+                users = self._upload_lock_users.pop(upload_id) - 1
+                if users:
+                    self._upload_lock_users[upload_id] = users
+                else:
+                    del self.upload_locks[upload_id]
+    
+    def _process_upload_task(self, app, upload_id: int, file_path: Path, original_filename: str,
+                             use_ai: bool, processing_mode: str, timeout: Optional[int] = None) -> Dict[str, Any]:
+        """上传处理任务实现（在线程池中执行）"""
+        # 截止时间从任务开始执行时计算，与任务队列的超时一致（等待处理锁的时间也计算在内）
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._upload_lock(upload_id), app.app_context():
+            upload_record = UploadHistory.query.get(upload_id)
+            if not upload_record:
+                raise ValueError(f"Upload record {upload_id} not found")
+            
+            try:
+                result = self.run_upload(
+                    file_path, original_filename, upload_record, use_ai, processing_mode,
+                    progress_callback=lambda stage, progress: self._report_upload_progress(upload_id, stage, progress),
+                    deadline=deadline
+                )
+            except Exception as e:
+                db.session.rollback()
+                if upload_record.status in ('pending', 'processing'):
+                    upload_record.status = 'failed'
+                    upload_record.error_message = str(e)
+                    upload_record.completed_at = datetime.utcnow()
+                    db.session.commit()
+                raise
+            finally:
+                db.session.remove()
+            
+            if not result['success']:
+                raise RuntimeError(result.get('error') or result.get('message') or '文件处理失败')
+            
+            self._report_upload_progress(upload_id, 'completed', 100)
+            return result
+    
+    def _report_upload_progress(self, upload_id: int, stage: str, progress: float):
+        """更新上传任务进度并推送WebSocket通知"""
+        task_id = self.upload_tasks.get(upload_id)
+        if not task_id:
+            return
+        
+        self.task_queue.update_progress(task_id, progress, stage)
+        
+        from app.services.websocket_service import get_websocket_manager
+        get_websocket_manager().notify_task_update(task_id)
+    
+    def run_upload(self, file_path: Path, original_filename: str, upload_record: UploadHistory,
+                   use_ai: bool = True, processing_mode: str = 'standard',
+                   progress_callback: Optional[Callable[[str, float], None]] = None,
+                   deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        处理已保存的上传文件（后台任务和 wait=true 同步模式共用）
+        
+        deadline 为处理截止时间（time.monotonic()），标准处理器到期后停止并保留检查点
+        
+        Returns:
+            Dict: 与原同步上传接口兼容的处理结果
+        """
+        from app.services import FileProcessor
+        from app.services.ai_file_processor import AIFileProcessor
+        from app.services.intelligent_file_processor import intelligent_file_processor
+        
+        if progress_callback:
+            progress_callback('processing', 5)
+        
+        # AI和智能处理需要整个文档，压缩文件改用标准处理器边解压边流式处理
+        if get_compression(file_path) and (use_ai or processing_mode == 'intelligent'):
+            logger.info(f"Compressed upload {original_filename}: using standard streaming processor")
+            use_ai, processing_mode = False, 'standard'
+        
+        if processing_mode == 'intelligent':
+            result_obj = asyncio.run(intelligent_file_processor.process_file_intelligently(
+                file_path, original_filename, force_ai=use_ai, upload_record=upload_record
+            ))
+            
+            # 转换为兼容格式
+            result = {
+                'success': result_obj.success,
+                'upload_id': result_obj.upload_id,
+                'total_extracted': result_obj.qa_pairs_extracted,
+                'total_saved': result_obj.final_knowledge_entries,
+                'processing_time': result_obj.processing_time,
+                'processing_method': result_obj.processing_method,
+                'ai_enabled': result_obj.ai_enabled,
+                'statistics': {
+                    'original_messages': result_obj.original_messages,
+                    'useful_messages': result_obj.useful_messages,
+                    'noise_filtered': result_obj.noise_filtered,
+                    'extraction_efficiency': result_obj.extraction_efficiency,
+                    'content_improvement_rate': result_obj.content_improvement_rate,
+                    'ai_provider_used': result_obj.ai_provider_used,
+                    'tokens_consumed': result_obj.tokens_consumed,
+                    'processing_cost': result_obj.processing_cost
+                },
+                'message': f'智能处理完成! 从{result_obj.original_messages}条消息中生成{result_obj.final_knowledge_entries}个高质量知识库条目',
+                'error': result_obj.error_message
+            }
+        elif use_ai:
+            processor = AIFileProcessor()
+            processor.progress_callback = progress_callback
+            result = processor.process_file_async_with_ai(
+                file_path, original_filename, use_ai=True, upload_record=upload_record
+            )
+        else:
+            processor = FileProcessor()
+            processor.progress_callback = progress_callback
+            processor.deadline = deadline
+            result = processor.process_file_async(file_path, original_filename, upload_record=upload_record)
+        
+        # 清理临时文件（仅在成功时清理，失败的文件保留用于分析）
+        if result['success']:
+            try:
+                file_path.unlink()
+            except Exception as e:
+                logger.warning(f"Failed to remove temp file {file_path}: {str(e)}")
+        
+        return result
+    
+    def get_upload_task(self, upload_id: int) -> Optional[Dict[str, Any]]:
+        """获取上传记录对应的后台任务状态"""
+        task_id = self.upload_tasks.get(upload_id)
+        task_result = self.task_queue.get_task_status(task_id) if task_id else None
+        if not task_result:
+            return None
+        
+        return task_result.to_dict()
+    
     def get_processing_status(self, task_id: str) -> Dict[str, Any]:
         """获取处理状态"""
         task_result = self.task_queue.get_task_status(task_id)
@@ -0,0 +1,429 @@
+"""
+上传预览 - 在正式处理前抽样估算一个导出文件的提取结果
+
+只在内存中读取文件的一部分消息，运行与正式处理相同的水位线过滤、标准化、问答提取和规则分类，
+不写数据库（水位线只读取不推进）。返回候选问答样例、按读取比例外推的消息数和问答对数，
+以及按历史上传或本次预览速度估算的处理时间。
+
+两种抽样方式：
+- prefix：从头流式读取前 N 条消息（压缩文件边解压边读，分块上传只需已接收的开头部分）
+- spread：在未压缩文件中等间距定位若干窗口，每个窗口重新对齐到消息对象边界后读取一段连续消息，
+  样本覆盖整个时间跨度；压缩文件无法随机定位，退回 prefix
+
+时间预算按比例分给读取、提取和分类，超时的部分不再处理（结果标记 partial），
+估算按实际完成提取的消息比例外推；返回的候选样例按置信度从高到低，总是已完成分类的。
+识别消息数组也受读取时间限制；样本不足 MIN_ESTIMATE_MESSAGES 条且不是完整文件时不外推
+（estimates 中 insufficient_sample 为 true，消息数和问答对数为空）。
+"""
+import json
+import logging
+import re
+import time
+import zipfile
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import ijson
+
+from app.models import UploadHistory
+from app.utils.compressed_input import (
+    CORRUPT_ERRORS, SizeBudget, get_compression, list_json_members, open_json_stream
+)
+from app.utils.streaming_processor import PrefixDetectionTimeout, StreamingJSONProcessor
+from .chat_watermark import WatermarkFilter, get_chat_id
+from .data_extractor import DataExtractor, QACandidate
+from .qa_classifier import QAClassifier
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_WINDOW_BYTES = 512 * 1024  # spread 抽样每个窗口读取的字节数
+IJSON_BUFFER_SIZE = 8 * 1024       # 较小的读取缓冲，已读字节数更接近实际解析到的位置
+HISTORY_SAMPLE_SIZE = 20           # 估算处理时间参考的最近上传数
+PREVIEW_SHARD_SIZE = 250           # 预览的提取分片（小分片便于在时间预算内停止）
+MIN_ESTIMATE_MESSAGES = 100        # 外推估算需要的最少样本消息数
+
+# 时间预算的分配：读取、提取，其余用于分类
+READ_BUDGET_SHARE = 0.3
+EXTRACT_BUDGET_SHARE = 0.5
+
+# 窗口内的消息对象起点：数组开头或逗号之后的 {
+_OBJECT_START = re.compile(r'[\[,]\s*\{')
+_CONTENT_KEYS = ('content', 'contents', 'text', 'message', 'body')
+_SENDER_KEYS = ('senderName', 'sender', 'from', 'from_user', 'user', 'nickname', 'talker')
+
+# 读到未上传完的文件末尾时的解析错误
+_TRUNCATED_ERRORS = (ijson.JSONError,) + CORRUPT_ERRORS
+
+
+def _looks_like_message(item: Any) -> bool:
+    """窗口对齐时跳过嵌套在消息里的对象"""
+    return (isinstance(item, dict)
+            and any(key in item for key in _CONTENT_KEYS)
+            and any(key in item for key in _SENDER_KEYS))
+
+
+class UploadPreviewService:
+    """上传预览服务（提取器单进程运行，预览请求之间共用规则）"""
+    
+    SAMPLE_MODES = ('prefix', 'spread')
+    
+    def __init__(self):
+        self.extractor = DataExtractor(max_workers=1)
+        self.extractor.SHARD_SIZE = PREVIEW_SHARD_SIZE
+        self.classifier = QAClassifier()
+        self.streaming_processor = StreamingJSONProcessor()
+        self._decoder = json.JSONDecoder()
+    
+    def preview(self, file_path: Path, filename: Optional[str] = None, total_size: Optional[int] = None,
+                limit: int = 2000, sample: str = 'prefix', windows: int = 5, time_budget: float = 0.8,
+                candidate_limit: int = 20, max_decompressed: Optional[int] = None,
+                watermark_filter: Optional[WatermarkFilter] = None) -> Dict[str, Any]:
+        """
+        抽样预览
+        
+        Args:
+            file_path: 文件路径（可以是尚未上传完的分块上传数据）
+            filename: 识别压缩格式用的原始文件名，默认取 file_path
+            total_size: 完整文件的字节数（分块上传未完成时大于已接收的部分），默认为文件大小
+            limit: 最多读取的消息数
+            sample: 'prefix' 或 'spread'
+            windows: spread 抽样的窗口数
+            time_budget: 预览的总时间（秒）
+            candidate_limit: 返回的候选问答样例数（按置信度从高到低）
+            max_decompressed: 解压字节数上限
+            watermark_filter: 聊天水位线（只用于过滤，不推进）
+            
+        Raises:
+            ValueError: 文件中没有可识别的消息数组，或 zip 文件尚未上传完整
+        """
+        started = time.perf_counter()
+        read_deadline = started + time_budget * READ_BUDGET_SHARE
+        extract_deadline = started + time_budget * (READ_BUDGET_SHARE + EXTRACT_BUDGET_SHARE)
+        deadline = started + time_budget
+        
+        name = filename or str(file_path)
+        compression = get_compression(name)
+        received = file_path.stat().st_size
+        total_size = max(total_size or received, received)
+        
+        mode = sample if sample in self.SAMPLE_MODES else 'prefix'
+        if mode == 'spread' and compression is not None:
+            mode = 'prefix'
+            
+        if mode == 'spread':
+            chats, sample_info = self._read_spread(file_path, name, received, total_size, limit,
+                                                   max(1, windows), read_deadline)
+        else:
+            chats, sample_info = self._read_prefix(file_path, name, received, total_size, limit,
+                                                   max_decompressed, read_deadline)
+        sample_info.update({'mode': mode, 'requested_mode': sample})
+        read_time = time.perf_counter() - started
+        
+        # 水位线过滤和标准化（整个样本）
+        chat_counts: Counter = Counter()
+        chat_names: Dict[str, str] = {}
+        normalized_chats = []
+        for source, messages in chats:
+            for msg in messages:
+                talker = get_chat_id(msg)
+                if talker is not None:
+                    chat_counts[talker] += 1
+                    if msg.get('talkerName'):
+                        chat_names[talker] = str(msg['talkerName'])
+            if watermark_filter is not None:
+                messages = watermark_filter.filter(messages)
+            normalized_chats.append((source, list(self.extractor.iter_normalized_messages(messages))))
+        kept = sum(len(messages) for _, messages in normalized_chats)
+        
+        # 按分片提取，超过提取时间后停止（已提取的比例用于外推）
+        candidates: List[QACandidate] = []
+        processed = 0
+        partial = sample_info['timed_out']
+        for source, messages in normalized_chats:
+            for position, shard_candidates in self.extractor.iter_extract(messages, source):
+                candidates.extend(shard_candidates)
+                if time.perf_counter() >= extract_deadline and position < len(messages):
+                    partial = True
+                    processed += position
+                    break
+            else:
+                processed += len(messages)
+                continue
+            break
+        extract_time = time.perf_counter() - started - read_time
+        
+        # 置信度高的先分类，返回的样例总是已分类的
+        candidates.sort(key=lambda qa: qa.confidence, reverse=True)
+        classified = []
+        for qa in candidates:
+            if time.perf_counter() >= deadline and len(classified) >= candidate_limit:
+                partial = True
+                break
+            try:
+                classified.append((qa, self.classifier.classify_qa(qa.question, qa.answer, qa.context)))
+            except Exception as e:
+                logger.error(f"Failed to classify preview QA: {str(e)}")
+        classify_time = time.perf_counter() - started - read_time - extract_time
+        
+        # 每条标准化消息的处理时间（未分类的候选按已分类的速度折算）
+        per_message = 0.0
+        if processed:
+            per_message = (extract_time + classify_time * len(candidates) / max(len(classified), 1)) / processed
+        sample_info.update({'kept_messages': kept, 'processed_messages': processed})
+        estimates = self._estimate(sample_info, kept, processed, len(candidates), compression, total_size,
+                                   per_message)
+        elapsed = time.perf_counter() - started
+        top = classified[:candidate_limit]
+        
+        return {
+            'file': {
+                'filename': filename or file_path.name,
+                'compression': compression,
+                'size': total_size,
+                'received': received
+            },
+            'sample': sample_info,
+            'chats': [
+                {'talker': talker, 'name': chat_names.get(talker), 'messages': count}
+                for talker, count in chat_counts.most_common(10)
+            ],
+            'watermark': watermark_filter.get_stats() if watermark_filter is not None else None,
+            'extraction': self.extractor.get_extraction_stats(candidates),
+            'classification': self.classifier.get_classification_stats([c for _, c in classified]),
+            'candidates': [
+                {
+                    'question': qa.question,
+                    'answer': qa.answer,
+                    'asker': qa.asker,
+                    'advisor': qa.advisor,
+                    'timestamp': qa.timestamp.isoformat() if qa.timestamp else None,
+                    'confidence': round(qa.confidence, 3),
+                    'category_id': classification.category_id,
+                    'category_name': classification.category_name,
+                    'category_confidence': round(classification.confidence, 3)
+                }
+                for qa, classification in top
+            ],
+            'estimates': estimates,
+            'partial': partial,
+            'timing': {
+                'read': round(read_time, 3),
+                'extract': round(extract_time, 3),
+                'classify': round(classify_time, 3),
+                'elapsed': round(elapsed, 3)
+            }
+        }
+    
+    def load_watermark_filter(self, enabled: bool = True) -> Optional[WatermarkFilter]:
+        """读取聊天水位线（预览只过滤、不推进），未启用增量导入或读取失败时返回 None"""
+        if not enabled:
+            return None
+        try:
+            return WatermarkFilter.load(
+                DataExtractor.ANSWER_TIME_WINDOW, context_messages=DataExtractor.CONTEXT_LOOKBEHIND
+            )
+        except Exception as e:
+            logger.warning(f"Failed to load chat watermarks for preview: {str(e)}")
+            return None
+    
+    def _read_prefix(self, file_path: Path, name: str, received: int, total_size: int, limit: int,
+                     max_decompressed: Optional[int], read_deadline: float
+                     ) -> Tuple[List[Tuple[str, List[Dict[str, Any]]]], Dict[str, Any]]:
+        """从头读取前 limit 条消息，返回 ([(来源, 消息)], 抽样信息)"""
+        try:
+            members = list_json_members(file_path, name)
+        except CORRUPT_ERRORS:
+            # zip 的目录在文件末尾，上传完成前无法读取
+            raise ValueError('zip 文件不完整，需要上传完成后才能预览')
+        if not members:
+            raise ValueError('压缩包中没有JSON文件')
+            
+        is_zip = members != [None]
+        budget = SizeBudget(max_decompressed)
+        raw_budget = SizeBudget(None)
+        chats = []
+        count = 0
+        complete = True
+        truncated = False
+        timed_out = False
+        
+        for member in members:
+            if count >= limit or time.perf_counter() >= read_deadline:
+                complete = False
+                break
+                
+            try:
+                prefix = self.streaming_processor.detect_messages_prefix(
+                    file_path, member, budget, name, deadline=read_deadline
+                )
+            except PrefixDetectionTimeout:
+                timed_out = True
+                complete = False
+                break
+            except _TRUNCATED_ERRORS as e:
+                raise ValueError(f"JSON格式错误: {str(e)}")
+            source = f"{name}:{member}" if member else name
+            messages = []
+            chats.append((source, messages))
+            try:
+                with open_json_stream(file_path, member, budget, None if is_zip else raw_budget, name) as stream:
+                    for item in ijson.items(stream, prefix, use_float=True, buf_size=IJSON_BUFFER_SIZE):
+                        if not isinstance(item, dict):
+                            continue
+                        messages.append(item)
+                        count += 1
+                        if count >= limit or time.perf_counter() >= read_deadline:
+                            complete = False
+                            break
+            except _TRUNCATED_ERRORS:
+                # 分块上传未完成时读到已接收部分的末尾
+                truncated = True
+                complete = False
+                break
+                
+        if is_zip:
+            with zipfile.ZipFile(file_path) as archive:
+                total_bytes = sum(archive.getinfo(member).file_size for member in members)
+            bytes_read = budget.used
+        else:
+            total_bytes = total_size
+            bytes_read = raw_budget.used
+            
+        return chats, {
+            'messages': count,
+            'chats': len(chats),
+            'complete': complete and received >= total_size,
+            'truncated': truncated,
+            'timed_out': timed_out,
+            'bytes_read': bytes_read,
+            'coverage': round(min(bytes_read / total_bytes, 1.0), 4) if total_bytes else 1.0
+        }
+    
+    def _read_spread(self, file_path: Path, name: str, received: int, total_size: int, limit: int,
+                     windows: int, read_deadline: float
+                     ) -> Tuple[List[Tuple[str, List[Dict[str, Any]]]], Dict[str, Any]]:
+        """在已接收的数据中等间距读取 windows 个窗口，每个窗口最多 limit / windows 条连续消息"""
+        per_window = max(1, limit // windows)
+        chats = []
+        count = 0
+        bytes_covered = 0
+        
+        with open(file_path, 'rb') as f:
+            for index in range(windows):
+                if time.perf_counter() >= read_deadline:
+                    break
+                f.seek(received * index // windows)
+                text = f.read(PREVIEW_WINDOW_BYTES).decode('utf-8', errors='ignore')
+                messages, span = self._decode_window(text, per_window)
+                if messages:
+                    chats.append((f"{name}#window{index + 1}", messages))
+                    count += len(messages)
+                    bytes_covered += len(span.encode('utf-8'))
+        
+        # 样本的消息密度外推到整个文件
+        return chats, {
+            'messages': count,
+            'chats': len(chats),
+            'windows': windows,
+            'complete': False,
+            'truncated': False,
+            'timed_out': False,
+            'bytes_read': bytes_covered,
+            'coverage': round(min(bytes_covered / total_size, 1.0), 4) if total_size else 1.0
+        }
+    
+    def _decode_window(self, text: str, limit: int) -> Tuple[List[Dict[str, Any]], str]:
+        """从任意位置开始的文本中解析连续的消息对象，返回 (消息, 覆盖的文本)"""
+        messages = []
+        first = last = None
+        position = 0
+        while len(messages) < limit:
+            match = _OBJECT_START.search(text, position)
+            if match is None:
+                break
+            start = match.end() - 1
+            try:
+                item, end = self._decoder.raw_decode(text, start)
+            except ValueError:
+                position = match.end()
+                continue
+            if not _looks_like_message(item):
+                position = match.end()
+                continue
+            messages.append(item)
+            first = start if first is None else first
+            last = position = end
+        return messages, text[first:last] if messages else ''
+    
+    def _estimate(self, sample_info: Dict[str, Any], kept: int, processed: int, extracted: int,
+                  compression: Optional[str], total_size: int, per_message: float) -> Dict[str, Any]:
+        """
+        按样本占文件的比例外推消息数、问答对数和处理时间
+        
+        样本不完整且完成提取的消息少于 MIN_ESTIMATE_MESSAGES 时外推误差太大，
+        消息数和问答对数返回 None（insufficient_sample），处理时间只按历史上传估算。
+        
+        Args:
+            kept: 样本中水位线过滤、标准化后保留的消息数
+            processed: 其中在时间预算内完成提取的消息数
+            extracted: 这些消息提取出的候选数
+            per_message: 预览中每条保留消息的提取和分类时间
+        """
+        exact = sample_info['complete'] and processed == kept
+        insufficient = not exact and processed < MIN_ESTIMATE_MESSAGES
+        coverage = sample_info['coverage']
+        scale = 1.0 if sample_info['complete'] or not coverage else 1.0 / coverage
+        new_messages = kept * scale
+        
+        if insufficient:
+            estimates = {'exact': False, 'insufficient_sample': True,
+                         'messages': None, 'new_messages': None, 'qa_pairs': None}
+        else:
+            estimates = {
+                'exact': exact,
+                'insufficient_sample': False,
+                'messages': round(sample_info['messages'] * scale),
+                'new_messages': round(new_messages),
+                'qa_pairs': round(extracted / processed * new_messages) if processed else 0
+            }
+            
+        seconds_per_byte = self._history_rate(compression)
+        if seconds_per_byte is not None:
+            estimates['processing_time'] = round(seconds_per_byte * total_size, 1)
+            estimates['time_basis'] = 'history'
+        elif insufficient:
+            estimates['processing_time'] = None
+            estimates['time_basis'] = None
+        else:
+            # 预览速度不含解析和数据库写入，偏乐观
+            estimates['processing_time'] = round(per_message * new_messages, 1)
+            estimates['time_basis'] = 'preview'
+        return estimates
+    
+    def _history_rate(self, compression: Optional[str]) -> Optional[float]:
+        """最近完成的同类（相同压缩格式）上传的平均每字节处理时间"""
+        try:
+            recent = UploadHistory.query.filter(
+                UploadHistory.status == 'completed',
+                UploadHistory.processing_time > 0,
+                UploadHistory.file_size > 0
+            ).order_by(UploadHistory.uploaded_at.desc()).limit(HISTORY_SAMPLE_SIZE * 3).all()
+        except Exception as e:
+            logger.warning(f"Failed to load upload history for preview: {str(e)}")
+            return None
+            
+        similar = [u for u in recent if get_compression(u.filename) == compression][:HISTORY_SAMPLE_SIZE]
+        total_bytes = sum(u.file_size for u in similar)
+        if not total_bytes:
+            return None
+        return sum(u.processing_time for u in similar) / total_bytes
+
+
+# 全局预览服务实例
+upload_preview_service = UploadPreviewService()
+
+
+def get_upload_preview_service() -> UploadPreviewService:
+    """获取上传预览服务实例"""
+    return upload_preview_service
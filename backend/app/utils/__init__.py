@@ -3,21 +3,21 @@
 """
 
 from .cache import (
-    cached, 
-    get_cached, 
-    set_cached, 
-    delete_cached, 
-    clear_cache, 
-    get_cache_stats,
-    cache_key
+    cached,
+    cache_clear,
+    cache_stats,
+    cleanup_expired_cache,
+    get_cache_key,
+    search_cache,
+    category_cache
 )
 
 __all__ = [
     'cached',
-    'get_cached',
-    'set_cached', 
-    'delete_cached',
-    'clear_cache',
-    'get_cache_stats',
-    'cache_key'
-]
\ No newline at end of file
+    'cache_clear',
+    'cache_stats',
+    'cleanup_expired_cache',
+    'get_cache_key',
+    'search_cache',
+    'category_cache'
+]
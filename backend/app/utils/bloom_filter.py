@@ -0,0 +1,187 @@
+"""
+内存映射的布隆过滤器
+
+用于在不把全部内容指纹装进内存的情况下判断"指纹是否可能已存在"：
+- 返回 False 时一定不存在；返回 True 时以设定的误判率可能不存在（由调用方再查数据库确认）
+- 位数组放在文件里通过 mmap 访问，占用固定 capacity × 约1.44×log2(1/误判率) 位，
+  与实际指纹数无关；path 为 None 时使用匿名内存（如内存数据库的测试环境）
+- 只能添加，不能删除（删除的记录只会增加误判，不会漏判）
+
+文件开头是 HEADER_SIZE 字节的头部：格式标记、位数、哈希函数个数、容量、已添加数和
+一段由调用方使用的 JSON 元数据（如已同步到的记录ID），之后是位数组。
+
+哈希：32位十六进制的 MD5 指纹直接拆成两个64位整数（其他字符串先做 BLAKE2b），
+第 i 个位置为 (h1 + i × h2) mod 2^64 mod 位数（双重哈希）。
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from hashlib import blake2b
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+MAGIC = b'CLBF'
+FORMAT_VERSION = 1
+HEADER_SIZE = 4096
+_HEADER = struct.Struct('<4sHHQQQI')  # 标记、版本、哈希数、位数、容量、已添加数、元数据长度
+_MASK64 = (1 << 64) - 1
+
+
+def optimal_parameters(capacity: int, error_rate: float) -> Tuple[int, int]:
+    """容量和误判率对应的 (位数, 哈希函数个数)，位数取整到8的倍数"""
+    capacity = max(int(capacity), 1)
+    error_rate = min(max(error_rate, 1e-9), 0.5)
+    num_bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+    num_bits = (num_bits + 7) // 8 * 8
+    num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+    return num_bits, num_hashes
+
+
+def _hash_pair(fingerprint: str) -> Tuple[int, int]:
+    if len(fingerprint) == 32:
+        try:
+            return int(fingerprint[:16], 16), int(fingerprint[16:], 16) | 1
+        except ValueError:
+            pass
+    digest = blake2b(fingerprint.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+
+
+class BloomFilter:
+    """
+    布隆过滤器（线程安全）
+    
+    用 create() 新建、open() 打开已有文件；修改在 flush() 或 close() 时写回文件。
+    """
+    
+    def __init__(self, buffer: Union[mmap.mmap, bytearray], path: Optional[Path] = None):
+        self.path = path
+        self._buffer = buffer
+        self._lock = threading.Lock()
+        
+        magic, version, self.num_hashes, self.num_bits, self.capacity, self.count, meta_length = \
+            _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f'Not a bloom filter file: {path}')
+        meta = bytes(buffer[_HEADER.size:_HEADER.size + meta_length])
+        self.meta: Dict[str, Any] = json.loads(meta) if meta else {}
+        
+        # 逐个读写用 memoryview，批量操作用 numpy，两者都直接映射文件中的位数组
+        self._view = memoryview(buffer)[HEADER_SIZE:HEADER_SIZE + self.num_bits // 8]
+        self._bits = np.frombuffer(buffer, dtype=np.uint8, count=self.num_bits // 8, offset=HEADER_SIZE)
+        self._steps = np.arange(self.num_hashes, dtype=np.uint64)
+    
+    @classmethod
+    def create(cls, path: Optional[Path], capacity: int, error_rate: float) -> 'BloomFilter':
+        """新建空的过滤器（文件已存在时覆盖）"""
+        num_bits, num_hashes = optimal_parameters(capacity, error_rate)
+        size = HEADER_SIZE + num_bits // 8
+        header = _HEADER.pack(MAGIC, FORMAT_VERSION, num_hashes, num_bits, capacity, 0, 0)
+        
+        if path is None:
+            buffer = bytearray(size)
+            buffer[:len(header)] = header
+            return cls(buffer)
+            
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(header)
+            f.truncate(size)
+        return cls.open(path)
+    
+    @classmethod
+    def open(cls, path: Path) -> 'BloomFilter':
+        """打开过滤器文件（读写映射）"""
+        with open(path, 'r+b') as f:
+            buffer = mmap.mmap(f.fileno(), 0)
+        try:
+            return cls(buffer, Path(path))
+        except Exception:
+            buffer.close()
+            raise
+    
+    def _positions(self, fingerprint: str) -> List[int]:
+        h1, h2 = _hash_pair(fingerprint)
+        return [((h1 + i * h2) & _MASK64) % self.num_bits for i in range(self.num_hashes)]
+    
+    def _positions_many(self, fingerprints: List[str]) -> np.ndarray:
+        pairs = np.array([_hash_pair(fp) for fp in fingerprints], dtype=np.uint64).reshape(-1, 2)
+        with np.errstate(over='ignore'):
+            return (pairs[:, :1] + self._steps * pairs[:, 1:]) % np.uint64(self.num_bits)
+    
+    def add(self, fingerprint: str) -> bool:
+        """添加指纹，返回之前是否可能已存在"""
+        positions = self._positions(fingerprint)
+        with self._lock:
+            bits = self._view
+            existed = True
+            for position in positions:
+                byte, mask = position >> 3, 1 << (position & 7)
+                if not bits[byte] & mask:
+                    bits[byte] |= mask
+                    existed = False
+            if not existed:
+                self.count += 1
+        return existed
+    
+    def update(self, fingerprints: Iterable[str]):
+        """批量添加（计数按添加的条数累加，重复添加时会偏大）"""
+        fingerprints = list(fingerprints)
+        if not fingerprints:
+            return
+        positions = self._positions_many(fingerprints).ravel()
+        with self._lock:
+            np.bitwise_or.at(self._bits, positions >> np.uint64(3),
+                             np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+            self.count += len(fingerprints)
+    
+    def __contains__(self, fingerprint: str) -> bool:
+        bits = self._view
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(fingerprint))
+    
+    def contains_many(self, fingerprints: List[str]) -> List[bool]:
+        """批量判断（结果与逐个 in 相同）"""
+        if not fingerprints:
+            return []
+        positions = self._positions_many(fingerprints)
+        hits = (self._bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return hits.all(axis=1).tolist()
+    
+    @property
+    def size_bytes(self) -> int:
+        return HEADER_SIZE + self.num_bits // 8
+    
+    @property
+    def estimated_error_rate(self) -> float:
+        """按已添加数估算的当前误判率"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+    
+    def flush(self):
+        """写回头部（计数、元数据）并把位数组同步到文件"""
+        meta = json.dumps(self.meta).encode('utf-8')
+        if _HEADER.size + len(meta) > HEADER_SIZE:
+            raise ValueError('Bloom filter metadata too large')
+        with self._lock:
+            _HEADER.pack_into(self._buffer, 0, MAGIC, FORMAT_VERSION, self.num_hashes, self.num_bits,
+                              self.capacity, self.count, len(meta))
+            self._buffer[_HEADER.size:_HEADER.size + len(meta)] = meta
+            if isinstance(self._buffer, mmap.mmap):
+                self._buffer.flush()
+    
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap) and not self._buffer.closed:
+            self.flush()
+            self._view.release()
+            del self._bits
+            self._buffer.close()
+    
+    def replace_file(self, path: Path):
+        """把过滤器文件原子地移动到 path（重建时先写临时文件）"""
+        os.replace(self.path, path)
+        self.path = Path(path)
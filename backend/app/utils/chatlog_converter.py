@@ -0,0 +1,274 @@
+"""
+chatlog 导出数据转换为简单消息格式
+
+chatlog 导出的消息是带 contents / recordInfo 等嵌套结构的复杂对象，这里把它们转换为
+知识库使用的简单格式：{"id", "timestamp", "from_user", "content", "message_type"}。
+
+- 输入用 ijson 逐条读取（支持 .json、.json.gz、.json.zst 和 .zip，见 compressed_input），
+  输出边转换边写入（NDJSON 每行一条，或 JSON 数组），内存占用与文件大小无关
+- 多个文件用进程池并行转换，每个进程处理一个文件
+- extract_chatlog_content 同时被 DataExtractor 用于提取消息内容，两处规则保持一致
+
+命令行入口见项目根目录的 convert_chatlog_data.py。
+"""
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import ijson
+
+from app.utils.compressed_input import JSON_SUFFIXES, get_upload_suffix, list_json_members, open_json_stream
+from app.utils.streaming_processor import StreamingJSONProcessor
+
+OUTPUT_FORMATS = ('ndjson', 'json')
+MIN_CONTENT_LENGTH = 10  # 短于该长度的消息不转换
+SKIPPED_MESSAGE_TYPES = (3, 10000)  # 图片、系统消息
+
+_SENDER_PREFIX = re.compile(r'^[^:：]+[:：]\s*')
+_WHITESPACE = re.compile(r'\s+')
+_EMOJI_ONLY = re.compile(
+    r'^[\s\U0001F300-\U0001F9FF\u2600-\u27BF\u2B05-\u2B07\u2934-\u2935\u25B6\u25C0\u23CF-\u23FA\U0001F680-\U0001F6FF]+$'
+)
+_CONTENT_FIELDS = ('content', 'text', 'message', 'body')
+_WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def extract_chatlog_content(msg: Dict[str, Any]) -> str:
+    """
+    提取消息的文本内容
+    
+    优先使用 chatlog 的 contents.desc，其次是嵌套聊天记录中最长的一条，
+    都没有时取 content / text / message / body 字段；去掉"林: "这样的发送者前缀并合并空白。
+    """
+    content = ''
+    
+    # 优先处理chatlog格式的复杂内容结构
+    contents = msg.get('contents')
+    if isinstance(contents, dict):
+        if contents.get('desc'):
+            content = str(contents['desc']).strip()
+        elif contents.get('recordInfo') and contents['recordInfo'].get('DataList'):
+            data_list = contents['recordInfo']['DataList']
+            for item in data_list.get('DataItems') or ():
+                if item.get('DataDesc'):
+                    nested_content = str(item['DataDesc']).strip()
+                    if nested_content and len(nested_content) > len(content):
+                        content = nested_content
+    
+    # 如果没有找到复杂内容，尝试标准字段
+    if not content:
+        for name in _CONTENT_FIELDS:
+            if msg.get(name):
+                content = str(msg[name]).strip()
+                break
+                
+    if content:
+        content = _SENDER_PREFIX.sub('', content)
+        content = _WHITESPACE.sub(' ', content).strip()
+        
+    return content
+
+
+def parse_timestamp(time_str: Any) -> int:
+    """ISO 时间字符串转换为毫秒时间戳，无法解析时使用当前时间"""
+    try:
+        return int(datetime.fromisoformat(str(time_str).replace('Z', '+00:00')).timestamp() * 1000)
+    except ValueError:
+        return int(time.time() * 1000)
+
+
+def convert_message(msg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """转换一条消息（不含 id），系统消息、空消息、过短和纯表情的消息返回 None"""
+    if msg.get('type') in SKIPPED_MESSAGE_TYPES or not msg.get('senderName'):
+        return None
+        
+    content = extract_chatlog_content(msg)
+    if len(content) < MIN_CONTENT_LENGTH or _EMOJI_ONLY.match(content):
+        return None
+        
+    return {
+        'timestamp': parse_timestamp(msg.get('time', '')),
+        'from_user': msg['senderName'],
+        'content': content,
+        'message_type': 'text'
+    }
+
+
+def iter_converted(messages: Iterable[Dict[str, Any]], start_id: int = 1) -> Iterator[Dict[str, Any]]:
+    """逐条转换消息，有效消息按顺序编号为 msg_000001、msg_000002……"""
+    message_id = start_id
+    for msg in messages:
+        if not isinstance(msg, dict):
+            continue
+        converted = convert_message(msg)
+        if converted is None:
+            continue
+        yield {'id': f"msg_{message_id:06d}", **converted}
+        message_id += 1
+
+
+@dataclass
+class ConversionResult:
+    """一个文件的转换结果"""
+    input_path: str
+    output_path: str
+    input_bytes: int = 0
+    messages: int = 0
+    converted: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+    samples: List[Dict[str, Any]] = field(default_factory=list)
+    
+    @property
+    def success(self) -> bool:
+        return self.error is None
+    
+    @property
+    def messages_per_second(self) -> float:
+        return self.messages / self.seconds if self.seconds > 0 else 0.0
+    
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.input_bytes / 1024 / 1024 / self.seconds if self.seconds > 0 else 0.0
+
+
+def output_format_for(output_path: Path) -> str:
+    """按输出文件后缀确定格式：.json 写 JSON 数组，其他写 NDJSON"""
+    return 'json' if Path(output_path).suffix.lower() == '.json' else 'ndjson'
+
+
+def output_name_for(input_path: Path, output_format: str = 'ndjson') -> str:
+    """输入文件对应的输出文件名（去掉 .json / .json.gz 等后缀）"""
+    name = Path(input_path).name
+    suffix = get_upload_suffix(name)
+    stem = name[:-len(suffix)] if suffix in JSON_SUFFIXES else Path(name).stem
+    return f"{stem}.{output_format}"
+
+
+def iter_chatlog_messages(input_path: Path) -> Iterator[Dict[str, Any]]:
+    """逐条读取导出文件（zip 中的多个 JSON 依次读取）中的原始消息"""
+    detector = StreamingJSONProcessor()
+    for member in list_json_members(input_path):
+        prefix = detector.detect_messages_prefix(input_path, member)
+        with open_json_stream(input_path, member) as stream:
+            yield from ijson.items(stream, prefix, use_float=True)
+
+
+def convert_file(input_path: Path, output_path: Path, output_format: Optional[str] = None,
+                 sample_size: int = 0) -> ConversionResult:
+    """
+    流式转换一个导出文件
+    
+    先写到同目录的临时文件，完成后再替换 output_path，转换失败不会留下不完整的输出。
+    
+    Args:
+        output_format: 'ndjson' 或 'json'，为 None 时按输出文件后缀确定
+        sample_size: 结果中保留的转换样例条数
+        
+    Raises:
+        ValueError: 文件中没有可识别的消息数组
+        ijson.JSONError: JSON 格式错误
+    """
+    input_path, output_path = Path(input_path), Path(output_path)
+    output_format = output_format or output_format_for(output_path)
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'Unsupported output format: {output_format}')
+        
+    result = ConversionResult(str(input_path), str(output_path), input_bytes=input_path.stat().st_size)
+    started = time.perf_counter()
+    
+    def counted(messages):
+        for msg in messages:
+            result.messages += 1
+            yield msg
+            
+    temp_path = output_path.with_name(f".{output_path.name}.tmp")
+    try:
+        with open(temp_path, 'w', encoding='utf-8', buffering=_WRITE_BUFFER_SIZE) as out:
+            separator = '\n' if output_format == 'ndjson' else ',\n'
+            if output_format == 'json':
+                out.write('[\n')
+            for converted in iter_converted(counted(iter_chatlog_messages(input_path))):
+                if result.converted:
+                    out.write(separator)
+                out.write(json.dumps(converted, ensure_ascii=False))
+                result.converted += 1
+                if len(result.samples) < sample_size:
+                    result.samples.append(converted)
+            out.write('\n]\n' if output_format == 'json' else ('\n' if result.converted else ''))
+        os.replace(temp_path, output_path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+        
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def _convert_in_worker(input_path: str, output_path: str, output_format: Optional[str],
+                       sample_size: int) -> ConversionResult:
+    """进程池中转换一个文件，错误记录在结果里而不是抛出"""
+    try:
+        return convert_file(Path(input_path), Path(output_path), output_format, sample_size)
+    except Exception as e:
+        size = Path(input_path).stat().st_size if Path(input_path).exists() else 0
+        return ConversionResult(input_path, output_path, input_bytes=size,
+                                error=f"{type(e).__name__}: {' '.join(str(e).split())}")
+
+
+def convert_files(jobs: List[tuple], workers: Optional[int] = None, output_format: Optional[str] = None,
+                  sample_size: int = 0,
+                  on_result: Optional[Callable[[ConversionResult], None]] = None) -> List[ConversionResult]:
+    """
+    并行转换多个文件
+    
+    Args:
+        jobs: (输入文件, 输出文件) 列表
+        workers: 进程数，默认为 CPU 核数（不超过文件数）；为 1 时在当前进程中依次转换
+        on_result: 每个文件完成时回调（按完成顺序，用于显示进度）
+        
+    Returns:
+        List[ConversionResult]: 与 jobs 顺序相同的转换结果
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs) or 1))
+    results: List[Optional[ConversionResult]] = [None] * len(jobs)
+    
+    if workers == 1:
+        for index, (input_path, output_path) in enumerate(jobs):
+            results[index] = _convert_in_worker(str(input_path), str(output_path), output_format, sample_size)
+            if on_result:
+                on_result(results[index])
+        return results
+        
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 大文件先提交，避免最后只剩一个大文件在单核上转换
+        order = sorted(range(len(jobs)), key=lambda i: Path(jobs[i][0]).stat().st_size, reverse=True)
+        futures = {
+            executor.submit(_convert_in_worker, str(jobs[i][0]), str(jobs[i][1]), output_format, sample_size): i
+            for i in order
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if on_result:
+                on_result(results[futures[future]])
+    return results
+
+
+def find_input_files(paths: Iterable[Path]) -> List[Path]:
+    """展开输入路径：目录中按文件名顺序取所有 .json / .json.gz / .json.zst / .zip 文件（不递归）"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(
+                child for child in path.iterdir()
+                if child.is_file() and get_upload_suffix(child.name) in JSON_SUFFIXES
+            ))
+        else:
+            files.append(path)
+    return files
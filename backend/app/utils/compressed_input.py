@@ -0,0 +1,152 @@
+"""
+压缩上传文件的流式读取
+
+支持 .json.gz、.json.zst（需要安装 zstandard）和 .zip（一个压缩包包含多个聊天的 JSON 文件）。
+解压后的数据直接交给 ijson 增量解析，不写入磁盘也不整体读入内存。
+解压出的字节数受 SizeBudget 限制，超过时抛出 DecompressedSizeError，防止压缩炸弹；
+zip 包中各成员共用同一个额度。
+"""
+import gzip
+import re
+import zipfile
+from contextlib import ExitStack, contextmanager
+from pathlib import Path, PurePath
+from typing import BinaryIO, Iterator, List, Optional
+
+from werkzeug.utils import secure_filename
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+# 压缩格式按文件名后缀识别（复合后缀在前）
+COMPRESSED_SUFFIXES = {
+    '.json.gz': 'gzip',
+    '.json.zst': 'zstd',
+    '.zip': 'zip'
+}
+JSON_SUFFIXES = ('.json',) + tuple(COMPRESSED_SUFFIXES)
+
+# 打开压缩数据时可能出现的损坏错误
+CORRUPT_ERRORS = (gzip.BadGzipFile, zipfile.BadZipFile, EOFError) + (
+    (zstandard.ZstdError,) if ZSTD_AVAILABLE else ()
+)
+
+
+class DecompressedSizeError(ValueError):
+    """解压后的数据超过大小限制"""
+
+
+def get_upload_suffix(filename) -> str:
+    """上传文件的类型后缀（如 '.json.gz'），不支持的类型返回最后一个后缀"""
+    name = PurePath(str(filename)).name.lower()
+    for suffix in JSON_SUFFIXES:
+        if name.endswith(suffix):
+            return suffix
+    return PurePath(name).suffix
+
+
+def secure_upload_name(filename, default_stem: str = 'chatlog') -> str:
+    """
+    保存上传文件用的安全文件名，保留原文件名的类型后缀
+    
+    secure_filename 会去掉中文等非 ASCII 字符：'聊天记录.zip' 变成 'zip'、'群聊.json.gz' 变成 'json.gz'，
+    后缀随之丢失或变成 '.gz'。这里只对主干调用 secure_filename（为空时用 default_stem），后缀取自原文件名。
+    """
+    name = PurePath(str(filename or '')).name
+    suffix = get_upload_suffix(name)
+    if not re.fullmatch(r'(\.[a-z0-9]+)+', suffix):
+        suffix = ''
+    stem = name[:len(name) - len(suffix)] if suffix else name
+    return f"{secure_filename(stem) or default_stem}{suffix}"
+
+
+def get_compression(filename) -> Optional[str]:
+    """压缩格式（'gzip' / 'zstd' / 'zip'），未压缩时返回 None"""
+    return COMPRESSED_SUFFIXES.get(get_upload_suffix(filename))
+
+
+class SizeBudget:
+    """解压字节数额度"""
+    
+    def __init__(self, max_size: Optional[int]):
+        self.max_size = max_size
+        self.used = 0
+    
+    def consume(self, size: int):
+        self.used += size
+        if self.max_size is not None and self.used > self.max_size:
+            raise DecompressedSizeError(f'解压后的数据超过 {self.max_size // (1024 * 1024)}MB')
+
+
+class SizeLimitedReader:
+    """按额度计数的只读流包装（ijson 只需要 read）"""
+    
+    def __init__(self, stream: BinaryIO, budget: SizeBudget):
+        self.stream = stream
+        self.budget = budget
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.budget.consume(len(data))
+        return data
+
+
+def list_json_members(file_path: Path, name: Optional[str] = None) -> List[Optional[str]]:
+    """
+    文件中的 JSON 数据：zip 返回其中 .json 成员名（跳过目录和 __MACOSX），
+    其他格式返回 [None] 表示整个文件
+    
+    name 为识别压缩格式用的文件名（如分块上传的 .part 文件），默认取 file_path
+    """
+    if get_compression(name or file_path) != 'zip':
+        return [None]
+        
+    with zipfile.ZipFile(file_path) as archive:
+        return [
+            info.filename for info in archive.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith('__MACOSX/')
+            and info.filename.lower().endswith('.json')
+        ]
+
+
+@contextmanager
+def open_json_stream(file_path: Path, member: Optional[str] = None,
+                     budget: Optional[SizeBudget] = None,
+                     raw_budget: Optional[SizeBudget] = None,
+                     name: Optional[str] = None) -> Iterator[BinaryIO]:
+    """
+    打开解压后的 JSON 字节流
+    
+    Args:
+        file_path: 上传文件路径
+        member: zip 成员名（见 list_json_members）
+        budget: 解压额度，为 None 时不限制（未压缩文件不计数）
+        raw_budget: 统计从文件读取的原始（压缩）字节数，用于按读取比例估算整个文件；
+            zip 需要随机读取，不统计
+        name: 识别压缩格式用的文件名，默认取 file_path
+    """
+    compression = get_compression(name or file_path)
+    with ExitStack() as stack:
+        if compression == 'zip':
+            archive = stack.enter_context(zipfile.ZipFile(file_path))
+            stream = stack.enter_context(archive.open(member))
+        else:
+            raw = stack.enter_context(open(file_path, 'rb'))
+            if raw_budget is not None:
+                raw = SizeLimitedReader(raw, raw_budget)
+            if compression is None:
+                yield raw
+                return
+            if compression == 'gzip':
+                stream = stack.enter_context(gzip.GzipFile(fileobj=raw, mode='rb'))
+            else:
+                if not ZSTD_AVAILABLE:
+                    raise ValueError('服务器未安装 zstandard，无法读取 .json.zst 文件')
+                stream = stack.enter_context(zstandard.ZstdDecompressor().stream_reader(raw))
+                
+        yield SizeLimitedReader(stream, budget) if budget is not None else stream
@@ -0,0 +1,33 @@
+"""
+问答内容指纹
+
+去掉标点和多余空白、转为小写后，取问题和回答各前200字与提问者、回答者一起做 MD5。
+qa_pairs 和 raw_qa_pairs 的 content_fingerprint 列都用它计算，上传去重按指纹比较。
+"""
+import hashlib
+import re
+
+_PUNCTUATION = re.compile(r'[^\w\s\u4e00-\u9fff]')
+_WHITESPACE = re.compile(r'\s+')
+
+FINGERPRINT_TEXT_LENGTH = 200  # 参与指纹的问题、回答长度（标准化之后）
+
+
+def normalize_text(text) -> str:
+    """标准化文本：移除标点和多余空白，转为小写"""
+    if not text:
+        return ""
+    text = _PUNCTUATION.sub('', text)
+    text = _WHITESPACE.sub(' ', text)
+    return text.lower().strip()
+
+
+def content_fingerprint(question, answer, asker=None, advisor=None) -> str:
+    """问答对的内容指纹（32位十六进制 MD5）"""
+    content = "|".join((
+        normalize_text(question)[:FINGERPRINT_TEXT_LENGTH],
+        normalize_text(answer)[:FINGERPRINT_TEXT_LENGTH],
+        normalize_text(asker),
+        normalize_text(advisor)
+    ))
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
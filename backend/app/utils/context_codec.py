@@ -0,0 +1,255 @@
+"""
+问答上下文压缩编码
+
+original_context 以压缩后的二进制（qa_pairs.context_blob）存储。首字节标记编码方式：
+- 0x00: 未压缩的 UTF-8 文本（压缩后反而更大时使用）
+- 0x01: zlib，使用内置的预置字典（上下文 JSON 的常见键名和聊天高频词）
+- 0x02: zstd（需要安装 zstandard），不带字典首部的旧格式；使用字典时按帧头中的字典ID解压
+- 0x03: zstd，首字节后是 4 字节（大端）字典ID，再后是压缩数据
+
+训练得到的 zstd 字典按字典ID保存在 context_dictionaries 表（所有进程共享）。重新训练只新增
+字典、不覆盖旧字典，解压时按数据中的字典ID加载对应字典，各进程不依赖本进程内的“当前字典”。
+"""
+import logging
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+CODEC_RAW = 0x00
+CODEC_ZLIB = 0x01
+CODEC_ZSTD = 0x02
+CODEC_ZSTD_DICT = 0x03
+
+DICT_ID_SIZE = 4
+CURRENT_DICTIONARY_REFRESH = 60.0  # 重新读取当前字典ID的间隔（秒），新训练的字典在此时间内被各进程采用
+
+# zlib 预置字典：越靠后的内容在匹配时距离越近，高频片段放在末尾
+ZLIB_DICTIONARY = (
+    '"classification_method": "ai", "classification_confidence": '
+    '"ai_processed": true, "reviewed": true, "raw_qa_id": '
+    '"question_timestamp": "", "answer_timestamp": "", '
+    '谢谢 好的 收到 请问 您好 老师 客服 产品 价格 费用 安装 使用 教程 售后 退款 '
+    '问题 怎么 如何 为什么 可以 不能 需要 建议 方法 步骤 解决 处理 一下 这个 那个 '
+    '吗？", "我", "'
+).encode('utf-8')
+
+
+class ZstdDictionaryStore:
+    """
+    zstd 字典仓库
+    
+    字典内容按ID不可变，加载后缓存在进程内；当前用于压缩的字典ID定期重新读取，
+    其他进程训练的新字典无需重启即可生效。
+    """
+    
+    def __init__(self, loader: Optional[Callable[[int], Optional[bytes]]] = None,
+                 current_loader: Optional[Callable[[], Optional[int]]] = None,
+                 refresh_interval: float = CURRENT_DICTIONARY_REFRESH):
+        """
+        Args:
+            loader: 按字典ID读取字典内容，不存在时返回 None
+            current_loader: 读取当前用于压缩的字典ID，没有时返回 None
+            refresh_interval: 重新读取当前字典ID的间隔（秒）
+        """
+        self._loader = loader
+        self._current_loader = current_loader
+        self.refresh_interval = refresh_interval
+        self._dictionaries: Dict[int, 'zstandard.ZstdCompressionDict'] = {}
+        self._default_id: Optional[int] = None  # 仓库中没有字典时使用的字典（旧版本的字典文件）
+        self._current_id: Optional[int] = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def add(self, data: bytes, default: bool = False) -> int:
+        """登记字典内容，返回字典ID"""
+        dictionary = zstandard.ZstdCompressionDict(data)
+        dict_id = dictionary.dict_id()
+        if not dict_id:
+            raise ValueError('zstd context dictionary has no dictionary id')
+        self._dictionaries.setdefault(dict_id, dictionary)
+        if default:
+            self._default_id = dict_id
+        return dict_id
+    
+    def get(self, dict_id: int) -> 'zstandard.ZstdCompressionDict':
+        """按字典ID获取字典（未缓存时从仓库加载）"""
+        dictionary = self._dictionaries.get(dict_id)
+        if dictionary is None and self._loader is not None:
+            data = self._loader(dict_id)
+            if data:
+                self.add(data)
+                dictionary = self._dictionaries.get(dict_id)
+        if dictionary is None:
+            raise ValueError(f'zstd context dictionary {dict_id} not found')
+        return dictionary
+    
+    def current(self) -> Optional['zstandard.ZstdCompressionDict']:
+        """当前用于压缩的字典，没有时返回 None"""
+        if self._current_loader is not None:
+            with self._lock:
+                now = time.monotonic()
+                if self._checked_at is None or now - self._checked_at >= self.refresh_interval:
+                    try:
+                        self._current_id = self._current_loader()
+                    except Exception as e:
+                        logger.debug(f"Failed to read current context dictionary: {str(e)}")
+                    self._checked_at = now
+                    
+        dict_id = self._current_id or self._default_id
+        return self.get(dict_id) if dict_id else None
+    
+    def refresh(self):
+        """下次压缩前重新读取当前字典ID"""
+        with self._lock:
+            self._checked_at = None
+
+
+class ContextCodec:
+    """上下文压缩编解码器"""
+    
+    def __init__(self, method: str = 'zlib', level: int = 6, dictionaries: Optional[ZstdDictionaryStore] = None):
+        if method == 'zstd' and not ZSTD_AVAILABLE:
+            logger.warning("zstandard is not installed, falling back to zlib context compression")
+            method = 'zlib'
+            
+        self.method = method
+        self.level = level
+        self.dictionaries = dictionaries if dictionaries is not None or not ZSTD_AVAILABLE else ZstdDictionaryStore()
+    
+    def encode(self, text: Optional[str]) -> Optional[bytes]:
+        """压缩上下文文本"""
+        if text is None:
+            return None
+            
+        raw = text.encode('utf-8')
+        if self.method == 'zstd':
+            dictionary = self.dictionaries.current()
+            if dictionary is not None:
+                compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+                header = bytes([CODEC_ZSTD_DICT]) + dictionary.dict_id().to_bytes(DICT_ID_SIZE, 'big')
+            else:
+                compressor = zstandard.ZstdCompressor(level=self.level)
+                header = bytes([CODEC_ZSTD])
+            payload = header + compressor.compress(raw)
+        else:
+            compressor = zlib.compressobj(self.level, zdict=ZLIB_DICTIONARY)
+            payload = bytes([CODEC_ZLIB]) + compressor.compress(raw) + compressor.flush()
+            
+        if len(payload) >= len(raw) + 1:
+            return bytes([CODEC_RAW]) + raw
+        return payload
+    
+    def decode(self, blob: Optional[bytes]) -> Optional[str]:
+        """解压上下文文本（zstd 数据按其中的字典ID选择字典）"""
+        if blob is None:
+            return None
+        if not blob:
+            return ''
+            
+        codec, payload = blob[0], bytes(blob[1:])
+        if codec == CODEC_RAW:
+            return payload.decode('utf-8')
+        if codec == CODEC_ZLIB:
+            decompressor = zlib.decompressobj(zdict=ZLIB_DICTIONARY)
+            return (decompressor.decompress(payload) + decompressor.flush()).decode('utf-8')
+        if codec in (CODEC_ZSTD, CODEC_ZSTD_DICT):
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError('zstandard is required to decode this context')
+            if codec == CODEC_ZSTD_DICT:
+                dict_id = int.from_bytes(payload[:DICT_ID_SIZE], 'big')
+                payload = payload[DICT_ID_SIZE:]
+            else:
+                dict_id = zstandard.get_frame_parameters(payload).dict_id
+            dictionary = self.dictionaries.get(dict_id) if dict_id else None
+            decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+            return decompressor.decompress(payload).decode('utf-8')
+            
+        raise ValueError(f'Unknown context codec: {codec}')
+
+
+def train_zstd_dictionary(samples: List[str], dict_size: int = 16 * 1024) -> bytes:
+    """
+    用语料样本训练 zstd 字典
+    
+    Args:
+        samples: 上下文文本样本
+        dict_size: 字典大小（字节）
+        
+    Returns:
+        bytes: 字典内容
+    """
+    if not ZSTD_AVAILABLE:
+        raise RuntimeError('zstandard is required to train a compression dictionary')
+        
+    dictionary = zstandard.train_dictionary(dict_size, [s.encode('utf-8') for s in samples if s])
+    return dictionary.as_bytes()
+
+
+# 全局编解码器（未初始化时使用 zlib 默认配置）
+_context_codec = ContextCodec()
+
+
+def get_context_codec() -> ContextCodec:
+    """获取当前上下文编解码器"""
+    return _context_codec
+
+
+def _load_dictionary(dict_id: int) -> Optional[bytes]:
+    """从 context_dictionaries 表读取字典（独立连接，不触发当前会话的 autoflush）"""
+    from app import db
+    from app.models import ContextDictionary
+    
+    table = ContextDictionary.__table__
+    with db.engine.connect() as conn:
+        return conn.execute(select(table.c.data).where(table.c.dict_id == dict_id)).scalar()
+
+
+def _load_current_dictionary_id() -> Optional[int]:
+    """最近训练的字典ID"""
+    from app import db
+    from app.models import ContextDictionary
+    
+    table = ContextDictionary.__table__
+    with db.engine.connect() as conn:
+        return conn.execute(select(table.c.dict_id)
+                            .order_by(table.c.created_at.desc(), table.c.dict_id.desc()).limit(1)).scalar()
+
+
+def load_context_codec(config) -> ContextCodec:
+    """按配置创建编解码器（字典从 context_dictionaries 表按ID加载）"""
+    method = config.get('CONTEXT_COMPRESSION', 'zlib')
+    level = config.get('CONTEXT_COMPRESSION_LEVEL', 6)
+    if not ZSTD_AVAILABLE:
+        return ContextCodec(method=method, level=level)
+        
+    dictionaries = ZstdDictionaryStore(_load_dictionary, _load_current_dictionary_id)
+    
+    # 旧版本把唯一的字典保存在文件中：登记后历史 zstd 数据仍可解压，表中没有字典时继续用它压缩
+    dict_path = config.get('CONTEXT_ZSTD_DICT_PATH')
+    if dict_path and Path(dict_path).exists():
+        try:
+            dictionaries.add(Path(dict_path).read_bytes(), default=True)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable context dictionary {dict_path}: {str(e)}")
+            
+    return ContextCodec(method=method, level=level, dictionaries=dictionaries)
+
+
+def init_context_codec(app) -> ContextCodec:
+    """按应用配置初始化全局编解码器"""
+    global _context_codec
+    _context_codec = load_context_codec(app.config)
+    return _context_codec
@@ -0,0 +1,98 @@
+"""
+内容指纹去重索引
+
+上传处理按内容指纹跳过已入库的问答对。批量上传时同一批文件在多个线程里共用一份索引，
+claim() 把"检查是否存在"和"登记"合成一个原子操作，两个文件里的相同问答对只会保存一次。
+
+已入库的指纹有两种来源：
+- 从数据库加载的指纹集合（未启用布隆过滤器时）
+- 布隆过滤器 + lookup 回调：过滤器判断不存在的直接通过，可能存在的再由 lookup 查数据库确认，
+  内存中只保留本次处理登记的指纹，与库中的数据量无关（见 fingerprint_filter）
+"""
+import threading
+from typing import Callable, Iterable, List, Optional, Set
+
+from .bloom_filter import BloomFilter
+
+
+class DedupIndex:
+    """
+    线程安全的内容指纹集合
+    
+    mirror 为另一个索引时，claim 成功的指纹同时登记到 mirror（正式问答对的指纹
+    也要让暂存表的去重看到）。
+    
+    bloom 不为 None 时 lookup 必须提供：lookup(指纹列表) 返回其中在数据库中确实存在的指纹；
+    claim 成功的指纹同时加入过滤器（事务回滚时只会多一次误判）。
+    """
+    
+    def __init__(self, fingerprints: Iterable[str] = (), mirror: Optional['DedupIndex'] = None,
+                 bloom: Optional[BloomFilter] = None,
+                 lookup: Optional[Callable[[List[str]], Set[str]]] = None):
+        self._fingerprints = set(fingerprints)
+        self._lock = threading.Lock()
+        self.mirror = mirror
+        self.bloom = bloom
+        self.lookup = lookup
+        self._checked: Set[str] = set()  # 已查过数据库、确认不存在的指纹
+        self.lookups = 0  # 查询数据库的指纹数（过滤器命中）
+    
+    def claim(self, fingerprint: str) -> bool:
+        """指纹未出现过时登记并返回 True，已存在返回 False"""
+        with self._lock:
+            if fingerprint in self._fingerprints:
+                return False
+            if self.bloom is not None and fingerprint not in self._checked and fingerprint in self.bloom:
+                self.lookups += 1
+                if self.lookup([fingerprint]):
+                    self._fingerprints.add(fingerprint)
+                    return False
+            self._fingerprints.add(fingerprint)
+            self._checked.discard(fingerprint)
+            if self.bloom is not None:
+                self.bloom.add(fingerprint)
+        if self.mirror is not None:
+            self.mirror.add(fingerprint)
+        return True
+    
+    def prefetch(self, fingerprints: List[str]):
+        """
+        一次查询一批指纹（过滤器命中的才查数据库），之后对它们的 claim 不再逐个查询
+        
+        未启用过滤器时不做任何事。
+        """
+        if self.bloom is None:
+            return
+        with self._lock:
+            candidates = [
+                fp for fp, hit in zip(fingerprints, self.bloom.contains_many(fingerprints))
+                if hit and fp not in self._fingerprints and fp not in self._checked
+            ]
+            candidates = list(dict.fromkeys(candidates))
+            if not candidates:
+                return
+            self.lookups += len(candidates)
+            existing = self.lookup(candidates)
+            self._fingerprints.update(existing)
+            self._checked.update(fp for fp in candidates if fp not in existing)
+    
+    def add(self, fingerprint: str):
+        with self._lock:
+            self._fingerprints.add(fingerprint)
+            self._checked.discard(fingerprint)
+    
+    def update(self, fingerprints: Iterable[str]):
+        with self._lock:
+            self._fingerprints.update(fingerprints)
+            self._checked.difference_update(self._fingerprints)
+    
+    def __iter__(self):
+        """已登记的指纹（使用过滤器时只有本次处理登记和确认存在的）"""
+        with self._lock:
+            return iter(list(self._fingerprints))
+    
+    def __contains__(self, fingerprint: str) -> bool:
+        return fingerprint in self._fingerprints
+    
+    def __len__(self) -> int:
+        return len(self._fingerprints)
@@ -0,0 +1,128 @@
+"""
+上传文件哈希
+
+接收上传时在写盘的同一遍循环里计算哈希，不再保存后重新读取整个文件：
+- content_hash：xxh3-128（需要安装 xxhash），未安装时使用 BLAKE2b-128，用于重复文件判断。
+  值带算法前缀（如 "xxh128:..."），不同算法的哈希不会互相比较
+- md5：仅在库里还有不能用当前 content_hash 比较的旧上传时计算，用于和旧记录比较
+- sample_hash：文件大小 + 开头 SAMPLE_SIZE 字节的哈希，分块上传收到开头部分即可判断疑似重复
+"""
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    xxhash = None
+    XXHASH_AVAILABLE = False
+
+READ_BUFFER_SIZE = 1024 * 1024  # 读写缓冲 1MB
+SAMPLE_SIZE = 64 * 1024
+
+CONTENT_HASH_ALGORITHM = 'xxh128' if XXHASH_AVAILABLE else 'blake2b'
+CONTENT_HASH_PREFIX = CONTENT_HASH_ALGORITHM + ':'
+
+
+@dataclass
+class FileHashes:
+    """一次读取得到的文件哈希"""
+    size: int
+    content_hash: str
+    sample_hash: str
+    md5: Optional[str] = None
+
+
+def _new_content_hasher():
+    if XXHASH_AVAILABLE:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def _content_digest(hasher) -> str:
+    return CONTENT_HASH_PREFIX + hasher.hexdigest()
+
+
+def compute_sample_hash(total_size: int, head: bytes) -> str:
+    """文件大小与开头字节的哈希"""
+    hasher = _new_content_hasher()
+    hasher.update(str(total_size).encode('ascii'))
+    hasher.update(b':')
+    hasher.update(head[:SAMPLE_SIZE])
+    return _content_digest(hasher)
+
+
+class UploadHasher:
+    """
+    增量文件哈希
+    
+    按接收顺序调用 update()，结束时 finish() 得到 FileHashes。total_size 已知时
+    （分块上传）收到开头 SAMPLE_SIZE 字节后 sample_hash 即可用。
+    """
+    
+    def __init__(self, total_size: Optional[int] = None, legacy_md5: bool = True):
+        self.total_size = total_size
+        self.size = 0
+        self._content = _new_content_hasher()
+        self._md5 = hashlib.md5() if legacy_md5 else None
+        self._head = bytearray()
+        self._sample_hash: Optional[str] = None
+    
+    def update(self, block: bytes):
+        self._content.update(block)
+        if self._md5 is not None:
+            self._md5.update(block)
+        if len(self._head) < SAMPLE_SIZE:
+            self._head += block[:SAMPLE_SIZE - len(self._head)]
+        self.size += len(block)
+    
+    @property
+    def sample_hash(self) -> Optional[str]:
+        """开头部分已收齐时返回样本哈希，否则返回 None"""
+        if self._sample_hash is None and self.total_size is not None and \
+                len(self._head) >= min(SAMPLE_SIZE, self.total_size):
+            self._sample_hash = compute_sample_hash(self.total_size, bytes(self._head))
+        return self._sample_hash
+    
+    def finish(self) -> FileHashes:
+        if self.total_size is None:
+            self.total_size = self.size
+        return FileHashes(
+            size=self.size,
+            content_hash=_content_digest(self._content),
+            sample_hash=self.sample_hash or compute_sample_hash(self.size, bytes(self._head)),
+            md5=self._md5.hexdigest() if self._md5 is not None else None
+        )
+
+
+def hash_file(file_path: Path, legacy_md5: bool = True) -> FileHashes:
+    """读取一遍文件计算哈希"""
+    hasher = UploadHasher(file_path.stat().st_size, legacy_md5)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BUFFER_SIZE), b''):
+            hasher.update(block)
+    return hasher.finish()
+
+
+def save_stream(stream: BinaryIO, file_path: Path, legacy_md5: bool = True,
+                max_size: Optional[int] = None) -> FileHashes:
+    """
+    把上传的数据流写入文件，同时计算哈希
+    
+    max_size 不为空时，写入超过该大小会删除已写入的部分并抛出 ValueError
+    （解压 zip 成员时不能只相信压缩包里记录的大小）。
+    """
+    hasher = UploadHasher(legacy_md5=legacy_md5)
+    try:
+        with open(file_path, 'wb') as f:
+            for block in iter(lambda: stream.read(READ_BUFFER_SIZE), b''):
+                if max_size is not None and hasher.size + len(block) > max_size:
+                    raise ValueError(f'文件大小超过 {max_size // (1024 * 1024)}MB')
+                f.write(block)
+                hasher.update(block)
+    except Exception:
+        file_path.unlink(missing_ok=True)
+        raise
+    return hasher.finish()
@@ -3,6 +3,7 @@
 """
 import psutil
 import gc
+import os
 import sys
 import logging
 import threading
@@ -68,8 +69,8 @@ class MemoryMonitor:
         # 回调函数
         self.alert_callbacks: List[Callable[[MemoryAlert], None]] = []
         
-        # 启用内存追踪
-        if not tracemalloc.is_tracing():
+        # 内存热点追踪会让所有内存分配变慢数倍（导入本模块的进程都受影响），只在显式开启时启用
+        if os.environ.get('MEMORY_TRACEMALLOC', 'false').lower() == 'true' and not tracemalloc.is_tracing():
             tracemalloc.start()
     
     def add_alert_callback(self, callback: Callable[[MemoryAlert], None]):
@@ -0,0 +1,175 @@
+"""
+列式消息缓冲区 - 标准化消息的紧凑存储
+
+标准化后的消息原本是一条一个 dict（内容、发送者、datetime、类型，外加原始消息引用），
+大群导出时 dict 本身比消息内容还占内存。这里按列存储：
+- 时间戳：int64 微秒（相对 1970-01-01 的本地时间，与 datetime 比较结果一致）
+- 发送者：驻留后的整数 ID + 发送者表
+- 内容：连续的字符串列表
+原始消息在标准化后即丢弃。
+"""
+from array import array
+from collections.abc import Sequence
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def datetime_to_micros(value: datetime) -> int:
+    """datetime 转为相对 EPOCH 的微秒数（带时区的时间先换算为 UTC）"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def micros_to_datetime(value: int) -> datetime:
+    """微秒数还原为 datetime"""
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+class MessageBuffer(Sequence):
+    """
+    列式消息缓冲区
+    
+    按下标访问时返回与标准化消息相同结构的 dict（content, sender, timestamp, msg_type），
+    切片返回新的缓冲区，因此可以直接替代原来的消息列表使用。提取器通过 timestamps、
+    sender_ids 两个 NumPy 列做向量化计算，features 列用于缓存每条消息的规则特征。
+    """
+    
+    def __init__(self, senders: Optional[List[str]] = None):
+        self.contents: List[str] = []
+        self.senders: List[str] = list(senders) if senders else []
+        self.features: List[Any] = []
+        self._sender_index = {sender: i for i, sender in enumerate(self.senders)}
+        self._timestamps = array('q')
+        self._sender_ids = array('i')
+        self._msg_types = array('q')
+        self._columns = None
+        self._sorted = None
+    
+    @classmethod
+    def from_messages(cls, messages: Iterable[Dict[str, Any]]) -> 'MessageBuffer':
+        """从标准化消息 dict 构建缓冲区"""
+        buffer = cls()
+        buffer.extend(messages)
+        return buffer
+    
+    def append(self, content: str, sender: str, timestamp: datetime, msg_type: Any = 1):
+        """追加一条消息"""
+        sender_id = self._sender_index.get(sender)
+        if sender_id is None:
+            sender_id = len(self.senders)
+            self.senders.append(sender)
+            self._sender_index[sender] = sender_id
+            
+        try:
+            msg_type = int(msg_type)
+        except (TypeError, ValueError):
+            msg_type = 0
+            
+        self.contents.append(content)
+        self.features.append(None)
+        self._timestamps.append(datetime_to_micros(timestamp))
+        self._sender_ids.append(sender_id)
+        self._msg_types.append(msg_type)
+        self._columns = None
+        self._sorted = None
+    
+    def append_message(self, message: Dict[str, Any]):
+        """追加一条标准化消息 dict"""
+        self.append(message['content'], message['sender'], message['timestamp'], message.get('msg_type', 1))
+    
+    def extend(self, messages: Iterable[Dict[str, Any]]):
+        """批量追加标准化消息"""
+        for message in messages:
+            self.append_message(message)
+    
+    def _get_columns(self):
+        if self._columns is None:
+            self._columns = (
+                np.frombuffer(self._timestamps, dtype=np.int64).copy(),
+                np.frombuffer(self._sender_ids, dtype=np.int32).copy()
+            )
+        return self._columns
+    
+    @property
+    def timestamps(self) -> np.ndarray:
+        """时间戳列（int64 微秒）"""
+        return self._get_columns()[0]
+    
+    @property
+    def sender_ids(self) -> np.ndarray:
+        """发送者ID列（int32）"""
+        return self._get_columns()[1]
+    
+    def content(self, index: int) -> str:
+        return self.contents[index]
+    
+    def sender(self, index: int) -> str:
+        return self.senders[self._sender_ids[index]]
+    
+    def timestamp(self, index: int) -> datetime:
+        return micros_to_datetime(self._timestamps[index])
+    
+    def is_sorted(self) -> bool:
+        """消息是否已按时间升序排列"""
+        if self._sorted is None:
+            self._sorted = bool(np.all(np.diff(self.timestamps) >= 0))
+        return self._sorted
+    
+    def sorted_by_time(self) -> 'MessageBuffer':
+        """按时间稳定排序（与 sorted(..., key=timestamp) 顺序一致）"""
+        if self.is_sorted():
+            return self
+        return self._take(np.argsort(self.timestamps, kind='stable').tolist())
+    
+    def _take(self, indices: List[int]) -> 'MessageBuffer':
+        """按下标列表取出消息组成新的缓冲区（沿用发送者表）"""
+        buffer = MessageBuffer(self.senders)
+        buffer.contents = [self.contents[i] for i in indices]
+        buffer.features = [self.features[i] for i in indices]
+        buffer._timestamps = array('q', (self._timestamps[i] for i in indices))
+        buffer._sender_ids = array('i', (self._sender_ids[i] for i in indices))
+        buffer._msg_types = array('q', (self._msg_types[i] for i in indices))
+        return buffer
+    
+    def __len__(self) -> int:
+        return len(self.contents)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return self._take(list(range(start, stop, step)))
+            buffer = MessageBuffer(self.senders)
+            buffer.contents = self.contents[start:stop]
+            buffer.features = self.features[start:stop]
+            buffer._timestamps = self._timestamps[start:stop]
+            buffer._sender_ids = self._sender_ids[start:stop]
+            buffer._msg_types = self._msg_types[start:stop]
+            return buffer
+            
+        return {
+            'content': self.contents[index],
+            'sender': self.senders[self._sender_ids[index]],
+            'timestamp': micros_to_datetime(self._timestamps[index]),
+            'msg_type': self._msg_types[index]
+        }
+    
+    def __getstate__(self):
+        # NumPy 列缓存和发送者反查表不参与序列化（分片发送到工作进程时更小）
+        state = self.__dict__.copy()
+        state['_columns'] = None
+        state['_sender_index'] = None
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._sender_index = {sender: i for i, sender in enumerate(self.senders)}
+    
+    def __repr__(self):
+        return f'<MessageBuffer {len(self)} messages, {len(self.senders)} senders>'
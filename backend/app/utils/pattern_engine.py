@@ -0,0 +1,85 @@
+"""
+规则匹配引擎
+
+DataExtractor 和 QAClassifier 的规则都是"某条正则是否在文本中出现"和"某个关键词是否出现"。
+这里把正则列表预编译成一次扫描的组合表达式，把关键词列表构建成 Aho-Corasick 自动机
+（需要安装 pyahocorasick，未安装时退回逐个子串判断），结果与逐条 re.search / in 判断一致。
+"""
+import re
+from typing import Dict, Hashable, Iterable, Set
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    ahocorasick = None
+    AHOCORASICK_AVAILABLE = False
+
+
+def simplify_search_pattern(pattern: str) -> str:
+    """
+    去掉 search 语义下多余的首尾 .*
+    
+    对 re.search 来说 '.*X.*' 与 'X' 是否命中完全相同，但前者在不命中时要做大量回溯。
+    """
+    if pattern.startswith('.*?'):
+        pattern = pattern[3:]
+    elif pattern.startswith('.*'):
+        pattern = pattern[2:]
+    if pattern.endswith('.*') and not pattern.endswith('\\.*'):
+        pattern = pattern[:-2]
+    return pattern
+
+
+class PatternSet:
+    """
+    组合正则集合
+    
+    每个规则（一组正则，任意一条命中即算命中）编译成一个可选的先行断言
+    (?=[\\s\\S]*?(?P<gN>p1|p2|...))?，在文本开头做一次 match 就能从命名分组得到
+    所有命中的规则。规则内的正则不能使用按序号的反向引用。
+    """
+    
+    def __init__(self, rules: Dict[Hashable, Iterable[str]], flags: int = re.IGNORECASE):
+        self.keys = list(rules.keys())
+        parts = []
+        alternatives = []
+        for index, key in enumerate(self.keys):
+            patterns = [f'(?:{simplify_search_pattern(p)})' for p in rules[key]]
+            if patterns:
+                parts.append(f'(?=[\\s\\S]*?(?P<g{index}>{"|".join(patterns)}))?')
+                alternatives.extend(patterns)
+        self._group_keys = {f'g{index}': key for index, key in enumerate(self.keys)}
+        self._regex = re.compile(''.join(parts), flags)
+        # 只关心是否命中时用普通的多选分支，一次 search 即可
+        self._any_regex = re.compile('|'.join(alternatives), flags) if alternatives else None
+    
+    def matches(self, text: str) -> Set[Hashable]:
+        """返回在文本中命中的规则键"""
+        groups = self._regex.match(text).groupdict()
+        return {self._group_keys[name] for name, value in groups.items() if value is not None}
+    
+    def search(self, text: str) -> bool:
+        """是否有任意规则命中"""
+        return self._any_regex is not None and self._any_regex.search(text) is not None
+
+
+class KeywordMatcher:
+    """关键词集合匹配：一次扫描找出文本中出现过的关键词"""
+    
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = list(dict.fromkeys(k for k in keywords if k))
+        self._automaton = None
+        
+        if AHOCORASICK_AVAILABLE and self.keywords:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+    
+    def find(self, text: str) -> Set[str]:
+        """返回文本中出现过的关键词"""
+        if self._automaton is not None:
+            return {keyword for _, keyword in self._automaton.iter(text)}
+        return {keyword for keyword in self.keywords if keyword in text}
+
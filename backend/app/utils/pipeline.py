@@ -0,0 +1,272 @@
+"""
+分阶段处理流水线
+
+上传处理的各个步骤（读取解析 → 标准化/暂存 → 问答提取 → 分类 → 入库）串成一条流水线，
+每个阶段是一个"迭代器进、迭代器出"的函数：
+- 普通阶段以生成器的方式在下游所在的线程里按需拉取，不额外占用内存
+- threaded=True 的阶段（连同它上游的普通阶段）在独立线程里运行，结果放进有界队列交给下游。
+  队列满时上游阻塞等待（背压），内存占用与文件大小无关；解压、解析、数据库写入等
+  可以释放 GIL 的步骤与下游的处理同时进行
+
+任一阶段抛出的异常会传递到调用 run() 的线程；cancel() 或下游提前停止读取时，
+所有阶段线程都会退出。每个阶段记录输入/输出条数、自身处理时间（不含等待上游和
+队列的时间）和队列深度，get_metrics() 返回的数据用于找出流水线里最慢的阶段。
+"""
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 8
+_POLL_INTERVAL = 0.1  # 阻塞在队列上时检查取消的间隔（秒）
+_END = object()
+
+
+class PipelineCancelled(Exception):
+    """流水线被取消"""
+
+
+class _Failure:
+    """阶段线程中的异常，经队列转交给下游线程重新抛出"""
+    
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+@dataclass
+class Stage:
+    """
+    流水线阶段
+    
+    fn 接收上游的迭代器并返回（或作为生成器产出）下游的数据；queue_size 只对
+    threaded 阶段有效，为 None 时使用流水线的默认值。
+    """
+    name: str
+    fn: Callable[[Iterator[Any]], Iterable[Any]]
+    threaded: bool = False
+    queue_size: Optional[int] = None
+
+
+def iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """把数据按 size 条打包成列表（最后一批可能不满）"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@dataclass
+class StageMetrics:
+    """单个阶段的运行指标"""
+    name: str
+    threaded: bool = False
+    items_in: int = 0
+    items_out: int = 0
+    busy_time: float = 0.0     # 阶段自身的处理时间
+    wait_time: float = 0.0     # 等待上游数据的时间
+    blocked_time: float = 0.0  # 下游队列已满、等待下游取走的时间（背压）
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'threaded': self.threaded,
+            'items_in': self.items_in,
+            'items_out': self.items_out,
+            'busy_time': round(self.busy_time, 3),
+            'wait_time': round(self.wait_time, 3),
+            'blocked_time': round(self.blocked_time, 3),
+            # 每秒处理的条数（输入、输出取较多的一侧，如入库阶段按条输入、按批输出）
+            'throughput': round(max(self.items_in, self.items_out) / self.busy_time, 1) if self.busy_time > 0 else None,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth
+        }
+
+
+class Pipeline:
+    """
+    由多个阶段组成的处理流水线
+    
+    用法：
+        pipeline = Pipeline('upload', [Stage('parse', parse, threaded=True), batch_stage('batch', 100), ...])
+        for result in pipeline.run(source):
+            ...
+        pipeline.get_metrics()
+        
+    同一个 Pipeline 对象只运行一次；需要中途停止时从其他线程调用 cancel()，
+    run() 的迭代随即抛出 PipelineCancelled。
+    """
+    
+    def __init__(self, name: str, stages: List[Stage], queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.stages = stages
+        self.queue_size = queue_size
+        self.metrics = [StageMetrics(stage.name, stage.threaded) for stage in stages]
+        self._cancelled = threading.Event()
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+    
+    def cancel(self):
+        """取消流水线：各阶段在处理完当前数据后退出"""
+        self._cancelled.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+    
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise PipelineCancelled(f'Pipeline {self.name} cancelled')
+    
+    def run(self, source: Iterable[Any]) -> Iterator[Any]:
+        """运行流水线，逐个产出最后一个阶段的输出"""
+        self._started_at = time.perf_counter()
+        app = current_app._get_current_object() if has_app_context() else None
+        
+        items = iter(source)
+        for stage, metrics in zip(self.stages, self.metrics):
+            items = self._instrument(stage, metrics, items)
+            if stage.threaded:
+                items = self._run_threaded(stage, metrics, items, app)
+                
+        try:
+            yield from items
+        finally:
+            close = getattr(items, 'close', None)
+            if close is not None:
+                close()
+            self._finished_at = time.perf_counter()
+    
+    def drain(self, source: Iterable[Any]) -> int:
+        """运行流水线并丢弃输出（最后一个阶段自己保存结果时使用），返回输出条数"""
+        count = 0
+        for _ in self.run(source):
+            count += 1
+        return count
+    
+    def _instrument(self, stage: Stage, metrics: StageMetrics, upstream: Iterator[Any]) -> Iterator[Any]:
+        """运行阶段函数并记录指标（在拉取该阶段输出的线程里执行）"""
+        def inputs():
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(upstream)
+                except StopIteration:
+                    metrics.wait_time += time.perf_counter() - started
+                    return
+                metrics.wait_time += time.perf_counter() - started
+                metrics.items_in += 1
+                yield item
+                
+        stage_inputs = inputs()
+        outputs = iter(stage.fn(stage_inputs))
+        try:
+            while True:
+                self._check_cancelled()
+                started = time.perf_counter()
+                waited = metrics.wait_time
+                try:
+                    item = next(outputs)
+                except StopIteration:
+                    break
+                finally:
+                    metrics.busy_time += time.perf_counter() - started - (metrics.wait_time - waited)
+                metrics.items_out += 1
+                yield item
+        finally:
+            # 提前结束时关闭阶段函数和上游，让上游的 finally（刷新缓冲、停止线程）得以执行
+            for iterator in (outputs, stage_inputs, upstream):
+                close = getattr(iterator, 'close', None)
+                if close is not None:
+                    close()
+    
+    def _run_threaded(self, stage: Stage, metrics: StageMetrics, items: Iterator[Any],
+                      app) -> Iterator[Any]:
+        """在独立线程中拉取 items，经有界队列交给下游"""
+        buffer = queue.Queue(maxsize=stage.queue_size or self.queue_size)
+        stopped = threading.Event()  # 下游不再读取
+        
+        def put(item) -> bool:
+            started = time.perf_counter()
+            try:
+                while not stopped.is_set():
+                    try:
+                        buffer.put(item, timeout=_POLL_INTERVAL)
+                    except queue.Full:
+                        continue
+                    metrics.queue_depth = buffer.qsize()
+                    metrics.max_queue_depth = max(metrics.max_queue_depth, metrics.queue_depth)
+                    return True
+                return False
+            finally:
+                metrics.blocked_time += time.perf_counter() - started
+        
+        def produce():
+            try:
+                for item in items:
+                    if not put(item):
+                        return
+                put(_END)
+            except BaseException as e:
+                put(_Failure(e))
+            finally:
+                items.close()
+        
+        def target():
+            if app is None:
+                produce()
+                return
+            # 阶段线程使用自己的应用上下文（和数据库会话），退出时由 Flask 清理
+            with app.app_context():
+                produce()
+                
+        thread = threading.Thread(target=target, name=f'{self.name}-{stage.name}', daemon=True)
+        thread.start()
+        
+        try:
+            while True:
+                try:
+                    item = buffer.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    self._check_cancelled()
+                    if not thread.is_alive() and buffer.empty():
+                        raise RuntimeError(f'Pipeline stage {stage.name} exited unexpectedly')
+                    continue
+                metrics.queue_depth = buffer.qsize()
+                
+                if item is _END:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            stopped.set()
+            thread.join()
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """流水线和各阶段的运行指标"""
+        if self._started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._finished_at or time.perf_counter()) - self._started_at
+            
+        stages = [metrics.to_dict() for metrics in self.metrics]
+        bottleneck = max(self.metrics, key=lambda m: m.busy_time, default=None)
+        return {
+            'name': self.name,
+            'elapsed_time': round(elapsed, 3),
+            'cancelled': self.cancelled,
+            'bottleneck': bottleneck.name if bottleneck is not None and bottleneck.busy_time > 0 else None,
+            'stages': stages
+        }
@@ -6,6 +6,7 @@ import logging
 import mmap
 import os
 import gc
+import time
 from typing import Iterator, Dict, Any, List, Optional, Callable, TextIO
 from pathlib import Path
 from dataclasses import dataclass
@@ -15,10 +16,15 @@ import ijson
 from contextlib import contextmanager
 
 from app.utils.memory_monitor import memory_monitor
+from app.utils.compressed_input import SizeBudget, open_json_stream
 
 logger = logging.getLogger(__name__)
 
 
+class PrefixDetectionTimeout(TimeoutError):
+    """到截止时间仍未找到消息数组"""
+
+
 @dataclass
 class StreamingConfig:
     """流式处理配置"""
@@ -128,6 +134,86 @@ class StreamingJSONProcessor:
             logger.error(f"Failed to stream parse JSON: {str(e)}")
             raise
     
+    def detect_messages_prefix(self, file_path: Path, member: Optional[str] = None,
+                               budget: Optional[SizeBudget] = None, name: Optional[str] = None,
+                               deadline: Optional[float] = None) -> str:
+        """
+        识别消息数组在文档中的位置
+        
+        只读到第一个候选为止：顶层数组、根对象的 messages 字段或根对象的 data 数组，
+        确认后立即返回，不再解析文档其余部分。根对象同时有 messages 和 data 时取先出现的
+        （正常导出只有其中一个；内存中处理的 DataExtractor.iter_raw_messages 使用相同规则）。
+        
+        Args:
+            file_path: JSON文件路径（可以是压缩文件，见 compressed_input）
+            member: zip 压缩包中的成员名
+            budget: 解压字节数额度（同一次上传的识别、校验和流式读取共用），为 None 时不限制
+            name: 识别压缩格式用的文件名，默认取 file_path
+            deadline: 截止时间（time.perf_counter()），为 None 时不限时
+            
+        Returns:
+            str: ijson 前缀，'item'（顶层数组）、'messages.item' 或 'data.item'
+        
+        Raises:
+            ValueError: 文档中没有可识别的消息数组
+            ijson.JSONError: JSON格式错误
+            DecompressedSizeError: 解压后的数据超过额度
+            PrefixDetectionTimeout: 到 deadline 仍未找到消息数组（如消息数组前有很大的其他字段）
+        """
+        with open_json_stream(file_path, member, budget, name=name) as file:
+            for prefix, event, value in ijson.parse(file):
+                if deadline is not None and time.perf_counter() >= deadline:
+                    raise PrefixDetectionTimeout('在时间预算内未找到消息数组')
+                if prefix == '' and event == 'start_array':
+                    return 'item'
+                if prefix == '' and event not in ('start_map', 'map_key', 'end_map'):
+                    break
+                    
+                # 只看根对象的直接字段
+                if prefix == 'messages' and event in ('start_array', 'start_map', 'string', 'number',
+                                                     'boolean', 'null'):
+                    return 'messages.item'
+                if prefix == 'data' and event == 'start_array':
+                    return 'data.item'
+                    
+        raise ValueError('未找到消息数组（messages、data 或顶层数组）')
+    
+    def stream_messages(self, file_path: Path, member: Optional[str] = None,
+                        budget: Optional[SizeBudget] = None) -> Iterator[Dict[str, Any]]:
+        """
+        逐条读取聊天导出中的消息对象
+        
+        支持 {"messages": [...]}、{"data": [...]} 和顶层数组三种结构，
+        使用 ijson.items 逐个产出数组元素，内存占用与文件大小无关。
+        压缩文件边解压边解析，解压数据不落盘。
+        
+        Args:
+            file_path: JSON文件路径（可以是压缩文件，见 compressed_input）
+            member: zip 压缩包中的成员名
+            budget: 解压字节数额度（同一次上传的所有成员共用，识别消息数组读取的部分也计入），
+                为 None 时不限制
+                
+        Yields:
+            Dict[str, Any]: 原始消息对象
+        """
+        prefix = self.detect_messages_prefix(file_path, member, budget)
+        source = f"{file_path}:{member}" if member else file_path
+        logger.info(f"Streaming messages from {source} (backend: {ijson.backend}, prefix: {prefix})")
+        
+        with open_json_stream(file_path, member, budget) as file:
+            for item in ijson.items(file, prefix, use_float=True):
+                if not isinstance(item, dict):
+                    continue
+                    
+                self.processed_count += 1
+                yield item
+                
+                if self.processed_count % self.config.gc_frequency == 0:
+                    current_memory = memory_monitor.get_current_snapshot().rss_mb
+                    if current_memory > self.config.memory_limit_mb:
+                        logger.debug(f"Memory usage high: {current_memory:.1f}MB")
+                        gc.collect()
+    
     def _chunk_parse_fallback(self, file: TextIO) -> Iterator[Dict[str, Any]]:
         """分块解析回退方案"""
         buffer = ""
@@ -210,8 +296,8 @@ class StreamingJSONProcessor:
                     else:
                         yield batch
                     
-                    batch = []
                     self.processed_count += len(batch)
+                    batch = []
                     
                     # 内存检查
                     current_memory = memory_monitor.get_current_snapshot().rss_mb
@@ -260,40 +346,30 @@ class StreamingJSONProcessor:
         split_files = []
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as source:
-                # 尝试解析为JSON数组
-                data = json.load(source)
-                
-                if isinstance(data, dict) and 'messages' in data:
-                    messages = data['messages']
-                    chunk_size = max_size_bytes // (len(json.dumps(messages[0]).encode()) + 100)
-                    
-                    for i in range(0, len(messages), chunk_size):
-                        chunk_data = {
-                            **{k: v for k, v in data.items() if k != 'messages'},
-                            'messages': messages[i:i + chunk_size]
-                        }
-                        
-                        temp_file = self.create_temp_file()
-                        with open(temp_file, 'w', encoding='utf-8') as f:
-                            json.dump(chunk_data, f, ensure_ascii=False)
-                        
-                        split_files.append(temp_file)
-                        
-                elif isinstance(data, list):
-                    chunk_size = max_size_bytes // (len(json.dumps(data[0]).encode()) + 100)
-                    
-                    for i in range(0, len(data), chunk_size):
-                        chunk_data = data[i:i + chunk_size]
-                        
-                        temp_file = self.create_temp_file()
-                        with open(temp_file, 'w', encoding='utf-8') as f:
-                            json.dump(chunk_data, f, ensure_ascii=False)
-                        
-                        split_files.append(temp_file)
-                
-                logger.info(f"Split into {len(split_files)} files")
-                return split_files
+            # 逐条读取消息，按序列化后的大小切分，不整体加载文件
+            prefix = self.detect_messages_prefix(file_path)
+            root_key = prefix.split('.')[0] if prefix != 'item' else None
+            chunk, chunk_bytes = [], 0
+            
+            def flush():
+                temp_file = self.create_temp_file()
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump({root_key: chunk} if root_key else chunk, f, ensure_ascii=False)
+                split_files.append(temp_file)
+            
+            for message in self.stream_messages(file_path):
+                size = len(json.dumps(message, ensure_ascii=False).encode('utf-8')) + 2
+                if chunk and chunk_bytes + size > max_size_bytes:
+                    flush()
+                    chunk, chunk_bytes = [], 0
+                chunk.append(message)
+                chunk_bytes += size
+            
+            if chunk:
+                flush()
+            
+            logger.info(f"Split into {len(split_files)} files")
+            return split_files
                 
         except Exception as e:
             logger.error(f"Failed to split file: {str(e)}")
@@ -406,9 +482,9 @@ class StreamingCSVProcessor:
                         json_data = json.dumps(chunk, ensure_ascii=False)
                         json_file.write(json_data[1:-1])
                         processed += len(chunk)
-                    
+                        
                     json_file.write(']')
-            
+                    
             logger.info(f"Converted {processed} CSV records to JSON")
             return processed
             
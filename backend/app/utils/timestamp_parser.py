@@ -0,0 +1,153 @@
+"""
+聊天记录时间戳解析
+
+同一个导出文件里的时间戳格式基本一致。TimestampParser 用文件开头的几条消息识别格式，
+之后每条消息只调用一次对应的快速解析（datetime.fromisoformat 或 Unix 时间戳换算），
+快速解析失败的个别消息才走逐个格式尝试的慢速路径。
+"""
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+# 时间戳字段（按优先级）
+TIMESTAMP_FIELDS = ('timestamp', 'time', 'created_at', 'date')
+
+# 慢速路径依次尝试的字符串格式
+STRPTIME_FORMATS = (
+    '%Y-%m-%d %H:%M:%S',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%dT%H:%M:%SZ',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S.%fZ'
+)
+
+TIMEZONE_SUFFIX = re.compile(r'[+\-]\d{2}:\d{2}$')
+
+
+def get_timestamp_value(msg: Dict[str, Any]) -> Any:
+    """取消息中第一个非空的时间戳字段"""
+    for field in TIMESTAMP_FIELDS:
+        value = msg.get(field)
+        if value is not None:
+            return value
+    return None
+
+
+def parse_timestamp_slow(value: Any) -> Optional[datetime]:
+    """
+    逐个格式尝试解析时间戳
+    
+    字符串依次尝试 STRPTIME_FORMATS，再去掉时区后缀（保留当地时间）重试；
+    数值按 Unix 时间戳处理（大于 1e10 视为毫秒）。无法解析时返回 None。
+    """
+    if isinstance(value, datetime):
+        return value
+        
+    if isinstance(value, (int, float)):
+        if value > 1e10:  # 毫秒时间戳
+            value = value / 1000
+        return datetime.fromtimestamp(value)
+        
+    if isinstance(value, str):
+        for fmt in STRPTIME_FORMATS:
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+        
+        # 处理chatlog的复杂ISO格式（如2025-07-28T09:21:50+08:00）
+        clean_value = TIMEZONE_SUFFIX.sub('', value).replace('Z', '')
+        for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f'):
+            try:
+                return datetime.strptime(clean_value, fmt)
+            except ValueError:
+                continue
+                
+    return None
+
+
+def _parse_isoformat(value: str) -> datetime:
+    result = datetime.fromisoformat(value)
+    if result.tzinfo is not None:
+        result = result.replace(tzinfo=None)  # 与慢速路径一致，保留当地时间
+    return result
+
+
+def _parse_slash(value: str) -> datetime:
+    return _parse_isoformat(value.replace('/', '-', 2))
+
+
+def _parse_epoch_seconds(value) -> datetime:
+    if value > 1e10:
+        raise ValueError('millisecond timestamp')
+    return datetime.fromtimestamp(value)
+
+
+def _parse_epoch_millis(value) -> datetime:
+    if value <= 1e10:
+        raise ValueError('second timestamp')
+    return datetime.fromtimestamp(value / 1000)
+
+
+# 候选快速解析器：(名称, 适用的值类型, 解析函数)
+FAST_PARSERS = (
+    ('isoformat', str, _parse_isoformat),
+    ('slash', str, _parse_slash),
+    ('epoch_seconds', (int, float), _parse_epoch_seconds),
+    ('epoch_millis', (int, float), _parse_epoch_millis),
+)
+
+
+class TimestampParser:
+    """
+    按文件识别格式的时间戳解析器
+    
+    每个文件（一次 iter_normalized_messages）使用一个实例：前 SNIFF_SAMPLES 个时间戳
+    走慢速路径，同时找出对这些样本结果完全一致的快速解析器；之后优先使用快速解析器，
+    失败时再退回慢速路径。
+    """
+    
+    SNIFF_SAMPLES = 5
+    
+    def __init__(self):
+        self.fast_parser_name: Optional[str] = None
+        self._fast_parser: Optional[Callable[[Any], datetime]] = None
+        self._fast_type = None
+        self._samples = []
+        self.fast_count = 0
+        self.slow_count = 0
+    
+    def parse(self, value: Any) -> Optional[datetime]:
+        """解析时间戳，无法解析时返回 None"""
+        if value is None or isinstance(value, datetime):
+            return value
+            
+        if self._fast_parser is not None and isinstance(value, self._fast_type) and not isinstance(value, bool):
+            try:
+                result = self._fast_parser(value)
+                self.fast_count += 1
+                return result
+            except (ValueError, TypeError, OverflowError, OSError):
+                pass
+                
+        self.slow_count += 1
+        result = parse_timestamp_slow(value)
+        if self._fast_parser is None and result is not None and len(self._samples) < self.SNIFF_SAMPLES:
+            self._samples.append((value, result))
+            if len(self._samples) == self.SNIFF_SAMPLES:
+                self._select_fast_parser()
+        return result
+    
+    def _select_fast_parser(self):
+        """选出对所有样本与慢速路径结果一致的快速解析器"""
+        for name, value_type, parser in FAST_PARSERS:
+            try:
+                if all(isinstance(value, value_type) and not isinstance(value, bool) and parser(value) == result
+                       for value, result in self._samples):
+                    self.fast_parser_name = name
+                    self._fast_parser = parser
+                    self._fast_type = value_type
+                    return
+            except (ValueError, TypeError, OverflowError, OSError):
+                continue
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+规则匹配微基准
+
+对比逐条 re.search / 子串判断（优化前的实现）与组合正则 + 关键词自动机（pattern_engine）
+在每条消息上的耗时，并校验两者对每条消息给出的得分完全一致。
+
+用法:
+    python benchmark_patterns.py                      # 使用内置样本
+    python benchmark_patterns.py chatlog.json -n 5    # 使用真实导出文件，每种实现跑5轮
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+
+from app.services.data_extractor import DataExtractor
+from app.services.qa_classifier import QAClassifier
+from app.utils.pattern_engine import AHOCORASICK_AVAILABLE
+
+SAMPLE_TEXTS = [
+    '请问老师孩子申请学校需要准备什么材料？',
+    '胡老师，今年秋季孩子学校的学费账单已下发，但是 fafsa 给的金额到现在还没出，学校说是推迟了。'
+    'CSS从去年开始就没有申请下来费用，问过学校，原因是有银行存款，您有好的办法吗？',
+    '这个软件安装的时候一直报错，无法启动，怎么解决？',
+    '首先打开设置页面，然后选择高级配置，最后重启一下就可以了',
+    '我建议先联系客服申请退款，关于这个问题需要注意保留好订单截图',
+    '专业版的价格是多少钱？有没有优惠套餐',
+    '好的，收到，谢谢老师',
+    '哈哈哈',
+    '[图片]',
+    '@张三 明天几点开会',
+    '12345',
+    'OK 没问题',
+    '今天天气不错，大家周末愉快' * 8,
+    'The export fails with an unknown bug, any idea?',
+]
+
+
+# ---- 优化前的实现（用于对比和校验） ----
+
+def legacy_is_noise(extractor, content):
+    if len(content.strip()) < 2:
+        return True
+    for pattern in extractor.noise_patterns:
+        if re.search(pattern, content, re.IGNORECASE):
+            return True
+    return False
+
+
+def legacy_is_potential_question(extractor, content):
+    question_score = 0
+    for pattern_group in extractor.qa_patterns:
+        for pattern in pattern_group['question_patterns']:
+            if re.search(pattern, content, re.IGNORECASE):
+                question_score += 1
+                break
+    if len(content) > 5:
+        question_score += 0.5
+    for word in extractor.QUESTION_WORDS:
+        if word in content:
+            question_score += 0.5
+            break
+    for word in extractor.EDUCATIONAL_WORDS:
+        if word in content:
+            question_score += 0.3
+            break
+    if re.search(r'.*[您你].*(有|什么|怎么).*(好的)?.*[办法方法建议].*[吗？?]?', content):
+        question_score += 0.8
+    if re.search(r'.*(老师|请教|咨询|求助|帮忙).*', content):
+        question_score += 0.4
+    return question_score >= 0.3
+
+
+def legacy_answer_confidence(extractor, question, answer):
+    confidence = 0.0
+    if len(answer) < 5:
+        return 0.1
+    for pattern_group in extractor.qa_patterns:
+        for pattern in pattern_group.get('answer_indicators', []):
+            if re.search(pattern, answer, re.IGNORECASE):
+                confidence += pattern_group.get('confidence_boost', 0.2)
+                break
+    question_words = set(re.findall(r'[\u4e00-\u9fff]+', question))
+    answer_words = set(re.findall(r'[\u4e00-\u9fff]+', answer))
+    if question_words and answer_words:
+        overlap_ratio = len(question_words & answer_words) / len(question_words | answer_words)
+        confidence += overlap_ratio * 0.3
+    if re.search(r'(可以|建议|推荐|方法|步骤|解决|处理)', answer):
+        confidence += 0.2
+    if re.search(r'(首先|然后|接着|最后|第[一二三四五六七八九十])', answer):
+        confidence += 0.15
+    if 10 <= len(answer) <= 200:
+        confidence += 0.1
+    elif len(answer) > 200:
+        confidence += 0.05
+    return min(confidence, 1.0)
+
+
+def legacy_category_scores(classifier, text):
+    scores = {}
+    for category_id, rule in classifier.category_rules.items():
+        score = 0.0
+        text_lower = text.lower()
+        keyword_matches = sum(1 for keyword in rule['keywords'] if keyword in text_lower)
+        if keyword_matches > 0:
+            score += (keyword_matches / len(rule['keywords'])) * 0.6
+        pattern_matches = sum(1 for pattern in rule['patterns'] if re.search(pattern, text, re.IGNORECASE))
+        if pattern_matches > 0:
+            score += (pattern_matches / len(rule['patterns'])) * 0.4
+        score *= rule.get('weight', 1.0)
+        if len(text) > 100:
+            score *= 1.1
+        scores[category_id] = score
+    return scores
+
+
+# ---- 基准 ----
+
+def load_texts(path):
+    """从聊天记录导出文件读取消息文本"""
+    extractor = DataExtractor(max_workers=1)
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('messages') or data.get('data') or []
+    texts = []
+    for msg in data:
+        if isinstance(msg, dict):
+            content = extractor._extract_content(msg)
+            if content:
+                texts.append(content)
+    return texts
+
+
+def run(label, func, texts, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            func(text)
+    elapsed = time.perf_counter() - start
+    per_message = elapsed / (rounds * len(texts)) * 1e6
+    print(f"  {label:<8} {per_message:9.2f} µs/消息")
+    return per_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description='规则匹配微基准')
+    parser.add_argument('file', nargs='?', help='聊天记录导出 JSON 文件')
+    parser.add_argument('-n', '--rounds', type=int, default=20, help='每种实现运行的轮数')
+    args = parser.parse_args()
+    
+    texts = load_texts(args.file) if args.file else SAMPLE_TEXTS * 20
+    if not texts:
+        print('没有可用的消息文本')
+        return 1
+        
+    extractor = DataExtractor(max_workers=1)
+    classifier = QAClassifier()
+    random.seed(0)
+    answers = [random.choice(texts) for _ in texts]
+    
+    # 校验得分一致
+    mismatches = 0
+    for question, answer in zip(texts, answers):
+        mismatches += legacy_is_noise(extractor, question) != extractor._is_noise(question)
+        mismatches += legacy_is_potential_question(extractor, question) != extractor._is_potential_question(question)
+        mismatches += legacy_answer_confidence(extractor, question, answer) != \
+            extractor._calculate_answer_confidence(question, answer)
+        mismatches += legacy_category_scores(classifier, question) != classifier._calculate_category_scores(question)
+    print(f"消息数: {len(texts)}，得分不一致: {mismatches}，Aho-Corasick: {'是' if AHOCORASICK_AVAILABLE else '否（子串判断）'}")
+    
+    # 消息特征在提取时每条只计算一次，答案评分直接使用缓存
+    features = {text: extractor._compute_features(text) for text in texts}
+    
+    benchmarks = [
+        ('_is_noise',
+         lambda t: legacy_is_noise(extractor, t), extractor._is_noise),
+        ('_is_potential_question',
+         lambda t: legacy_is_potential_question(extractor, t), extractor._is_potential_question),
+        ('answer confidence (cached features)',
+         lambda t: legacy_answer_confidence(extractor, t, t), lambda t: extractor._score_answer(features[t], features[t])),
+        ('category scores',
+         lambda t: legacy_category_scores(classifier, t), classifier._calculate_category_scores),
+    ]
+    for name, before, after in benchmarks:
+        print(name)
+        before_cost = run('before', before, texts, args.rounds)
+        after_cost = run('after', after, texts, args.rounds)
+        print(f"  speedup  {before_cost / after_cost:9.2f}x")
+        
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
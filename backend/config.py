@@ -27,7 +27,40 @@ class Config:
     # 文件上传配置
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
     UPLOAD_FOLDER = BASE_DIR / 'uploads'
-    ALLOWED_EXTENSIONS = {'.json'}
+    ALLOWED_EXTENSIONS = {'.json', '.json.gz', '.json.zst', '.zip'}
+    UPLOAD_SYNC_MAX_SIZE = int(os.environ.get('UPLOAD_SYNC_MAX_SIZE', 5 * 1024 * 1024))  # wait=true 同步处理的文件大小上限
+    UPLOAD_TASK_TIMEOUT = int(os.environ.get('UPLOAD_TASK_TIMEOUT', 1800))  # 后台处理任务超时（秒）
+    UPLOAD_TASK_MAX_RETRIES = int(os.environ.get('UPLOAD_TASK_MAX_RETRIES', 2))  # 后台处理失败或超时后的重试次数（从检查点继续）
+    UPLOAD_MAX_FILE_SIZE = int(os.environ.get('UPLOAD_MAX_FILE_SIZE', 4 * 1024 * 1024 * 1024))  # 可处理的文件大小上限（大文件用分块上传）
+    UPLOAD_MAX_DECOMPRESSED_SIZE = int(os.environ.get('UPLOAD_MAX_DECOMPRESSED_SIZE', 4 * 1024 * 1024 * 1024))  # 压缩上传解压后的大小上限（防止压缩炸弹）
+    CHUNKED_UPLOAD_CHUNK_SIZE = int(os.environ.get('CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # 建议的分块大小，需小于 MAX_CONTENT_LENGTH
+    INCREMENTAL_INGEST = os.environ.get('INCREMENTAL_INGEST', 'true').lower() == 'true'  # 按聊天水位线跳过已处理的消息
+    UPLOAD_PREVIEW_MESSAGES = int(os.environ.get('UPLOAD_PREVIEW_MESSAGES', 2000))  # 上传预览默认抽样的消息数
+    UPLOAD_PREVIEW_TIME_BUDGET = float(os.environ.get('UPLOAD_PREVIEW_TIME_BUDGET', 0.8))  # 上传预览的时间预算（秒）
+    UPLOAD_PREVIEW_MAX_BYTES = int(os.environ.get('UPLOAD_PREVIEW_MAX_BYTES', 16 * 1024 * 1024))  # 预览请求直接上传的文件（或文件开头）大小上限
+    DEDUP_FILTER_ENABLED = os.environ.get('DEDUP_FILTER_ENABLED', 'true').lower() == 'true'  # 上传去重使用持久化布隆过滤器（否则每次加载全部指纹）
+    DEDUP_FILTER_DIR = os.environ.get('DEDUP_FILTER_DIR') or str(BASE_DIR / 'dedup')  # 布隆过滤器文件目录
+    DEDUP_FILTER_CAPACITY = int(os.environ.get('DEDUP_FILTER_CAPACITY', 2000000))  # 过滤器容量（指纹数），决定文件大小
+    DEDUP_FILTER_ERROR_RATE = float(os.environ.get('DEDUP_FILTER_ERROR_RATE', 0.001))  # 过滤器误判率（误判时多查一次数据库）
+    MESSAGE_ARCHIVE_ENABLED = os.environ.get('MESSAGE_ARCHIVE_ENABLED', 'true').lower() == 'true'  # 归档标准化消息，调整规则后可重新提取
+    MESSAGE_ARCHIVE_SEGMENT_SIZE = int(os.environ.get('MESSAGE_ARCHIVE_SEGMENT_SIZE', 2000))  # 每个归档分段的消息数
+    EXTRACT_WORKERS = int(os.environ.get('EXTRACT_WORKERS', 1))  # 大文件分片提取的进程数（1 为在当前进程提取；进程池在进程内共享）
+    RECLASSIFY_BATCH_SIZE = int(os.environ.get('RECLASSIFY_BATCH_SIZE', 2000))  # 重新分类每批读取和写回的问答对数
+    RECLASSIFY_WORKERS = int(os.environ.get('RECLASSIFY_WORKERS', 2))  # 重新分类的进程数（最多8个，1 为在当前进程分类）
+    BATCH_UPLOAD_CONCURRENCY = int(os.environ.get('BATCH_UPLOAD_CONCURRENCY', 3))  # 批量上传同时处理的文件数上限
+    BATCH_UPLOAD_MAX_FILES = int(os.environ.get('BATCH_UPLOAD_MAX_FILES', 200))  # 一次批量上传的文件数上限
+    
+    # chatlog 同步配置（从 chatlog HTTP 接口增量拉取聊天记录）
+    CHATLOG_SYNC_URL = os.environ.get('CHATLOG_SYNC_URL', 'http://127.0.0.1:5030')
+    CHATLOG_SYNC_TALKERS = [t.strip() for t in os.environ.get('CHATLOG_SYNC_TALKERS', '').split(',') if t.strip()]  # 要同步的聊天，为空时同步会话列表中的聊天
+    CHATLOG_SYNC_GROUPS_ONLY = os.environ.get('CHATLOG_SYNC_GROUPS_ONLY', 'true').lower() == 'true'  # 按会话列表同步时只同步群聊
+    CHATLOG_SYNC_CONCURRENCY = int(os.environ.get('CHATLOG_SYNC_CONCURRENCY', 4))  # 同时同步的聊天数（也是连接池大小）
+    CHATLOG_SYNC_PAGE_SIZE = int(os.environ.get('CHATLOG_SYNC_PAGE_SIZE', 500))  # 每次请求的消息数
+    CHATLOG_SYNC_REQUEST_TIMEOUT = float(os.environ.get('CHATLOG_SYNC_REQUEST_TIMEOUT', 30))  # 单次请求超时（秒）
+    CHATLOG_SYNC_TASK_TIMEOUT = int(os.environ.get('CHATLOG_SYNC_TASK_TIMEOUT', 3600))  # 一次同步的后台任务超时（秒）
+    CHATLOG_SYNC_SINCE = os.environ.get('CHATLOG_SYNC_SINCE', '2010-01-01')  # 没有水位线的聊天从这一天开始同步
+    CHATLOG_SYNC_INTERVAL = int(os.environ.get('CHATLOG_SYNC_INTERVAL', 0))  # 定时同步间隔（秒），0表示不自动同步
+    CHATLOG_SYNC_LOCK_FILE = os.environ.get('CHATLOG_SYNC_LOCK_FILE')  # 定时同步的进程锁文件（多进程只由一个进程同步），默认上传目录下的 chatlog_sync.lock
     
     # 搜索配置
     SEARCH_RESULTS_PER_PAGE = 20
@@ -37,6 +70,14 @@ class Config:
     CACHE_TYPE = 'simple'
     CACHE_DEFAULT_TIMEOUT = 300  # 5分钟
     
+    # 问答上下文压缩配置
+    CONTEXT_COMPRESSION = os.environ.get('CONTEXT_COMPRESSION', 'zlib')  # zlib 或 zstd（需安装 zstandard）
+    CONTEXT_COMPRESSION_LEVEL = int(os.environ.get('CONTEXT_COMPRESSION_LEVEL', 6))
+    CONTEXT_ZSTD_DICT_PATH = os.environ.get('CONTEXT_ZSTD_DICT_PATH') or str(BASE_DIR / 'context_zstd.dict')  # 旧版本的字典文件（只读取，新字典保存在 context_dictionaries 表）
+    
+    # 统计汇总配置
+    STATS_RECONCILE_INTERVAL = int(os.environ.get('STATS_RECONCILE_INTERVAL', 6 * 3600))  # 全量校准间隔（秒），0表示不自动校准
+    
     # CORS配置
     CORS_ORIGINS = ['http://localhost:3000', 'http://127.0.0.1:3000']
     
@@ -0,0 +1,85 @@
+"""Add stats rollup tables
+
+Revision ID: 4c7e2a9d13f0
+Revises: 1b325da1d245
+Create Date: 2025-08-20 10:12:44.215093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c7e2a9d13f0'
+down_revision = '1b325da1d245'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stats_category',
+        sa.Column('category_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('qa_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('quality_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('category_id')
+    )
+
+    op.create_table('stats_advisor',
+        sa.Column('advisor', sa.String(length=100), nullable=False),
+        sa.Column('qa_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('quality_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('advisor')
+    )
+    op.create_index('idx_stats_advisor_quality', 'stats_advisor', ['quality_count'], unique=False)
+
+    op.create_table('stats_confidence',
+        sa.Column('source_kind', sa.String(length=10), nullable=False),
+        sa.Column('bucket', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('qa_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('confidence_sum', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('confidence_min', sa.Float(), nullable=True),
+        sa.Column('confidence_max', sa.Float(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('source_kind', 'bucket')
+    )
+
+    op.create_table('stats_daily',
+        sa.Column('day', sa.String(length=10), nullable=False),
+        sa.Column('qa_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('quality_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('upload_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('day')
+    )
+
+    op.create_table('stats_upload_status',
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('upload_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('qa_total', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('processing_time_sum', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('processing_time_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('file_size_sum', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('status')
+    )
+
+    # stats_state 中没有 last_reconciled_at 时，首次读取统计会提交后台全量校准任务，
+    # 也可以手动执行 `flask reconcile-stats`
+    op.create_table('stats_state',
+        sa.Column('key', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.String(length=255), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('stats_state')
+    op.drop_table('stats_upload_status')
+    op.drop_table('stats_daily')
+    op.drop_table('stats_confidence')
+    op.drop_index('idx_stats_advisor_quality', table_name='stats_advisor')
+    op.drop_table('stats_advisor')
+    op.drop_table('stats_category')
@@ -0,0 +1,135 @@
+"""Move raw imported QA pairs into a staging table
+
+Revision ID: 8e5b0f6c2a71
+Revises: 4c7e2a9d13f0
+Create Date: 2025-08-21 15:40:03.118452
+
+"""
+import hashlib
+import json
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e5b0f6c2a71'
+down_revision = '4c7e2a9d13f0'
+branch_labels = None
+depends_on = None
+
+
+def _normalize_text(text):
+    if not text:
+        return ""
+    text = re.sub(r'[^\w\s\u4e00-\u9fff]', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.lower().strip()
+
+
+def _fingerprint(question, answer, asker, advisor):
+    # 与 FileProcessor._generate_content_fingerprint 保持一致
+    content = (f"{_normalize_text(question)[:200]}|{_normalize_text(answer)[:200]}|"
+               f"{_normalize_text(asker) if asker else ''}|{_normalize_text(advisor) if advisor else ''}")
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def _has_table(bind, name):
+    return bind.execute(sa.text(
+        "SELECT name FROM sqlite_master WHERE name = :name"
+    ), {'name': name}).fetchone() is not None
+
+
+def upgrade():
+    op.create_table('raw_qa_pairs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('upload_id', sa.Integer(), nullable=True),
+        sa.Column('question', sa.Text(), nullable=False),
+        sa.Column('answer', sa.Text(), nullable=False),
+        sa.Column('asker', sa.String(length=100), nullable=True),
+        sa.Column('advisor', sa.String(length=100), nullable=True),
+        sa.Column('question_timestamp', sa.String(length=40), nullable=True),
+        sa.Column('answer_timestamp', sa.String(length=40), nullable=True),
+        sa.Column('content_fingerprint', sa.String(length=32), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('reviewed_at', sa.DateTime(), nullable=True),
+        sa.Column('promoted_qa_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.CheckConstraint("status IN ('pending', 'approved', 'rejected')", name='valid_raw_status'),
+        sa.ForeignKeyConstraint(['upload_id'], ['upload_history.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_raw_qa_upload_status', 'raw_qa_pairs', ['upload_id', 'status'], unique=False)
+
+    # 迁移已有的原始导入记录（source_file = upload_<id>_raw）
+    bind = op.get_bind()
+    rows = bind.execute(sa.text("""
+        SELECT id, question, answer, asker, advisor, source_file, original_context, created_at, updated_at
+        FROM qa_pairs WHERE source_file LIKE 'upload\\_%\\_raw' ESCAPE '\\'
+    """)).fetchall()
+
+    if rows:
+        staged = []
+        for row in rows:
+            try:
+                context = json.loads(row.original_context) if row.original_context else {}
+            except (TypeError, ValueError):
+                context = {}
+            upload_part = row.source_file[len('upload_'):-len('_raw')]
+            staged.append({
+                'upload_id': int(upload_part) if upload_part.isdigit() else None,
+                'question': row.question,
+                'answer': row.answer,
+                'asker': row.asker,
+                'advisor': row.advisor,
+                'question_timestamp': context.get('question_timestamp'),
+                'answer_timestamp': context.get('answer_timestamp'),
+                'content_fingerprint': _fingerprint(row.question, row.answer, row.asker, row.advisor),
+                'created_at': row.created_at,
+                'updated_at': row.updated_at
+            })
+
+        bind.execute(sa.text("""
+            INSERT INTO raw_qa_pairs
+                (upload_id, question, answer, asker, advisor, question_timestamp, answer_timestamp,
+                 content_fingerprint, status, created_at, updated_at)
+            VALUES (:upload_id, :question, :answer, :asker, :advisor, :question_timestamp, :answer_timestamp,
+                    :content_fingerprint, 'pending', :created_at, :updated_at)
+        """), staged)
+
+        bind.execute(sa.text(
+            "DELETE FROM qa_pairs WHERE source_file LIKE 'upload\\_%\\_raw' ESCAPE '\\'"
+        ))
+
+        # 外部内容FTS表需要重建；统计汇总表在下次读取时重新校准
+        if _has_table(bind, 'qa_pairs_fts'):
+            bind.execute(sa.text("INSERT INTO qa_pairs_fts(qa_pairs_fts) VALUES('delete-all')"))
+            bind.execute(sa.text("""
+                INSERT INTO qa_pairs_fts(rowid, question, answer, category_name, advisor)
+                SELECT qa.id, qa.question, qa.answer, COALESCE(c.name, ''), COALESCE(qa.advisor, '')
+                FROM qa_pairs qa LEFT JOIN categories c ON qa.category_id = c.id
+            """))
+        if _has_table(bind, 'stats_state'):
+            bind.execute(sa.text("DELETE FROM stats_state WHERE key = 'last_reconciled_at'"))
+
+
+def downgrade():
+    bind = op.get_bind()
+    bind.execute(sa.text("""
+        INSERT INTO qa_pairs
+            (question, answer, category_id, asker, advisor, confidence, source_file, original_context,
+             created_at, updated_at)
+        SELECT question, answer, 1, asker, advisor, 0.1, 'upload_' || upload_id || '_raw',
+               json_object('question_timestamp', question_timestamp,
+                           'answer_timestamp', answer_timestamp,
+                           'raw_import', json('true'), 'needs_review', json('true')),
+               created_at, updated_at
+        FROM raw_qa_pairs WHERE status = 'pending'
+    """))
+    if _has_table(bind, 'stats_state'):
+        bind.execute(sa.text("DELETE FROM stats_state WHERE key = 'last_reconciled_at'"))
+
+    op.drop_index('idx_raw_qa_upload_status', table_name='raw_qa_pairs')
+    op.drop_table('raw_qa_pairs')
@@ -0,0 +1,29 @@
+"""Add ingest checkpoint to upload_history
+
+入库流水线每提交一批数据就把处理进度写入 ingest_checkpoint（JSON），
+后台任务重试时从检查点继续，最终状态记录入库失败的消息范围。
+
+Revision ID: a7c3e9f1d285
+Revises: f2b6d8e4a913
+Create Date: 2025-08-24 10:12:47.503918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9f1d285'
+down_revision = 'f2b6d8e4a913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upload_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ingest_checkpoint', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('upload_history', schema=None) as batch_op:
+        batch_op.drop_column('ingest_checkpoint')
@@ -0,0 +1,46 @@
+"""Add message archive segments for re-extraction without re-upload
+
+Revision ID: b3f9c2d7e614
+Revises: d5a1f7c3b962
+Create Date: 2025-08-26 14:20:37.815402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f9c2d7e614'
+down_revision = 'd5a1f7c3b962'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('message_archive_segments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('upload_id', sa.Integer(), nullable=False),
+        sa.Column('source', sa.String(length=255), nullable=False),
+        sa.Column('segment_index', sa.Integer(), nullable=False),
+        sa.Column('start_position', sa.Integer(), nullable=False),
+        sa.Column('chat', sa.String(length=255), nullable=True),
+        sa.Column('chat_name', sa.String(length=255), nullable=True),
+        sa.Column('first_timestamp', sa.DateTime(), nullable=False),
+        sa.Column('last_timestamp', sa.DateTime(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['upload_id'], ['upload_history.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('upload_id', 'source', 'segment_index', name='uq_archive_upload_segment')
+    )
+    with op.batch_alter_table('message_archive_segments', schema=None) as batch_op:
+        batch_op.create_index('idx_archive_chat_time', ['chat', 'first_timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message_archive_segments', schema=None) as batch_op:
+        batch_op.drop_index('idx_archive_chat_time')
+
+    op.drop_table('message_archive_segments')
@@ -0,0 +1,63 @@
+"""Store original_context compressed in a deferred blob column
+
+升级后执行一次 VACUUM 才能回收数据库文件空间（不能在迁移事务内执行）。
+
+Revision ID: c19d4e7a5b32
+Revises: 8e5b0f6c2a71
+Create Date: 2025-08-22 11:05:27.640918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from flask import current_app
+
+from app.utils.context_codec import load_context_codec
+
+
+# revision identifiers, used by Alembic.
+revision = 'c19d4e7a5b32'
+down_revision = '8e5b0f6c2a71'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def _convert(bind, source, target, transform):
+    """分批把 source 列的值转换后写入 target 列"""
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            f"SELECT id, {source} FROM qa_pairs WHERE id > :last_id AND {source} IS NOT NULL "
+            f"ORDER BY id LIMIT {BATCH_SIZE}"
+        ), {'last_id': last_id}).fetchall()
+        if not rows:
+            break
+        bind.execute(
+            sa.text(f"UPDATE qa_pairs SET {target} = :value WHERE id = :id"),
+            [{'id': row[0], 'value': transform(row[1])} for row in rows]
+        )
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    with op.batch_alter_table('qa_pairs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('context_blob', sa.LargeBinary(), nullable=True))
+
+    codec = load_context_codec(current_app.config)
+    _convert(op.get_bind(), 'original_context', 'context_blob', codec.encode)
+
+    with op.batch_alter_table('qa_pairs', schema=None) as batch_op:
+        batch_op.drop_column('original_context')
+
+
+def downgrade():
+    with op.batch_alter_table('qa_pairs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('original_context', sa.Text(), nullable=True))
+
+    codec = load_context_codec(current_app.config)
+    _convert(op.get_bind(), 'context_blob', 'original_context', codec.decode)
+
+    with op.batch_alter_table('qa_pairs', schema=None) as batch_op:
+        batch_op.drop_column('context_blob')
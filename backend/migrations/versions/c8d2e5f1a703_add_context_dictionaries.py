@@ -0,0 +1,31 @@
+"""Keep zstd context dictionaries by id
+
+Revision ID: c8d2e5f1a703
+Revises: b3f9c2d7e614
+Create Date: 2025-08-27 10:12:44.301527
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8d2e5f1a703'
+down_revision = 'b3f9c2d7e614'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 旧版本 CONTEXT_ZSTD_DICT_PATH 中的字典仍在启动时按字典ID登记，历史数据无需迁移
+    op.create_table('context_dictionaries',
+        sa.Column('dict_id', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('sample_count', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('dict_id')
+    )
+
+
+def downgrade():
+    op.drop_table('context_dictionaries')
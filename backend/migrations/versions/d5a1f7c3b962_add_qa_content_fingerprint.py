@@ -0,0 +1,54 @@
+"""Store content fingerprints on qa_pairs for bloom-filter dedup
+
+上传去重改为布隆过滤器 + 按指纹查库确认（见 app.services.fingerprint_filter），
+qa_pairs 增加 content_fingerprint 列并回填，两张表的指纹列都加索引。
+
+Revision ID: d5a1f7c3b962
+Revises: a7c3e9f1d285
+Create Date: 2025-08-25 09:41:06.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.content_fingerprint import content_fingerprint
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a1f7c3b962'
+down_revision = 'a7c3e9f1d285'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def upgrade():
+    with op.batch_alter_table('qa_pairs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_fingerprint', sa.String(length=32), nullable=True))
+
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            f"SELECT id, question, answer, asker, advisor FROM qa_pairs WHERE id > :last_id "
+            f"ORDER BY id LIMIT {BATCH_SIZE}"
+        ), {'last_id': last_id}).fetchall()
+        if not rows:
+            break
+        bind.execute(
+            sa.text("UPDATE qa_pairs SET content_fingerprint = :fingerprint WHERE id = :id"),
+            [{'id': row[0], 'fingerprint': content_fingerprint(row[1], row[2], row[3], row[4])} for row in rows]
+        )
+        last_id = rows[-1][0]
+
+    op.create_index('idx_qa_content_fingerprint', 'qa_pairs', ['content_fingerprint'], unique=False)
+    op.create_index('idx_raw_qa_content_fingerprint', 'raw_qa_pairs', ['content_fingerprint'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_raw_qa_content_fingerprint', table_name='raw_qa_pairs')
+    op.drop_index('idx_qa_content_fingerprint', table_name='qa_pairs')
+
+    with op.batch_alter_table('qa_pairs', schema=None) as batch_op:
+        batch_op.drop_column('content_fingerprint')
@@ -0,0 +1,65 @@
+"""Keep the fingerprint a QA pair was extracted with
+
+content_fingerprint 在修改问答内容时重新计算，重新提取（见 app.services.reextraction）
+按它判断过时会删除手工修改过的问答。qa_pairs 增加插入后不再改变的 extraction_fingerprint，
+已有记录中没有修改过的（updated_at 与 created_at 相差不超过1秒）取 content_fingerprint，
+修改过的留空，不会被当作过时删除。
+
+Revision ID: d9e4b2a6f185
+Revises: c8d2e5f1a703
+Create Date: 2025-08-28 16:05:37.412908
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9e4b2a6f185'
+down_revision = 'c8d2e5f1a703'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+EDIT_TOLERANCE = timedelta(seconds=1)  # created_at 和 updated_at 的默认值分别取时间，会有微小差异
+
+
+def upgrade():
+    with op.batch_alter_table('qa_pairs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('extraction_fingerprint', sa.String(length=32), nullable=True))
+
+    bind = op.get_bind()
+    qa_pairs = sa.table(
+        'qa_pairs',
+        sa.column('id', sa.Integer), sa.column('content_fingerprint', sa.String),
+        sa.column('created_at', sa.DateTime), sa.column('updated_at', sa.DateTime)
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(qa_pairs.c.id, qa_pairs.c.content_fingerprint, qa_pairs.c.created_at, qa_pairs.c.updated_at)
+            .where(qa_pairs.c.id > last_id).order_by(qa_pairs.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        unedited = [
+            {'qa_id': row[0], 'fingerprint': row[1]} for row in rows
+            if row[1] and (row[3] is None or row[2] is None or row[3] - row[2] <= EDIT_TOLERANCE)
+        ]
+        if unedited:
+            bind.execute(
+                sa.text("UPDATE qa_pairs SET extraction_fingerprint = :fingerprint WHERE id = :qa_id"),
+                unedited
+            )
+        last_id = rows[-1][0]
+
+    op.create_index('idx_qa_extraction_fingerprint', 'qa_pairs', ['extraction_fingerprint'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_qa_extraction_fingerprint', table_name='qa_pairs')
+
+    with op.batch_alter_table('qa_pairs', schema=None) as batch_op:
+        batch_op.drop_column('extraction_fingerprint')
@@ -0,0 +1,37 @@
+"""Add per-chat watermarks for incremental re-ingestion
+
+Revision ID: e7f3a1c9d402
+Revises: c19d4e7a5b32
+Create Date: 2025-08-23 10:12:44.509137
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7f3a1c9d402'
+down_revision = 'c19d4e7a5b32'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('chat_watermarks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('talker', sa.String(length=255), nullable=False),
+        sa.Column('talker_name', sa.String(length=255), nullable=True),
+        sa.Column('last_timestamp', sa.DateTime(), nullable=False),
+        sa.Column('last_seq', sa.BigInteger(), nullable=True),
+        sa.Column('message_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('upload_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['upload_id'], ['upload_history.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('talker')
+    )
+
+
+def downgrade():
+    op.drop_table('chat_watermarks')
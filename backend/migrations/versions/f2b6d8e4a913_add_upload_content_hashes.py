@@ -0,0 +1,35 @@
+"""Add content hash and sample hash to upload_history
+
+旧记录只有 MD5（file_hash），上传文件处理后即删除，无法补算；
+只要还有这样的已完成记录，新上传会在同一遍读取中继续计算 MD5 用于比较。
+
+Revision ID: f2b6d8e4a913
+Revises: e7f3a1c9d402
+Create Date: 2025-08-23 16:38:05.221374
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b6d8e4a913'
+down_revision = 'e7f3a1c9d402'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upload_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=48), nullable=True))
+        batch_op.add_column(sa.Column('sample_hash', sa.String(length=48), nullable=True))
+        batch_op.create_index('idx_upload_content_hash', ['content_hash'], unique=False)
+        batch_op.create_index('idx_upload_sample_hash', ['file_size', 'sample_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('upload_history', schema=None) as batch_op:
+        batch_op.drop_index('idx_upload_sample_hash')
+        batch_op.drop_index('idx_upload_content_hash')
+        batch_op.drop_column('sample_hash')
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,92 @@
+"""
+测试公共夹具：每个测试使用临时目录中的 SQLite 数据库和上传目录
+"""
+import json
+import re
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@event.listens_for(Engine, 'connect')
+def _register_regexp(dbapi_connection, connection_record):
+    """SQLite 没有内置 REGEXP（分类颜色的 CHECK 约束使用）"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function(
+            'REGEXP', 2, lambda pattern, value: 1 if value is not None and re.search(pattern, value) else 0
+        )
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """使用临时数据库的应用，已建表并创建默认分类"""
+    monkeypatch.setenv('AI_CONFIG_FILE', str(tmp_path / 'ai_config.json'))
+    
+    from config import TestingConfig
+    from app import create_app, db
+    from app.models import Category
+    
+    class Config(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path}/test.db'
+        UPLOAD_FOLDER = tmp_path / 'uploads'
+        DEDUP_FILTER_DIR = str(tmp_path / 'dedup')
+        CONTEXT_ZSTD_DICT_PATH = str(tmp_path / 'context_zstd.dict')
+        MAX_CONTENT_LENGTH = 50 * 1024 * 1024
+        
+    app = create_app(Config)
+    with app.app_context():
+        db.create_all()
+        Category.create_default_categories()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db_session(app):
+    from app import db
+    return db.session
+
+
+QUESTIONS = ['请问老师孩子申请学校需要准备什么材料？', '这个软件安装的时候一直报错怎么解决？', '专业版的价格是多少钱？有没有优惠']
+ANSWERS = ['首先准备成绩单，然后写推荐信，最后提交申请就可以了', '建议先卸载再重新安装，然后重启电脑', '专业版每年999元，可以联系客服申请优惠']
+
+
+def build_chat_messages(count, talker='group1', tag='T', start=datetime(2025, 7, 1, 9), seq_start=1000):
+    """生成 chatlog 导出格式的消息：用户提问与老师回答交替出现，每条内容唯一"""
+    messages = []
+    for i in range(count):
+        if i % 2 == 0:
+            content, sender = QUESTIONS[(i // 2) % 3] + tag + str(i), f'user{i % 7}'
+        else:
+            content, sender = ANSWERS[(i // 2) % 3] + tag + str(i), '老师'
+        messages.append({
+            'seq': seq_start + i,
+            'time': (start + timedelta(minutes=7 * i)).strftime('%Y-%m-%dT%H:%M:%S') + '+08:00',
+            'talker': talker, 'talkerName': talker,
+            'sender': sender, 'senderName': sender,
+            'type': 1, 'content': content
+        })
+    return messages
+
+
+@pytest.fixture
+def make_chat():
+    """生成 chatlog 导出文件内容（bytes）；key 不为空时包装为 {key: [...]}"""
+    def make(count, talker='group1', tag='T', key=None, **kwargs):
+        messages = build_chat_messages(count, talker, tag, **kwargs)
+        return json.dumps({key: messages} if key else messages, ensure_ascii=False).encode('utf-8')
+    return make
@@ -0,0 +1,38 @@
+"""
+消息规则特征缓存：每条消息只计算一次特征，答案评分与逐次计算一致
+"""
+import benchmark_patterns as legacy
+from app.services.data_extractor import DataExtractor
+from app.utils.message_buffer import MessageBuffer
+
+from conftest import build_chat_messages
+
+
+def test_features_are_computed_once_per_message(monkeypatch):
+    extractor = DataExtractor(max_workers=1)
+    messages = list(extractor.iter_normalized_messages(build_chat_messages(300)))
+    buffer = MessageBuffer.from_messages(messages)
+    
+    calls = []
+    compute = extractor._compute_features
+    monkeypatch.setattr(extractor, '_compute_features', lambda content: calls.append(content) or compute(content))
+    
+    candidates = extractor._extract_shard(buffer, 0, len(buffer))
+    assert candidates
+    assert len(calls) <= len(buffer)
+    
+    # 第二次提取全部命中缓存
+    calls.clear()
+    extractor._extract_shard(buffer, 0, len(buffer))
+    assert calls == []
+
+
+def test_cached_answer_score_matches_direct_scoring():
+    extractor = DataExtractor(max_workers=1)
+    texts = legacy.SAMPLE_TEXTS
+    features = {text: extractor._compute_features(text) for text in texts}
+    
+    for question in texts:
+        for answer in texts:
+            assert extractor._score_answer(features[question], features[answer]) == \
+                legacy.legacy_answer_confidence(extractor, question, answer)
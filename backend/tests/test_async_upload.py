@@ -0,0 +1,50 @@
+"""
+上传默认后台处理：202 + upload_id / task_id，wait=true 保留同步处理
+"""
+import io
+import time
+
+from app.models import QAPair, UploadHistory
+
+
+def _post(client, content, filename, query=''):
+    return client.post(f'/api/v1/upload/file{query}', data={'file': (io.BytesIO(content), filename), 'use_ai': 'false'},
+                       content_type='multipart/form-data')
+
+
+def _wait_for_upload(client, upload_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get(f'/api/v1/upload/status/{upload_id}').get_json()['data']
+        if status['status'] in ('completed', 'failed'):
+            return status
+        assert time.monotonic() < deadline, status
+        time.sleep(0.1)
+
+
+def test_upload_returns_202_and_processes_in_background(client, make_chat):
+    response = _post(client, make_chat(60), 'chat.json')
+    
+    assert response.status_code == 202
+    data = response.get_json()['data']
+    assert response.headers['Location'].endswith(f"/status/{data['upload_id']}")
+    assert data['task_id']
+    
+    status = _wait_for_upload(client, data['upload_id'])
+    assert status['status'] == 'completed'
+    assert status['qa_count'] == QAPair.query.count() > 0
+    
+    task = client.get(f"/api/v1/upload/task/{data['task_id']}/status").get_json()
+    assert task['success']
+
+
+def test_wait_mode_keeps_synchronous_response(client, make_chat):
+    response = _post(client, make_chat(20, tag='W'), 'chat.json', '?wait=true')
+    assert response.status_code == 200
+    assert response.get_json()['data']['upload_id']
+    
+    invalid = _post(client, b'not a chat export', 'broken.json', '?wait=true')
+    assert invalid.status_code == 400
+    
+    # 校验失败的上传记录被关闭，不会停留在 pending
+    assert UploadHistory.query.filter_by(status='pending').count() == 0
@@ -0,0 +1,56 @@
+"""
+批量上传：zip 展开、批次内去重，以及所有 zip 成员共用的解压额度
+"""
+import io
+import zipfile
+from pathlib import Path
+
+from app.models import UploadHistory
+
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def _post_batch(client, files):
+    return client.post('/api/v1/upload/batch', data={'files': [(io.BytesIO(content), name) for name, content in files]},
+                       content_type='multipart/form-data')
+
+
+def _staged_files(app):
+    return [path for path in Path(app.config['UPLOAD_FOLDER']).iterdir() if path.is_file()]
+
+
+def test_zip_members_are_staged_and_deduplicated(app, client, make_chat):
+    chat_a, chat_b = make_chat(40, talker='a', tag='A'), make_chat(40, talker='b', tag='B')
+    archive = _zip({'a.json': chat_a, 'b.json': chat_b, 'copy/a.json': chat_a, 'notes.txt': b'x'})
+    
+    response = _post_batch(client, [('export.zip', archive)])
+    assert response.status_code == 202, response.get_json()
+    files = response.get_json()['data']['files']
+    assert [item['status'] for item in files] == ['queued', 'queued', 'duplicate', 'rejected']
+    assert files[2]['duplicate_of'] == files[0]['upload_id']
+
+
+def test_decompressed_budget_is_shared_by_all_members(app, client, make_chat):
+    members = {f'chat{i}.json': make_chat(200, talker=f'g{i}', tag=f'G{i}') for i in range(3)}
+    member_size = max(len(content) for content in members.values())
+    
+    # 每个成员都小于额度，合计超过额度
+    app.config['UPLOAD_MAX_DECOMPRESSED_SIZE'] = member_size * 2 + 100
+    response = _post_batch(client, [('first.zip', _zip(dict(list(members.items())[:2]))),
+                                    ('second.zip', _zip(dict(list(members.items())[2:])))])
+                                    
+    assert response.status_code == 413
+    assert response.get_json()['error']['code'] == 'DECOMPRESSED_TOO_LARGE'
+    assert _staged_files(app) == []
+    assert UploadHistory.query.count() == 0
+    
+    app.config['UPLOAD_MAX_DECOMPRESSED_SIZE'] = member_size * 3 + 100
+    response = _post_batch(client, [('all.zip', _zip(members))])
+    assert response.status_code == 202
+    assert UploadHistory.query.count() == 3
@@ -0,0 +1,57 @@
+"""
+聊天水位线：同一聊天重新导出时跳过已处理的消息，结果与全量处理一致
+"""
+import io
+
+from app.models import ChatWatermark, QAPair
+from app.services.data_extractor import DataExtractor
+from app.services.chat_watermark import WatermarkFilter
+from app.utils.timestamp_parser import parse_timestamp_slow
+
+from conftest import build_chat_messages
+
+
+def _upload(client, content, filename):
+    response = client.post('/api/v1/upload/file?wait=true',
+                           data={'file': (io.BytesIO(content), filename), 'use_ai': 'false'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['data']
+
+
+def test_reexport_only_processes_new_messages(client, make_chat):
+    _upload(client, make_chat(300), 'week1.json')
+    watermark = ChatWatermark.query.filter_by(talker='group1').one()
+    assert watermark.last_seq == 1299
+    assert watermark.message_count == 300
+    
+    second = _upload(client, make_chat(500), 'week2.json')
+    processing = second['statistics']['processing']
+    assert processing['watermark']['skipped_messages'] > 250
+    assert processing['total_messages_parsed'] < 250
+    
+    watermark = ChatWatermark.query.filter_by(talker='group1').one()
+    assert watermark.last_seq == 1499
+    assert watermark.message_count == 500
+    
+    # 两次增量导入的问答与一次处理完整导出相同
+    extractor = DataExtractor(max_workers=1)
+    expected = {(qa.question, qa.answer) for qa in extractor.extract_from_stream(
+        extractor.iter_normalized_messages(build_chat_messages(500)), 'full.json')}
+    assert {(qa.question, qa.answer) for qa in QAPair.query} == expected
+
+
+def test_filter_keeps_lookback_window_and_context():
+    raw = build_chat_messages(100)
+    cutoff = raw[59]
+    watermarks = {'group1': (parse_timestamp_slow(cutoff['time']), cutoff['seq'])}
+    watermark_filter = WatermarkFilter(watermarks, lookback_seconds=0, context_messages=2)
+    
+    kept = list(watermark_filter.filter(raw))
+    
+    # 水位线之后的 40 条新消息，加上之前的 2 条上下文
+    assert [msg['seq'] for msg in kept] == [msg['seq'] for msg in raw[58:]]
+    assert watermark_filter.get_stats() == {'chats': 1, 'skipped_messages': 58, 'lookback_messages': 2}
+    assert watermark_filter.latest['group1'][1:3] == [raw[-1]['seq'], 40]
+    assert all(watermark_filter.is_new(msg) for msg in raw[60:])
+    assert not watermark_filter.is_new(raw[0])
@@ -0,0 +1,111 @@
+"""
+chatlog 导出转换：逐条转换规则、压缩输入、两种输出格式、失败不留输出和多文件并行
+"""
+import gzip
+import json
+import zipfile
+
+import pytest
+
+from app.utils.chatlog_converter import (
+    convert_file, convert_files, find_input_files, iter_chatlog_messages, output_name_for
+)
+
+MESSAGES = [
+    {'time': '2025-07-01T09:00:00+08:00', 'type': 1, 'senderName': '林', 'content': '林: 请问这个  软件怎么\n安装呢？'},
+    {'time': '2025-07-01T09:01:00+08:00', 'type': 49, 'senderName': '老师',
+     'contents': {'desc': '先下载安装包，然后双击运行即可'}},
+    {'time': '2025-07-01T09:02:00+08:00', 'type': 49, 'senderName': '老师',
+     'contents': {'recordInfo': {'DataList': {'DataItems': [
+         {'DataDesc': '短的'}, {'DataDesc': '聊天记录里最长的一条内容会被保留'}
+     ]}}}},
+    {'time': '2025-07-01T09:03:00+08:00', 'type': 10000, 'senderName': '系统', 'content': '某某加入了群聊，欢迎欢迎欢迎'},
+    {'time': '2025-07-01T09:04:00+08:00', 'type': 3, 'senderName': '林', 'content': '[图片] 这是一张很长的图片描述'},
+    {'time': '2025-07-01T09:05:00+08:00', 'type': 1, 'senderName': '', 'content': '没有发送者的消息会被跳过'},
+    {'time': '2025-07-01T09:06:00+08:00', 'type': 1, 'senderName': '林', 'content': '太短了'},
+    {'time': '2025-07-01T09:07:00+08:00', 'type': 1, 'senderName': '林', 'content': '😀😀😀😀😀😀😀😀😀😀😀'},
+    {'time': '2025-07-01T09:08:00Z', 'type': 1, 'senderName': '王', 'content': '好的谢谢老师，我试一下安装'},
+]
+
+EXPECTED = [
+    {'id': 'msg_000001', 'timestamp': 1751331600000, 'from_user': '林',
+     'content': '请问这个 软件怎么 安装呢？', 'message_type': 'text'},
+    {'id': 'msg_000002', 'timestamp': 1751331660000, 'from_user': '老师',
+     'content': '先下载安装包，然后双击运行即可', 'message_type': 'text'},
+    {'id': 'msg_000003', 'timestamp': 1751331720000, 'from_user': '老师',
+     'content': '聊天记录里最长的一条内容会被保留', 'message_type': 'text'},
+    {'id': 'msg_000004', 'timestamp': 1751360880000, 'from_user': '王',
+     'content': '好的谢谢老师，我试一下安装', 'message_type': 'text'},
+]
+
+
+def _read_ndjson(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_convert_file_applies_message_rules(tmp_path):
+    source = tmp_path / 'export.json'
+    source.write_text(json.dumps(MESSAGES, ensure_ascii=False), encoding='utf-8')
+    
+    result = convert_file(source, tmp_path / 'out.ndjson', sample_size=2)
+    assert result.success
+    assert (result.messages, result.converted) == (len(MESSAGES), len(EXPECTED))
+    assert result.samples == EXPECTED[:2]
+    assert _read_ndjson(tmp_path / 'out.ndjson') == EXPECTED
+    
+    # .json 输出为 JSON 数组
+    convert_file(source, tmp_path / 'out.json')
+    assert json.loads((tmp_path / 'out.json').read_text(encoding='utf-8')) == EXPECTED
+
+
+def test_compressed_and_wrapped_inputs(tmp_path):
+    wrapped = json.dumps({'messages': MESSAGES}, ensure_ascii=False).encode('utf-8')
+    (tmp_path / 'a.json.gz').write_bytes(gzip.compress(wrapped))
+    with zipfile.ZipFile(tmp_path / 'b.zip', 'w') as archive:
+        archive.writestr('part1.json', json.dumps(MESSAGES[:4], ensure_ascii=False))
+        archive.writestr('part2.json', json.dumps(MESSAGES[4:], ensure_ascii=False))
+        
+    assert list(iter_chatlog_messages(tmp_path / 'a.json.gz')) == MESSAGES
+    assert list(iter_chatlog_messages(tmp_path / 'b.zip')) == MESSAGES
+    
+    for name in ('a.json.gz', 'b.zip'):
+        output = tmp_path / output_name_for(tmp_path / name)
+        convert_file(tmp_path / name, output)
+        assert _read_ndjson(output) == EXPECTED
+    assert output_name_for(tmp_path / 'a.json.gz', 'json') == 'a.json'
+
+
+def test_failed_conversion_leaves_no_output(tmp_path):
+    source = tmp_path / 'broken.json'
+    source.write_text(json.dumps(MESSAGES, ensure_ascii=False)[:-40], encoding='utf-8')
+    output = tmp_path / 'broken.ndjson'
+    
+    with pytest.raises(Exception):
+        convert_file(source, output)
+    assert list(tmp_path.iterdir()) == [source]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_convert_files_keeps_job_order_and_reports_errors(tmp_path, workers):
+    inputs = tmp_path / 'in'
+    inputs.mkdir()
+    for index in range(3):
+        (inputs / f'chat{index}.json').write_text(
+            json.dumps(MESSAGES * (index + 1), ensure_ascii=False), encoding='utf-8'
+        )
+    (inputs / 'chat3.json').write_text('{"not": "messages"}', encoding='utf-8')
+    (inputs / 'notes.txt').write_text('ignored', encoding='utf-8')
+    
+    files = find_input_files([inputs])
+    assert [path.name for path in files] == ['chat0.json', 'chat1.json', 'chat2.json', 'chat3.json']
+    
+    completed = []
+    jobs = [(path, tmp_path / output_name_for(path)) for path in files]
+    results = convert_files(jobs, workers=workers, on_result=completed.append)
+    
+    assert [result.input_path for result in results] == [str(path) for path in files]
+    assert len(completed) == 4
+    assert [result.converted for result in results[:3]] == [4, 8, 12]
+    assert not results[3].success and results[3].error.startswith('ValueError')
+    assert _read_ndjson(tmp_path / 'chat2.ndjson')[-1]['id'] == 'msg_000012'
+    assert not (tmp_path / 'chat3.ndjson').exists()
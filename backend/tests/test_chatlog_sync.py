@@ -0,0 +1,126 @@
+"""
+chatlog 同步：按时间游标分页、同步期间消息变化不漏读不重复
+"""
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from app.services.chatlog_sync import ChatlogClient, ChatlogSyncService
+
+from conftest import build_chat_messages
+
+
+class FakeChatlog:
+    """按 chatlog 接口的参数（time 范围、limit、offset）返回消息"""
+    
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.requests = []
+        self.on_request = None
+    
+    def get(self, path, params):
+        self.requests.append(params)
+        if self.on_request:
+            self.on_request(len(self.requests))
+        start, end = params['time'].split('~')
+        start = datetime.fromisoformat(start)
+        matched = [
+            msg for msg in self.messages
+            if start <= self._time(msg) and self._time(msg).date() <= date.fromisoformat(end)
+        ]
+        matched.sort(key=self._time)
+        return matched[params['offset']:params['offset'] + params['limit']]
+    
+    @staticmethod
+    def _time(msg):
+        return datetime.fromisoformat(msg['time']).replace(tzinfo=None)
+
+
+def _client(fake, page_size=50):
+    client = ChatlogClient('http://chatlog.test', page_size=page_size)
+    client._get = fake.get
+    return client
+
+
+def _read(client):
+    return [msg['seq'] for msg in client.iter_messages('group1', date(2025, 7, 1), date(2025, 8, 1))]
+
+
+def test_pages_by_time_cursor():
+    messages = build_chat_messages(230)
+    fake = FakeChatlog(messages)
+    
+    assert _read(_client(fake)) == [msg['seq'] for msg in messages]
+    assert len(fake.requests) == 5
+    assert fake.requests[0]['time'] == '2025-07-01~2025-08-01'
+    assert fake.requests[1]['time'].startswith(messages[49]['time'][:19])
+    assert all(params['offset'] == 0 for params in fake.requests)
+
+
+def test_messages_changing_during_sync_are_not_skipped_or_repeated():
+    messages = build_chat_messages(200)
+    fake = FakeChatlog(messages)
+    late = build_chat_messages(5, tag='L', start=datetime(2025, 7, 10), seq_start=5000)
+    
+    def change(request_number):
+        # 第二页之后：撤回一条已读过的消息，并写入新消息（偏移量分页会漏读一条）
+        if request_number == 3:
+            fake.messages.remove(messages[10])
+            fake.messages.extend(late)
+            
+    fake.on_request = change
+    seqs = _read(_client(fake))
+    assert len(seqs) == len(set(seqs))
+    assert seqs == [msg['seq'] for msg in messages + late]
+
+
+def test_same_second_messages_beyond_a_page():
+    messages = build_chat_messages(30)
+    burst = build_chat_messages(25, tag='B', seq_start=2000)
+    for msg in burst:
+        msg['time'] = messages[10]['time']
+    fake = FakeChatlog(messages[:11] + burst + messages[11:])
+    
+    seqs = _read(_client(fake, page_size=10))
+    assert sorted(seqs) == sorted(msg['seq'] for msg in messages + burst)
+    assert len(seqs) == len(set(seqs))
+
+
+def test_only_one_process_runs_scheduled_syncs(app, monkeypatch):
+    # 两个服务实例各自打开锁文件，与两个进程一样互斥
+    leader, follower = ChatlogSyncService(), ChatlogSyncService()
+    started = []
+    
+    def fake_start(service):
+        def start(app, trigger):
+            started.append(service)
+            return SimpleNamespace(run_id=trigger), True
+        return start
+        
+    for service in (leader, follower):
+        monkeypatch.setattr(service, 'start', fake_start(service))
+        
+    leader._scheduled_sync(app)
+    follower._scheduled_sync(app)
+    leader._scheduled_sync(app)
+    assert started == [leader, leader]
+    assert leader.get_schedule()['leader'] and not follower.get_schedule()['leader']
+    
+    # 持有锁的进程停止后，其他进程在下一次到点时接替
+    leader.stop_scheduler()
+    follower._scheduled_sync(app)
+    assert started[-1] is follower
+    follower.stop_scheduler()
+
+
+def test_messages_without_time_are_returned_once():
+    messages = build_chat_messages(120)
+    broken = [dict(messages[30], time='not a time', seq=None), dict(messages[31], time=None, seq=None)]
+    fake = FakeChatlog(messages)
+    # 接口把时间无法解析的消息放在第一页，之后重新请求游标所在的页时仍会返回
+    fake_get = fake.get
+    fake.get = lambda path, params: broken + fake_get(path, params)
+    
+    client = _client(fake)
+    read = list(client.iter_messages('group1', date(2025, 7, 1), date(2025, 8, 1)))
+    assert [msg for msg in read if msg['seq'] is None] == broken
+    assert [msg['seq'] for msg in read if msg['seq'] is not None] == [msg['seq'] for msg in messages]
@@ -0,0 +1,112 @@
+"""
+分块上传：续传、跨进程的哈希补读和会话锁、接收时计算的校验值
+"""
+import hashlib
+import io
+from pathlib import Path
+
+import pytest
+
+from app.services.chunked_upload import ChunkedUploadError, ChunkedUploadService, get_chunked_upload_service
+from app.utils.file_hash import hash_file
+
+
+def _init(client, content, **extra):
+    response = client.post('/api/v1/upload/chunked', json={'filename': 'chat.json', 'total_size': len(content), **extra})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['data']
+
+
+def _put(client, token, content, offset):
+    return client.put(f'/api/v1/upload/chunked/{token}?offset={offset}', data=content)
+
+
+def test_chunked_upload_resumes_and_finalizes(app, client, make_chat, tmp_path):
+    content = make_chat(300)
+    status = _init(client, content)
+    token = status['upload_token']
+    
+    assert _put(client, token, content[:5000], 0).status_code == 200
+    mismatch = _put(client, token, content[5000:], 4000)
+    assert mismatch.status_code == 409
+    assert mismatch.get_json()['error']['details'] == {'received': 5000}
+    
+    resumed = client.get(f'/api/v1/upload/chunked/{token}').get_json()['data']
+    assert resumed['received'] == 5000
+    assert _put(client, token, content[5000:], 5000).get_json()['data']['complete']
+    
+    expected = tmp_path / 'expected.json'
+    expected.write_bytes(content)
+    response = client.post(f'/api/v1/upload/chunked/{token}/finalize',
+                           json={'content_hash': hash_file(expected).content_hash})
+    assert response.status_code == 202, response.get_json()
+    
+    session_dir = Path(app.config['UPLOAD_FOLDER']) / ChunkedUploadService.SESSION_DIR
+    assert list(session_dir.iterdir()) == []
+    assert token not in get_chunked_upload_service()._hashers
+
+
+def test_chunks_received_by_another_process_are_hashed_once(app, tmp_path):
+    upload_folder = Path(app.config['UPLOAD_FOLDER'])
+    content = bytes(range(256)) * 4096
+    first, second = ChunkedUploadService(), ChunkedUploadService()
+    token = first.init_upload(upload_folder, 'chat.json', len(content), 1 << 20, 1 << 30)['upload_token']
+    
+    first.write_chunk(upload_folder, token, 0, io.BytesIO(content[:300000]))
+    # 第二个进程没有哈希缓存：补读已接收部分后继续
+    second.write_chunk(upload_folder, token, 300000, io.BytesIO(content[300000:700000]))
+    # 回到第一个进程：只补读第二个进程写入的部分
+    first.write_chunk(upload_folder, token, 700000, io.BytesIO(content[700000:]))
+    assert first._hashers[token].size == len(content)
+    
+    target = tmp_path / 'assembled.json'
+    hashes = first.finalize(upload_folder, token, target)['hashes']
+    assert target.read_bytes() == content
+    assert hashes == hash_file(target)
+    assert hashes.md5 == hashlib.md5(content).hexdigest()
+    
+    # 会话结束后其他进程遗留的哈希缓存在清理时丢弃
+    assert token in second._hashers
+    second.cleanup_expired(upload_folder)
+    assert token not in second._hashers
+
+
+def test_session_lock_is_shared_and_removed_on_abort(app):
+    upload_folder = Path(app.config['UPLOAD_FOLDER'])
+    service, other = ChunkedUploadService(), ChunkedUploadService()
+    token = service.init_upload(upload_folder, 'chat.json', 10, 10, 100)['upload_token']
+    
+    with service._session_lock(upload_folder, token) as lock_path:
+        with pytest.raises(ChunkedUploadError) as busy:
+            other.write_chunk(upload_folder, token, 0, io.BytesIO(b'0123456789'))
+        assert busy.value.code == 'UPLOAD_BUSY'
+        assert lock_path.exists()
+        
+    other.write_chunk(upload_folder, token, 0, io.BytesIO(b'01234'))
+    service.abort(upload_folder, token)
+    assert list((upload_folder / ChunkedUploadService.SESSION_DIR).iterdir()) == []
+    assert token not in service._hashers
+    
+    with pytest.raises(ChunkedUploadError) as missing:
+        other.write_chunk(upload_folder, token, 5, io.BytesIO(b'56789'))
+    assert missing.value.code == 'UPLOAD_NOT_FOUND'
+    assert list((upload_folder / ChunkedUploadService.SESSION_DIR).iterdir()) == []
+
+
+def test_md5_checksum_requires_md5_session(client, make_chat):
+    content = make_chat(20)
+    
+    untracked = _init(client, content)
+    assert not untracked['md5']
+    _put(client, untracked['upload_token'], content, 0)
+    response = client.post(f"/api/v1/upload/chunked/{untracked['upload_token']}/finalize",
+                           json={'md5': hashlib.md5(content).hexdigest()})
+    assert response.status_code == 400
+    assert response.get_json()['error']['code'] == 'MD5_NOT_TRACKED'
+    
+    tracked = _init(client, content, md5=True)
+    assert tracked['md5']
+    _put(client, tracked['upload_token'], content, 0)
+    response = client.post(f"/api/v1/upload/chunked/{tracked['upload_token']}/finalize",
+                           json={'md5': hashlib.md5(content).hexdigest()})
+    assert response.status_code == 202, response.get_json()
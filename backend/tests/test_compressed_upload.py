@@ -0,0 +1,90 @@
+"""
+压缩上传：一次上传的识别、校验和流式读取共用一个解压额度
+"""
+import gzip
+import io
+import zipfile
+
+import pytest
+
+from app import db
+from app.models import QAPair, UploadHistory
+from app.services.file_processor import FileProcessor
+from app.utils.compressed_input import SizeBudget, secure_upload_name
+
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def _upload_record(filename):
+    record = UploadHistory(filename=filename, file_size=1, status='pending')
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def test_zip_members_share_one_budget(app, tmp_path, make_chat):
+    members = {f'chat{i}.json': make_chat(200, talker=f'g{i}', tag=f'G{i}', key='messages') for i in range(3)}
+    member_size = max(len(content) for content in members.values())
+    path = tmp_path / 'export.zip'
+    path.write_bytes(_zip(members))
+    
+    # 每个成员都在额度内，三个成员合计超过额度
+    app.config['UPLOAD_MAX_DECOMPRESSED_SIZE'] = member_size * 2
+    result = FileProcessor().process_file_async(path, path.name, upload_record=_upload_record(path.name))
+    
+    assert not result['success']
+    assert '解压后的数据超过' in (result.get('error') or result.get('message'))
+    
+    app.config['UPLOAD_MAX_DECOMPRESSED_SIZE'] = member_size * 10
+    result = FileProcessor().process_file_async(path, 'again.zip', upload_record=_upload_record('again.zip'))
+    assert result['success'], result
+    assert QAPair.query.count() > 0
+
+
+def test_validation_and_streaming_consume_the_same_budget(app, tmp_path, make_chat):
+    content = make_chat(300, key='data')
+    path = tmp_path / 'chat.json.gz'
+    path.write_bytes(gzip.compress(content))
+    processor = FileProcessor()
+    
+    budget = SizeBudget(None)
+    assert processor.validate_file(path, budget) == (True, '')
+    detected = budget.used
+    assert 0 < detected
+    
+    messages = list(processor.streaming_processor.stream_messages(path, None, budget))
+    assert len(messages) == 300
+    # 流式读取再次识别消息数组并读完整个文件，都计入同一个额度
+    assert budget.used >= detected + len(content)
+    
+    # 额度只够读一遍文件时，校验之后的流式读取失败
+    app.config['UPLOAD_MAX_DECOMPRESSED_SIZE'] = len(content) + 10
+    result = processor.process_file_async(path, path.name, upload_record=_upload_record(path.name))
+    assert not result['success']
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('聊天记录.zip', 'chatlog.zip'),
+    ('群聊.json.gz', 'chatlog.json.gz'),
+    ('家长群 2025.JSON.ZST', '2025.json.zst'),
+    ('../../export.json', 'export.json'),
+    ('说明', 'chatlog'),
+])
+def test_secure_upload_name_keeps_suffix(name, expected):
+    assert secure_upload_name(name) == expected
+
+
+def test_compressed_upload_with_chinese_name(client, make_chat):
+    # 中文文件名是微信导出的常见情况，保存时不能丢掉压缩后缀
+    response = client.post('/api/v1/upload/file?wait=true',
+                           data={'file': (io.BytesIO(gzip.compress(make_chat(40))), '家长群聊天记录.json.gz'),
+                                 'use_ai': 'false'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    assert QAPair.query.count() > 0
@@ -0,0 +1,112 @@
+"""
+上下文压缩：编码格式、按字典ID解压和重新训练字典
+"""
+import json
+import random
+
+import pytest
+
+from app import db
+from app.models import ContextDictionary, QAPair
+from app.utils import context_codec
+from app.utils.context_codec import (
+    CODEC_RAW, CODEC_ZLIB, CODEC_ZSTD, CODEC_ZSTD_DICT, ContextCodec, load_context_codec,
+    train_zstd_dictionary
+)
+
+zstandard = pytest.importorskip('zstandard')
+
+
+def _contexts(seed, count=400):
+    rng = random.Random(seed)
+    words = ['请问', '怎么', '安装', '价格', '退款', '老师', '谢谢', 'chatlog', 'export', '版本', '配置', '报错']
+    return [
+        json.dumps({
+            'question_timestamp': f'2024-01-{rng.randint(1, 28):02d} 10:{rng.randint(0, 59):02d}:00',
+            'answer_timestamp': f'2024-01-{rng.randint(1, 28):02d} 11:{rng.randint(0, 59):02d}:00',
+            'context': [' '.join(rng.choice(words) for _ in range(rng.randint(5, 30))) for _ in range(3)],
+        }, ensure_ascii=False)
+        for _ in range(count)
+    ]
+
+
+def _register(dictionary, samples=0):
+    dict_id = zstandard.ZstdCompressionDict(dictionary).dict_id()
+    db.session.add(ContextDictionary(dict_id=dict_id, data=dictionary, sample_count=samples))
+    db.session.commit()
+    return dict_id
+
+
+def test_zlib_and_raw_round_trip():
+    codec = ContextCodec()
+    text = json.dumps({'question_timestamp': '2024-01-01', 'context': ['请问怎么安装']}, ensure_ascii=False)
+    
+    assert codec.encode(text)[0] == CODEC_ZLIB
+    assert codec.decode(codec.encode(text)) == text
+    assert codec.encode('x')[0] == CODEC_RAW
+    assert codec.decode(codec.encode('')) == ''
+    assert codec.encode(None) is None and codec.decode(None) is None
+
+
+def test_blobs_stay_readable_after_retrain(app):
+    app.config['CONTEXT_COMPRESSION'] = 'zstd'
+    codec = load_context_codec(app.config)
+    samples = _contexts(1)
+    
+    # 还没有训练字典：不带字典压缩
+    assert codec.encode(samples[0])[0] == CODEC_ZSTD
+    
+    first_id = _register(train_zstd_dictionary(samples[:300], 4096), 300)
+    codec.dictionaries.refresh()
+    first_blobs = [codec.encode(text) for text in samples[300:]]
+    assert first_blobs[0][0] == CODEC_ZSTD_DICT
+    assert int.from_bytes(first_blobs[0][1:5], 'big') == first_id
+    
+    # 另一个进程重新训练：本进程的编解码器不需要被替换
+    second_id = _register(train_zstd_dictionary(_contexts(2), 4096), 400)
+    assert second_id != first_id
+    worker_codec = load_context_codec(app.config)
+    assert [worker_codec.decode(blob) for blob in first_blobs] == samples[300:]
+    
+    second_blob = worker_codec.encode(samples[0])
+    assert int.from_bytes(second_blob[1:5], 'big') == second_id
+    assert codec.decode(second_blob) == samples[0]
+    
+    codec.dictionaries.refresh()
+    assert int.from_bytes(codec.encode(samples[0])[1:5], 'big') == second_id
+
+
+def test_legacy_file_dictionary_decodes_old_blobs(app, tmp_path):
+    dictionary = train_zstd_dictionary(_contexts(3), 4096)
+    legacy = zstandard.ZstdCompressor(dict_data=zstandard.ZstdCompressionDict(dictionary))
+    text = _contexts(4, 1)[0]
+    blob = bytes([CODEC_ZSTD]) + legacy.compress(text.encode('utf-8'))
+    
+    dict_path = tmp_path / 'legacy.dict'
+    dict_path.write_bytes(dictionary)
+    app.config['CONTEXT_ZSTD_DICT_PATH'] = str(dict_path)
+    assert load_context_codec(app.config).decode(blob) == text
+
+
+def test_train_context_dict_twice_keeps_rows_readable(app, monkeypatch):
+    app.config['CONTEXT_COMPRESSION'] = 'zstd'
+    monkeypatch.setattr(context_codec, '_context_codec', load_context_codec(app.config))
+    texts = _contexts(5)
+    for i, text in enumerate(texts):
+        db.session.add(QAPair(question=f'q{i}', answer='a', original_context=text))
+    db.session.commit()
+    
+    runner = app.test_cli_runner()
+    for _ in range(2):
+        result = runner.invoke(args=['train-context-dict', '--samples', '300', '--dict-size', '4096'])
+        assert result.exit_code == 0, result.output
+        
+    assert ContextDictionary.query.count() == 2
+    db.session.expire_all()
+    assert [qa.original_context for qa in QAPair.query.order_by(QAPair.id)] == texts
+    
+    # 从数据库重新加载的编解码器（新进程）同样可以解压
+    fresh = load_context_codec(app.config)
+    blob = db.session.query(QAPair.context_blob).order_by(QAPair.id).first()[0]
+    assert blob[0] == CODEC_ZSTD_DICT
+    assert fresh.decode(blob) == texts[0]
@@ -0,0 +1,82 @@
+"""
+上传哈希：写盘的同一遍计算内容哈希、样本哈希和旧记录用的 MD5
+"""
+import hashlib
+import io
+
+import pytest
+
+from app import db
+from app.models import UploadHistory
+from app.services.file_processor import FileProcessor
+from app.utils import file_hash
+from app.utils.file_hash import CONTENT_HASH_PREFIX, SAMPLE_SIZE, UploadHasher, compute_sample_hash, hash_file, save_stream
+
+
+def test_save_stream_hashes_while_writing(tmp_path):
+    content = bytes(range(256)) * 5000
+    target = tmp_path / 'upload.json'
+    
+    hashes = save_stream(io.BytesIO(content), target)
+    assert target.read_bytes() == content
+    assert hashes.size == len(content)
+    assert hashes.md5 == hashlib.md5(content).hexdigest()
+    assert hashes.content_hash.startswith(CONTENT_HASH_PREFIX)
+    assert hashes.sample_hash == compute_sample_hash(len(content), content[:SAMPLE_SIZE])
+    assert hashes == hash_file(target)
+    
+    # 不需要 MD5 时不计算
+    assert save_stream(io.BytesIO(content), tmp_path / 'b.json', legacy_md5=False).md5 is None
+
+
+def test_save_stream_enforces_max_size(tmp_path):
+    target = tmp_path / 'member.json'
+    with pytest.raises(ValueError):
+        save_stream(io.BytesIO(b'x' * 3000), target, max_size=2000)
+    assert not target.exists()
+
+
+def test_sample_hash_is_ready_after_head():
+    hasher = UploadHasher(total_size=SAMPLE_SIZE * 4)
+    hasher.update(b'a' * (SAMPLE_SIZE - 1))
+    assert hasher.sample_hash is None
+    hasher.update(b'a' * 10)
+    assert hasher.sample_hash == compute_sample_hash(SAMPLE_SIZE * 4, b'a' * SAMPLE_SIZE)
+    
+    # 小于样本大小的文件收齐即可
+    small = UploadHasher(total_size=5)
+    small.update(b'abcde')
+    assert small.sample_hash == compute_sample_hash(5, b'abcde')
+
+
+def test_blake2b_fallback(monkeypatch, tmp_path):
+    monkeypatch.setattr(file_hash, 'XXHASH_AVAILABLE', False)
+    monkeypatch.setattr(file_hash, 'CONTENT_HASH_PREFIX', 'blake2b:')
+    path = tmp_path / 'f.json'
+    path.write_bytes(b'hello')
+    assert hash_file(path).content_hash == 'blake2b:' + hashlib.blake2b(b'hello', digest_size=16).hexdigest()
+
+
+def test_legacy_md5_only_needed_for_old_records(app):
+    processor = FileProcessor()
+    assert not processor.needs_legacy_md5()
+    
+    db.session.add(UploadHistory(filename='old.json', file_size=1, file_hash='0' * 32, status='completed'))
+    db.session.commit()
+    assert processor.needs_legacy_md5()
+    assert processor.check_duplicate_upload(file_hash='0' * 32).filename == 'old.json'
+
+
+def test_probable_duplicate_reported_during_chunked_upload(client, make_chat):
+    content = make_chat(400)
+    assert len(content) > SAMPLE_SIZE
+    first = client.post('/api/v1/upload/file?wait=true', data={'file': (io.BytesIO(content), 'chat.json'), 'use_ai': 'false'},
+                        content_type='multipart/form-data')
+    assert first.status_code == 200
+    upload_id = first.get_json()['data']['upload_id']
+    assert db.session.get(UploadHistory, upload_id).sample_hash
+    
+    token = client.post('/api/v1/upload/chunked', json={'filename': 'chat.json', 'total_size': len(content)}
+                        ).get_json()['data']['upload_token']
+    head = client.put(f'/api/v1/upload/chunked/{token}?offset=0', data=content[:SAMPLE_SIZE]).get_json()['data']
+    assert head['probable_duplicate_of'] == upload_id
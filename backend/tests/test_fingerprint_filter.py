@@ -0,0 +1,115 @@
+"""
+内容指纹布隆过滤器：文件往返、无漏判、命中时查库确认，以及重复上传去重
+"""
+import io
+
+import pytest
+
+from app import db
+from app.models import QAPair
+from app.services.fingerprint_filter import get_fingerprint_filter_service
+from app.utils.bloom_filter import BloomFilter
+from app.utils.dedup_index import DedupIndex
+from app.utils.content_fingerprint import content_fingerprint
+
+
+@pytest.fixture
+def small_filter(app):
+    app.config['DEDUP_FILTER_CAPACITY'] = 10000
+    return app
+
+
+def _fingerprints(count, tag='f'):
+    return [content_fingerprint(f'question {tag}{i}', f'answer {i}', 'user', 'advisor') for i in range(count)]
+
+
+def test_bloom_filter_round_trips_through_file(tmp_path):
+    path = tmp_path / 'fp.bloom'
+    added = _fingerprints(2000)
+    bloom = BloomFilter.create(path, 2000, 0.01)
+    bloom.update(added[:1000])
+    for fingerprint in added[1000:]:
+        bloom.add(fingerprint)
+    bloom.meta = {'qa_id': 42}
+    bloom.close()
+    
+    reopened = BloomFilter.open(path)
+    assert reopened.meta == {'qa_id': 42}
+    assert 1900 < reopened.count <= 2000  # 逐个添加时已全部命中的指纹不计数
+    # 没有漏判，批量与逐个判断结果一致
+    assert all(fingerprint in reopened for fingerprint in added)
+    assert reopened.contains_many(added) == [True] * len(added)
+    
+    others = _fingerprints(2000, tag='other')
+    hits = reopened.contains_many(others)
+    assert hits == [fingerprint in reopened for fingerprint in others]
+    assert sum(hits) < 2000 * 0.05
+    reopened.close()
+
+
+def test_filter_hits_are_confirmed_against_database(small_filter):
+    db.session.add(QAPair(question='已有问题', answer='已有回答', asker='user', advisor='老师'))
+    db.session.commit()
+    existing = QAPair.query.one().content_fingerprint
+    
+    service = get_fingerprint_filter_service()
+    bloom = service.get_filter()
+    assert existing in bloom
+    assert bloom.meta['qa_id'] == 1
+    
+    # 只在过滤器中（误判）的指纹查库后仍算作新指纹
+    false_positive = content_fingerprint('不存在的问题', '回答', None, None)
+    bloom.add(false_positive)
+    queried = []
+    
+    def lookup(fingerprints):
+        queried.extend(fingerprints)
+        return service.lookup(fingerprints)
+        
+    index = DedupIndex(bloom=bloom, lookup=lookup)
+    assert not index.claim(existing)
+    assert index.claim(false_positive)
+    assert not index.claim(false_positive)
+    fresh = content_fingerprint('全新的问题', '回答', None, None)
+    assert index.claim(fresh)
+    assert queried == [existing, false_positive]
+    assert fresh in bloom
+
+
+def test_filter_catches_up_with_rows_written_elsewhere(small_filter):
+    service = get_fingerprint_filter_service()
+    bloom = service.get_filter()
+    assert bloom.count == 0
+    
+    db.session.execute(QAPair.__table__.insert(), [
+        {'question': f'q{i}', 'answer': 'a', 'confidence': 0.9} for i in range(5)
+    ])
+    db.session.commit()
+    
+    bloom = service.get_filter()
+    assert bloom.meta['qa_id'] == 5
+    # 绕过 ORM 写入的记录补算了指纹
+    fingerprints = [fp for (fp,) in db.session.query(QAPair.content_fingerprint)]
+    assert all(fingerprints) and all(fp in bloom for fp in fingerprints)
+
+
+def test_duplicate_upload_saves_no_duplicates(client, small_filter, make_chat):
+    content = make_chat(80)
+    
+    def upload():
+        response = client.post('/api/v1/upload/file?wait=true',
+                               data={'file': (io.BytesIO(content), 'chat.json'), 'use_ai': 'false'},
+                               content_type='multipart/form-data')
+        assert response.status_code == 200, response.get_json()
+        
+    upload()
+    first = QAPair.query.count()
+    assert first > 0
+    
+    # 重新打开过滤器文件（模拟进程重启）后再次上传同样的内容
+    service = get_fingerprint_filter_service()
+    service._filters.clear()
+    upload()
+    assert QAPair.query.count() == first
+    assert db.session.query(QAPair.content_fingerprint).distinct().count() == first
+    assert service.get_filter().meta['qa_id'] == first
@@ -0,0 +1,103 @@
+"""
+断点续传：处理失败后重试同一个上传，从检查点继续，结果与一次处理完相同
+"""
+import gzip
+from datetime import datetime
+
+from app import db
+from app.models import ChatWatermark, QAPair, UploadHistory
+from app.services.chat_watermark import WatermarkFilter
+from app.services.data_extractor import DataExtractor
+from app.services.file_processor import FileProcessor
+from app.services.ingest_checkpoint import IngestCheckpoint
+
+from conftest import build_chat_messages
+
+
+def _record(path):
+    record = UploadHistory(filename=path.name, file_size=path.stat().st_size, content_hash='xxh128:test',
+                           status='pending')
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def _fail_third_batch(path, record, monkeypatch):
+    """处理上传，第三批入库时失败"""
+    processor = FileProcessor()
+    save_qa_batch, calls = processor._save_qa_batch, []
+    
+    def failing_save(batch, *args, **kwargs):
+        calls.append(len(batch))
+        if len(calls) == 3:
+            raise RuntimeError('database went away')
+        return save_qa_batch(batch, *args, **kwargs)
+        
+    monkeypatch.setattr(processor, '_save_qa_batch', failing_save)
+    assert not processor.process_file(path, record).success
+    return processor
+
+
+def test_failed_upload_resumes_from_checkpoint(app, tmp_path, make_chat, monkeypatch):
+    monkeypatch.setattr(DataExtractor, 'SHARD_SIZE', 200)
+    content = make_chat(1200, key='messages')
+    path = tmp_path / 'chat.json.gz'
+    path.write_bytes(gzip.compress(content))
+    record = _record(path)
+    
+    # 第一次处理：第三批入库时失败
+    _fail_third_batch(path, record, monkeypatch)
+    
+    data = record.get_ingest_checkpoint()
+    source = next(iter(data['chats']))
+    first_position = data['chats'][source]['qa']
+    assert 0 < first_position < 1200
+    assert data['last_error'] == 'database went away'
+    assert data['saved'] == QAPair.query.count() > 0
+    
+    # 重试：只提取检查点之后的消息
+    retry = FileProcessor()
+    positions = []
+    iter_extract = retry.data_extractor.iter_extract
+    monkeypatch.setattr(retry.data_extractor, 'iter_extract',
+                        lambda messages, source, offset=0: positions.append(offset) or iter_extract(messages, source, offset))
+    result = retry.process_file(path, record)
+    assert result.success
+    assert positions == [first_position]
+    assert retry.checkpoint.resumed and retry.checkpoint.attempts == 2
+    
+    extractor = DataExtractor(max_workers=1)
+    expected = extractor.extract_from_stream(extractor.iter_normalized_messages(build_chat_messages(1200)), 'x')
+    pairs = [(qa.question, qa.answer) for qa in QAPair.query]
+    assert len(pairs) == len(set(pairs))
+    assert set(pairs) == {(qa.question, qa.answer) for qa in expected}
+    assert db.session.get(UploadHistory, record.id).qa_count == len(pairs)
+    
+    # 完成后的检查点不再用于续传
+    assert record.get_ingest_checkpoint()['completed']
+    assert not IngestCheckpoint.load(record, retry.checkpoint.key).resumed
+
+
+def test_checkpoint_only_depends_on_watermarks_of_covered_chats(app, tmp_path, make_chat, monkeypatch):
+    monkeypatch.setattr(DataExtractor, 'SHARD_SIZE', 200)
+    path = tmp_path / 'chat.json.gz'
+    path.write_bytes(gzip.compress(make_chat(1200, talker='group1', key='messages')))
+    record = _record(path)
+    key = _fail_third_batch(path, record, monkeypatch).checkpoint.key
+    
+    saved = record.get_ingest_checkpoint()['watermarks']
+    assert saved['chats'] == ['group1']
+    
+    # 覆盖的聊天水位线变化时检查点失效，其他聊天的不影响
+    moved = {'group1': (datetime(2025, 7, 1, 12), 1020)}
+    other = {'group2': (datetime(2025, 8, 1), 99)}
+    assert IngestCheckpoint.load(record, key, WatermarkFilter(other, 60)).resumed
+    assert not IngestCheckpoint.load(record, key, WatermarkFilter(moved, 60)).resumed
+    assert not IngestCheckpoint.load(record, key).resumed
+    
+    # 另一个聊天在两次处理之间推进了水位线：重试仍从检查点继续
+    db.session.add(ChatWatermark(talker='group2', last_timestamp=datetime(2025, 8, 1), last_seq=99, message_count=1))
+    db.session.commit()
+    retry = FileProcessor()
+    assert retry.process_file(path, record).success
+    assert retry.checkpoint.resumed and retry.checkpoint.attempts == 2
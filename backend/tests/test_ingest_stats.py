@@ -0,0 +1,57 @@
+"""
+上传处理统计：提取和分类只累计计数，结果与按列表统计一致
+"""
+import random
+from datetime import datetime
+
+from app.services.data_extractor import DataExtractor, QACandidate
+from app.services.ingest_pipeline import IngestStats, classify_stage, extract_stage, normalize_stage, parse_stage
+from app.services.qa_classifier import CategoryMatch, QAClassifier
+from app.utils.pipeline import Pipeline
+
+from conftest import build_chat_messages
+
+
+def test_tallies_match_list_statistics():
+    rng = random.Random(3)
+    candidates = [
+        QACandidate('q', 'a', 'u', f'advisor{rng.randrange(8)}', datetime(2025, 1, 1), rng.random(), [])
+        for _ in range(500)
+    ]
+    matches = [CategoryMatch(i % 4, f'c{i % 4}', rng.random(), []) for i in range(500)]
+    stats = IngestStats()
+    for qa, match in zip(candidates, matches):
+        stats.extraction.add(qa.confidence, qa.advisor)
+        stats.classification.add(match)
+        
+    assert stats.extraction.to_stats() == DataExtractor(max_workers=1).get_extraction_stats(candidates)
+    assert stats.classification.to_stats() == QAClassifier().get_classification_stats(matches)
+    assert stats.extracted == stats.classified == 500
+    
+    empty = IngestStats()
+    assert empty.extraction.to_stats() == DataExtractor(max_workers=1).get_extraction_stats([])
+    assert empty.classification.to_stats() == QAClassifier().get_classification_stats([])
+
+
+def test_pipeline_keeps_counters_not_candidates():
+    extractor, classifier = DataExtractor(max_workers=1), QAClassifier()
+    stats = IngestStats(resumed_extracted=7)
+    results = []
+    
+    pipeline = Pipeline('stats', [
+        parse_stage(),
+        normalize_stage(extractor, stats),
+        extract_stage(extractor, stats),
+        classify_stage(classifier, stats)
+    ])
+    for item in pipeline.run([('chat.json', iter(build_chat_messages(400)))]):
+        if isinstance(item, tuple):
+            results.append(item)
+            
+    assert results
+    assert stats.messages == 400
+    assert stats.extracted == stats.classified == len(results)
+    assert stats.total_extracted == len(results) + 7
+    assert isinstance(stats.extracted, int)
+    assert stats.extraction.to_stats() == extractor.get_extraction_stats([qa for qa, _ in results])
+    assert stats.classification.to_stats() == classifier.get_classification_stats([match for _, match in results])
@@ -0,0 +1,82 @@
+"""
+列式消息缓冲区：发送者驻留、切片、按时间排序，以及与消息 dict 列表的提取结果一致
+"""
+import json
+import pickle
+import random
+from datetime import datetime, timedelta, timezone
+
+from app.services.data_extractor import DataExtractor
+from app.utils.message_buffer import MessageBuffer, datetime_to_micros, micros_to_datetime
+
+from conftest import build_chat_messages
+
+
+def _message(content, sender, minutes):
+    return {'content': content, 'sender': sender,
+            'timestamp': datetime(2025, 7, 1, 9) + timedelta(minutes=minutes), 'msg_type': 1}
+
+
+def test_micros_round_trip_and_timezone():
+    value = datetime(2025, 7, 1, 9, 30, 15, 123456)
+    assert micros_to_datetime(datetime_to_micros(value)) == value
+    aware = datetime(2025, 7, 1, 9, tzinfo=timezone(timedelta(hours=8)))
+    assert micros_to_datetime(datetime_to_micros(aware)) == datetime(2025, 7, 1, 1)
+
+
+def test_senders_are_interned_and_items_match_input():
+    messages = [_message(f'm{i}', ('alice', 'bob', 'carol')[i % 3], i) for i in range(9)]
+    buffer = MessageBuffer.from_messages(messages)
+    
+    assert len(buffer) == 9
+    assert buffer.senders == ['alice', 'bob', 'carol']
+    assert buffer.sender_ids.tolist() == [0, 1, 2] * 3
+    assert [buffer[i] for i in range(len(buffer))] == messages
+    assert buffer.features == [None] * 9
+
+
+def test_slices_keep_sender_table_and_columns():
+    buffer = MessageBuffer.from_messages(_message(f'm{i}', f's{i % 4}', i) for i in range(20))
+    
+    part = buffer[5:12]
+    assert isinstance(part, MessageBuffer)
+    assert part.senders == buffer.senders
+    assert [part[i] for i in range(len(part))] == [buffer[i] for i in range(5, 12)]
+    assert part.timestamps.tolist() == buffer.timestamps[5:12].tolist()
+    
+    stepped = buffer[::5]
+    assert [stepped[i]['content'] for i in range(len(stepped))] == ['m0', 'm5', 'm10', 'm15']
+    
+    # 分片发送到工作进程：序列化后可还原并继续追加
+    restored = pickle.loads(pickle.dumps(part))
+    assert [restored[i] for i in range(len(restored))] == [part[i] for i in range(len(part))]
+    restored.append('new', 's1', datetime(2025, 7, 2))
+    assert restored.sender_ids[-1] == restored.senders.index('s1')
+
+
+def test_sorted_by_time_is_stable():
+    messages = [_message(f'm{i}', 'x', minutes) for i, minutes in enumerate([3, 1, 2, 1, 0, 3])]
+    buffer = MessageBuffer.from_messages(messages)
+    assert not buffer.is_sorted()
+    
+    ordered = buffer.sorted_by_time()
+    expected = sorted(messages, key=lambda message: message['timestamp'])
+    assert [ordered[i] for i in range(len(ordered))] == expected
+    assert ordered.is_sorted()
+    assert ordered.sorted_by_time() is ordered
+
+
+def test_extraction_from_unsorted_export_matches_sorted_list():
+    extractor = DataExtractor(max_workers=1)
+    raw = build_chat_messages(400)
+    shuffled = raw[:]
+    random.Random(7).shuffle(shuffled)
+    
+    from_buffer = extractor.extract_from_json(json.dumps(shuffled), 'shuffled.json')
+    
+    messages = sorted(extractor.iter_normalized_messages(raw), key=lambda message: message['timestamp'])
+    from_list = extractor._deduplicate_qa(extractor._extract_qa_pairs(messages, 'shuffled.json'))
+    
+    assert from_buffer
+    assert [(qa.question, qa.answer, qa.asker, qa.advisor) for qa in from_buffer] == \
+        [(qa.question, qa.answer, qa.asker, qa.advisor) for qa in from_list]
@@ -0,0 +1,87 @@
+"""
+多进程分片提取：结果与串行提取一致，小消息流不创建进程池
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import data_extractor
+from app.services.data_extractor import DataExtractor
+
+
+def _messages(count, seed=1):
+    rng = random.Random(seed)
+    questions = ['请问老师孩子申请学校需要准备什么？', '怎么办理助学金？', 'FAFSA 怎么填', '这个问题如何解决', '好的', '谢谢老师']
+    answers = ['建议首先准备成绩单，然后联系学校', '可以在官网申请，步骤如下', '方法很简单，第一步登录', '推荐你先咨询顾问再处理']
+    people = ['张三', '李四', '王老师', '赵老师', '小明']
+    current = datetime(2024, 1, 1)
+    messages = []
+    for i in range(count):
+        current += timedelta(seconds=rng.choice([5, 30, 60, 120]))
+        messages.append({'content': rng.choice(questions + answers) + str(i % 7), 'sender': rng.choice(people),
+                         'timestamp': current})
+    return messages
+
+
+def _key(candidates):
+    return [(qa.question, qa.answer, qa.asker, qa.advisor, qa.confidence, tuple(qa.context)) for qa in candidates]
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    created = []
+    real = data_extractor.ProcessPoolExecutor
+    
+    def recording_pool(*args, **kwargs):
+        created.append(kwargs.get('max_workers'))
+        return real(*args, **kwargs)
+        
+    monkeypatch.setattr(data_extractor, 'ProcessPoolExecutor', recording_pool)
+    data_extractor.shutdown_extract_pool()
+    yield created
+    data_extractor.shutdown_extract_pool()
+
+
+def test_parallel_stream_matches_serial_extraction(pools):
+    messages = _messages(3000)
+    serial = DataExtractor(max_workers=1)._extract_qa_pairs([dict(m) for m in messages], 'chat.json')
+    
+    parallel = DataExtractor(max_workers=2)
+    parallel.SHARD_SIZE = 250
+    parallel.PARALLEL_MIN_MESSAGES = 1000
+    streamed = parallel.extract_from_stream(iter([dict(m) for m in messages]), 'chat.json')
+    
+    assert pools == [2]
+    assert _key(streamed) == _key(serial)
+    
+    # 之后的提取器共用同一个进程池
+    again = DataExtractor(max_workers=2)
+    again.SHARD_SIZE = 250
+    again.PARALLEL_MIN_MESSAGES = 1000
+    assert _key(again.extract_from_stream(iter([dict(m) for m in messages]), 'chat.json')) == _key(serial)
+    assert pools == [2]
+
+
+def test_small_stream_stays_in_process(pools):
+    messages = _messages(800)
+    extractor = DataExtractor(max_workers=4)
+    extractor.SHARD_SIZE = 100
+    extractor.PARALLEL_MIN_MESSAGES = 1000
+    
+    positions = [position for position, _ in extractor.iter_shard_results(iter(messages), 'chat.json')]
+    streamed = extractor.extract_from_stream(iter([dict(m) for m in messages]), 'chat.json')
+    
+    assert pools == []
+    assert positions == list(range(100, 900, 100))
+    assert _key(streamed) == _key(DataExtractor(max_workers=1).extract_from_stream(iter(messages), 'chat.json'))
+
+
+def test_default_extracts_in_process(app):
+    # 默认（EXTRACT_WORKERS=1）不创建进程池
+    assert DataExtractor().max_workers == 1
+    app.config['EXTRACT_WORKERS'] = 3
+    try:
+        assert DataExtractor().max_workers == 3
+    finally:
+        app.config['EXTRACT_WORKERS'] = 1
@@ -0,0 +1,54 @@
+"""
+组合规则匹配：结果与逐条 re.search / 子串判断一致
+"""
+import random
+import re
+
+import pytest
+
+import benchmark_patterns as legacy
+from app.services.data_extractor import DataExtractor
+from app.services.qa_classifier import QAClassifier
+from app.utils.pattern_engine import KeywordMatcher, PatternSet, simplify_search_pattern
+
+
+RULES = {
+    'question': [r'.*[？?].*', r'(请问|怎么)'],
+    'price': [r'\d+元', r'价格.*多少'],
+    'greeting': [r'^(你好|您好)'],
+    'empty': [],
+}
+
+
+@pytest.mark.parametrize('text', legacy.SAMPLE_TEXTS + ['您好，价格是999元吗？', '', 'x' * 500])
+def test_pattern_set_matches_each_rule_like_re_search(text):
+    patterns = PatternSet(RULES)
+    expected = {key for key, rule in RULES.items() if any(re.search(p, text, re.IGNORECASE) for p in rule)}
+    
+    assert patterns.matches(text) == expected
+    assert patterns.search(text) == bool(expected)
+
+
+def test_simplify_keeps_escaped_dot_star():
+    assert simplify_search_pattern('.*?老师.*') == '老师'
+    assert simplify_search_pattern(r'版本\.*') == r'版本\.*'
+
+
+def test_keyword_matcher_finds_all_present_keywords():
+    matcher = KeywordMatcher(['价格', '价', '安装', '', '价格'])
+    assert matcher.find('专业版价格多少') == {'价格', '价'}
+    assert matcher.find('没有关键词') == set()
+
+
+def test_extractor_and_classifier_scores_match_legacy_rules():
+    extractor = DataExtractor(max_workers=1)
+    classifier = QAClassifier()
+    texts = legacy.SAMPLE_TEXTS
+    answers = random.Random(0).sample(texts, len(texts))
+    
+    for question, answer in zip(texts, answers):
+        assert extractor._is_noise(question) == legacy.legacy_is_noise(extractor, question)
+        assert extractor._is_potential_question(question) == legacy.legacy_is_potential_question(extractor, question)
+        assert extractor._calculate_answer_confidence(question, answer) == \
+            legacy.legacy_answer_confidence(extractor, question, answer)
+        assert classifier._calculate_category_scores(question) == legacy.legacy_category_scores(classifier, question)
@@ -0,0 +1,134 @@
+"""
+重新分类：键集分批、进程池分类与逐条分类结果一致，只写回变化的行并同步统计汇总
+"""
+import os
+
+import pytest
+
+from app import db
+from app.models import Category, CategoryStats, QAPair
+from app.services.qa_classifier import QAClassifier
+from app.services.reclassification import get_reclassification_service
+from app.services.stats_rollup import get_stats_rollup_service
+
+from conftest import ANSWERS, QUESTIONS
+
+EXTRA_QUESTIONS = ['退款要多久能到账？', '怎么修改登录密码？', '这个功能下个版本会上线吗？']
+
+
+def _category_counts():
+    return sorted((row.category_id, row.qa_count) for row in CategoryStats.query.filter(CategoryStats.qa_count != 0))
+
+
+@pytest.fixture
+def qa_pairs(app):
+    rollup = get_stats_rollup_service()
+    rollup._needs_reconcile = False
+    questions = QUESTIONS + EXTRA_QUESTIONS
+    for i in range(30):
+        db.session.add(QAPair(
+            question=f'{questions[i % len(questions)]}（{i}）', answer=ANSWERS[i % len(ANSWERS)],
+            category_id=1, advisor='老师', confidence=0.9,
+            source_file='upload_1_ai' if i % 10 == 0 else 'upload_1'
+        ))
+    db.session.commit()
+    rollup.reconcile()
+    yield
+    rollup._needs_reconcile = False
+
+
+def _run(app, **options):
+    service = get_reclassification_service()
+    job, created = service.create_job(**options)
+    assert created
+    return service.run_job(app, job.job_id)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_reclassify_matches_classifier_and_rollup(app, qa_pairs, workers):
+    classifier = QAClassifier()
+    rows = QAPair.query.order_by(QAPair.id).all()
+    # AI 处理的问答对默认跳过
+    expected = {
+        qa.id: 1 if qa.source_file.endswith('_ai') else classifier.classify_qa(qa.question, qa.answer, []).category_id
+        for qa in rows
+    }
+    unchanged_at = {qa.id: qa.updated_at for qa in rows if expected[qa.id] == 1}
+    assert set(expected.values()) != {1}
+    
+    result = _run(app, batch_size=7, workers=workers)
+    assert result['status'] == 'completed', result['error']
+    assert (result['total'], result['processed']) == (27, 27)
+    assert result['changed'] == sum(1 for category_id in expected.values() if category_id != 1)
+    assert sum(item['count'] for item in result['transitions']) == result['changed']
+    
+    db.session.expire_all()
+    assert {qa.id: qa.category_id for qa in QAPair.query} == expected
+    assert {qa.id: qa.updated_at for qa in QAPair.query if qa.id in unchanged_at} == unchanged_at
+    
+    # 增量更新的统计汇总与全量校准一致
+    incremental = _category_counts()
+    get_stats_rollup_service().reconcile()
+    assert _category_counts() == incremental
+    
+    # 再运行一次没有变化
+    assert _run(app, batch_size=7, workers=1)['changed'] == 0
+
+
+def test_include_ai_and_rows_added_during_job(app, qa_pairs, monkeypatch):
+    service = get_reclassification_service()
+    iter_batches = service._iter_batches
+    
+    def add_row_after_first_batch(job, max_id):
+        for index, rows in enumerate(iter_batches(job, max_id)):
+            if index == 0:
+                # 任务开始后入库的问答对已按当前规则分类，不在本次范围内
+                db.session.add(QAPair(question='专业版的价格是多少钱？（新）', answer=ANSWERS[2], category_id=1))
+                db.session.commit()
+            yield rows
+            
+    monkeypatch.setattr(service, '_iter_batches', add_row_after_first_batch)
+    result = _run(app, batch_size=10, workers=1, include_ai=True)
+    assert (result['total'], result['processed'], result['last_id']) == (30, 30, 30)
+    assert db.session.query(QAPair.category_id).filter(QAPair.id == 31).scalar() == 1
+
+
+def test_rows_changed_between_read_and_write_are_left_alone(app, qa_pairs, monkeypatch):
+    service = get_reclassification_service()
+    classify_batches = service._classify_batches
+    manual = {}
+    
+    def change_rows_before_write(job, classifier, max_id):
+        for index, (rows, category_ids) in enumerate(classify_batches(job, classifier, max_id)):
+            if index == 0:
+                # 读取后、写回前：手工修改一条的分类，删除另一条
+                changing = [(row, category_id) for row, category_id in zip(rows, category_ids)
+                            if category_id != row.category_id]
+                (edited, new_category_id), (deleted, _) = changing[:2]
+                manual_category_id = next(c.id for c in Category.query if c.id not in (1, new_category_id))
+                db.session.get(QAPair, edited.id).category_id = manual_category_id
+                db.session.delete(db.session.get(QAPair, deleted.id))
+                db.session.commit()
+                manual.update(id=edited.id, category_id=manual_category_id)
+            yield rows, category_ids
+            
+    monkeypatch.setattr(service, '_classify_batches', change_rows_before_write)
+    result = _run(app, batch_size=30, workers=1)
+    assert result['status'] == 'completed', result['error']
+    assert result['conflicts'] == 2
+    
+    db.session.expire_all()
+    assert db.session.get(QAPair, manual['id']).category_id == manual['category_id']
+    
+    # 统计汇总没有因被跳过的行产生偏差
+    incremental = _category_counts()
+    get_stats_rollup_service().reconcile()
+    assert _category_counts() == incremental
+
+
+def test_worker_count_is_bounded(app):
+    service = get_reclassification_service()
+    for requested, expected in ((None, min(2, os.cpu_count() or 1)), (1000, 8), (1, 1)):
+        job, created = service.create_job(workers=requested)
+        assert created and job.workers == expected
+        job.status = 'completed'
@@ -0,0 +1,75 @@
+"""
+重新提取：按提取时的指纹比较，手工修改过的问答不被当作过时删除，也不会被重复添加
+"""
+import io
+
+from app import db
+from app.models import QAPair
+from app.services.reextraction import get_reextraction_service
+
+
+def _upload(client, content):
+    response = client.post('/api/v1/upload/file?wait=true',
+                           data={'file': (io.BytesIO(content), 'chat.json'), 'use_ai': 'false'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['data']['upload_id']
+
+
+def _run(app, upload_id, **options):
+    service = get_reextraction_service()
+    job, created = service.create_job([upload_id], **options)
+    assert created
+    return service.run_job(app, job.job_id)
+
+
+def test_prune_keeps_hand_edited_pairs(app, client, make_chat):
+    upload_id = _upload(client, make_chat(60))
+    extracted = QAPair.query.order_by(QAPair.id).all()
+    assert len(extracted) > 2
+    
+    # 手工修改一条提取出的问答：内容指纹变了，提取时的指纹不变
+    edited = extracted[0]
+    original_fingerprint = edited.content_fingerprint
+    edited.answer = edited.answer + '（老师补充：记得先备份）'
+    db.session.commit()
+    assert edited.content_fingerprint != original_fingerprint
+    assert edited.extraction_fingerprint == original_fingerprint
+    
+    # 旧规则提取、新规则不再提取的两条：一条未修改（过时），一条之后被手工修改过
+    obsolete = QAPair(question='旧规则提取的问题？', answer='旧规则提取的回答', source_file=f'upload_{upload_id}')
+    reviewed = QAPair(question='旧规则提取的另一个问题？', answer='旧回答', source_file=f'upload_{upload_id}')
+    db.session.add_all([obsolete, reviewed])
+    db.session.commit()
+    reviewed.answer = '人工改写过的回答'
+    db.session.commit()
+    obsolete_id, reviewed_id, edited_id = obsolete.id, reviewed.id, edited.id
+    
+    result = _run(app, upload_id, apply=True, prune=True)
+    assert result['status'] == 'completed', result['error']
+    assert (result['added'], result['saved']) == (0, 0)
+    assert result['matched'] == len(extracted)
+    assert (result['stale'], result['removed'], result['edited']) == (1, 1, 1)
+    
+    remaining = {qa.id for qa in QAPair.query}
+    assert obsolete_id not in remaining
+    assert {edited_id, reviewed_id} <= remaining
+    assert len(remaining) == len(extracted) + 1
+    
+    # 再运行一次：没有新增，也没有过时
+    again = _run(app, upload_id, apply=True, prune=True)
+    assert (again['added'], again['stale'], again['edited']) == (0, 0, 1)
+    assert QAPair.query.count() == len(extracted) + 1
+
+
+def test_dry_run_reports_without_changes(app, client, make_chat):
+    upload_id = _upload(client, make_chat(40, tag='D'))
+    total = QAPair.query.count()
+    db.session.add(QAPair(question='旧规则提取的问题？', answer='旧规则提取的回答', source_file=f'upload_{upload_id}'))
+    db.session.commit()
+    
+    result = _run(app, upload_id)
+    assert result['mode'] == 'dry_run'
+    assert result['stale'] == 1 and result['removed'] == 0
+    assert result['stale_samples'][0]['question'] == '旧规则提取的问题？'
+    assert QAPair.query.count() == total + 1
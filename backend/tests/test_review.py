@@ -0,0 +1,63 @@
+"""
+原始问答暂存表：低质量配对进入 raw_qa_pairs，审核通过后才进入 qa_pairs
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from app import db
+from app.models import QAPair, RawQAPair, UploadHistory
+from app.services.file_processor import FileProcessor
+from app.services.search_service import SearchService
+
+
+@pytest.fixture
+def staged(app):
+    SearchService()  # 创建 FTS 表
+    upload = UploadHistory(filename='chat.json', file_size=10)
+    db.session.add(upload)
+    db.session.commit()
+    
+    messages = [
+        {'content': f'message number {i} 怎么办', 'sender': f's{i % 2}', 'timestamp': datetime(2024, 1, 1, 0, i)}
+        for i in range(10)
+    ]
+    processor = FileProcessor()
+    created = processor._create_raw_qa_pairs_from_messages(messages, upload.id)
+    return upload, processor, messages, created
+
+
+def test_raw_pairs_are_staged_outside_qa_pairs(staged):
+    upload, processor, messages, created = staged
+    
+    assert len(created) == 5
+    assert RawQAPair.query.filter_by(upload_id=upload.id, status='pending').count() == 5
+    assert QAPair.query.count() == 0
+    
+    # 重复导入按指纹去重
+    assert processor._create_raw_qa_pairs_from_messages(messages, upload.id) == []
+    assert RawQAPair.query.count() == 5
+
+
+def test_review_endpoints_promote_and_reject(staged, client):
+    upload = staged[0]
+    
+    queue = client.get(f'/api/v1/review?upload_id={upload.id}').get_json()
+    assert queue['pagination']['total'] == 5
+    assert queue['stats'] == {'approved': 0, 'pending': 5, 'rejected': 0}
+    ids = [item['id'] for item in queue['data']]
+    
+    approved = client.post('/api/v1/review/approve', json={'ids': ids[:2]}).get_json()
+    assert approved['data']['approved'] == 2
+    rejected = client.post('/api/v1/review/reject', json={'ids': [ids[2]]}).get_json()
+    assert rejected['data']['rejected'] == 1
+    
+    assert client.post('/api/v1/review/approve', json={}).status_code == 400
+    
+    # 审核通过的问答进入 qa_pairs、全文索引和列表接口
+    assert QAPair.query.count() == 2
+    indexed = db.session.execute(text("SELECT rowid FROM qa_pairs_fts WHERE qa_pairs_fts MATCH 'message'")).fetchall()
+    assert sorted(row[0] for row in indexed) == sorted(approved['data']['qa_ids'])
+    assert client.get('/api/v1/qa').get_json()['total'] == 2
+    assert RawQAPair.query.filter_by(status='pending').count() == 2
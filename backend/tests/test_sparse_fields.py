@@ -0,0 +1,68 @@
+"""
+列表和搜索接口的 fields= / view=list 稀疏字段
+"""
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.models import QAPair
+from app.services.search_service import SearchService
+
+
+@pytest.fixture
+def corpus(app):
+    for i in range(30):
+        db.session.add(QAPair(question=f'如何安装产品{i} install guide', answer='安装步骤 ' * 40,
+                              category_id=1 + i % 3, advisor='张三', confidence=0.9, original_context='{"a": 1}'))
+    db.session.commit()
+    SearchService()._rebuild_fts_index()
+
+
+@pytest.fixture
+def statements(app):
+    executed = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+        
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+LIST_VIEW = {'id', 'question', 'answer_preview', 'category', 'advisor', 'confidence', 'created_at'}
+
+
+def test_qa_list_view_skips_answer_and_context(corpus, client, statements):
+    data = client.get('/api/v1/qa?view=list&per_page=3').get_json()['data']
+    
+    assert set(data[0]) == LIST_VIEW
+    assert len(data[0]['answer_preview']) == QAPair.ANSWER_PREVIEW_LENGTH
+    assert set(data[0]['category']) == {'id', 'name', 'color'}
+    
+    select = [sql for sql in statements if sql.lstrip().startswith('SELECT') and 'LIMIT' in sql][-1]
+    assert 'qa_pairs.answer AS' not in select
+    assert 'context_blob' not in select
+
+
+def test_qa_fields_selection_and_validation(corpus, client):
+    data = client.get('/api/v1/qa?fields=question,confidence&per_page=2').get_json()['data']
+    assert [set(item) for item in data] == [{'id', 'question', 'confidence'}] * 2
+    
+    response = client.get('/api/v1/qa?fields=bogus')
+    assert response.status_code == 400
+    assert response.get_json()['error']['code'] == 'INVALID_PARAMETERS'
+    
+    # 不指定字段时返回完整问答，但不含上下文
+    full = client.get('/api/v1/qa?per_page=1').get_json()['data'][0]
+    assert 'answer' in full and 'original_context' not in full
+
+
+def test_search_list_view_projects_requested_columns(corpus, client, statements):
+    result = client.get('/api/v1/search/?q=install&view=list&per_page=2').get_json()
+    
+    assert result['pagination']['total'] == 30
+    assert set(result['data'][0]) >= LIST_VIEW - {'category'}
+    assert 'answer' not in result['data'][0]
+    match = [sql for sql in statements if 'MATCH' in sql]
+    assert match and 'substr(qa.answer, 1, 120)' in match[0]
@@ -0,0 +1,135 @@
+"""
+统计汇总表：增量维护、SAVEPOINT 隔离、过期标记和全量校准
+"""
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from app import db
+from app.models import CategoryStats, QAPair, StatsState, UploadHistory
+from app.services import stats_rollup
+from app.services.stats_rollup import get_stats_rollup_service
+
+
+@pytest.fixture
+def rollup(app):
+    service = get_stats_rollup_service()
+    service._needs_reconcile = False
+    service.reconcile()
+    yield service
+    service._needs_reconcile = False
+
+
+def _snapshot_rollup():
+    return {
+        'categories': sorted((row.category_id, row.qa_count, row.quality_count)
+                             for row in CategoryStats.query.filter(CategoryStats.qa_count != 0)),
+        'statistics': QAPair.get_statistics(),
+        'uploads': get_stats_rollup_service().get_upload_statistics(),
+        'ai': get_stats_rollup_service().get_confidence_distribution('ai'),
+    }
+
+
+def test_incremental_updates_match_reconcile(rollup):
+    objects = [
+        QAPair(question=f'q{i}', answer='a', category_id=(i % 5) + 1 if i % 6 else None,
+               advisor=('x', 'y', None)[i % 3], confidence=(0.1, 0.45, 0.55, 0.8, 0.95)[i % 5],
+               source_file=('upload_1', 'upload_2_raw', 'upload_3_ai')[i % 3])
+        for i in range(60)
+    ]
+    db.session.bulk_save_objects(objects)
+    rollup.record_qa_inserts(objects)
+    db.session.commit()
+    
+    upload = UploadHistory(filename='f.json', file_size=100)
+    db.session.add(upload)
+    db.session.commit()
+    upload.status = 'completed'
+    upload.qa_count = 5
+    upload.processing_time = 2.0
+    qa = QAPair.query.filter_by(advisor='x').first()
+    qa.confidence = 0.2
+    qa.category_id = 5
+    db.session.delete(QAPair.query.filter_by(advisor='y').first())
+    db.session.commit()
+    
+    incremental = _snapshot_rollup()
+    rollup.reconcile()
+    assert _snapshot_rollup() == incremental
+    assert incremental['statistics']['total_qa'] == QAPair.query.filter(QAPair.confidence >= 0.5).count()
+
+
+def test_failed_upsert_rolls_back_to_savepoint_and_marks_stale(rollup, monkeypatch):
+    monkeypatch.setattr(stats_rollup, '_UPSERT_CATEGORY', text(
+        'INSERT INTO missing_rollup_table (category_id) VALUES (:category_id)'
+    ))
+    db.session.add(QAPair(question='q', answer='a', category_id=1, advisor='x', confidence=0.9))
+    db.session.commit()
+    
+    # 业务写入已提交，失败批次中的其他汇总表没有部分写入
+    assert QAPair.query.count() == 1
+    assert db.session.get(StatsState, 'needs_reconcile') is not None
+    assert rollup.get_confidence_distribution('rule')['total'] == 0
+    
+    # 同一会话后续写入不受影响
+    db.session.add(QAPair(question='q2', answer='a', category_id=2, confidence=0.9))
+    db.session.commit()
+    assert QAPair.query.count() == 2
+    
+    monkeypatch.undo()
+    rollup._needs_reconcile = False
+    assert rollup.is_stale()
+    rollup.reconcile()
+    assert not rollup.is_stale()
+    assert db.session.get(StatsState, 'needs_reconcile') is None
+    assert QAPair.get_statistics()['total_qa'] == 2
+
+
+def test_reads_schedule_reconcile_instead_of_running_it(app, monkeypatch):
+    service = get_stats_rollup_service()
+    submitted = []
+    
+    def fail_reconcile():
+        raise AssertionError('reconcile must not run inside a read')
+        
+    monkeypatch.setattr(service, 'reconcile', fail_reconcile)
+    monkeypatch.setattr(service, 'submit_reconcile', lambda app: submitted.append(app) or 'task')
+    
+    # 从未校准：读取统计只提交后台任务
+    assert service.is_stale()
+    QAPair.get_statistics()
+    service.get_upload_statistics()
+    assert len(submitted) == 2
+
+
+def test_submit_reconcile_runs_in_task_queue(app):
+    service = get_stats_rollup_service()
+    db.session.add(QAPair(question='q', answer='a', category_id=1, confidence=0.9))
+    db.session.commit()
+    db.session.execute(CategoryStats.__table__.delete())
+    db.session.commit()
+    
+    task_id = service.submit_reconcile(app)
+    
+    from app.services.task_queue import TaskStatus, get_task_queue
+    deadline = time.monotonic() + 10
+    while get_task_queue().get_task_status(task_id).status != TaskStatus.COMPLETED:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+        
+    db.session.expire_all()
+    assert not service.is_stale()
+    assert db.session.get(CategoryStats, 1).qa_count == 1
+
+
+def test_reconcile_statements_are_portable():
+    statements = get_stats_rollup_service().reconcile_statements(datetime(2024, 1, 1))
+    compiled = [str(statement.compile(dialect=postgresql.dialect())) for statement in statements]
+    
+    confidence_sql, daily_sql = compiled[2], compiled[3]
+    assert ') AS scored' in confidence_sql
+    assert ') AS daily' in daily_sql
+    assert 'ON CONFLICT' not in daily_sql
@@ -0,0 +1,59 @@
+"""
+消息数组的流式读取：结构识别和逐条产出
+"""
+import json
+
+import pytest
+
+from app.services.data_extractor import DataExtractor
+from app.utils.streaming_processor import StreamingJSONProcessor
+
+from conftest import build_chat_messages
+
+
+@pytest.fixture
+def processor():
+    return StreamingJSONProcessor()
+
+
+@pytest.mark.parametrize('wrap, prefix', [
+    (lambda messages: messages, 'item'),
+    (lambda messages: {'chat': 'g1', 'messages': messages}, 'messages.item'),
+    (lambda messages: {'meta': {'count': len(messages)}, 'data': messages}, 'data.item'),
+])
+def test_stream_messages_supports_export_layouts(tmp_path, processor, wrap, prefix):
+    messages = build_chat_messages(50)
+    path = tmp_path / 'chat.json'
+    path.write_text(json.dumps(wrap(messages), ensure_ascii=False), encoding='utf-8')
+    
+    assert processor.detect_messages_prefix(path) == prefix
+    assert list(processor.stream_messages(path)) == messages
+
+
+def test_detection_stops_at_first_candidate_array(tmp_path, processor):
+    # 数组之后的内容不会被解析：文件尾部即使不完整，识别也能立即返回
+    messages = json.dumps(build_chat_messages(10), ensure_ascii=False)
+    path = tmp_path / 'chat.json'
+    path.write_text('{"data": ' + messages + ', "trailer": [1, 2, ', encoding='utf-8')
+    
+    assert processor.detect_messages_prefix(path) == 'data.item'
+
+
+@pytest.mark.parametrize('keys', [('messages', 'data'), ('data', 'messages')])
+def test_streaming_and_in_memory_pick_the_same_array(tmp_path, processor, keys):
+    first, second = build_chat_messages(5, tag='A'), build_chat_messages(5, tag='B')
+    document = {keys[0]: first, keys[1]: second}
+    path = tmp_path / 'chat.json'
+    path.write_text(json.dumps(document, ensure_ascii=False), encoding='utf-8')
+    
+    # 两者都有时取先出现的，流式读取和内存中读取一致
+    assert list(processor.stream_messages(path)) == first
+    assert list(DataExtractor(max_workers=1).iter_raw_messages(document)) == first
+
+
+def test_detection_rejects_documents_without_messages(tmp_path, processor):
+    path = tmp_path / 'chat.json'
+    path.write_text('{"data": {"messages": []}, "count": 0}', encoding='utf-8')
+    
+    with pytest.raises(ValueError):
+        processor.detect_messages_prefix(path)
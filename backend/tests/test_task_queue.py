@@ -0,0 +1,173 @@
+"""
+任务队列：并发工作线程、优先级和延迟堆，以及上传处理锁的串行执行与清理
+"""
+import io
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import UploadHistory
+from app.services.task_queue import (
+    FileProcessingService, TaskPriority, TaskQueue, TaskStatus, get_file_processing_service
+)
+
+
+@pytest.fixture
+def queue():
+    queue = TaskQueue(max_workers=3)
+    yield queue
+    queue.shutdown(timeout=5)
+
+
+def _wait(queue, task_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while queue.get_task_status(task_id).status not in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return queue.get_task_status(task_id)
+
+
+def test_tasks_run_on_concurrent_workers(queue):
+    barrier = threading.Barrier(3, timeout=5)
+    task_ids = [queue.submit_task('test', lambda: barrier.wait(), max_retries=0) for _ in range(3)]
+    # 三个任务同时在等待屏障，只有并发执行才能全部完成
+    assert all(_wait(queue, task_id).status == TaskStatus.COMPLETED for task_id in task_ids)
+
+
+def test_priority_and_delayed_tasks():
+    queue = TaskQueue(max_workers=1)
+    try:
+        started, release, order = threading.Event(), threading.Event(), []
+        blocker = queue.submit_task('test', lambda: started.set() or release.wait(5), max_retries=0)
+        assert started.wait(5)
+        
+        delayed_at = time.monotonic()
+        delayed = queue.submit_task('test', lambda: order.append(('delayed', time.monotonic())), max_retries=0,
+                                    scheduled_for=datetime.utcnow() + timedelta(seconds=0.3))
+        low = queue.submit_task('test', lambda: order.append(('low', 0)), max_retries=0, priority=TaskPriority.LOW)
+        high = queue.submit_task('test', lambda: order.append(('high', 0)), max_retries=0, priority=TaskPriority.HIGH)
+        release.set()
+        
+        for task_id in (blocker, low, high, delayed):
+            assert _wait(queue, task_id).status == TaskStatus.COMPLETED
+        assert [name for name, _ in order] == ['high', 'low', 'delayed']
+        assert order[-1][1] - delayed_at >= 0.3
+    finally:
+        queue.shutdown(timeout=5)
+
+
+def test_failed_task_is_retried_after_backoff(queue):
+    attempts = []
+    
+    def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RuntimeError('first attempt fails')
+        return {'attempts': len(attempts)}
+        
+    task_id = queue.submit_task('test', flaky, max_retries=1)
+    deadline = time.monotonic() + 10
+    while queue.get_task_status(task_id).status != TaskStatus.COMPLETED:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    result = queue.get_task_status(task_id)
+    assert result.retry_count == 1 and result.result == {'attempts': 2}
+    assert attempts[1] - attempts[0] >= 1.9
+
+
+def test_timed_out_task_retries_after_previous_attempt_ends(queue):
+    queue.TIMEOUT_GRACE = 0
+    attempts = []
+    
+    def slow():
+        attempt = [time.monotonic(), None]
+        attempts.append(attempt)
+        if len(attempts) == 1:
+            time.sleep(2.5)  # 超过超时时间和重试退避（2秒）仍在运行
+        attempt[1] = time.monotonic()
+        return len(attempts)
+        
+    task_id = queue.submit_task('test', slow, max_retries=2, timeout=0.2)
+    deadline = time.monotonic() + 10
+    while queue.get_task_status(task_id).status != TaskStatus.COMPLETED:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+        
+    # 超时后等上一次执行结束才重试，只重试一次
+    assert len(attempts) == 2 and queue.get_task_status(task_id).retry_count == 1
+    assert attempts[1][0] >= attempts[0][1]
+
+
+def test_upload_deadline_counts_lock_wait(app, queue, monkeypatch):
+    service = FileProcessingService(queue)
+    record = UploadHistory(filename='chat.json')
+    db.session.add(record)
+    db.session.commit()
+    upload_id, deadlines = record.id, []
+    monkeypatch.setattr(service, 'run_upload', lambda *args, deadline=None, **kwargs: deadlines.append(deadline) or {
+        'success': True
+    })
+    
+    held, release = threading.Event(), threading.Event()
+    
+    def hold():
+        with service._upload_lock(upload_id):
+            held.set()
+            release.wait(5)
+            
+    thread = threading.Thread(target=hold)
+    thread.start()
+    assert held.wait(5)
+    threading.Timer(0.3, release.set).start()
+    started = time.monotonic()
+    service._process_upload_task(app, upload_id, None, 'chat.json', False, 'standard', 10)
+    thread.join(5)
+    
+    # 截止时间从任务开始时计算，而不是拿到处理锁之后
+    assert deadlines[0] - started <= 10.05
+
+
+def test_upload_lock_serializes_and_is_removed(queue):
+    service = FileProcessingService(queue)
+    inside, overlaps = [], []
+    
+    def hold(upload_id, fail=False):
+        try:
+            with service._upload_lock(upload_id):
+                if inside:
+                    overlaps.append(upload_id)
+                inside.append(upload_id)
+                time.sleep(0.05)
+                inside.remove(upload_id)
+                if fail:
+                    raise RuntimeError('processing failed')
+        except RuntimeError:
+            pass
+            
+    threads = [threading.Thread(target=hold, args=(7, i == 1)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+        
+    assert overlaps == []
+    # 最后一个任务结束（包括失败）后锁被删除，不会随上传数量增长
+    assert service.upload_locks == {} and service._upload_lock_users == {}
+
+
+def test_upload_lock_released_after_background_upload(client, make_chat):
+    response = client.post('/api/v1/upload/file', data={'file': (io.BytesIO(make_chat(40)), 'chat.json'),
+                                                         'use_ai': 'false'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+    data = response.get_json()['data']
+    
+    service = get_file_processing_service()
+    assert _wait(service.task_queue, data['task_id'], timeout=30).status == TaskStatus.COMPLETED
+    deadline = time.monotonic() + 5
+    while data['upload_id'] in service.upload_locks:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
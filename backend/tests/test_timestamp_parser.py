@@ -0,0 +1,64 @@
+"""
+时间戳解析：按文件识别格式后走快速路径，结果与逐个格式尝试一致
+"""
+from datetime import datetime
+
+import pytest
+
+from app.services.data_extractor import DataExtractor
+from app.utils.timestamp_parser import TimestampParser, get_timestamp_value, parse_timestamp_slow
+
+from conftest import build_chat_messages
+
+
+@pytest.mark.parametrize('values, parser_name', [
+    ([f'2025-07-01T09:{i:02d}:00+08:00' for i in range(20)], 'isoformat'),
+    ([f'2025-07-01 09:{i:02d}:00' for i in range(20)], 'isoformat'),
+    ([f'2025/07/01 09:{i:02d}:00' for i in range(20)], 'slash'),
+    ([1751331600 + i * 60 for i in range(20)], 'epoch_seconds'),
+    ([1751331600000 + i * 60000 for i in range(20)], 'epoch_millis'),
+])
+def test_sniffed_parser_matches_slow_path(values, parser_name):
+    parser = TimestampParser()
+    results = [parser.parse(value) for value in values]
+    
+    assert results == [parse_timestamp_slow(value) for value in values]
+    assert parser.fast_parser_name == parser_name
+    assert parser.slow_count == TimestampParser.SNIFF_SAMPLES
+    assert parser.fast_count == len(values) - TimestampParser.SNIFF_SAMPLES
+
+
+def test_timezone_suffix_keeps_local_time():
+    parser = TimestampParser()
+    values = [f'2025-07-01T09:00:0{i}+08:00' for i in range(6)]
+    assert [parser.parse(value) for value in values][-1] == datetime(2025, 7, 1, 9, 0, 5)
+
+
+def test_outliers_fall_back_to_slow_path():
+    parser = TimestampParser()
+    for i in range(TimestampParser.SNIFF_SAMPLES):
+        parser.parse(f'2025/07/01 09:0{i}:00')
+    assert parser.fast_parser_name == 'slash'
+    
+    # 文件中混入其他格式的个别时间戳
+    assert parser.parse(1751331600) == parse_timestamp_slow(1751331600)
+    assert parser.parse('not a time') is None
+    assert parser.parse(None) is None
+    assert parser.slow_count == TimestampParser.SNIFF_SAMPLES + 2
+    
+    # 快速路径能解析的 ISO 变体与慢速路径结果一致
+    assert parser.parse('2025-07-01T09:00:00.5Z') == parse_timestamp_slow('2025-07-01T09:00:00.5Z')
+
+
+def test_get_timestamp_value_field_priority():
+    assert get_timestamp_value({'time': 'b', 'timestamp': 'a'}) == 'a'
+    assert get_timestamp_value({'timestamp': None, 'created_at': 'c'}) == 'c'
+    assert get_timestamp_value({'content': 'x'}) is None
+
+
+def test_normalized_messages_use_one_parser_per_file():
+    extractor = DataExtractor(max_workers=1)
+    raw = build_chat_messages(50)
+    
+    timestamps = [message['timestamp'] for message in extractor.iter_normalized_messages(raw)]
+    assert timestamps == [parse_timestamp_slow(message['time']) for message in raw]
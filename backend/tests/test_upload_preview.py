@@ -0,0 +1,64 @@
+"""
+上传预览：识别消息数组受读取时间限制，样本太少时不外推
+"""
+import json
+import time
+
+import pytest
+
+from app.services.upload_preview import MIN_ESTIMATE_MESSAGES, UploadPreviewService
+from app.utils.streaming_processor import PrefixDetectionTimeout, StreamingJSONProcessor
+
+from conftest import build_chat_messages
+
+
+def _write(path, document):
+    path.write_text(json.dumps(document, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+def test_data_keyed_preview_extrapolates_from_first_data_array(app, tmp_path):
+    path = _write(tmp_path / 'chat.json', {'data': build_chat_messages(3000), 'total': 3000})
+    
+    preview = UploadPreviewService().preview(path, limit=600, time_budget=5)
+    
+    assert preview['sample']['messages'] == 600
+    assert not preview['sample']['timed_out']
+    estimates = preview['estimates']
+    assert not estimates['insufficient_sample']
+    assert 2000 < estimates['messages'] < 4500
+    assert estimates['qa_pairs'] > 0
+
+
+def test_prefix_detection_stops_at_read_deadline(app, tmp_path):
+    # 消息数组前有很大的其他字段
+    path = _write(tmp_path / 'chat.json', {'meta': list(range(2_000_000)), 'data': build_chat_messages(50)})
+    
+    with pytest.raises(PrefixDetectionTimeout):
+        StreamingJSONProcessor().detect_messages_prefix(path, deadline=time.perf_counter() + 0.01)
+        
+    started = time.perf_counter()
+    preview = UploadPreviewService().preview(path, time_budget=0.1)
+    assert time.perf_counter() - started < 1.0
+    
+    assert preview['sample']['timed_out']
+    assert preview['sample']['messages'] == 0
+    assert preview['partial']
+    assert preview['estimates']['insufficient_sample']
+    assert preview['estimates']['messages'] is None
+    assert preview['estimates']['qa_pairs'] is None
+
+
+def test_tiny_sample_is_not_extrapolated(app, tmp_path):
+    path = _write(tmp_path / 'chat.json', {'messages': build_chat_messages(400)})
+    
+    preview = UploadPreviewService().preview(path, limit=1, time_budget=5)
+    assert preview['sample']['messages'] == 1
+    assert preview['estimates']['insufficient_sample']
+    assert preview['estimates']['qa_pairs'] is None
+    
+    # 完整读完的小文件即使少于 MIN_ESTIMATE_MESSAGES 条也是准确值
+    small = _write(tmp_path / 'small.json', {'messages': build_chat_messages(MIN_ESTIMATE_MESSAGES // 2)})
+    estimates = UploadPreviewService().preview(small, time_budget=5)['estimates']
+    assert estimates['exact'] and not estimates['insufficient_sample']
+    assert estimates['messages'] == MIN_ESTIMATE_MESSAGES // 2
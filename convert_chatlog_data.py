@@ -2,147 +2,131 @@
 """
 微信群聊数据格式转换工具
 将 chatlog 导出的复杂JSON格式转换为知识库系统预期的简单格式
+
+输入文件流式读取、边转换边写出，多个文件用进程池并行转换（转换逻辑见
+backend/app/utils/chatlog_converter.py，与后端提取消息内容的规则相同）。
 """
 
-import json
+import argparse
+import os
 import sys
-import re
-from datetime import datetime
-from typing import List, Dict, Any
+import time
+from pathlib import Path
 
-def parse_timestamp(time_str: str) -> int:
-    """将 ISO 时间字符串转换为时间戳"""
-    try:
-        dt = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
-        return int(dt.timestamp() * 1000)
-    except:
-        return int(datetime.now().timestamp() * 1000)
-
-def extract_content_from_chatlog_message(msg: Dict[str, Any]) -> str:
-    """从 chatlog 消息中提取文本内容"""
-    content = ""
-    
-    # 普通文本消息
-    if msg.get('content') and isinstance(msg['content'], str):
-        content = msg['content'].strip()
-    
-    # 复合消息内容
-    if msg.get('contents'):
-        contents = msg['contents']
-        
-        # 描述内容
-        if contents.get('desc'):
-            content = contents['desc'].strip()
-        
-        # 聊天记录内容
-        if contents.get('recordInfo') and contents['recordInfo'].get('DataList'):
-            data_list = contents['recordInfo']['DataList']
-            if data_list.get('DataItems'):
-                for item in data_list['DataItems']:
-                    if item.get('DataDesc'):
-                        # 处理嵌套的聊天记录
-                        nested_content = item['DataDesc'].strip()
-                        if nested_content and len(nested_content) > len(content):
-                            content = nested_content
-    
-    # 清理内容
-    if content:
-        # 移除用户名前缀（如 "林: "）
-        content = re.sub(r'^[^:：]+[:：]\s*', '', content)
-        # 移除多余的空白字符
-        content = re.sub(r'\s+', ' ', content).strip()
-    
-    return content
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'backend'))
+
+from app.utils.chatlog_converter import (  # noqa: E402
+    OUTPUT_FORMATS, ConversionResult, convert_files, find_input_files, output_format_for, output_name_for
+)
+
+LEGACY_OUTPUT_SUFFIXES = ('.json', '.ndjson', '.jsonl')
 
-def convert_chatlog_to_simple_format(chatlog_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """将 chatlog 数据转换为简单格式"""
-    converted_messages = []
-    message_id = 1
+EXAMPLES = """示例:
+  python convert_chatlog_data.py chatlog_export.json converted_data.json
+  python convert_chatlog_data.py exports/ -o converted/ -j 8
+  python convert_chatlog_data.py a.json.gz b.zip -o converted/ --format json
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='将 chatlog 导出的 JSON 转换为知识库使用的简单消息格式',
+        epilog=EXAMPLES,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('inputs', nargs='+', help='输入文件或目录（.json / .json.gz / .json.zst / .zip）；只有两个参数且第二个是 .json/.ndjson/.jsonl 时，第二个视为输出文件')
+    parser.add_argument('-o', '--output', help='输出文件（单个输入时）或目录；默认输出到输入文件所在目录')
+    parser.add_argument('-f', '--format', choices=OUTPUT_FORMATS,
+                        help='输出格式：ndjson 每行一条消息，json 为消息数组（默认按输出文件后缀，目录输出为 ndjson）')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help='并行进程数（默认为CPU核数）')
+    args = parser.parse_args(argv)
     
-    for msg in chatlog_data:
-        # 跳过空消息或系统消息
-        if msg.get('type') in [3, 10000] or not msg.get('senderName'):
-            continue
-        
-        # 提取消息内容
-        content = extract_content_from_chatlog_message(msg)
-        
-        # 跳过空内容或太短的消息
-        if not content or len(content.strip()) < 10:
-            continue
-        
-        # 跳过纯表情或特殊字符
-        if re.match(r'^[\s\U0001F300-\U0001F9FF\u2600-\u27BF\u2B05-\u2B07\u2934-\u2935\u2B05-\u2B07\u25B6\u25C0\u23CF-\u23FA\U0001F680-\U0001F6FF]+$', content):
-            continue
-        
-        # 处理时间戳
-        timestamp = parse_timestamp(msg.get('time', ''))
-        
-        # 获取发送者名称
-        sender_name = msg.get('senderName', '未知用户')
+    # 兼容旧用法: convert_chatlog_data.py <输入文件> <输出文件>（第二个参数为 .json/.ndjson/.jsonl 文件）
+    if args.output is None and len(args.inputs) == 2 and Path(args.inputs[0]).is_file() \
+            and not Path(args.inputs[1]).is_dir() and Path(args.inputs[1]).suffix.lower() in LEGACY_OUTPUT_SUFFIXES:
+        args.output = args.inputs.pop()
+    return args
+
+
+def plan_jobs(inputs, output, output_format):
+    """确定每个输入文件的输出路径和输出格式"""
+    files = find_input_files(inputs)
+    if not files:
+        raise ValueError('没有找到要转换的文件')
+    missing = [str(path) for path in files if not path.exists()]
+    if missing:
+        raise FileNotFoundError(f"找不到输入文件 {', '.join(missing)}")
         
-        # 创建简化消息
-        simple_msg = {
-            "id": f"msg_{message_id:06d}",
-            "timestamp": timestamp,
-            "from_user": sender_name,
-            "content": content,
-            "message_type": "text"
-        }
+    output = Path(output) if output else None
+    if output is not None and len(files) == 1 and not output.is_dir() and not str(output).endswith(os.sep):
+        return [(files[0], output)], output_format or output_format_for(output)
         
-        converted_messages.append(simple_msg)
-        message_id += 1
-    
-    return converted_messages
+    output_format = output_format or 'ndjson'
+    if output is not None:
+        output.mkdir(parents=True, exist_ok=True)
+    jobs, used = [], set()
+    for path in files:
+        target = (output or path.parent) / output_name_for(path, output_format)
+        # 不同目录下的同名文件输出到同一目录时加序号区分
+        index = 1
+        while target in used:
+            index += 1
+            target = target.with_name(f"{output_name_for(path, output_format).rsplit('.', 1)[0]}-{index}.{output_format}")
+        used.add(target)
+        jobs.append((path, target))
+    return jobs, output_format
 
-def main():
-    if len(sys.argv) != 3:
-        print("使用方法: python convert_chatlog_data.py <输入文件> <输出文件>")
-        print("示例: python convert_chatlog_data.py chatlog_export.json converted_data.json")
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
+
+def print_result(result: ConversionResult):
+    name = Path(result.input_path).name
+    if not result.success:
+        print(f"❌ {name}: {result.error}", flush=True)
+        return
+    print(f"✅ {name} → {result.output_path}: {result.messages} 条 → {result.converted} 条, "
+          f"{result.seconds:.1f}s, {result.messages_per_second:,.0f} 条/秒, "
+          f"{result.megabytes_per_second:.1f} MB/秒", flush=True)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     
     try:
-        print(f"读取原始数据: {input_file}")
-        with open(input_file, 'r', encoding='utf-8') as f:
-            chatlog_data = json.load(f)
-        
-        print(f"原始消息数量: {len(chatlog_data)}")
-        
-        # 转换数据格式
-        print("转换数据格式...")
-        converted_data = convert_chatlog_to_simple_format(chatlog_data)
-        
-        print(f"转换后消息数量: {len(converted_data)}")
-        
-        # 保存转换后的数据
-        print(f"保存转换后数据: {output_file}")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(converted_data, f, ensure_ascii=False, indent=2)
-        
-        print("✅ 转换完成!")
-        print(f"📊 统计信息:")
-        print(f"   - 原始消息: {len(chatlog_data)} 条")
-        print(f"   - 有效消息: {len(converted_data)} 条")
-        print(f"   - 转换率: {len(converted_data)/len(chatlog_data)*100:.1f}%")
+        jobs, output_format = plan_jobs(args.inputs, args.output, args.format)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
         
-        # 显示一些样例
-        if converted_data:
-            print(f"\n📝 转换样例:")
-            for i, msg in enumerate(converted_data[:3]):
-                print(f"   {i+1}. [{msg['from_user']}]: {msg['content'][:50]}...")
+    workers = max(1, min(args.workers, len(jobs)))
+    print(f"转换 {len(jobs)} 个文件（{output_format}，{workers} 个进程）...")
+    started = time.perf_counter()
+    results = convert_files(jobs, workers=workers, output_format=output_format,
+                            sample_size=3 if len(jobs) == 1 else 0, on_result=print_result)
+    elapsed = time.perf_counter() - started
     
-    except FileNotFoundError:
-        print(f"❌ 错误: 找不到输入文件 {input_file}")
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        print(f"❌ 错误: JSON 格式错误 - {e}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"❌ 错误: {e}")
+    succeeded = [r for r in results if r.success]
+    messages = sum(r.messages for r in succeeded)
+    converted = sum(r.converted for r in succeeded)
+    megabytes = sum(r.input_bytes for r in succeeded) / 1024 / 1024
+    
+    print(f"📊 统计信息:")
+    print(f"   - 文件: {len(succeeded)}/{len(results)} 个成功")
+    print(f"   - 原始消息: {messages} 条")
+    print(f"   - 有效消息: {converted} 条")
+    if messages:
+        print(f"   - 转换率: {converted / messages * 100:.1f}%")
+    if elapsed > 0:
+        print(f"   - 用时: {elapsed:.1f}s，{messages / elapsed:,.0f} 条/秒，{megabytes / elapsed:.1f} MB/秒")
+    
+    # 单个文件时显示一些样例
+    samples = succeeded[0].samples if len(results) == 1 and succeeded else []
+    if samples:
+        print(f"\n📝 转换样例:")
+        for i, msg in enumerate(samples):
+            print(f"   {i+1}. [{msg['from_user']}]: {msg['content'][:50]}...")
+            
+    if len(succeeded) < len(results):
         sys.exit(1)
 
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()